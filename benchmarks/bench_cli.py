@@ -0,0 +1,297 @@
+"""
+End-to-end latency benchmarks for fml, run against a local fake Gemini API.
+
+No network access or API key is needed: every request goes to
+fml.testing.fake_gemini.FakeGeminiServer via FML_GEMINI_BASE_URL. The response
+cache, daemon and local command index are disabled so every query reaches the
+provider, and the clipboard is replaced by the in-memory fake backend.
+
+Usage:
+    python benchmarks/bench_cli.py --output results.json
+    python benchmarks/bench_cli.py --latency 0.2 --explanation-words 200 --queries 100
+
+Reported metrics (all times in milliseconds):
+    import_cli_ms           importing fml.__main__ in a fresh interpreter
+    import_provider_ms      importing GeminiService and the google-genai SDK
+    cold_start_help_ms      `python -m fml --help` wall time
+    cold_start_query_ms     one query in a fresh process, start to exit
+    ttfo_ms                 one query in a fresh process, start to first byte of output
+    ttfo_stream_ms          the same with --stream
+    main_latency_ms         main() called repeatedly in-process (p50/p95/p99)
+    generate_latency_ms     AIService.generate_command on one service (p50/p95/p99)
+    batch                   run_batch throughput in queries per second
+    batch_packed            the same with --pack (several queries per request)
+
+Compare two runs with:
+    python benchmarks/bench_cli.py --compare old.json new.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+from unittest.mock import patch
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from fml.testing.fake_gemini import FakeGeminiServer  # noqa: E402
+
+MODEL = "gemini-2.0-flash"
+QUERY = "how do I find files modified in the last day"
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Returns rounded p50/p95/p99, min, max and mean of the values (nearest rank)."""
+    ordered = sorted(values)
+
+    def rank(q):
+        return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))]
+
+    return {
+        "p50": round(rank(0.50), 3),
+        "p95": round(rank(0.95), 3),
+        "p99": round(rank(0.99), 3),
+        "min": round(ordered[0], 3),
+        "max": round(ordered[-1], 3),
+        "mean": round(statistics.fmean(ordered), 3),
+        "samples": len(ordered),
+    }
+
+
+def _median_ms(samples: List[float]) -> float:
+    return round(statistics.median(samples) * 1000, 3)
+
+
+def _run_python(code: str, env: dict) -> str:
+    return subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True
+    ).stdout
+
+
+def bench_imports(env: dict, repeats: int) -> Dict[str, float]:
+    timer = "import time; t = time.perf_counter(); {}; print(time.perf_counter() - t)"
+    cli, provider = [], []
+    for _ in range(repeats):
+        cli.append(float(_run_python(timer.format("import fml.__main__"), env)))
+        provider.append(
+            float(
+                _run_python(
+                    timer.format("import fml.ai_providers.gemini_service; from google import genai"),
+                    env,
+                )
+            )
+        )
+    return {"import_cli_ms": _median_ms(cli), "import_provider_ms": _median_ms(provider)}
+
+
+def _time_process(args: List[str], env: dict) -> tuple:
+    """Returns (seconds to first stdout byte, seconds to exit)."""
+    start = time.perf_counter()
+    process = subprocess.Popen(args, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    process.stdout.read(1)
+    first_output = time.perf_counter() - start
+    process.stdout.read()
+    if process.wait() != 0:
+        raise RuntimeError(f"{' '.join(args)} exited with {process.returncode}")
+    return first_output, time.perf_counter() - start
+
+
+def bench_cold_start(env: dict, repeats: int) -> Dict[str, float]:
+    help_runs, query_runs, ttfo, ttfo_stream = [], [], [], []
+    query_args = [sys.executable, "-m", "fml", "--no-color", "-m", MODEL, QUERY]
+    stream_args = query_args[:3] + ["--stream"] + query_args[3:]
+    for _ in range(repeats):
+        help_runs.append(_time_process([sys.executable, "-m", "fml", "--help"], env)[1])
+        first, total = _time_process(query_args, env)
+        ttfo.append(first)
+        query_runs.append(total)
+        ttfo_stream.append(_time_process(stream_args, env)[0])
+    return {
+        "cold_start_help_ms": _median_ms(help_runs),
+        "cold_start_query_ms": _median_ms(query_runs),
+        "ttfo_ms": _median_ms(ttfo),
+        "ttfo_stream_ms": _median_ms(ttfo_stream),
+    }
+
+
+def bench_main(queries: int) -> Dict[str, float]:
+    from fml.__main__ import main
+
+    latencies = []
+    argv = ["fml", "--no-color", "--no-cache", "--no-daemon", "--no-local-index", "-m", MODEL]
+    for i in range(queries):
+        with patch.object(sys, "argv", argv + [f"{QUERY} {i}"]), contextlib.redirect_stdout(
+            io.StringIO()
+        ):
+            start = time.perf_counter()
+            main()
+            latencies.append((time.perf_counter() - start) * 1000)
+    return percentiles(latencies)
+
+
+def _create_service():
+    from fml.__main__ import _initialize_ai_service
+
+    return _initialize_ai_service(MODEL)
+
+
+def bench_generate(queries: int) -> Dict[str, float]:
+    from fml.gather_system_info import get_system_info
+    from fml.schemas import AIContext
+
+    service = _create_service()
+    ai_context = AIContext(system_info=get_system_info())
+    service.generate_command("warm up", ai_context)
+
+    latencies = []
+    for i in range(queries):
+        start = time.perf_counter()
+        service.generate_command(f"{QUERY} {i}", ai_context)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return percentiles(latencies)
+
+
+def bench_batch(queries: int, concurrency: int, pack_size: int = 1) -> Dict[str, float]:
+    from fml.batch import BatchItem, run_batch
+    from fml.gather_system_info import get_system_info
+    from fml.schemas import AIContext
+
+    items = [BatchItem(index=i, query=f"{QUERY} {i}") for i in range(queries)]
+    summary = run_batch(
+        items,
+        lambda model: _create_service(),
+        AIContext(system_info=get_system_info()),
+        default_model=MODEL,
+        output=io.StringIO(),
+        max_concurrency=concurrency,
+        pack_size=pack_size,
+    )
+    return {
+        "queries": summary.total,
+        "failed": summary.failed,
+        "concurrency": concurrency,
+        "pack_size": pack_size,
+        "total_tokens": summary.usage.total_tokens,
+        "elapsed_ms": round(summary.elapsed_seconds * 1000, 3),
+        "queries_per_second": round(summary.total / summary.elapsed_seconds, 3),
+        "latency_ms": percentiles(summary.latencies_ms),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_benchmarks(args) -> dict:
+    """Runs every benchmark against a fresh fake server and returns the results document."""
+    with tempfile.TemporaryDirectory() as cache_dir, FakeGeminiServer(
+        latency=args.latency,
+        explanation_words=args.explanation_words,
+        flag_count=args.flags,
+    ) as server:
+        overrides = {
+            "FML_GEMINI_BASE_URL": server.base_url,
+            "GEMINI_API_KEY": "fake-key",
+            "FML_CACHE_DIR": cache_dir,
+            "FML_DAEMON": "off",
+            "FML_LOCAL_INDEX": "off",
+            # Keeps every run off the real clipboard.
+            "FML_CLIPBOARD": "fake",
+            "PYTHONPATH": os.pathsep.join(filter(None, [REPO_ROOT, os.environ.get("PYTHONPATH")])),
+        }
+        env = {**os.environ, **overrides}
+        with patch.dict(os.environ, overrides):
+            results = {}
+            results.update(bench_imports(env, args.repeats))
+            results.update(bench_cold_start(env, args.repeats))
+            results["main_latency_ms"] = bench_main(args.queries)
+            results["generate_latency_ms"] = bench_generate(args.queries)
+            results["batch"] = bench_batch(args.batch_queries, args.concurrency)
+            results["batch_packed"] = bench_batch(args.batch_queries, args.concurrency, args.pack)
+            results["provider_requests"] = server.request_count
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "latency_s": args.latency,
+            "explanation_words": args.explanation_words,
+            "flags": args.flags,
+            "repeats": args.repeats,
+            "queries": args.queries,
+            "batch_queries": args.batch_queries,
+            "concurrency": args.concurrency,
+            "pack": args.pack,
+        },
+        "results": results,
+    }
+
+
+def _flatten(prefix: str, value, out: dict) -> dict:
+    if isinstance(value, dict):
+        for key, inner in value.items():
+            _flatten(f"{prefix}.{key}" if prefix else key, inner, out)
+    elif isinstance(value, (int, float)):
+        out[prefix] = value
+    return out
+
+
+def compare(old_path: str, new_path: str) -> None:
+    """Prints every metric of two result files side by side with the relative change."""
+    with open(old_path) as f:
+        old = _flatten("", json.load(f)["results"], {})
+    with open(new_path) as f:
+        new = _flatten("", json.load(f)["results"], {})
+    for key in sorted(old.keys() & new.keys()):
+        change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+        print(f"{key:40} {old[key]:>12} {new[key]:>12} {change:+8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", "-o", help="Write the results JSON to this file.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake API latency in seconds.")
+    parser.add_argument("--explanation-words", type=int, default=30)
+    parser.add_argument("--flags", type=int, default=2, help="Flags per fake response.")
+    parser.add_argument("--repeats", type=int, default=5, help="Fresh processes per cold-start metric.")
+    parser.add_argument("--queries", type=int, default=50, help="In-process queries per latency metric.")
+    parser.add_argument("--batch-queries", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--pack", type=int, default=10, help="Queries per request for batch_packed.")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files.")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    document = run_benchmarks(args)
+    text = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
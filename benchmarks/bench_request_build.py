@@ -0,0 +1,98 @@
+"""
+Micro-benchmark of the CPU time GeminiService spends building one request.
+
+Compares the current GeminiService._build_request, which reuses the response
+schema, GenerateContentConfig and serialized system information across
+requests, with the previous construction that rebuilt all three on every
+call. No client is created and nothing is sent.
+
+Usage:
+    python benchmarks/bench_request_build.py
+    python benchmarks/bench_request_build.py --iterations 5000 --output build.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from fml.ai_providers.gemini_service import GeminiService  # noqa: E402
+from fml.gather_system_info import get_system_info  # noqa: E402
+from fml.schemas import AICommandResponse, AIContext  # noqa: E402
+
+MODEL = "gemini-2.0-flash"
+QUERY = "how do I find files modified in the last day"
+
+
+def build_uncached(service: GeminiService, query: str, ai_context: AIContext) -> dict:
+    """Builds a request the way GeminiService did before request artifacts were reused."""
+    from google import genai
+
+    contents_parts = [query]
+    if ai_context.system_info:
+        system_info_json = ai_context.system_info.model_dump_json(indent=2)
+        contents_parts.append(
+            f"\n\nUser's System Information:\n```json\n{system_info_json}\n```"
+        )
+    return dict(
+        model=service.model_name,
+        contents=contents_parts,
+        config=genai.types.GenerateContentConfig(
+            system_instruction=service.system_instruction,
+            response_mime_type="application/json",
+            response_schema=AICommandResponse.model_json_schema(),
+        ),
+    )
+
+
+def time_per_call(build: Callable[[], dict], iterations: int) -> float:
+    """Returns the best-of-three mean microseconds per call."""
+    build()
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            build()
+        best = min(best, (time.perf_counter() - start) / iterations)
+    return round(best * 1e6, 2)
+
+
+def run(iterations: int) -> Dict[str, float]:
+    service = GeminiService("fake-key", "You are a command line assistant.", MODEL)
+    ai_context = AIContext(system_info=get_system_info())
+
+    cached = service._build_request(QUERY, ai_context)
+    uncached = build_uncached(service, QUERY, ai_context)
+    if cached != uncached:
+        raise RuntimeError("The cached and uncached requests differ.")
+
+    before = time_per_call(lambda: build_uncached(service, QUERY, ai_context), iterations)
+    after = time_per_call(lambda: service._build_request(QUERY, ai_context), iterations)
+    return {
+        "iterations": iterations,
+        "uncached_us_per_request": before,
+        "cached_us_per_request": after,
+        "speedup": round(before / after, 1) if after else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--output", "-o", help="Write the results JSON to this file.")
+    args = parser.parse_args()
+
+    text = json.dumps(run(args.iterations), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
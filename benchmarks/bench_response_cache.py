@@ -0,0 +1,94 @@
+"""
+Micro-benchmark of ResponseCache lookups as the cache grows.
+
+Fills a cache in a temporary directory with --entries responses, then times
+get() from a second instance (as another fml process would see it) for hits
+and misses, plus the time a fresh process needs for its first lookup.
+
+Usage:
+    python benchmarks/bench_response_cache.py
+    python benchmarks/bench_response_cache.py --entries 300000 --output cache.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from fml.response_cache import ResponseCache  # noqa: E402
+from fml.schemas import AICommandResponse, Flag  # noqa: E402
+
+
+def percentiles_us(samples: List[float]) -> Dict[str, float]:
+    """Returns the p50/p99 of durations in seconds, in microseconds."""
+    ordered = sorted(samples)
+    return {
+        "p50": round(ordered[len(ordered) // 2] * 1e6, 1),
+        "p99": round(ordered[int(len(ordered) * 0.99)] * 1e6, 1),
+    }
+
+
+def run(entries: int, lookups: int) -> Dict[str, object]:
+    response = AICommandResponse(
+        explanation="Finds files below the current directory modified in the last day.",
+        flags=[Flag(flag="-mtime -1", description="Modified less than a day ago.")],
+        command="find . -type f -mtime -1",
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "responses.log")
+        writer = ResponseCache(path, max_entries=entries)
+        start = time.perf_counter()
+        for i in range(entries):
+            writer.put(f"key {i}", response)
+        fill_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        ResponseCache(path).get("key 0")
+        first_lookup = time.perf_counter() - start
+
+        reader = ResponseCache(path)
+        keys = [f"key {random.randrange(entries)}" for _ in range(lookups)]
+        hits, misses = [], []
+        for key in keys:
+            start = time.perf_counter()
+            reader.get(key)
+            hits.append(time.perf_counter() - start)
+        for i in range(lookups):
+            start = time.perf_counter()
+            reader.get(f"missing {i}")
+            misses.append(time.perf_counter() - start)
+
+        return {
+            "entries": entries,
+            "put_us": round(fill_seconds / entries * 1e6, 1),
+            "first_lookup_us": round(first_lookup * 1e6, 1),
+            "hit_us": percentiles_us(hits),
+            "miss_us": percentiles_us(misses),
+            "log_bytes": os.path.getsize(path),
+            "index_bytes": os.path.getsize(path + ".index"),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=5000)
+    parser.add_argument("--output", "-o", help="Write the results JSON to this file.")
+    args = parser.parse_args()
+
+    text = json.dumps(run(args.entries, args.lookups), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,37 @@
+import time
+
+_IMPORT_START_NS = time.perf_counter_ns()
+
 import argparse
 import os
 import sys
-import pyperclip
 import importlib
-from fml.ai_providers.models import MODELS
-from fml.output_formatter import OutputFormatter
-from fml.ai_service import AIService, AIServiceError
-from fml.schemas import AIContext, SystemInfo
+from typing import List, Optional, TYPE_CHECKING
+from fml.ai_providers.models import AUTO_MODEL, MODELS
+from fml.context_encoding import CONTEXT_ENCODINGS
+from fml.output_formatter import OutputFormatter, StreamingRenderer
 from fml.gather_system_info import get_system_info
+from fml.http_transport import configure_transport, current_transport
+from fml.paths import get_cache_dir
+from fml.profiling import TRACE_FORMATS, get_tracer, span, traced
+
+_IMPORT_END_NS = time.perf_counter_ns()
+
+# Everything below is only needed once a query is actually being answered, so it is
+# imported on that path instead of at startup. Help output and argument errors never
+# load pydantic, the provider SDKs, requests or pyperclip.
+if TYPE_CHECKING:
+    from fml.ai_service import AIService
+    from fml.response_cache import ResponseCache
+    from fml.context_collectors import ContextCollection
+    from fml.history import HistoryStore
+    from fml.model_stats import ModelStatsStore
+    from fml.schemas import AICommandResponse, AIContext, SystemInfo
+    from fml.semantic_cache import SemanticCache
 
 
-def _initialize_ai_service(model_name: str) -> AIService:
+@traced("initialize_ai_service")
+def _initialize_ai_service(model_name: str) -> "AIService":
     """
     Initializes and returns the appropriate AI service based on the model name.
     """
@@ -36,7 +57,8 @@ def _initialize_ai_service(model_name: str) -> AIService:
 
     # Dynamically import the provider module and class
     try:
-        provider_module = importlib.import_module(provider_module_name)
+        with span("import_provider", module=provider_module_name):
+            provider_module = importlib.import_module(provider_module_name)
         service_class = getattr(provider_module, service)
     except (ImportError, AttributeError) as e:
         raise RuntimeError(
@@ -60,7 +82,474 @@ def _initialize_ai_service(model_name: str) -> AIService:
     return selected_ai_service
 
 
+def _gather_system_info() -> "SystemInfo":
+    """
+    Gathers system information, reusing the static facts cached by earlier runs.
+    """
+    return get_system_info(
+        cache_path=os.path.join(get_cache_dir(), "system_info.json"))
+
+
+def _parse_context_names(value: str) -> List[str]:
+    """
+    Parses a comma-separated --context value into optional collector names.
+    """
+    from fml.context_collectors import OPTIONAL_COLLECTORS
+
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in OPTIONAL_COLLECTORS]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown context {', '.join(unknown)!r} (choose from {', '.join(OPTIONAL_COLLECTORS)})"
+        )
+    return names
+
+
+def _start_context_collection(args) -> "ContextCollection":
+    """
+    Starts gathering system information and any --context in the background.
+    """
+    from fml.context_collectors import (
+        OPTIONAL_COLLECTORS,
+        ContextCollection,
+        SystemInfoCollector,
+    )
+
+    collectors = [SystemInfoCollector(_gather_system_info)]
+    collectors.extend(OPTIONAL_COLLECTORS[name]() for name in args.context)
+    return ContextCollection(collectors).start()
+
+
+def _create_response_cache(background_compaction: bool = False) -> "ResponseCache":
+    """
+    Returns the on-disk response cache shared by all fml invocations.
+
+    Long-lived processes (the daemon and the server) compact it in the
+    background; a one-shot run compacts it before exiting.
+    """
+    from fml.response_cache import ResponseCache
+
+    return ResponseCache(os.path.join(get_cache_dir(), "responses.log"),
+                         background_compaction=background_compaction)
+
+
+def _create_semantic_cache(threshold: float) -> "SemanticCache":
+    """
+    Returns the near-duplicate query cache, exiting with an error if numpy is missing.
+    """
+    try:
+        from fml.semantic_cache import SemanticCache
+    except ImportError:
+        print(
+            "Error: The semantic cache requires numpy. "
+            "Install it with: uv tool install 'fml-ai[semantic]'",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    return SemanticCache(os.path.join(get_cache_dir(), "semantic"),
+                         threshold=threshold)
+
+
+def _attach_caches(ai_service: "AIService", args) -> None:
+    """
+    Attaches the response caches selected on the command line to a service.
+    """
+    if args.no_cache:
+        return
+    ai_service.cache = _create_response_cache()
+    if args.semantic_cache:
+        ai_service.semantic_cache = _create_semantic_cache(
+            args.semantic_threshold)
+
+
+def _create_model_stats() -> "ModelStatsStore":
+    """
+    Returns the per-model latency and failure statistics shared by all fml invocations.
+    """
+    from fml.model_stats import ModelStatsStore
+
+    return ModelStatsStore(os.path.join(get_cache_dir(), "model_stats.json"))
+
+
+def _resolve_model(model_name: str) -> str:
+    """
+    Returns the model to use, choosing one from the recorded statistics for --model auto.
+    """
+    if model_name != AUTO_MODEL:
+        return model_name
+
+    from fml.routing import choose_model
+
+    with span("route_model") as current:
+        model_name = choose_model(_create_model_stats(), list(MODELS))
+        if current is not None:
+            current.attributes["model"] = model_name
+    return model_name
+
+
+def _configure_requests(ai_service: "AIService", args) -> None:
+    """
+    Applies the command line options that shape provider requests to a service.
+    """
+    ai_service.context_encoding = args.context_encoding
+    ai_service.model_stats = _create_model_stats()
+    if args.prompt_cache:
+        from fml.prompt_cache import PromptCacheRegistry
+
+        ai_service.prompt_cache = PromptCacheRegistry(
+            os.path.join(get_cache_dir(), "prompt_caches.json"))
+
+
+def _create_history_store() -> "HistoryStore":
+    """
+    Returns the local history of answered queries shared by all fml invocations.
+    """
+    from fml.history import HistoryStore
+
+    return HistoryStore(os.path.join(get_cache_dir(), "history.sqlite3"))
+
+
+def _print_history(text: str, limit: int) -> None:
+    """
+    Prints earlier commands matching text (the most recent ones without text).
+    """
+    import sqlite3
+
+    from fml.history import format_entries
+
+    try:
+        entries = _create_history_store().search(text, limit=limit)
+    except sqlite3.Error as e:
+        print(f"Error: Could not read the history: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(format_entries(entries))
+
+
+def _record_history(args, query: str, response: "AICommandResponse", model: str,
+                    source: str, latency_ms: float,
+                    system_info: Optional["SystemInfo"]) -> None:
+    """
+    Adds an answered query to the history unless --no-history or FML_HISTORY=off.
+    """
+    if args.no_history or os.environ.get("FML_HISTORY", "").lower() == "off":
+        return
+    import sqlite3
+
+    try:
+        _create_history_store().record(query, response, model, source,
+                                       latency_ms=latency_ms,
+                                       system_info=system_info)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Warning: Could not record the query in the history: {e}",
+              file=sys.stderr)
+
+
+def _print_cache_stats() -> None:
+    """
+    Prints entry counts and semantic cache hit-rate statistics.
+    """
+    print(f"Response cache: {len(_create_response_cache())} entries")
+    _print_model_stats()
+    try:
+        from fml.semantic_cache import SemanticCache
+    except ImportError:
+        print("Semantic cache: unavailable (numpy is not installed)")
+        return
+    stats = SemanticCache(os.path.join(get_cache_dir(), "semantic")).stats()
+    print(f"Semantic cache: {stats['entries']} entries, "
+          f"{stats['hits']}/{stats['lookups']} lookups hit "
+          f"(hit rate {stats['hit_rate']:.1%})")
+
+
+def _print_model_stats() -> None:
+    """
+    Prints the recorded latency quantiles and health of every model that has been used.
+    """
+    stats = _create_model_stats()
+    for model in MODELS:
+        if not stats.sample_count(model) and not stats.failure_rate(model):
+            continue
+        p50 = stats.latency_quantile(model, 0.5)
+        p90 = stats.latency_quantile(model, 0.9)
+        latency = (f"p50 {p50:.2f}s, p90 {p90:.2f}s" if p50 is not None
+                   else f"{stats.sample_count(model)} latencies recorded")
+        line = f"Model {model}: {latency}, {stats.failure_rate(model):.1%} failed"
+        open_until = stats.circuit_open_until(model)
+        if open_until:
+            line += f", circuit open for {open_until - time.time():.0f}s"
+        print(line)
+
+
+def _run_daemon(args) -> None:
+    """
+    Runs the fml daemon in the foreground until it has been idle for --daemon-idle-timeout seconds.
+    """
+    from fml.daemon import FmlDaemon, daemon_supported
+
+    if not daemon_supported():
+        print("Error: The fml daemon requires Unix domain socket support.",
+              file=sys.stderr)
+        sys.exit(1)
+
+    def service_factory(model_name: str) -> "AIService":
+        service = _initialize_ai_service(model_name)
+        _configure_requests(service, args)
+        return service
+
+    daemon = FmlDaemon(
+        service_factory=service_factory,
+        idle_timeout=args.daemon_idle_timeout,
+        cache=_create_response_cache(background_compaction=True),
+        semantic_cache=_create_semantic_cache(args.semantic_threshold)
+        if args.semantic_cache else None,
+    )
+    try:
+        daemon.serve()
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def _generate_via_daemon(args, full_query: str,
+                         ai_context: "AIContext") -> Optional["AICommandResponse"]:
+    """
+    Asks a running fml daemon for the answer.
+
+    Returns None when no daemon is reachable so the caller can fall back to
+    in-process execution. With FML_DAEMON=auto a daemon is started in the
+    background for subsequent invocations; FML_DAEMON=off disables the client.
+    """
+    daemon_mode = os.environ.get("FML_DAEMON", "").lower()
+    if args.no_daemon or daemon_mode == "off":
+        return None
+
+    from fml.daemon import DaemonUnavailable, daemon_supported, request_via_daemon, spawn_daemon
+
+    if not daemon_supported():
+        return None
+
+    # Extra --context is only forwarded when it was asked for; otherwise the
+    # system information is all the daemon needs.
+    extra = {"ai_context": ai_context} if args.context else {}
+    try:
+        return request_via_daemon(
+            args.model,
+            full_query,
+            ai_context.system_info,
+            refresh=args.refresh,
+            use_cache=not args.no_cache,
+            **extra,
+        )
+    except DaemonUnavailable:
+        if daemon_mode == "auto":
+            spawn_daemon()
+        return None
+
+
+def _answer_from_local_index(args, full_query: str,
+                             ai_context: "AIContext") -> Optional["AICommandResponse"]:
+    """
+    Looks the query up in the built-in command index.
+
+    Returns None when the index has no confident answer (or is disabled with
+    --no-local-index, FML_LOCAL_INDEX=off or --refresh) so the caller can ask
+    the model. With --offline a weaker match is accepted, since there is no
+    model to fall back to.
+    """
+    from fml.local_index import DEFAULT_CONFIDENCE, OFFLINE_MIN_SCORE, get_default_index
+
+    if not args.offline and (args.no_local_index or args.refresh or
+                             os.environ.get("FML_LOCAL_INDEX", "").lower() == "off"):
+        return None
+
+    os_name = ai_context.system_info.os_name if ai_context.system_info else None
+    try:
+        index = get_default_index()
+    except (OSError, ValueError):
+        # A damaged install must not stop fml from asking the model.
+        return None
+    return index.lookup(
+        full_query,
+        os_name=os_name,
+        min_score=OFFLINE_MIN_SCORE if args.offline else DEFAULT_CONFIDENCE,
+    )
+
+
+def _run_batch(args) -> None:
+    """
+    Answers every query in the --batch input and prints one JSON result per line.
+    """
+    from fml.batch import read_batch_file, run_batch
+    from fml.schemas import AIContext
+
+    try:
+        items = read_batch_file(args.batch)
+    except OSError as e:
+        print(f"Error: Could not read batch input: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    from fml.throttling import RetryPolicy, TokenBucket
+
+    if args.concurrency < 1:
+        print("Error: --concurrency must be at least 1.", file=sys.stderr)
+        sys.exit(1)
+    if args.pack < 1:
+        print("Error: --pack must be at least 1.", file=sys.stderr)
+        sys.exit(1)
+
+    def service_factory(model_name: str) -> "AIService":
+        service = _initialize_ai_service(_resolve_model(model_name))
+        _attach_caches(service, args)
+        _configure_requests(service, args)
+        service.retry_policy = RetryPolicy()
+        if args.rpm:
+            # Provider quotas are per model, so each service gets its own bucket.
+            service.rate_limiter = TokenBucket.per_minute(args.rpm)
+        return service
+
+    summary = run_batch(
+        items,
+        service_factory,
+        _start_context_collection(args).context(),
+        default_model=_resolve_model(args.model),
+        output=sys.stdout,
+        refresh=args.refresh,
+        max_concurrency=args.concurrency,
+        pack_size=args.pack,
+    )
+    print(
+        f"Batch finished: {summary.succeeded}/{summary.total} succeeded, "
+        f"{summary.failed} failed in {summary.elapsed_seconds:.2f}s",
+        file=sys.stderr,
+    )
+    if args.usage:
+        print(f"Tokens: {summary.usage.format()}", file=sys.stderr)
+    if summary.failed:
+        sys.exit(1)
+
+
+def _is_serve_command(argv: List[str]) -> bool:
+    """
+    Returns True for `fml serve [options]`.
+
+    Only a bare `serve`, optionally followed by options, starts the server, so
+    queries such as `fml serve a directory over http` are still answered.
+    """
+    return bool(argv) and argv[0] == "serve" and (len(argv) == 1 or argv[1].startswith("-"))
+
+
+def _run_server(argv: List[str]) -> None:
+    """
+    Runs `fml serve`: an HTTP/JSON endpoint answering queries for a whole team.
+    """
+    from fml.server import DEFAULT_HOST, DEFAULT_PORT, DEFAULT_QUEUE_SIZE, DEFAULT_WORKERS
+
+    parser = argparse.ArgumentParser(
+        prog="fml serve",
+        description="Answer fml queries over HTTP: POST /v1/generate, GET /metrics, GET /healthz.",
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help=f"Address to listen on (default: {DEFAULT_HOST}).")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help=f"Port to listen on (default: {DEFAULT_PORT}).")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, metavar="N",
+                        help=f"Queries answered at once (default: {DEFAULT_WORKERS}).")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, metavar="N",
+                        help="Queries that may wait for a worker before new ones are refused "
+                        f"with 429 (default: {DEFAULT_QUEUE_SIZE}).")
+    parser.add_argument("-m", "--model", default=list(MODELS.keys())[0],
+                        help="The model used for requests that do not name one.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Do not read from or write to the local response cache.")
+    parser.add_argument("--semantic-cache", action="store_true",
+                        help="Also reuse answers to similar earlier queries (requires numpy).")
+    parser.add_argument("--semantic-threshold", type=float, default=0.9, metavar="SIMILARITY",
+                        help="Minimum cosine similarity (0-1) for a --semantic-cache hit "
+                        "(default: 0.9).")
+    parser.add_argument("--rpm", type=float, metavar="N",
+                        help="Limit requests to N per minute per model, matching your "
+                        "provider quota.")
+    _add_request_options(parser)
+    args = parser.parse_args(argv)
+
+    try:
+        configure_transport(args.http_pool_size, args.http_idle_timeout)
+    except ValueError as e:
+        parser.error(str(e))
+
+    from fml.server import FmlServer, run_server
+    from fml.throttling import RetryPolicy, TokenBucket
+
+    def service_factory(model_name: str) -> "AIService":
+        service = _initialize_ai_service(model_name)
+        _configure_requests(service, args)
+        service.retry_policy = RetryPolicy()
+        if args.rpm:
+            service.rate_limiter = TokenBucket.per_minute(args.rpm)
+        return service
+
+    try:
+        server = FmlServer(
+            service_factory,
+            default_model=args.model,
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            queue_size=args.queue_size,
+            cache=None if args.no_cache else _create_response_cache(background_compaction=True),
+            semantic_cache=_create_semantic_cache(args.semantic_threshold)
+            if args.semantic_cache else None,
+            model_resolver=_resolve_model,
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    except OSError as e:
+        print(f"Error: Could not listen on {args.host}:{args.port}: {e}", file=sys.stderr)
+        sys.exit(1)
+    run_server(server)
+
+
+def _add_request_options(parser: argparse.ArgumentParser) -> None:
+    """
+    Adds the options that shape provider requests (see _configure_requests).
+    """
+    parser.add_argument(
+        "--context-encoding",
+        choices=CONTEXT_ENCODINGS,
+        default=os.environ.get("FML_CONTEXT_ENCODING", "pretty"),
+        help="How system and --context information is written into the prompt: pretty "
+        "JSON, minified JSON or key=value pairs; the compact forms use fewer input "
+        "tokens (default: $FML_CONTEXT_ENCODING or pretty).",
+    )
+    parser.add_argument(
+        "--prompt-cache",
+        action="store_true",
+        default=os.environ.get("FML_PROMPT_CACHE", "").lower() == "on",
+        help="Store the system prompt with the provider's context caching and reuse it "
+        "across runs, where the model supports it (default: on if $FML_PROMPT_CACHE=on).",
+    )
+    parser.add_argument(
+        "--http-pool-size",
+        type=int,
+        metavar="N",
+        help="Maximum number of HTTP connections kept open to the model provider "
+        "(default: $FML_HTTP_POOL_SIZE or 10).",
+    )
+    parser.add_argument(
+        "--http-idle-timeout",
+        type=float,
+        metavar="SECONDS",
+        help="Close pooled HTTP connections after they have been idle this long "
+        "(default: $FML_HTTP_IDLE_TIMEOUT or 60).",
+    )
+
+
 def main():
+    if _is_serve_command(sys.argv[1:]):
+        _run_server(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(
         description="AI-Powered CLI Command Helper",
         epilog=
@@ -71,13 +560,166 @@ def main():
         "--model",
         default=list(MODELS.keys())
         [0],  # Use the first model in the MODELS dictionary as default
-        help="Specify the AI model to use (e.g., 'gemini-1.5-flash').",
+        help="Specify the AI model to use (e.g., 'gemini-1.5-flash'), or 'auto' to pick "
+        "the fastest model that is currently healthy, based on earlier requests.",
     )
     parser.add_argument(
         "--no-color",
         action="store_true",
         help="Disable colored output in the terminal.",
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not read from or write to the local response cache.",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Ignore any cached response and store the fresh one.",
+    )
+    parser.add_argument(
+        "--semantic-cache",
+        action="store_true",
+        help="Also reuse answers to similar earlier queries (requires numpy).",
+    )
+    parser.add_argument(
+        "--semantic-threshold",
+        type=float,
+        default=0.9,
+        metavar="SIMILARITY",
+        help="Minimum cosine similarity (0-1) for a --semantic-cache hit (default: 0.9).",
+    )
+    parser.add_argument(
+        "--cache-stats",
+        action="store_true",
+        help="Print response cache statistics and exit.",
+    )
+    parser.add_argument(
+        "--history",
+        nargs="?",
+        const="",
+        metavar="TEXT",
+        help="Print earlier commands whose query, explanation or command match TEXT "
+        "(the most recent ones without TEXT) and exit, without calling the model.",
+    )
+    parser.add_argument(
+        "--history-limit",
+        type=int,
+        default=10,
+        metavar="N",
+        help="Maximum number of commands printed by --history (default: 10).",
+    )
+    parser.add_argument(
+        "--no-history",
+        action="store_true",
+        help="Do not record this query and its answer in the local history "
+        "(or set FML_HISTORY=off).",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream the explanation and flags to the terminal as the model generates them.",
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help="Answer one query per line of FILE ('-' for stdin; JSON lines may set "
+        "'query', 'id', 'model' and 'refresh') and print one JSON result per line.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        metavar="N",
+        help="Maximum number of --batch queries sent to the model at once (default: 4).",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=float,
+        metavar="N",
+        help="Limit --batch requests to N per minute per model, matching your provider quota.",
+    )
+    parser.add_argument(
+        "--pack",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Answer up to N --batch queries for the same model with one model request "
+        "(default: 1, one request per query).",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Run the fml daemon in the foreground, keeping AI services warm for other invocations.",
+    )
+    parser.add_argument(
+        "--daemon-idle-timeout",
+        type=float,
+        default=15 * 60,
+        metavar="SECONDS",
+        help="Shut the daemon down after this many idle seconds (default: 900).",
+    )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Always answer in this process, even if an fml daemon is running.",
+    )
+    parser.add_argument(
+        "--context",
+        type=_parse_context_names,
+        default=os.environ.get("FML_CONTEXT", ""),
+        metavar="git,files",
+        help="Also send the current git status and/or the names of the files in the "
+        "current directory to the model (default: $FML_CONTEXT).",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Answer only from the built-in index of common commands and never contact the model.",
+    )
+    parser.add_argument(
+        "--no-local-index",
+        action="store_true",
+        help="Always ask the model, even if the built-in command index has a confident answer.",
+    )
+    parser.add_argument(
+        "--hedge",
+        metavar="MODEL",
+        help="If --model has not answered within its usual latency (see --hedge-quantile), "
+        "also ask MODEL and use whichever valid answer arrives first.",
+    )
+    parser.add_argument(
+        "--hedge-quantile",
+        type=float,
+        default=0.9,
+        metavar="Q",
+        help="Latency quantile (0-1) of --model after which --hedge sends the second "
+        "request (default: 0.9).",
+    )
+    _add_request_options(parser)
+    parser.add_argument(
+        "--usage",
+        action="store_true",
+        help="Print the input, cached and output tokens used by the model request.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print how long each phase (imports, context, model call, output, clipboard) took.",
+    )
+    parser.add_argument(
+        "--trace-file",
+        metavar="PATH",
+        help="Write the timing spans of this run to PATH for offline analysis.",
+    )
+    parser.add_argument(
+        "--trace-format",
+        choices=TRACE_FORMATS,
+        default="chrome",
+        help="Format of --trace-file: Chrome trace events (chrome://tracing, Perfetto) "
+        "or OpenTelemetry OTLP/JSON (default: chrome).",
+    )
     parser.add_argument(
         "query",
         nargs=argparse.REMAINDER,
@@ -86,40 +728,188 @@ def main():
 
     args = parser.parse_args()
 
+    if not (args.profile or args.trace_file):
+        _run(args, parser)
+        return
+
+    tracer = get_tracer()
+    tracer.enable()
+    tracer.add_span("import fml.__main__", _IMPORT_START_NS, _IMPORT_END_NS)
+    try:
+        with span("main"):
+            _run(args, parser)
+    finally:
+        _report_profile(args)
+
+
+def _report_profile(args) -> None:
+    """
+    Prints the --profile breakdown and writes the --trace-file, if requested.
+    """
+    tracer = get_tracer()
+    if args.profile:
+        print(tracer.format_summary(), file=sys.stderr)
+        transport = current_transport()
+        if transport is not None and transport.stats().requests:
+            print(f"HTTP: {transport.stats().format()}", file=sys.stderr)
+    if args.trace_file:
+        try:
+            tracer.write_trace(args.trace_file, args.trace_format)
+        except OSError as e:
+            print(f"Warning: Could not write trace file: {e}", file=sys.stderr)
+
+
+def _run(args, parser: argparse.ArgumentParser) -> None:
+    """
+    Runs the mode selected on the command line.
+    """
+    if args.cache_stats:
+        _print_cache_stats()
+        return
+
+    if args.history is not None:
+        if args.history_limit < 1:
+            parser.error("--history-limit must be at least 1")
+        _print_history(" ".join([args.history, *args.query]), args.history_limit)
+        return
+
+    # Every provider service created below takes its connections from this pool.
+    try:
+        configure_transport(args.http_pool_size, args.http_idle_timeout)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.daemon:
+        _run_daemon(args)
+        return
+
+    if args.batch:
+        if args.query:
+            parser.error("a query cannot be combined with --batch")
+        _run_batch(args)
+        return
+
     # If no query arguments are provided, print help and exit.
     # argparse handles -h/--help automatically when nargs=REMAINDER is used.
     if not args.query:
         parser.print_help()
         sys.exit(0)  # Exit with 0 for successful help display
 
+    if args.hedge and args.stream:
+        parser.error("--hedge cannot be combined with --stream")
+
+    args.model = _resolve_model(args.model)
+
+    with span("import fml.ai_service"):
+        from fml.ai_service import AIServiceError
+        from fml.schemas import AIContext
+
     # Join the list of query parts into a single string
     full_query = " ".join(args.query)
 
-    # Gather system information
-    system_info = get_system_info()
-    ai_context = AIContext(system_info=system_info)
+    # Gather context in the background while the request is being prepared.
+    # The local index and the cache key only depend on the system information.
+    collection = _start_context_collection(args)
+    with span("system_info"):
+        base_context = AIContext(system_info=collection.wait_for("system_info"))
+
+    # Streaming output is rendered in-process as the model generates it; the
+    # daemon only returns complete responses.
+    renderer = None
+    usage = None
+    generate_kwargs = {"refresh": args.refresh}
+    if args.stream:
+        renderer = StreamingRenderer(enable_color=not args.no_color)
+        generate_kwargs["on_partial"] = renderer.update
 
-    # Initialize AI service and generate command
+    # Common commands are answered from the local index; otherwise prefer a
+    # running daemon, falling back to initializing the AI service in-process
+    started = time.perf_counter()
+    answered_by = args.model
+    source = "index"
     try:
-        ai_service = _initialize_ai_service(args.model)
-        ai_command_response = ai_service.generate_command(
-            full_query, ai_context)
+        with span("local_index"):
+            ai_command_response = _answer_from_local_index(
+                args, full_query, base_context)
+        if ai_command_response is None and args.offline:
+            raise ValueError(
+                "No offline answer found for this query. Run it again without --offline to ask the model."
+            )
+        # Hedged requests need two in-process services, so they skip the daemon.
+        if ai_command_response is None and renderer is None and not args.hedge:
+            source = "daemon"
+            with span("daemon"):
+                ai_command_response = _generate_via_daemon(
+                    args, full_query, collection.context())
+        if ai_command_response is None:
+            ai_service = _initialize_ai_service(args.model)
+            _attach_caches(ai_service, args)
+            _configure_requests(ai_service, args)
+            if not collection.done():
+                # Load the provider SDK while the remaining collectors finish.
+                with span("prepare"):
+                    ai_service.prepare(full_query, base_context,
+                                       refresh=args.refresh)
+            with span("context"):
+                ai_context = collection.context()
+            if args.hedge:
+                from fml.hedging import generate_hedged
+
+                hedge_service = _initialize_ai_service(args.hedge)
+                _attach_caches(hedge_service, args)
+                _configure_requests(hedge_service, args)
+                result = generate_hedged(ai_service, hedge_service, full_query,
+                                         ai_context, quantile=args.hedge_quantile,
+                                         refresh=args.refresh)
+                ai_command_response = result.response
+                answered_by = result.model
+                answering_service = (ai_service if result.model == args.model
+                                     else hedge_service)
+            else:
+                ai_command_response = ai_service.generate_command(
+                    full_query, ai_context, **generate_kwargs)
+                answering_service = ai_service
+            usage = answering_service.last_usage
+            source = "cache" if answering_service.last_cache_hit else "model"
     except (AIServiceError, ValueError) as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
+    latency_ms = (time.perf_counter() - started) * 1000
 
     # Format and display response
-    formatter = OutputFormatter()
-    formatted_output = formatter.format_response(
-        ai_command_response, enable_color=not args.no_color)
-    print(formatted_output)
+    if renderer is not None:
+        renderer.finish(ai_command_response)
+    else:
+        formatter = OutputFormatter()
+        formatted_output = formatter.format_response(
+            ai_command_response, enable_color=not args.no_color)
+        print(formatted_output)
 
-    # Copy command to clipboard
-    try:
-        pyperclip.copy(ai_command_response.command)
-        print("(command copied to clipboard)")
-    except pyperclip.PyperclipException as e:
-        print(f"Warning: Could not copy to clipboard: {e}", file=sys.stderr)
+    # Copy command to clipboard. Backends hand the text over without waiting for
+    # slow helpers, so fml exits as soon as the output is printed.
+    with span("clipboard") as current:
+        from fml.clipboard import ClipboardError, get_clipboard
+
+        clipboard = get_clipboard()
+        if current is not None:
+            current.attributes["backend"] = clipboard.name
+        try:
+            clipboard.copy(ai_command_response.command)
+            if clipboard.confirms_copy:
+                print("(command copied to clipboard)")
+            else:
+                print("(command sent to the terminal clipboard)")
+        except ClipboardError as e:
+            print(f"Warning: Could not copy to clipboard: {e}", file=sys.stderr)
+
+    with span("history"):
+        _record_history(args, full_query, ai_command_response, answered_by,
+                        source, latency_ms, base_context.system_info)
+
+    if args.usage:
+        print(f"Tokens: {usage.format()}" if usage is not None else
+              "Tokens: none used by this process (answered from a cache, the "
+              "local index or the daemon)", file=sys.stderr)
 
 
 if __name__ == "__main__":
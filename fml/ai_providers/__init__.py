@@ -1 +1,8 @@
-from .gemini_service import GeminiService
+# Provider implementations are imported lazily so that importing the package (for
+# example to read the MODELS registry) does not pull in any provider SDK.
+def __getattr__(name):
+    if name == "GeminiService":
+        from .gemini_service import GeminiService
+
+        return GeminiService
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,43 +1,420 @@
 import os
-from fml.ai_service import AIService, AIServiceError
-from fml.schemas import AICommandResponse, AIContext
-from google import genai
-from google.genai.errors import APIError
-from google.genai.types import GenerateContentResponse
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, List, Optional, Tuple
+
+from fml.ai_service import (
+    ERROR_CATEGORY_API,
+    PACKED_QUERIES_PROMPT,
+    AIService,
+    AIServiceError,
+    PartialResponseCallback,
+    TokenUsage,
+    pack_queries,
+    parse_packed_response,
+    parse_partial_response,
+)
+from fml.context_encoding import encode_context
+from fml.http_transport import HttpTransport, get_transport
+from fml.profiling import span
+from fml.prompt_cache import PromptCacheEntry, UNSUPPORTED_RETRY_SECONDS, prompt_cache_key
+from fml.schemas import (
+    RESPONSE_SCHEMA_VERSION,
+    AICommandResponse,
+    AIContext,
+    packed_response_json_schema,
+    response_json_schema,
+)
+
+
+def _api_error(error) -> AIServiceError:
+    """Maps a google.genai APIError to a categorized AIServiceError."""
+    status_code = error.code if isinstance(error.code, int) else None
+    return AIServiceError(
+        f"API Error: {error.message} (Code: {error.code})",
+        category=ERROR_CATEGORY_API,
+        status_code=status_code,
+    )
+
+
+# Explicit caching is refused for system instructions shorter than this
+# (estimated at four characters per token); they are sent inline instead.
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_TTL_SECONDS = 60 * 60
+# Cached instructions are not referenced this close to their expiry.
+_PROMPT_CACHE_EXPIRY_MARGIN_SECONDS = 60
+# Errors returned when a referenced cached instruction is gone (e.g. deleted
+# or expired early); the request is then repeated with the instruction inline.
+_PROMPT_CACHE_MISS_CODES = (400, 403, 404)
+
+
+@lru_cache(maxsize=16)
+def _generate_content_config(
+    system_instruction: str,
+    schema_version: int,
+    cached_content: Optional[str] = None,
+    packed: bool = False,
+):
+    """
+    Returns the GenerateContentConfig shared by every request with this system prompt.
+
+    The config is reused across requests, services and threads. The SDK copies it
+    before converting it to a request body, so it must never be mutated. With
+    `cached_content`, the system instruction is referenced from that server-side
+    cache instead of being sent. Packed requests ask for a list of responses
+    tagged with query ids.
+    """
+    from google import genai
+
+    schema = packed_response_json_schema if packed else response_json_schema
+    return genai.types.GenerateContentConfig(
+        system_instruction=None if cached_content else system_instruction,
+        cached_content=cached_content,
+        response_mime_type="application/json",
+        response_schema=schema(schema_version),
+    )
+
+
+def _token_usage(usage_metadata) -> Optional[TokenUsage]:
+    """Converts the usage metadata of a response into TokenUsage."""
+    if usage_metadata is None:
+        return None
+    # Thinking models bill their thoughts as output tokens.
+    output_tokens = (usage_metadata.candidates_token_count or 0) + (
+        usage_metadata.thoughts_token_count or 0
+    )
+    return TokenUsage(
+        prompt_tokens=usage_metadata.prompt_token_count or 0,
+        cached_tokens=usage_metadata.cached_content_token_count or 0,
+        output_tokens=output_tokens,
+        total_tokens=usage_metadata.total_token_count or 0,
+    )
 
 
 class GeminiService(AIService):
     """
     Concrete implementation of AIService for Google Gemini.
+
+    The google-genai SDK is only imported when the first request is made, so
+    constructing the service (e.g. for a cache hit) stays cheap. With a
+    `prompt_cache` registry attached, the system instruction is stored with
+    Gemini's context caching and referenced by name instead of being sent with
+    every request, falling back to sending it inline whenever the cache is
+    unavailable. Several queries sharing a context can be answered by one
+    packed request (see AIService.generate_packed). HTTP connections come from `http_transport` (by default the
+    process-wide pool), so services in the same process share keep-alive
+    connections.
     """
 
-    def __init__(self, api_key: str, system_instruction_content: str, model: str):
-        self.client = genai.Client(api_key=api_key)
+    supports_packing = True
+
+    def __init__(
+        self,
+        api_key: str,
+        system_instruction_content: str,
+        model: str,
+        base_url: Optional[str] = None,
+        http_transport: Optional[HttpTransport] = None,
+    ):
+        super().__init__(api_key, system_instruction_content, model)
         self.model_name = model
         self.system_instruction = system_instruction_content
+        # Lets benchmarks and tests point the SDK at a local stand-in for the API.
+        self.base_url = base_url or os.environ.get("FML_GEMINI_BASE_URL") or None
+        self.http_transport = http_transport
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._prompt_cache_entry: Optional[PromptCacheEntry] = None
+        self._prompt_cache_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """The genai.Client used for requests, created on first access."""
+        if self._client is None:
+            # Concurrent first requests (batch mode, the daemon) must share one
+            # client: a discarded genai.Client closes its HTTP connections when
+            # it is garbage collected, failing the request still using it.
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    def _create_client(self):
+        with span("import google.genai"):
+            from google import genai
+
+        with span("gemini.create_client"):
+            transport = self.http_transport or get_transport()
+            return genai.Client(
+                api_key=self.api_key,
+                http_options=_http_options(genai.types.HttpOptions, self.base_url, transport),
+            )
+
+    def _prepare_client(self) -> None:
+        # Accessing the property imports google.genai and creates the client.
+        _ = self.client
+
+    def _build_request(
+        self, query: str, ai_context: AIContext, use_prompt_cache: bool = True
+    ) -> dict:
+        """Builds the keyword arguments shared by the blocking and streaming calls."""
+        with span("gemini.build_request"):
+            return self._build_request_kwargs([query], ai_context, use_prompt_cache)
+
+    def _build_packed_request(
+        self, packed_queries: str, ai_context: AIContext, use_prompt_cache: bool = True
+    ) -> dict:
+        """Builds the keyword arguments of a packed request for the queries listed by pack_queries."""
+        with span("gemini.build_request", packed=True):
+            return self._build_request_kwargs(
+                [PACKED_QUERIES_PROMPT, packed_queries], ai_context, use_prompt_cache, packed=True
+            )
+
+    def _build_request_kwargs(
+        self,
+        query_parts: List[str],
+        ai_context: AIContext,
+        use_prompt_cache: bool,
+        packed: bool = False,
+    ) -> dict:
+        contents_parts = list(query_parts)
+        contents_parts.extend(encode_context(ai_context, self.context_encoding))
+
+        cached_content = self._cached_instruction_name() if use_prompt_cache else None
+        return dict(
+            model=self.model_name,
+            contents=contents_parts,
+            config=_generate_content_config(
+                self.system_instruction, RESPONSE_SCHEMA_VERSION, cached_content, packed
+            ),
+        )
+
+    def _cached_instruction_name(self) -> Optional[str]:
+        """
+        Returns the name of the server-side cache holding the system instruction.
+
+        The cache is created on first use and shared through the prompt_cache
+        registry. Returns None when no registry is attached or the instruction
+        cannot be cached, in which case it is sent inline.
+        """
+        if self.prompt_cache is None:
+            return None
+        now = time.time()
+        entry = self._prompt_cache_entry
+        if entry is None or entry.expires_at <= now:
+            with self._prompt_cache_lock:
+                entry = self._prompt_cache_entry
+                if entry is None or entry.expires_at <= now:
+                    key = prompt_cache_key(self.model_name, self.system_instruction)
+                    entry = self.prompt_cache.get(key)
+                    if entry is None:
+                        entry = self._create_prompt_cache()
+                        if entry is not None:
+                            self.prompt_cache.put(key, entry.name, entry.expires_at)
+                    self._prompt_cache_entry = entry
+        return entry.name if entry is not None else None
+
+    def _create_prompt_cache(self) -> Optional[PromptCacheEntry]:
+        """
+        Stores the system instruction with Gemini's context caching.
+
+        Returns:
+            The new cache, an entry with no name if Gemini refuses to cache the
+            instruction, or None if the attempt should be repeated later.
+        """
+        if len(self.system_instruction) // 4 < PROMPT_CACHE_MIN_TOKENS:
+            return PromptCacheEntry(name=None, expires_at=time.time() + UNSUPPORTED_RETRY_SECONDS)
+
+        from google import genai
+        from google.genai.errors import APIError
+
+        try:
+            with span("gemini.create_prompt_cache"):
+                cached = self.client.caches.create(
+                    model=self.model_name,
+                    config=genai.types.CreateCachedContentConfig(
+                        system_instruction=self.system_instruction,
+                        ttl=f"{PROMPT_CACHE_TTL_SECONDS}s",
+                        display_name="fml system instruction",
+                    ),
+                )
+        except APIError as e:
+            if isinstance(e.code, int) and 400 <= e.code < 500 and e.code != 429:
+                # The model does not support caching this instruction.
+                return PromptCacheEntry(name=None, expires_at=time.time() + UNSUPPORTED_RETRY_SECONDS)
+            return None
+
+        expires_at = (
+            cached.expire_time.timestamp()
+            if cached.expire_time
+            else time.time() + PROMPT_CACHE_TTL_SECONDS
+        )
+        return PromptCacheEntry(
+            name=cached.name, expires_at=expires_at - _PROMPT_CACHE_EXPIRY_MARGIN_SECONDS
+        )
+
+    def _forget_prompt_cache(self) -> None:
+        with self._prompt_cache_lock:
+            self._prompt_cache_entry = None
+            if self.prompt_cache is not None:
+                self.prompt_cache.discard(
+                    prompt_cache_key(self.model_name, self.system_instruction)
+                )
+
+    def _is_prompt_cache_miss(self, request: dict, error) -> bool:
+        return (
+            request["config"].cached_content is not None
+            and error.code in _PROMPT_CACHE_MISS_CODES
+        )
+
+    def _send(self, build: Callable[[bool], dict], send: Callable[[dict], object]):
+        """
+        Builds the request and passes it to `send`, repeating it with the system
+        instruction inline if its server-side cache turns out to be gone.
+
+        Args:
+            build: Builds the request; receives whether the prompt cache may be used.
+            send: Sends a request and returns its result.
+        """
+        from google.genai.errors import APIError
+
+        request = build(True)
+        try:
+            return send(request)
+        except APIError as e:
+            if not self._is_prompt_cache_miss(request, e):
+                raise
+        self._forget_prompt_cache()
+        return send(build(False))
+
+    def _request_builder(self, query: str, ai_context: AIContext) -> Callable[[bool], dict]:
+        return lambda use_prompt_cache: self._build_request(query, ai_context, use_prompt_cache)
 
     def _generate_command_internal(
         self, query: str, ai_context: AIContext
     ) -> AICommandResponse:
-        contents_parts = [query]
+        with span("import google.genai"):
+            from google.genai.errors import APIError
+            from google.genai.types import GenerateContentResponse
 
-        if ai_context.system_info:
-            system_info_json = ai_context.system_info.model_dump_json(indent=2)
-            contents_parts.append(
-                f"\n\nUser's System Information:\n```json\n{system_info_json}\n```"
-            )
+        def send(request: dict) -> GenerateContentResponse:
+            with span("gemini.generate_content"):
+                return client.models.generate_content(**request)
 
         try:
-            response: GenerateContentResponse = self.client.models.generate_content(
-                model=self.model_name,
-                contents=contents_parts,
-                config=genai.types.GenerateContentConfig(
-                    system_instruction=self.system_instruction,
-                    response_mime_type="application/json",
-                    response_schema=AICommandResponse.model_json_schema(),
-                ),
-            )
-            # Parse the JSON string into the Pydantic model
+            client = self.client
+            response = self._send(self._request_builder(query, ai_context), send)
+        except APIError as e:
+            raise _api_error(e) from e
+
+        usage = _token_usage(getattr(response, "usage_metadata", None))
+        if usage is not None:
+            self._record_usage(usage)
+        # Parse the JSON string into the Pydantic model
+        with span("validate_response"):
             return AICommandResponse.model_validate_json(response.text)
+
+    def _generate_packed_internal(
+        self, queries: List[str], ai_context: AIContext
+    ) -> List[Optional[AICommandResponse]]:
+        with span("import google.genai"):
+            from google.genai.errors import APIError
+
+        ids, packed_queries = pack_queries(queries)
+
+        def build(use_prompt_cache: bool) -> dict:
+            return self._build_packed_request(packed_queries, ai_context, use_prompt_cache)
+
+        def send(request: dict):
+            with span("gemini.generate_content"):
+                return client.models.generate_content(**request)
+
+        try:
+            client = self.client
+            response = self._send(build, send)
+        except APIError as e:
+            raise _api_error(e) from e
+
+        usage = _token_usage(getattr(response, "usage_metadata", None))
+        if usage is not None:
+            self._record_usage(usage)
+        with span("validate_response"):
+            return parse_packed_response(response.text or "", ids)
+
+    async def _agenerate_command_internal(
+        self, query: str, ai_context: AIContext
+    ) -> AICommandResponse:
+        with span("import google.genai"):
+            from google.genai.errors import APIError
+
+        try:
+            request = self._build_request(query, ai_context)
+            try:
+                response = await self.client.aio.models.generate_content(**request)
+            except APIError as e:
+                if not self._is_prompt_cache_miss(request, e):
+                    raise
+                self._forget_prompt_cache()
+                response = await self.client.aio.models.generate_content(
+                    **self._build_request(query, ai_context, use_prompt_cache=False)
+                )
+        except APIError as e:
+            raise _api_error(e) from e
+
+        usage = _token_usage(getattr(response, "usage_metadata", None))
+        if usage is not None:
+            self._record_usage(usage)
+        return AICommandResponse.model_validate_json(response.text)
+
+    def _stream_command_internal(
+        self,
+        query: str,
+        ai_context: AIContext,
+        on_partial: PartialResponseCallback,
+    ) -> AICommandResponse:
+        with span("import google.genai"):
+            from google.genai.errors import APIError
+
+        def send(request: dict) -> Tuple[str, Optional[TokenUsage]]:
+            received_text = ""
+            usage = None
+            for chunk in client.models.generate_content_stream(**request):
+                # Usage is reported with the final chunk.
+                usage = _token_usage(getattr(chunk, "usage_metadata", None)) or usage
+                if not chunk.text:
+                    continue
+                received_text += chunk.text
+                partial = parse_partial_response(received_text)
+                if partial:
+                    on_partial(partial)
+            return received_text, usage
+
+        try:
+            client = self.client
+            received_text, usage = self._send(self._request_builder(query, ai_context), send)
         except APIError as e:
-            raise AIServiceError(f"API Error: {e.message} (Code: {e.code})") from e
+            raise _api_error(e) from e
+
+        if usage is not None:
+            self._record_usage(usage)
+
+        with span("validate_response"):
+            return AICommandResponse.model_validate_json(received_text)
+
+
+def _http_options(options_type, base_url: Optional[str], transport: HttpTransport):
+    """
+    Builds the client's HttpOptions, sharing the transport's pooled httpx clients.
+
+    google-genai releases before the httpx_client/httpx_async_client fields reject
+    them as unknown, so those releases keep their own connections instead.
+    """
+    fields = getattr(options_type, "model_fields", {})
+    if "httpx_client" not in fields or "httpx_async_client" not in fields:
+        return options_type(base_url=base_url)
+    return options_type(
+        base_url=base_url,
+        httpx_client=transport.client(),
+        httpx_async_client=transport.async_client(),
+    )
@@ -1,7 +1,10 @@
-from pydantic import BaseModel
+from dataclasses import dataclass
 
 
-class ModelProviderDetails(BaseModel):
+# A plain dataclass rather than a pydantic model keeps the registry cheap to import,
+# since the CLI needs it to build its --help output.
+@dataclass(frozen=True)
+class ModelProviderDetails:
     provider: str
     service: str
     env_var: str
@@ -9,6 +12,10 @@ class ModelProviderDetails(BaseModel):
     prompt_variable: str
 
 
+# Passed as --model to let fml pick a model from its recorded latencies and
+# failures (see fml.routing).
+AUTO_MODEL = "auto"
+
 MODELS = {
     # first item is default model
     "gemini-2.5-flash-preview-05-20":
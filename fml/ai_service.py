@@ -1,14 +1,241 @@
+import asyncio
+import hashlib
+import json
+import sys
+import threading
+import time
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Awaitable, Callable, List, Optional, Tuple, TypeVar
 from pydantic import ValidationError
-from requests.exceptions import ConnectionError
+from pydantic_core import from_json
+from fml.context_encoding import CONTEXT_ENCODING_PRETTY
 from fml.schemas import AICommandResponse, AIContext
+from fml.response_cache import ResponseCache, make_cache_key
+from fml.profiling import span
+from fml.singleflight import SingleFlight
+from fml.throttling import RetryPolicy, TokenBucket
+
+if TYPE_CHECKING:
+    from fml.model_stats import ModelStatsStore
+    from fml.prompt_cache import PromptCacheRegistry
+    # Optional: requires numpy, so only imported by callers that enable it.
+    from fml.semantic_cache import SemanticCache
+
+# Categories attached to AIServiceError so callers can tell failures apart.
+ERROR_CATEGORY_API = "api"
+ERROR_CATEGORY_NETWORK = "network"
+ERROR_CATEGORY_FORMAT = "format"
+ERROR_CATEGORY_UNEXPECTED = "unexpected"
 
 
 class AIServiceError(Exception):
     """Custom exception for AI service-related errors."""
 
-    pass
+    def __init__(
+        self,
+        message: str,
+        category: str = ERROR_CATEGORY_UNEXPECTED,
+        status_code: Optional[int] = None,
+    ):
+        super().__init__(message)
+        self.category = category
+        self.status_code = status_code
+
+    @property
+    def retryable(self) -> bool:
+        """True for rate limiting, server-side errors and network failures."""
+        if self.category == ERROR_CATEGORY_NETWORK:
+            return True
+        return self.status_code is not None and (
+            self.status_code == 429 or self.status_code >= 500
+        )
+
+
+@dataclass
+class CommandResult:
+    """The outcome of one query in AIService.generate_commands."""
+
+    query: str
+    response: Optional[AICommandResponse] = None
+    error: Optional[AIServiceError] = None
+    latency_seconds: float = 0.0
+    # The tokens spent on the query, if it was answered by the provider. A
+    # packed request's usage is divided between the queries it answered.
+    usage: Optional["TokenUsage"] = None
+
+
+@dataclass(frozen=True)
+class TokenUsage:
+    """Token counts reported by a provider for one request, or summed over several."""
+
+    prompt_tokens: int = 0
+    # The part of prompt_tokens served from a provider-side cache.
+    cached_tokens: int = 0
+    output_tokens: int = 0
+    total_tokens: int = 0
+
+    def __add__(self, other: "TokenUsage") -> "TokenUsage":
+        return TokenUsage(
+            prompt_tokens=self.prompt_tokens + other.prompt_tokens,
+            cached_tokens=self.cached_tokens + other.cached_tokens,
+            output_tokens=self.output_tokens + other.output_tokens,
+            total_tokens=self.total_tokens + other.total_tokens,
+        )
+
+    def split(self, parts: int) -> List["TokenUsage"]:
+        """
+        Divides the counts into `parts` nearly equal shares that add up to them.
+
+        Used to attribute the usage of a packed request to the queries it answered.
+        """
+        if parts < 1:
+            raise ValueError("parts must be at least 1.")
+
+        def shares(total: int) -> List[int]:
+            quotient, remainder = divmod(total, parts)
+            return [quotient + (1 if i < remainder else 0) for i in range(parts)]
+
+        return [
+            TokenUsage(*counts)
+            for counts in zip(
+                shares(self.prompt_tokens),
+                shares(self.cached_tokens),
+                shares(self.output_tokens),
+                shares(self.total_tokens),
+            )
+        ]
+
+    def format(self) -> str:
+        """Returns a one-line human-readable summary."""
+        return (
+            f"{self.prompt_tokens} input ({self.cached_tokens} cached), "
+            f"{self.output_tokens} output, {self.total_tokens} total"
+        )
+
+
+def _network_error_types() -> tuple:
+    """
+    Returns the exception types that indicate a network failure.
+
+    HTTP client libraries are only consulted if they have already been imported
+    by a provider; if a library was never imported it cannot have raised anything,
+    so checking sys.modules avoids importing them just to build an except clause.
+    """
+    error_types = [ConnectionError]
+    requests_exceptions = sys.modules.get("requests.exceptions")
+    if requests_exceptions is not None:
+        error_types.append(requests_exceptions.ConnectionError)
+    httpx = sys.modules.get("httpx")
+    if httpx is not None:
+        error_types.append(httpx.TransportError)
+    return tuple(error_types)
+
+
+# Receives a dict snapshot of the partially generated AICommandResponse JSON.
+PartialResponseCallback = Callable[[dict], None]
+
+T = TypeVar("T")
+
+# Sent ahead of the queries of a packed request (see AIService.generate_packed).
+PACKED_QUERIES_PROMPT = (
+    "Answer each of the following queries independently, exactly as if it had been "
+    "asked on its own. Return one entry in `responses` per query, with `id` set to "
+    "the id of the query it answers."
+)
+
+
+def pack_queries(queries: List[str]) -> Tuple[List[str], str]:
+    """
+    Assigns ids to the queries of a packed request and lists them for the prompt.
+
+    Returns:
+        The ids, in query order, and a JSON array of {"id", "query"} objects.
+    """
+    ids = [str(number) for number in range(1, len(queries) + 1)]
+    listing = json.dumps(
+        [{"id": query_id, "query": query} for query_id, query in zip(ids, queries)],
+        ensure_ascii=False,
+    )
+    return ids, listing
+
+
+def parse_packed_response(text: str, ids: List[str]) -> List[Optional[AICommandResponse]]:
+    """
+    Splits a packed response into one validated AICommandResponse per query.
+
+    Every entry is validated on its own, so one malformed answer does not
+    discard the others.
+
+    Args:
+        text: The JSON text returned for the packed request.
+        ids: The query ids, as returned by pack_queries.
+
+    Returns:
+        The responses in the order of `ids`, with None for every query whose
+        entry is missing, duplicated or invalid.
+
+    Raises:
+        AIServiceError: If the text is not a JSON object with a `responses` list.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        data = None
+        details = str(e)
+    else:
+        details = "missing 'responses' list"
+    entries = data.get("responses") if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        raise AIServiceError(
+            f"AI Response Format Error: The AI returned an unexpected packed response. Details: {details}",
+            category=ERROR_CATEGORY_FORMAT,
+        )
+
+    wanted = set(ids)
+    seen = set()
+    responses = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or not isinstance(entry.get("id"), str):
+            continue
+        query_id = entry["id"]
+        if query_id not in wanted:
+            continue
+        if query_id in seen:
+            # Two answers for one query: trust neither.
+            responses.pop(query_id, None)
+            continue
+        seen.add(query_id)
+        fields = {key: value for key, value in entry.items() if key != "id"}
+        try:
+            responses[query_id] = AICommandResponse.model_validate(fields)
+        except ValidationError:
+            continue
+    return [responses.get(query_id) for query_id in ids]
+
+
+def parse_partial_response(text: str) -> dict:
+    """
+    Parses the prefix of an AICommandResponse JSON document as it is being streamed.
+
+    Incomplete trailing strings are kept (so explanation text can be shown as it
+    arrives), while incomplete keys and values are dropped.
+
+    Args:
+        text: The JSON text received so far.
+
+    Returns:
+        A dict with whatever fields could be recovered, or an empty dict if the
+        text is not (yet) a JSON object.
+    """
+    if not text.strip():
+        return {}
+    try:
+        partial = from_json(text, allow_partial="trailing-strings")
+    except ValueError:
+        return {}
+    return partial if isinstance(partial, dict) else {}
 
 
 class AIService(ABC):
@@ -17,10 +244,57 @@ class AIService(ABC):
     Defines the interface for generating CLI commands.
     """
 
+    # Whether _generate_packed_internal answers several queries in one request,
+    # rather than with one request per query.
+    supports_packing = False
+
     def __init__(self, api_key: str, system_instruction_content: str, model: str):
         self.api_key = api_key
         self.system_instruction_content = system_instruction_content
         self.model = model
+        # Optional collaborators consulted by generate_command; attached by the caller.
+        self.cache: Optional[ResponseCache] = None
+        self.semantic_cache: Optional["SemanticCache"] = None
+        self.rate_limiter: Optional[TokenBucket] = None
+        self.retry_policy: Optional[RetryPolicy] = None
+        # How AIContext is rendered into the prompt (see fml.context_encoding).
+        self.context_encoding = CONTEXT_ENCODING_PRETTY
+        # Lets providers that can cache the system instruction server-side
+        # reuse those caches across runs; None disables server-side caching.
+        self.prompt_cache: Optional["PromptCacheRegistry"] = None
+        # Receives the latency of every successful provider request and the
+        # failures caused by the model, for --hedge and --model auto.
+        self.model_stats: Optional["ModelStatsStore"] = None
+        # Concurrent identical generate_command calls share one provider
+        # request through this; None sends every call to the provider.
+        self.coalescer: Optional[SingleFlight[AICommandResponse]] = SingleFlight()
+        # Sum of the token usage of every provider request made by this service.
+        self.usage_totals = TokenUsage()
+        self._usage_lock = threading.Lock()
+        self._usage_local = threading.local()
+
+    @property
+    def last_usage(self) -> Optional[TokenUsage]:
+        """
+        The token usage of the provider request made by the calling thread's last
+        generate_command, or None if it made no request (e.g. on a cache hit) or
+        the provider did not report usage.
+        """
+        return getattr(self._usage_local, "usage", None)
+
+    @property
+    def last_cache_hit(self) -> bool:
+        """
+        Whether the calling thread's last generate_command (or agenerate_command)
+        was answered from a response cache rather than by the provider.
+        """
+        return getattr(self._usage_local, "cache_hit", False)
+
+    def _record_usage(self, usage: TokenUsage) -> None:
+        """Called by providers with the token usage reported for a request."""
+        self._usage_local.usage = usage
+        with self._usage_lock:
+            self.usage_totals = self.usage_totals + usage
 
     @abstractmethod
     def _generate_command_internal(
@@ -39,31 +313,491 @@ class AIService(ABC):
         """
         pass
 
-    def generate_command(self, query: str, ai_context: AIContext) -> AICommandResponse:
+    def _stream_command_internal(
+        self,
+        query: str,
+        ai_context: AIContext,
+        on_partial: PartialResponseCallback,
+    ) -> AICommandResponse:
+        """
+        Internal method to generate a CLI command while reporting partial results.
+
+        Providers that support streaming should override this and call `on_partial`
+        with a dict snapshot (see parse_partial_response) each time more of the
+        response arrives. The default implementation does not stream.
+
+        Args:
+            query: The natural language query.
+            ai_context: An AIContext object containing additional context for the AI.
+            on_partial: Callback receiving partial response snapshots.
+
+        Returns:
+            The complete, validated AICommandResponse.
+        """
+        return self._generate_command_internal(query, ai_context)
+
+    async def _agenerate_command_internal(
+        self, query: str, ai_context: AIContext
+    ) -> AICommandResponse:
+        """
+        Internal coroutine to generate a CLI command based on a natural language query.
+
+        Providers with an async client should override this. The default
+        implementation runs _generate_command_internal in a worker thread.
+
+        Args:
+            query: The natural language query.
+            ai_context: An AIContext object containing additional context for the AI.
+
+        Returns:
+            An instance of AICommandResponse containing the generated command, explanation, and flags.
+        """
+        return await asyncio.to_thread(self._generate_command_internal, query, ai_context)
+
+    def _generate_packed_internal(
+        self, queries: List[str], ai_context: AIContext
+    ) -> List[Optional[AICommandResponse]]:
+        """
+        Internal method that answers several queries sharing one context.
+
+        This implementation sends one request per query. Providers that can
+        answer several queries with a single request override it, typically with
+        pack_queries and parse_packed_response, and set supports_packing.
+
+        Args:
+            queries: The natural language queries, all sharing `ai_context`.
+            ai_context: An AIContext object containing additional context for the AI.
+
+        Returns:
+            One response per query, in order, with None for every query whose
+            answer was missing or failed validation.
+        """
+        return [self._generate_command_internal(query, ai_context) for query in queries]
+
+    def _prepare_client(self) -> None:
+        """
+        Internal hook that loads the provider SDK and creates its client ahead of a request.
+
+        Providers that import their SDK lazily should override this. The default
+        implementation does nothing.
+        """
+        pass
+
+    def prepare(self, query: str, ai_context: AIContext, refresh: bool = False) -> None:
+        """
+        Gets the provider client ready for a request that is about to be made.
+
+        Callers can run this while other work (such as gathering context) is still
+        in progress. Nothing is loaded if the exact-match cache already holds the
+        answer, so cache hits stay cheap.
+
+        Args:
+            query: The natural language query that will be sent.
+            ai_context: The context known so far; only the fields used by the cache
+                key (see make_cache_key) need to be filled in.
+            refresh: If True, the cache will be bypassed, so the client is always prepared.
+        """
+        if not refresh and self.cache is not None:
+            if self.cache.get(self._cache_key(query, ai_context)) is not None:
+                return
+        self._prepare_client()
+
+    def generate_command(
+        self,
+        query: str,
+        ai_context: AIContext,
+        refresh: bool = False,
+        on_partial: Optional[PartialResponseCallback] = None,
+    ) -> AICommandResponse:
         """
         Generates a CLI command based on a natural language query, with common error handling.
 
+        If a response cache is attached, a previously validated response for the same
+        model, query, system prompt and system is returned without calling the provider.
+        Calls made while an identical request (same query and context) is already
+        waiting for the provider join that request and return its response (or
+        raise its error) instead of sending another one; streamed calls never do.
+
         Args:
             query: The natural language query.
             ai_context: An AIContext object containing additional context for the AI.
+            refresh: If True, skip the cache lookup but still store the fresh response.
+            on_partial: If given, the response is streamed and this callback receives
+                partial snapshots as they arrive. It is not called on a cache hit.
 
         Returns:
             An instance of AICommandResponse containing the generated command, explanation, and flags.
         """
-        try:
-            return self._generate_command_internal(query, ai_context)
-        except ConnectionError as e:
-            # Catch network-related errors
-            raise AIServiceError(
-                f"Network Error: Could not connect to the AI service. Please check your internet connection. Details: {e}"
-            ) from e
-        except ValidationError as e:
-            # Catch Pydantic validation errors if AI response is malformed
-            raise AIServiceError(
-                f"AI Response Format Error: The AI returned an unexpected response format. Details: {e}"
-            ) from e
-        except Exception as e:
-            # Catch any other unexpected errors
-            raise AIServiceError(
-                f"An unexpected error occurred during AI interaction: {e}"
-            ) from e
+        self._usage_local.usage = None
+        self._usage_local.cache_hit = False
+        with span("generate_command", model=self.model) as current:
+            if not refresh:
+                with span("cache_lookup"):
+                    cached_response = self._lookup_cached(query, ai_context)
+                if cached_response is not None:
+                    self._usage_local.cache_hit = True
+                    if current is not None:
+                        current.attributes["cache_hit"] = True
+                    return cached_response
+
+            if on_partial is not None or self.coalescer is None:
+                return self._generate_and_store(query, ai_context, on_partial)
+
+            response, coalesced = self.coalescer.do(
+                self._flight_key(query, ai_context),
+                lambda: self._generate_and_store(query, ai_context),
+            )
+            if coalesced and current is not None:
+                current.attributes["coalesced"] = True
+            return response
+
+    def _generate_and_store(
+        self,
+        query: str,
+        ai_context: AIContext,
+        on_partial: Optional[PartialResponseCallback] = None,
+    ) -> AICommandResponse:
+        response = self._generate_command_with_error_handling(query, ai_context, on_partial)
+        with span("cache_store"):
+            self._store_cached(query, ai_context, response)
+        return response
+
+    def _flight_key(self, query: str, ai_context: AIContext) -> str:
+        # Unlike the cache key, this covers everything that is sent: requests
+        # are only shared when the provider would see exactly the same prompt.
+        material = "\0".join(
+            (self.model, self.context_encoding, query, ai_context.model_dump_json())
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    async def agenerate_command(
+        self, query: str, ai_context: AIContext, refresh: bool = False
+    ) -> AICommandResponse:
+        """
+        Async variant of generate_command for use inside an event loop.
+
+        Caching, rate limiting, retries and error mapping behave exactly like
+        generate_command, but waiting (for the provider, the rate limiter or a retry
+        backoff) never blocks the event loop.
+
+        Args:
+            query: The natural language query.
+            ai_context: An AIContext object containing additional context for the AI.
+            refresh: If True, skip the cache lookup but still store the fresh response.
+
+        Returns:
+            An instance of AICommandResponse containing the generated command, explanation, and flags.
+        """
+        self._usage_local.usage = None
+        self._usage_local.cache_hit = False
+        if not refresh:
+            cached_response = self._lookup_cached(query, ai_context)
+            if cached_response is not None:
+                self._usage_local.cache_hit = True
+                return cached_response
+
+        async def send(attempt: int) -> AICommandResponse:
+            start = time.perf_counter()
+            response = await self._agenerate_command_internal(query, ai_context)
+            self._record_latency(time.perf_counter() - start)
+            return response
+
+        response = await self._awith_retries(send)
+        self._store_cached(query, ai_context, response)
+        return response
+
+    def _lookup_cached(
+        self, query: str, ai_context: AIContext
+    ) -> Optional[AICommandResponse]:
+        # The exact-match cache is consulted first; the semantic cache only
+        # catches rephrasings of questions that were already answered.
+        if self.cache is not None:
+            cached_response = self.cache.get(self._cache_key(query, ai_context))
+            if cached_response is not None:
+                return cached_response
+        if self.semantic_cache is not None:
+            return self.semantic_cache.lookup(
+                self.model, query, self.system_instruction_content, ai_context
+            )
+        return None
+
+    def _store_cached(
+        self, query: str, ai_context: AIContext, response: AICommandResponse
+    ) -> None:
+        if self.cache is not None:
+            self.cache.put(self._cache_key(query, ai_context), response)
+        if self.semantic_cache is not None:
+            self.semantic_cache.add(
+                self.model, query, self.system_instruction_content, ai_context, response
+            )
+
+    def _cache_key(self, query: str, ai_context: AIContext) -> str:
+        return make_cache_key(
+            self.model, query, self.system_instruction_content, ai_context
+        )
+
+    def _record_latency(self, seconds: float) -> None:
+        if self.model_stats is not None:
+            self.model_stats.record_success(self.model, seconds)
+
+    def _record_failure(self, error: AIServiceError) -> None:
+        # Network failures say nothing about the model, so they are not counted.
+        if self.model_stats is not None and error.category in (
+            ERROR_CATEGORY_API,
+            ERROR_CATEGORY_FORMAT,
+        ):
+            self.model_stats.record_failure(self.model)
+
+    def _retry_delay(self, error: AIServiceError, attempt: int, retry: bool = True) -> Optional[float]:
+        """
+        Records a failed attempt and decides whether to try again.
+
+        Shared by _with_retries and _awith_retries, which differ only in how they wait.
+
+        Returns:
+            How long to back off before the next attempt, or None to give up.
+        """
+        self._record_failure(error)
+        policy = self.retry_policy
+        if not retry or policy is None or not error.retryable or attempt + 1 >= policy.max_attempts:
+            return None
+        return policy.delay(attempt)
+
+    def generate_commands(
+        self,
+        queries: List[str],
+        ai_context: AIContext,
+        max_concurrency: int = 4,
+        refresh: bool = False,
+        pack_size: int = 1,
+    ) -> List[CommandResult]:
+        """
+        Generates CLI commands for many queries concurrently.
+
+        Up to `max_concurrency` requests are in flight at once. The attached
+        rate_limiter and retry_policy (if any) apply to every provider call, and a
+        failing query never affects the others. With a `pack_size` above one,
+        consecutive queries are sent in packs of up to that many (see
+        generate_packed).
+
+        Args:
+            queries: The natural language queries.
+            ai_context: An AIContext object shared by all queries.
+            max_concurrency: The maximum number of concurrent provider calls.
+            refresh: If True, skip cache lookups but still store fresh responses.
+            pack_size: The maximum number of queries answered by one request.
+
+        Returns:
+            One CommandResult per query, in the same order as `queries`.
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1.")
+        if pack_size < 1:
+            raise ValueError("pack_size must be at least 1.")
+
+        def run(pack: List[str]) -> List[CommandResult]:
+            return self.generate_packed(pack, ai_context, refresh=refresh)
+
+        packs = [queries[i:i + pack_size] for i in range(0, len(queries), pack_size)]
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            return [result for results in executor.map(run, packs) for result in results]
+
+    def generate_packed(
+        self, queries: List[str], ai_context: AIContext, refresh: bool = False
+    ) -> List[CommandResult]:
+        """
+        Answers several queries that share one context with as few requests as possible.
+
+        Cached queries are answered from the cache. If the provider supports
+        packing, the remaining ones are sent in a single request, saving the
+        per-request overhead and the repeated system prompt and context. Each
+        answer in the packed response is validated on its own; queries whose
+        answer is missing or invalid, or all of them if the packed response
+        cannot be parsed, are then sent on their own through generate_command.
+
+        Args:
+            queries: The natural language queries.
+            ai_context: An AIContext object shared by all queries.
+            refresh: If True, skip cache lookups but still store fresh responses.
+
+        Returns:
+            One CommandResult per query, in the same order as `queries`.
+        """
+        start = time.perf_counter()
+        results = [CommandResult(query=query) for query in queries]
+        pending = []
+        for index, query in enumerate(queries):
+            cached_response = None if refresh else self._lookup_cached(query, ai_context)
+            if cached_response is not None:
+                results[index].response = cached_response
+                results[index].latency_seconds = time.perf_counter() - start
+            else:
+                pending.append(index)
+
+        if self.supports_packing and len(pending) > 1:
+            packed = pending
+            pending = self._answer_packed(queries, ai_context, results, packed)
+            elapsed = time.perf_counter() - start
+            for index in set(packed) - set(pending):
+                results[index].latency_seconds = elapsed
+
+        for index in pending:
+            result = results[index]
+            try:
+                result.response = self.generate_command(result.query, ai_context, refresh=True)
+                result.usage = self.last_usage
+            except AIServiceError as e:
+                result.error = e
+            result.latency_seconds = time.perf_counter() - start
+        return results
+
+    def _answer_packed(
+        self,
+        queries: List[str],
+        ai_context: AIContext,
+        results: List[CommandResult],
+        pending: List[int],
+    ) -> List[int]:
+        """Sends the pending queries as one packed request; returns those left unanswered."""
+        self._usage_local.usage = None
+        packed_queries = [queries[index] for index in pending]
+
+        def send(attempt: int) -> List[Optional[AICommandResponse]]:
+            with span(
+                "provider_request", attempt=attempt, packed=len(packed_queries)
+            ) as current:
+                responses = self._generate_packed_internal(packed_queries, ai_context)
+                self._annotate_usage(current)
+                return responses
+
+        with span("generate_packed", model=self.model, size=len(packed_queries)):
+            try:
+                responses = self._with_retries(send)
+            except AIServiceError as e:
+                if e.category == ERROR_CATEGORY_FORMAT:
+                    # Unparseable as a whole; each query is asked on its own instead.
+                    return pending
+                for index in pending:
+                    results[index].error = e
+                return []
+
+            answered = [
+                (index, response)
+                for index, response in zip(pending, responses)
+                if response is not None
+            ]
+            usage = self.last_usage
+            shares = usage.split(len(answered)) if usage and answered else [None] * len(answered)
+            with span("cache_store"):
+                for (index, response), share in zip(answered, shares):
+                    results[index].response = response
+                    results[index].usage = share
+                    self._store_cached(queries[index], ai_context, response)
+        return [index for index, response in zip(pending, responses) if response is None]
+
+    def _annotate_usage(self, current) -> None:
+        if current is not None and self.last_usage is not None:
+            current.attributes.update(
+                prompt_tokens=self.last_usage.prompt_tokens,
+                cached_tokens=self.last_usage.cached_tokens,
+                output_tokens=self.last_usage.output_tokens,
+            )
+
+    def _with_retries(self, call: Callable[[int], T], retry: bool = True) -> T:
+        """
+        Makes a provider call, waiting for the rate limiter before every attempt.
+
+        Errors are mapped to AIServiceError and recorded in model_stats, and
+        retryable ones are retried according to the retry_policy.
+
+        Args:
+            call: Makes the request; receives the zero-based attempt number.
+            retry: If False, the first error is raised even if it is retryable.
+        """
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                with span("rate_limit_wait"):
+                    self.rate_limiter.acquire()
+            try:
+                return call(attempt)
+            except Exception as e:
+                error = _as_service_error(e)
+                delay = self._retry_delay(error, attempt, retry)
+                if delay is None:
+                    if error is e:
+                        raise
+                    raise error from e
+            time.sleep(delay)
+            attempt += 1
+
+    async def _awith_retries(self, call: Callable[[int], Awaitable[T]]) -> T:
+        """Async variant of _with_retries: the same decisions, but waits without blocking the event loop."""
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                wait = self.rate_limiter.reserve()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            try:
+                return await call(attempt)
+            except Exception as e:
+                error = _as_service_error(e)
+                delay = self._retry_delay(error, attempt)
+                if delay is None:
+                    if error is e:
+                        raise
+                    raise error from e
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _generate_command_with_error_handling(
+        self,
+        query: str,
+        ai_context: AIContext,
+        on_partial: Optional[PartialResponseCallback] = None,
+    ) -> AICommandResponse:
+        def send(attempt: int) -> AICommandResponse:
+            with span(
+                "provider_request", attempt=attempt, stream=on_partial is not None
+            ) as current:
+                start = time.perf_counter()
+                if on_partial is not None:
+                    response = self._stream_command_internal(query, ai_context, on_partial)
+                else:
+                    response = self._generate_command_internal(query, ai_context)
+                self._record_latency(time.perf_counter() - start)
+                self._annotate_usage(current)
+                return response
+
+        # A partially streamed response cannot be taken back, so streams are not retried.
+        return self._with_retries(send, retry=on_partial is None)
+
+
+def _as_service_error(e: Exception) -> AIServiceError:
+    """Returns e if a provider already categorized it, otherwise its mapped AIServiceError."""
+    if isinstance(e, AIServiceError):
+        return e
+    return _map_provider_error(e)
+
+
+def _map_provider_error(e: Exception) -> AIServiceError:
+    """
+    Maps an exception raised by a provider call to a categorized AIServiceError.
+
+    Shared by the sync and async code paths so both report errors identically.
+    """
+    if isinstance(e, ValidationError):
+        # Catch Pydantic validation errors if AI response is malformed
+        return AIServiceError(
+            f"AI Response Format Error: The AI returned an unexpected response format. Details: {e}",
+            category=ERROR_CATEGORY_FORMAT,
+        )
+    if isinstance(e, _network_error_types()):
+        # Catch network-related errors
+        return AIServiceError(
+            f"Network Error: Could not connect to the AI service. Please check your internet connection. Details: {e}",
+            category=ERROR_CATEGORY_NETWORK,
+        )
+    # Catch any other unexpected errors
+    return AIServiceError(f"An unexpected error occurred during AI interaction: {e}")
@@ -0,0 +1,273 @@
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, TextIO, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from fml.ai_service import AIService, TokenUsage
+    from fml.schemas import AIContext
+
+
+@dataclass
+class BatchItem:
+    """A single query read from a batch input file."""
+
+    index: int
+    query: str
+    id: Optional[str] = None
+    model: Optional[str] = None
+    refresh: bool = False
+    # Set when the input line itself could not be parsed.
+    error: Optional[str] = None
+
+
+@dataclass
+class BatchSummary:
+    """Totals reported once a batch has finished."""
+
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    elapsed_seconds: float = 0.0
+    latencies_ms: List[float] = field(default_factory=list)
+    # Sum of the token usage reported for every query answered by the model.
+    usage: Optional["TokenUsage"] = None
+
+
+def read_batch_items(lines: Iterable[str]) -> List[BatchItem]:
+    """
+    Parses batch input into BatchItems.
+
+    Each non-empty line is either a plain query or a JSON object with a required
+    `query` key and optional `id`, `model` and `refresh` keys. Blank lines and lines
+    starting with `#` are skipped. Lines that fail to parse become items carrying an
+    error so they are reported in order instead of aborting the batch.
+
+    Args:
+        lines: The input lines (e.g. an open file or sys.stdin).
+
+    Returns:
+        The parsed items, indexed in input order.
+    """
+    items = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        index = len(items)
+        if not line.startswith("{"):
+            items.append(BatchItem(index=index, query=line))
+            continue
+
+        try:
+            data = json.loads(line)
+            if not isinstance(data.get("query"), str) or not data["query"].strip():
+                raise ValueError("missing 'query' string")
+            if data.get("model") is not None and not isinstance(data["model"], str):
+                raise ValueError("'model' must be a string")
+            items.append(
+                BatchItem(
+                    index=index,
+                    query=data["query"],
+                    id=None if data.get("id") is None else str(data["id"]),
+                    model=data.get("model"),
+                    refresh=bool(data.get("refresh", False)),
+                )
+            )
+        except (ValueError, AttributeError) as e:
+            items.append(
+                BatchItem(index=index, query=line, error=f"Invalid batch line: {e}")
+            )
+    return items
+
+
+def run_batch(
+    items: List[BatchItem],
+    service_factory: Callable[[str], "AIService"],
+    ai_context: "AIContext",
+    default_model: str,
+    output: TextIO,
+    refresh: bool = False,
+    max_concurrency: int = 1,
+    pack_size: int = 1,
+) -> BatchSummary:
+    """
+    Answers every item and writes one JSON result per line, in input order.
+
+    One AIService is created per model and shared by all of its queries, with up
+    to `max_concurrency` queries in flight at once. Errors are reported on the
+    item's result line and never abort the batch. Queries answered by the model
+    report the tokens they used under `usage`. With a `pack_size` above one,
+    consecutive items for the same model (and refresh setting) are answered
+    together, up to that many per request (see AIService.generate_packed); a
+    pack's tokens are divided between its queries.
+
+    Args:
+        items: The items to answer, as returned by read_batch_items.
+        service_factory: Creates an AIService for a model name.
+        ai_context: The context shared by every query.
+        default_model: The model used for items that do not name one.
+        output: The stream result lines are written to.
+        refresh: If True, bypass the response cache lookup for every item.
+        max_concurrency: The maximum number of queries (or packs) answered concurrently.
+        pack_size: The maximum number of queries sent in one request.
+
+    Returns:
+        A BatchSummary with totals and per-query latencies.
+    """
+    from fml.ai_service import AIServiceError, TokenUsage
+
+    services: Dict[str, "AIService"] = {}
+    services_lock = threading.Lock()
+
+    def get_service(model: str) -> "AIService":
+        with services_lock:
+            service = services.get(model)
+            if service is None:
+                service = service_factory(model)
+                services[model] = service
+            return service
+
+    def new_result(item: BatchItem) -> dict:
+        model = item.model or default_model
+        return {"index": item.index, "id": item.id, "query": item.query, "model": model}
+
+    def answer(item: BatchItem) -> dict:
+        result = new_result(item)
+        model = result["model"]
+        start = time.perf_counter()
+        try:
+            error = _item_error(item)
+            if error:
+                raise ValueError(error)
+            service = get_service(model)
+            response = service.generate_command(
+                item.query, ai_context, refresh=refresh or item.refresh
+            )
+            result.update(ok=True, response=response.model_dump(mode="json"))
+            if service.last_usage is not None:
+                result["usage"] = asdict(service.last_usage)
+        except AIServiceError as e:
+            result.update(ok=False, error=str(e), error_category=e.category)
+        except (ValueError, RuntimeError) as e:
+            result.update(ok=False, error=str(e))
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        return result
+
+    def answer_pack(pack: List[BatchItem]) -> List[dict]:
+        if len(pack) == 1:
+            return [answer(pack[0])]
+        results = [new_result(item) for item in pack]
+        start = time.perf_counter()
+        try:
+            command_results = get_service(results[0]["model"]).generate_packed(
+                [item.query for item in pack], ai_context, refresh=refresh or pack[0].refresh
+            )
+        except (ValueError, RuntimeError) as e:
+            latency_ms = round((time.perf_counter() - start) * 1000, 3)
+            for result in results:
+                result.update(ok=False, error=str(e), latency_ms=latency_ms)
+            return results
+        for result, command_result in zip(results, command_results):
+            if command_result.response is not None:
+                result.update(ok=True, response=command_result.response.model_dump(mode="json"))
+                if command_result.usage is not None:
+                    result["usage"] = asdict(command_result.usage)
+            else:
+                error = command_result.error
+                result.update(ok=False, error=str(error), error_category=error.category)
+            result["packed"] = len(pack)
+            result["latency_ms"] = round(command_result.latency_seconds * 1000, 3)
+        return results
+
+    def results_in_input_order(executor: ThreadPoolExecutor) -> Iterable[dict]:
+        # map() yields packs in submission order, which is the order of their
+        # first item; a pack's later items may follow items of other packs, so
+        # results are held back until every earlier item has been written.
+        packs = _pack_items(items, default_model, refresh, pack_size)
+        positions = {id(item): position for position, item in enumerate(items)}
+        ready: Dict[int, dict] = {}
+        next_position = 0
+        for pack, results in zip(packs, executor.map(answer_pack, packs)):
+            for item, result in zip(pack, results):
+                ready[positions[id(item)]] = result
+            while next_position in ready:
+                yield ready.pop(next_position)
+                next_position += 1
+
+    summary = BatchSummary(usage=TokenUsage())
+    batch_start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        for result in results_in_input_order(executor):
+            summary.total += 1
+            if result["ok"]:
+                summary.succeeded += 1
+            else:
+                summary.failed += 1
+            summary.latencies_ms.append(result["latency_ms"])
+            if "usage" in result:
+                summary.usage = summary.usage + TokenUsage(**result["usage"])
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+
+    summary.elapsed_seconds = time.perf_counter() - batch_start
+    return summary
+
+
+def _pack_items(
+    items: List[BatchItem], default_model: str, refresh: bool, pack_size: int
+) -> List[List[BatchItem]]:
+    """
+    Groups items into packs that can be answered by one request.
+
+    Each pack holds up to `pack_size` items for the same model and refresh
+    setting. Packs are listed in the order of their first item and keep their
+    items in input order; invalid items are packed on their own.
+    """
+    packs: List[List[BatchItem]] = []
+    open_packs: Dict[tuple, List[BatchItem]] = {}
+    for item in items:
+        if _item_error(item) or pack_size <= 1:
+            packs.append([item])
+            continue
+        key = (item.model or default_model, refresh or item.refresh)
+        pack = open_packs.get(key)
+        if pack is None or len(pack) >= pack_size:
+            pack = open_packs[key] = []
+            packs.append(pack)
+        pack.append(item)
+    return packs
+
+
+def _item_error(item: BatchItem) -> Optional[str]:
+    """
+    Returns why an item cannot be answered, or None if it can.
+
+    Items built by read_batch_items are already checked; this also covers items
+    constructed by callers, so one bad item never aborts the batch.
+    """
+    if item.error:
+        return item.error
+    if not isinstance(item.query, str) or not item.query.strip():
+        return "Invalid batch item: 'query' must be a non-empty string"
+    if item.model is not None and not isinstance(item.model, str):
+        return "Invalid batch item: 'model' must be a string"
+    return None
+
+
+def read_batch_file(path: str) -> List[BatchItem]:
+    """
+    Reads batch items from a file, treating '-' as standard input.
+
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    if path == "-":
+        return read_batch_items(sys.stdin)
+    with open(path, "r", encoding="utf-8") as f:
+        return read_batch_items(f)
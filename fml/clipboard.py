@@ -0,0 +1,185 @@
+import base64
+import os
+import shutil
+import subprocess
+import sys
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Callable, List, Mapping, Optional
+
+# Clipboard helpers started by CommandBackend. References are kept so the
+# still-running processes are not reported as leaked when garbage collected.
+_helpers: List[subprocess.Popen] = []
+
+
+class ClipboardError(Exception):
+    """Raised when text could not be handed to the clipboard."""
+
+
+class ClipboardBackend(ABC):
+    """A mechanism for putting text on the user's clipboard."""
+
+    name: str = ""
+    # False when the backend cannot tell whether the text actually arrived.
+    confirms_copy: bool = True
+
+    @abstractmethod
+    def copy(self, text: str) -> None:
+        """
+        Puts text on the clipboard without waiting for slow helpers.
+
+        Raises:
+            ClipboardError: If the text could not be handed over.
+        """
+        pass
+
+
+class CommandBackend(ClipboardBackend):
+    """
+    Pipes the text into a clipboard helper (xclip, xsel, wl-copy, pbcopy).
+
+    The helper is started in its own session and fml does not wait for it to
+    exit: on X11 `xclip`/`xsel` stay alive as the owner of the selection, and
+    waiting for them is what makes a synchronous copy stall.
+    """
+
+    name = "command"
+
+    def __init__(self, command: List[str]):
+        self.command = command
+
+    def copy(self, text: str) -> None:
+        try:
+            process = subprocess.Popen(
+                self.command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                close_fds=True,
+                start_new_session=True,
+            )
+        except OSError as e:
+            raise ClipboardError(f"Could not start {self.command[0]}: {e}") from e
+        _helpers.append(process)
+        try:
+            # Commands are far smaller than a pipe buffer, so this never blocks.
+            process.stdin.write(text.encode("utf-8"))
+            process.stdin.close()
+        except OSError as e:
+            raise ClipboardError(f"{self.command[0]} exited early: {e}") from e
+
+
+class OSC52Backend(ClipboardBackend):
+    """
+    Asks the terminal emulator to set the clipboard with an OSC 52 escape sequence.
+
+    This works over SSH and without any display server, as long as the
+    terminal supports OSC 52; inside tmux the sequence is passed through.
+    Terminals never acknowledge the sequence, so a copy is only reported as sent.
+    """
+
+    name = "osc52"
+    confirms_copy = False
+
+    def __init__(self, tty_path: str = "/dev/tty", tmux: Optional[bool] = None):
+        self.tty_path = tty_path
+        self.tmux = bool(os.environ.get("TMUX")) if tmux is None else tmux
+
+    def sequence(self, text: str) -> str:
+        """Returns the escape sequence that sets the clipboard to text."""
+        payload = base64.b64encode(text.encode("utf-8")).decode("ascii")
+        sequence = f"\033]52;c;{payload}\a"
+        if self.tmux:
+            sequence = "\033Ptmux;" + sequence.replace("\033", "\033\033") + "\033\\"
+        return sequence
+
+    def copy(self, text: str) -> None:
+        if not sys.stdout.isatty():
+            # Output is piped or captured, so there may be no terminal to honour the sequence.
+            raise ClipboardError("Standard output is not a terminal; not sending the OSC 52 sequence")
+        try:
+            with open(self.tty_path, "w", encoding="ascii") as tty:
+                tty.write(self.sequence(text))
+        except OSError as e:
+            raise ClipboardError(f"No terminal to send the clipboard sequence to: {e}") from e
+
+
+class PyperclipBackend(ClipboardBackend):
+    """Copies with pyperclip (the Windows clipboard API, or its own helper detection)."""
+
+    name = "pyperclip"
+
+    def copy(self, text: str) -> None:
+        import pyperclip
+
+        try:
+            pyperclip.copy(text)
+        except pyperclip.PyperclipException as e:
+            raise ClipboardError(str(e)) from e
+
+
+class FakeBackend(ClipboardBackend):
+    """Records copied text in memory; selected with FML_CLIPBOARD=fake for headless tests."""
+
+    name = "fake"
+
+    def __init__(self):
+        self.copies: List[str] = []
+
+    @property
+    def contents(self) -> Optional[str]:
+        """The most recently copied text."""
+        return self.copies[-1] if self.copies else None
+
+    def copy(self, text: str) -> None:
+        self.copies.append(text)
+
+
+def detect_backend(
+    environ: Optional[Mapping[str, str]] = None,
+    platform: str = sys.platform,
+    which: Callable[[str], Optional[str]] = shutil.which,
+) -> ClipboardBackend:
+    """
+    Chooses the clipboard mechanism for this environment.
+
+    FML_CLIPBOARD may force "osc52", "pyperclip" or "fake". Otherwise macOS uses
+    pbcopy, Wayland wl-copy and X11 xclip or xsel; sessions without a display
+    (e.g. over SSH) use OSC 52, and anything else falls back to pyperclip.
+
+    Args:
+        environ: The environment to inspect (defaults to os.environ).
+        platform: The sys.platform value.
+        which: Looks up an executable on PATH.
+
+    Returns:
+        The backend to copy with.
+    """
+    env = os.environ if environ is None else environ
+    forced = env.get("FML_CLIPBOARD", "").lower()
+    if forced == FakeBackend.name:
+        return FakeBackend()
+    if forced == OSC52Backend.name:
+        return OSC52Backend(tmux=bool(env.get("TMUX")))
+    if forced == PyperclipBackend.name:
+        return PyperclipBackend()
+
+    if platform == "darwin" and which("pbcopy"):
+        return CommandBackend(["pbcopy"])
+    if platform.startswith(("linux", "freebsd", "openbsd")):
+        if env.get("WAYLAND_DISPLAY") and which("wl-copy"):
+            return CommandBackend(["wl-copy"])
+        if env.get("DISPLAY"):
+            if which("xclip"):
+                return CommandBackend(["xclip", "-selection", "clipboard"])
+            if which("xsel"):
+                return CommandBackend(["xsel", "--clipboard", "--input"])
+        if env.get("SSH_TTY") or not (env.get("DISPLAY") or env.get("WAYLAND_DISPLAY")):
+            return OSC52Backend(tmux=bool(env.get("TMUX")))
+    return PyperclipBackend()
+
+
+@lru_cache(maxsize=1)
+def get_clipboard() -> ClipboardBackend:
+    """Returns the clipboard backend for this process, detected on first use."""
+    return detect_backend()
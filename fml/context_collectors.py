@@ -0,0 +1,257 @@
+import os
+import subprocess
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, TYPE_CHECKING
+
+from fml.gather_system_info import get_system_info
+from fml.profiling import span
+
+if TYPE_CHECKING:
+    from fml.schemas import AIContext, FileContext, GitContext, SystemInfo
+
+# The total time optional collectors may take before they are dropped.
+DEFAULT_CONTEXT_BUDGET_SECONDS = 0.25
+MAX_CHANGED_FILES = 20
+MAX_FILE_ENTRIES = 50
+
+
+class ContextCollector(ABC):
+    """
+    Gathers one field of AIContext.
+
+    Subclasses declare the AIContext `field` they fill and an estimated `cost`
+    in seconds. Collectors whose cost exceeds the run's time budget are not
+    started at all. `required` collectors are always waited for; all others are
+    dropped if they have not finished when the budget runs out.
+    """
+
+    name: str = ""
+    field: str = ""
+    cost: float = 0.0
+    required: bool = False
+
+    @abstractmethod
+    def collect(self, timeout: float) -> Any:
+        """
+        Gathers the value for this collector's AIContext field.
+
+        Args:
+            timeout: The seconds left in the run's budget. Collectors that start
+                subprocesses should not let them run longer than this.
+
+        Returns:
+            The field value, or None if there is nothing to report.
+        """
+        pass
+
+
+class SystemInfoCollector(ContextCollector):
+    """Fills `system_info` using get_system_info (or another gather function)."""
+
+    name = "system_info"
+    field = "system_info"
+    cost = 0.001
+    required = True
+
+    def __init__(self, gather: Callable[[], "SystemInfo"] = get_system_info):
+        self.gather = gather
+
+    def collect(self, timeout: float) -> "SystemInfo":
+        return self.gather()
+
+
+class GitContextCollector(ContextCollector):
+    """Fills `git_context` from a single `git status` call in the working directory."""
+
+    name = "git"
+    field = "git_context"
+    cost = 0.03
+
+    def collect(self, timeout: float) -> Optional["GitContext"]:
+        from fml.schemas import GitContext
+
+        try:
+            result = subprocess.run(
+                ["git", "status", "--porcelain=v2", "--branch"],
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if result.returncode != 0:
+            # Not inside a repository.
+            return None
+        return GitContext(**parse_git_status(result.stdout))
+
+
+class FileContextCollector(ContextCollector):
+    """Fills `file_context` with the (truncated) listing of the working directory."""
+
+    name = "files"
+    field = "file_context"
+    cost = 0.005
+
+    def collect(self, timeout: float) -> Optional["FileContext"]:
+        from fml.schemas import FileContext
+
+        entries = []
+        truncated = False
+        try:
+            with os.scandir(os.getcwd()) as it:
+                for entry in it:
+                    if len(entries) == MAX_FILE_ENTRIES:
+                        truncated = True
+                        break
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    entries.append(entry.name + "/" if is_dir else entry.name)
+        except OSError:
+            return None
+        return FileContext(entries=sorted(entries), truncated=truncated)
+
+
+# Optional collectors selectable with --context.
+OPTIONAL_COLLECTORS: Dict[str, type] = {
+    GitContextCollector.name: GitContextCollector,
+    FileContextCollector.name: FileContextCollector,
+}
+
+
+def parse_git_status(output: str) -> dict:
+    """
+    Parses `git status --porcelain=v2 --branch` output.
+
+    Args:
+        output: The command's standard output.
+
+    Returns:
+        A dict of GitContext fields.
+    """
+    fields = {"branch": None, "upstream": None, "ahead": 0, "behind": 0, "changed_files": []}
+    for line in output.splitlines():
+        if line.startswith("# branch.head "):
+            head = line[len("# branch.head "):]
+            fields["branch"] = None if head == "(detached)" else head
+        elif line.startswith("# branch.upstream "):
+            fields["upstream"] = line[len("# branch.upstream "):]
+        elif line.startswith("# branch.ab "):
+            ahead, behind = line[len("# branch.ab "):].split()
+            fields["ahead"], fields["behind"] = int(ahead), -int(behind)
+        elif len(fields["changed_files"]) < MAX_CHANGED_FILES:
+            # Ordinary (1), renamed (2), unmerged (u) and untracked (?) entries;
+            # the path is the last space-separated field.
+            parts = {"1": 9, "2": 10, "u": 11, "?": 2}.get(line[:1])
+            if parts:
+                path = line.split(" ", parts - 1)[-1]
+                fields["changed_files"].append(path.split("\t")[0])
+    return fields
+
+
+class ContextCollection:
+    """
+    Runs context collectors concurrently under a time budget.
+
+    `start` submits every collector to a thread pool and returns immediately,
+    so callers can overlap collection with other work (such as initializing
+    the AI service) before calling `context`. Collectors still running when the
+    budget is used up are dropped and their field is left empty. After
+    `context`, `timings` holds the seconds each finished collector took and
+    `dropped` and `failed` name the collectors that were left out.
+    """
+
+    def __init__(
+        self,
+        collectors: List[ContextCollector],
+        budget_seconds: float = DEFAULT_CONTEXT_BUDGET_SECONDS,
+    ):
+        self.collectors = collectors
+        self.budget_seconds = budget_seconds
+        self.timings: Dict[str, float] = {}
+        self.dropped: List[str] = []
+        self.failed: List[str] = []
+        self._futures: Dict[str, Future] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._deadline = 0.0
+        self._context: Optional["AIContext"] = None
+
+    def start(self) -> "ContextCollection":
+        """Submits the collectors and returns without waiting for them."""
+        self._deadline = time.monotonic() + self.budget_seconds
+        runnable = []
+        for collector in self.collectors:
+            if collector.required or collector.cost <= self.budget_seconds:
+                runnable.append(collector)
+            else:
+                self.dropped.append(collector.name)
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, len(runnable)), thread_name_prefix="fml-context"
+        )
+        for collector in runnable:
+            self._futures[collector.name] = self._executor.submit(self._run, collector)
+        return self
+
+    def done(self) -> bool:
+        """Returns True once every started collector has finished."""
+        return all(future.done() for future in self._futures.values())
+
+    def wait_for(self, name: str) -> Any:
+        """
+        Waits for a single collector, regardless of the budget, and returns its value.
+
+        Raises:
+            KeyError: If no collector with this name was started.
+            Exception: Whatever the collector raised.
+        """
+        return self._futures[name].result()
+
+    def context(self) -> "AIContext":
+        """
+        Waits until every collector has finished or the budget is used up.
+
+        Returns:
+            An AIContext with the fields of every collector that finished in time.
+
+        Raises:
+            Exception: Whatever a required collector raised.
+        """
+        from fml.schemas import AIContext
+
+        if self._context is not None:
+            return self._context
+
+        by_name = {collector.name: collector for collector in self.collectors}
+        optional = [
+            future for name, future in self._futures.items() if not by_name[name].required
+        ]
+        wait(optional, timeout=max(0.0, self._deadline - time.monotonic()))
+
+        fields = {}
+        for name, future in self._futures.items():
+            collector = by_name[name]
+            if collector.required:
+                fields[collector.field] = future.result()
+            elif not future.done():
+                self.dropped.append(name)
+            elif future.exception() is not None:
+                self.failed.append(name)
+            elif future.result() is not None:
+                fields[collector.field] = future.result()
+
+        # Dropped collectors keep running in the background but nobody waits for them.
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._context = AIContext(**fields)
+        return self._context
+
+    def _run(self, collector: ContextCollector) -> Any:
+        start = time.perf_counter()
+        try:
+            with span(f"collect {collector.name}"):
+                return collector.collect(max(0.0, self._deadline - time.monotonic()))
+        finally:
+            self.timings[collector.name] = time.perf_counter() - start
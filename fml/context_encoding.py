@@ -0,0 +1,95 @@
+import json
+from functools import lru_cache
+from typing import List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pydantic import BaseModel
+
+    from fml.schemas import AIContext, SystemInfo
+
+# Pretty-printed JSON in a markdown fence, nulls included (the original format).
+CONTEXT_ENCODING_PRETTY = "pretty"
+# Minified JSON without null or empty fields.
+CONTEXT_ENCODING_COMPACT = "compact"
+# A single line of key=value pairs without null or empty fields.
+CONTEXT_ENCODING_KV = "kv"
+CONTEXT_ENCODINGS = (CONTEXT_ENCODING_PRETTY, CONTEXT_ENCODING_COMPACT, CONTEXT_ENCODING_KV)
+
+# AIContext fields in the order they are sent, with the heading introducing each.
+_SECTIONS = (
+    ("system_info", "User's System Information"),
+    ("git_context", "User's Git Repository"),
+    ("file_context", "Files in User's Current Directory"),
+)
+
+
+def encode_context(ai_context: "AIContext", encoding: str = CONTEXT_ENCODING_PRETTY) -> List[str]:
+    """
+    Renders the filled fields of an AIContext as prompt sections.
+
+    Args:
+        ai_context: The context to describe.
+        encoding: One of CONTEXT_ENCODINGS. The compact encodings spend fewer
+            input tokens on whitespace, punctuation and empty fields.
+
+    Returns:
+        One string per filled field, each starting with a blank line and a heading.
+
+    Raises:
+        ValueError: If the encoding is unknown.
+    """
+    if encoding not in CONTEXT_ENCODINGS:
+        raise ValueError(
+            f"Unknown context encoding '{encoding}'. Choose from: {', '.join(CONTEXT_ENCODINGS)}"
+        )
+    sections = []
+    for field, title in _SECTIONS:
+        value = getattr(ai_context, field)
+        if value is None:
+            continue
+        if field == "system_info":
+            sections.append(_system_info_section(value, encoding))
+        else:
+            sections.append(encode_section(title, value, encoding))
+    return sections
+
+
+def encode_section(title: str, value: "BaseModel", encoding: str) -> str:
+    """Renders one model as a prompt section introduced by `title`."""
+    if encoding == CONTEXT_ENCODING_PRETTY:
+        return f"\n\n{title}:\n```json\n{value.model_dump_json(indent=2)}\n```"
+    fields = {
+        key: item
+        for key, item in value.model_dump(mode="json", exclude_none=True).items()
+        if item not in ([], {}, "")
+    }
+    if encoding == CONTEXT_ENCODING_COMPACT:
+        body = json.dumps(fields, separators=(",", ":"), ensure_ascii=False)
+    else:
+        body = " ".join(f"{key}={_kv_value(item)}" for key, item in fields.items())
+    return f"\n\n{title}: {body}"
+
+
+def _kv_value(value) -> str:
+    if isinstance(value, list):
+        value = ",".join(str(item) for item in value)
+    elif isinstance(value, bool):
+        value = "true" if value else "false"
+    text = str(value)
+    # Quote values that would otherwise be ambiguous on a space-separated line.
+    if not text or any(c.isspace() or c in '"=' for c in text):
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+
+def _system_info_section(system_info: "SystemInfo", encoding: str) -> str:
+    # A client's system information rarely changes between requests, so the
+    # rendered section is memoized on its field values.
+    return _render_system_info_section(tuple(system_info.__dict__.items()), encoding)
+
+
+@lru_cache(maxsize=64)
+def _render_system_info_section(fields: tuple, encoding: str) -> str:
+    from fml.schemas import SystemInfo
+
+    return encode_section("User's System Information", SystemInfo(**dict(fields)), encoding)
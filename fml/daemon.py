@@ -0,0 +1,369 @@
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+from fml.http_transport import close_transport
+from fml.paths import get_cache_dir
+
+if TYPE_CHECKING:
+    from fml.ai_service import AIService
+    from fml.response_cache import ResponseCache
+    from fml.schemas import AICommandResponse, AIContext, SystemInfo
+    from fml.semantic_cache import SemanticCache
+
+DEFAULT_IDLE_TIMEOUT_SECONDS = 15 * 60
+# How long the client waits for the daemon to answer a single query.
+CLIENT_TIMEOUT_SECONDS = 120.0
+# How long the client waits for a connection before treating the daemon as absent.
+CONNECT_TIMEOUT_SECONDS = 0.5
+
+
+def daemon_supported() -> bool:
+    """Returns True if this platform supports Unix domain sockets."""
+    return hasattr(socket, "AF_UNIX")
+
+
+def get_socket_path() -> str:
+    """
+    Returns the Unix socket path the daemon listens on.
+
+    The FML_DAEMON_SOCKET environment variable overrides the default location
+    inside the fml cache directory.
+    """
+    return os.environ.get("FML_DAEMON_SOCKET") or os.path.join(
+        get_cache_dir(), "daemon.sock"
+    )
+
+
+class DaemonUnavailable(Exception):
+    """Raised by the client when no daemon answered: none is listening, or the connection failed."""
+
+    pass
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Handles one newline-delimited JSON request per connection."""
+
+    def handle(self):
+        daemon: "FmlDaemon" = self.server.fml_daemon
+        try:
+            line = self.rfile.readline()
+            try:
+                request = json.loads(line)
+                reply = daemon.handle_request(request)
+            except ValueError as e:
+                reply = {"ok": False, "error_type": "ValueError", "error": str(e)}
+            self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+        finally:
+            daemon._request_finished()
+
+
+class _DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def process_request(self, request, client_address):
+        # Count the request as active before its thread starts so the idle check
+        # in the serve loop can never race with a freshly accepted connection.
+        self.fml_daemon._request_started()
+        super().process_request(request, client_address)
+
+
+class RequestDispatcher:
+    """
+    Answers decoded fml requests with AI services shared between requests.
+
+    Services are created once per model and reused, and the response caches
+    are shared by all requests. With a `model_resolver`, the model a request
+    names (such as `auto`) is mapped to the model that answers it on every
+    request, so routing follows the models' current health. Used by the daemon
+    and by `fml serve`; a single instance may be shared between threads.
+    """
+
+    def __init__(
+        self,
+        service_factory: Callable[[str], "AIService"],
+        cache: Optional["ResponseCache"] = None,
+        semantic_cache: Optional["SemanticCache"] = None,
+        model_resolver: Optional[Callable[[str], str]] = None,
+    ):
+        self.service_factory = service_factory
+        self.cache = cache
+        self.semantic_cache = semantic_cache
+        self.model_resolver = model_resolver
+        self._services: Dict[Tuple[str, bool], "AIService"] = {}
+        self._services_lock = threading.Lock()
+
+    def handle_request(self, request: dict) -> dict:
+        """
+        Answers a single decoded request.
+
+        Args:
+            request: A dict with `model`, `query`, `system_info` and optional
+                `refresh`, `use_cache` and `context` (a full AIContext, taking
+                precedence over `system_info`) keys.
+
+        Returns:
+            A reply dict with either `response` or `error_type` and `error`
+            (plus `error_category` for AIServiceError).
+        """
+        from fml.ai_service import AIServiceError
+        from fml.schemas import AIContext, SystemInfo
+
+        try:
+            system_info = request.get("system_info")
+            if request.get("context"):
+                ai_context = AIContext.model_validate(request["context"])
+            else:
+                ai_context = AIContext(
+                    system_info=SystemInfo.model_validate(system_info)
+                    if system_info
+                    else None
+                )
+            model = request["model"]
+            if not isinstance(model, str):
+                raise ValueError("The model must be a string.")
+            if self.model_resolver is not None:
+                model = self.model_resolver(model)
+            service = self._get_service(model, request.get("use_cache", True))
+            response = service.generate_command(
+                request["query"], ai_context, refresh=request.get("refresh", False)
+            )
+        except AIServiceError as e:
+            return {
+                "ok": False,
+                "error_type": type(e).__name__,
+                "error": str(e),
+                "error_category": e.category,
+            }
+        except (ValueError, RuntimeError, KeyError) as e:
+            return {"ok": False, "error_type": type(e).__name__, "error": str(e)}
+        return {"ok": True, "response": response.model_dump(mode="json")}
+
+    def services(self) -> List["AIService"]:
+        """Returns the services created so far."""
+        with self._services_lock:
+            return list(self._services.values())
+
+    def _get_service(self, model: str, use_cache: bool) -> "AIService":
+        # Cached and uncached requests get separate instances so that requests
+        # running concurrently never see each other's cache setting.
+        with self._services_lock:
+            service = self._services.get((model, use_cache))
+            if service is None:
+                service = self.service_factory(model)
+                if use_cache:
+                    service.cache = self.cache
+                    service.semantic_cache = self.semantic_cache
+                self._services[(model, use_cache)] = service
+            return service
+
+
+class FmlDaemon:
+    """
+    A long-lived process that answers fml queries over a Unix domain socket.
+
+    AI services (and with them the provider SDK and its HTTP connections) are
+    created once per model and reused, and the response caches are shared by all
+    requests (see RequestDispatcher). The daemon exits after `idle_timeout`
+    seconds without requests.
+    """
+
+    def __init__(
+        self,
+        service_factory: Callable[[str], "AIService"],
+        socket_path: Optional[str] = None,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT_SECONDS,
+        cache: Optional["ResponseCache"] = None,
+        semantic_cache: Optional["SemanticCache"] = None,
+    ):
+        self.dispatcher = RequestDispatcher(service_factory, cache, semantic_cache)
+        self.socket_path = socket_path or get_socket_path()
+        self.idle_timeout = idle_timeout
+        self._activity_lock = threading.Lock()
+        self._active_requests = 0
+        self._last_activity = time.monotonic()
+        self._stopped = threading.Event()
+        self._server: Optional[_DaemonServer] = None
+
+    def handle_request(self, request: dict) -> dict:
+        """Answers a single decoded request (see RequestDispatcher.handle_request)."""
+        return self.dispatcher.handle_request(request)
+
+    def serve(self) -> None:
+        """
+        Binds the socket and serves requests until idle or stopped.
+
+        Raises:
+            RuntimeError: If another daemon is listening on the socket, or the
+                socket could not be created (e.g. its path is too long or not
+                writable).
+        """
+        if os.path.exists(self.socket_path) and _is_listening(self.socket_path):
+            raise RuntimeError(f"An fml daemon is already listening on {self.socket_path}.")
+        try:
+            self._bind()
+        except OSError as e:
+            raise RuntimeError(f"Could not listen on {self.socket_path}: {e.strerror or e}") from e
+        self._server.fml_daemon = self
+        self._server.timeout = min(1.0, self.idle_timeout)
+        self._last_activity = time.monotonic()
+
+        try:
+            while not self._stopped.is_set() and not self._idle_expired():
+                self._server.handle_request()
+        finally:
+            self._server.server_close()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+            close_transport()
+
+    def _bind(self) -> None:
+        directory = os.path.dirname(self.socket_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        # Only the current user may talk to the daemon.
+        old_umask = os.umask(0o077)
+        try:
+            self._server = _DaemonServer(self.socket_path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def stop(self) -> None:
+        """Asks the serve loop to exit after the current poll interval."""
+        self._stopped.set()
+
+    def _idle_expired(self) -> bool:
+        with self._activity_lock:
+            if self._active_requests:
+                return False
+            return time.monotonic() - self._last_activity > self.idle_timeout
+
+    def _request_started(self) -> None:
+        with self._activity_lock:
+            self._active_requests += 1
+            self._last_activity = time.monotonic()
+
+    def _request_finished(self) -> None:
+        with self._activity_lock:
+            self._active_requests -= 1
+            self._last_activity = time.monotonic()
+
+
+def _is_listening(socket_path: str) -> bool:
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(CONNECT_TIMEOUT_SECONDS)
+    try:
+        client.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        client.close()
+
+
+def request_via_daemon(
+    model: str,
+    query: str,
+    system_info: Optional["SystemInfo"],
+    refresh: bool = False,
+    use_cache: bool = True,
+    socket_path: Optional[str] = None,
+    ai_context: Optional["AIContext"] = None,
+) -> "AICommandResponse":
+    """
+    Sends a query to a running daemon and returns its answer.
+
+    Args:
+        model: The model name to use.
+        query: The natural language query.
+        system_info: The client's SystemInfo, sent along with the query.
+        refresh: If True, the daemon bypasses its cache lookup.
+        use_cache: If False, the daemon neither reads nor writes its cache.
+        socket_path: The socket to connect to; defaults to get_socket_path().
+        ai_context: The full AIContext to forward, for requests that carry more
+            context than the system information.
+
+    Returns:
+        The AICommandResponse produced by the daemon.
+
+    Raises:
+        DaemonUnavailable: If no daemon is listening, or the connection failed
+            before a complete reply arrived (e.g. the daemon shut down when idle).
+        AIServiceError, ValueError, RuntimeError: Re-raised from the daemon so that
+            callers can handle them exactly like in-process errors.
+    """
+    if not daemon_supported():
+        raise DaemonUnavailable("Unix domain sockets are not supported here.")
+
+    path = socket_path or get_socket_path()
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(CONNECT_TIMEOUT_SECONDS)
+    try:
+        try:
+            client.connect(path)
+        except OSError as e:
+            raise DaemonUnavailable(str(e)) from e
+
+        request = {
+            "model": model,
+            "query": query,
+            "system_info": system_info.model_dump(mode="json") if system_info else None,
+            "refresh": refresh,
+            "use_cache": use_cache,
+        }
+        if ai_context is not None:
+            request["context"] = ai_context.model_dump(mode="json")
+        try:
+            client.settimeout(CLIENT_TIMEOUT_SECONDS)
+            client.sendall(json.dumps(request).encode("utf-8") + b"\n")
+            with client.makefile("rb") as reader:
+                line = reader.readline()
+        except OSError as e:
+            # Includes timeouts and a daemon closing the socket while idling out.
+            raise DaemonUnavailable(f"The connection to the daemon failed: {e}") from e
+    finally:
+        client.close()
+
+    if not line.endswith(b"\n"):
+        raise DaemonUnavailable("The daemon closed the connection without a reply.")
+    try:
+        reply = json.loads(line)
+    except ValueError as e:
+        raise DaemonUnavailable(f"The daemon sent an invalid reply: {e}") from e
+    return _decode_reply(reply)
+
+
+def _decode_reply(reply: dict) -> "AICommandResponse":
+    from fml.ai_service import AIServiceError
+    from fml.schemas import AICommandResponse
+
+    if reply.get("ok"):
+        return AICommandResponse.model_validate(reply["response"])
+
+    error_types = {
+        "ValueError": ValueError,
+        "RuntimeError": RuntimeError,
+        "KeyError": ValueError,
+    }
+    raise error_types.get(reply.get("error_type"), AIServiceError)(reply.get("error"))
+
+
+def spawn_daemon() -> None:
+    """Starts a detached daemon process that outlives the current invocation."""
+    subprocess.Popen(
+        [sys.executable, "-m", "fml", "--daemon"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+        close_fds=True,
+    )
@@ -1,21 +1,42 @@
+import json
 import platform
 import os
-from fml.schemas import SystemInfo
+import sys
+import time
+from typing import Callable, Dict, Optional, TYPE_CHECKING
 
+from fml.paths import atomic_write
 
-def get_system_info() -> SystemInfo:
-    """
-    Gathers relevant system information.
+if TYPE_CHECKING:
+    from fml.schemas import SystemInfo
 
-    Returns:
-        An instance of SystemInfo containing the gathered system details.
-    """
-    os_name = platform.system()
-    architecture = platform.machine()
-    cwd = os.getcwd()
-    python_version = platform.python_version()
+STATIC_CACHE_FORMAT_VERSION = 1
+_BOOT_ID_PATH = "/proc/sys/kernel/random/boot_id"
+
+
+def _collect_os_name() -> str:
+    return platform.system()
+
+
+def _collect_architecture() -> str:
+    return platform.machine()
+
+
+def _collect_python_version() -> str:
+    return platform.python_version()
 
-    # Determine the default shell
+
+# Facts that cannot change without a reboot or a different Python interpreter.
+# They are cached on disk by SystemInfoGatherer.
+STATIC_COLLECTORS: Dict[str, Callable[[], str]] = {
+    "os_name": _collect_os_name,
+    "architecture": _collect_architecture,
+    "python_version": _collect_python_version,
+}
+
+
+def _detect_shell(os_name: str) -> str:
+    """Returns the user's shell from the environment, with a Windows fallback."""
     shell = os.environ.get("SHELL")
 
     if os_name == "Windows":
@@ -26,21 +47,152 @@ def get_system_info() -> SystemInfo:
                 "PSModulePath") else "unknown_shell"
     else:
         shell = os.path.basename(shell) if shell else "unknown_shell"
+    return shell
 
-    return SystemInfo(
-        os_name=os_name,
-        shell=shell,
-        cwd=cwd,
-        architecture=architecture,
-        python_version=python_version,
-    )
+
+def static_fingerprint() -> str:
+    """
+    Returns a value that changes whenever the cached static facts may be stale.
+
+    It combines the kernel boot ID (Linux only; other systems have no cheap
+    equivalent) with the path and modification time of the Python interpreter,
+    so a reboot, an OS upgrade that replaces the interpreter or running under a
+    different Python all invalidate the cache.
+    """
+    parts = []
+    try:
+        with open(_BOOT_ID_PATH, "r", encoding="ascii") as f:
+            parts.append(f.read().strip())
+    except OSError:
+        parts.append("")
+    parts.append(sys.executable)
+    try:
+        parts.append(str(os.stat(sys.executable).st_mtime_ns))
+    except (OSError, ValueError):
+        parts.append("")
+    return "|".join(parts)
+
+
+class SystemInfoGatherer:
+    """
+    Gathers SystemInfo, optionally memoizing static facts on disk.
+
+    With a `cache_path`, the OS name, architecture and Python version are read
+    from a small JSON file as long as static_fingerprint() still matches, and
+    only volatile fields (the working directory and the shell, which comes from
+    the environment of the calling terminal) are computed on every run. Without
+    one, every field is computed live. After `gather`, `timings` maps each
+    collector name to the seconds it took and `static_cache_hit` tells whether
+    the static facts came from disk.
+    """
+
+    def __init__(self, cache_path: Optional[str] = None):
+        self.cache_path = cache_path
+        self.timings: Dict[str, float] = {}
+        self.static_cache_hit = False
+
+    def gather(self) -> "SystemInfo":
+        """
+        Gathers relevant system information.
+
+        Returns:
+            An instance of SystemInfo containing the gathered system details.
+        """
+        # Imported here so the CLI can load this module without pulling in pydantic.
+        from fml.schemas import SystemInfo
+
+        self.timings = {}
+        self.static_cache_hit = False
+
+        static = None
+        fingerprint = None
+        if self.cache_path:
+            fingerprint = self._timed("static_cache", static_fingerprint)
+            static = self._timed("static_cache", self._load_static, fingerprint)
+        if static is not None:
+            self.static_cache_hit = True
+        else:
+            static = {
+                name: self._timed(name, collector)
+                for name, collector in STATIC_COLLECTORS.items()
+            }
+            if self.cache_path:
+                self._save_static(fingerprint, static)
+
+        return SystemInfo(
+            os_name=static["os_name"],
+            shell=self._timed("shell", _detect_shell, static["os_name"]),
+            cwd=self._timed("cwd", os.getcwd),
+            architecture=static["architecture"],
+            python_version=static["python_version"],
+        )
+
+    def _timed(self, name: str, collector: Callable, *args):
+        start = time.perf_counter()
+        try:
+            return collector(*args)
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + (
+                time.perf_counter() - start
+            )
+
+    def _load_static(self, fingerprint: str) -> Optional[Dict[str, str]]:
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (
+            not isinstance(data, dict)
+            or data.get("version") != STATIC_CACHE_FORMAT_VERSION
+            or data.get("fingerprint") != fingerprint
+        ):
+            return None
+        facts = data.get("facts")
+        if not isinstance(facts, dict) or not all(
+            isinstance(facts.get(name), str) for name in STATIC_COLLECTORS
+        ):
+            return None
+        return facts
+
+    def _save_static(self, fingerprint: str, facts: Dict[str, str]) -> None:
+        data = {
+            "version": STATIC_CACHE_FORMAT_VERSION,
+            "fingerprint": fingerprint,
+            "facts": facts,
+        }
+        try:
+            atomic_write(self.cache_path, json.dumps(data))
+        except OSError:
+            # The facts are simply collected again by the next run.
+            pass
+
+
+def get_system_info(cache_path: Optional[str] = None) -> "SystemInfo":
+    """
+    Gathers relevant system information.
+
+    Args:
+        cache_path: If given, static facts are memoized in this file (see
+            SystemInfoGatherer); by default everything is computed live.
+
+    Returns:
+        An instance of SystemInfo containing the gathered system details.
+    """
+    return SystemInfoGatherer(cache_path).gather()
 
 
 if __name__ == "__main__":
     # Example usage for testing
-    info = get_system_info()
+    from fml.paths import get_cache_dir
+
+    gatherer = SystemInfoGatherer(os.path.join(get_cache_dir(), "system_info.json"))
+    info = gatherer.gather()
     print(f"OS Name: {info.os_name}")
     print(f"Shell: {info.shell}")
     print(f"CWD: {info.cwd}")
     print(f"Architecture: {info.architecture}")
     print(f"Python Version: {info.python_version}")
+    print(f"Static facts cached: {gatherer.static_cache_hit}")
+    for name, seconds in gatherer.timings.items():
+        print(f"  {name}: {seconds * 1000:.3f} ms")
@@ -0,0 +1,139 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import List, Optional, TYPE_CHECKING
+
+from fml.profiling import span
+
+if TYPE_CHECKING:
+    from fml.ai_service import AIService
+    from fml.model_stats import ModelStatsStore
+    from fml.schemas import AICommandResponse, AIContext
+
+# The primary model's latency quantile after which the hedge request is sent.
+DEFAULT_HEDGE_QUANTILE = 0.9
+# The hedge delay used until the primary model has enough recorded latencies.
+DEFAULT_HEDGE_DELAY_SECONDS = 2.0
+
+
+@dataclass
+class HedgedResult:
+    """The answer of a hedged request and where it came from."""
+
+    response: "AICommandResponse"
+    # The model whose response was used.
+    model: str
+    # Whether the second request was sent at all.
+    hedged: bool
+    delay_seconds: float
+
+
+def hedge_delay(
+    stats: Optional["ModelStatsStore"],
+    model: str,
+    quantile: float = DEFAULT_HEDGE_QUANTILE,
+) -> float:
+    """
+    Returns how long to wait for a model before hedging.
+
+    Args:
+        stats: The recorded model latencies, if any.
+        model: The primary model.
+        quantile: The latency quantile of the primary model to wait for.
+
+    Returns:
+        The quantile of the model's recorded latencies, or
+        DEFAULT_HEDGE_DELAY_SECONDS if too few have been recorded.
+    """
+    if stats is not None:
+        delay = stats.latency_quantile(model, quantile)
+        if delay is not None:
+            return delay
+    return DEFAULT_HEDGE_DELAY_SECONDS
+
+
+async def agenerate_hedged(
+    primary: "AIService",
+    secondary: "AIService",
+    query: str,
+    ai_context: "AIContext",
+    delay_seconds: float,
+    refresh: bool = False,
+) -> HedgedResult:
+    """
+    Asks the primary service and, if it is slow or fails, the secondary one too.
+
+    The secondary request is sent once `delay_seconds` pass without a validated
+    response from the primary (or as soon as the primary fails). Whichever
+    request then returns a valid AICommandResponse first wins and the other
+    one is cancelled. A cancelled request's elapsed time is recorded in its
+    service's model_stats, since it is a lower bound of that model's latency.
+
+    Raises:
+        AIServiceError: The primary's error if both requests failed.
+    """
+    tasks = {}
+    started = {}
+
+    def submit(service: "AIService") -> None:
+        task = asyncio.ensure_future(service.agenerate_command(query, ai_context, refresh=refresh))
+        tasks[task] = service
+        started[task] = time.perf_counter()
+
+    submit(primary)
+    done, _ = await asyncio.wait(tasks, timeout=delay_seconds)
+    for task in done:
+        if task.exception() is None:
+            return HedgedResult(task.result(), primary.model, False, delay_seconds)
+
+    submit(secondary)
+    errors: List[BaseException] = [task.exception() for task in done]
+    pending = set(tasks) - done
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return HedgedResult(task.result(), tasks[task].model, True, delay_seconds)
+                errors.append(task.exception())
+    finally:
+        for task in pending:
+            task.cancel()
+            service = tasks[task]
+            if service.model_stats is not None:
+                service.model_stats.record_latency(
+                    service.model, time.perf_counter() - started[task]
+                )
+        if pending:
+            await asyncio.wait(pending)
+    raise errors[0]
+
+
+def generate_hedged(
+    primary: "AIService",
+    secondary: "AIService",
+    query: str,
+    ai_context: "AIContext",
+    quantile: float = DEFAULT_HEDGE_QUANTILE,
+    refresh: bool = False,
+) -> HedgedResult:
+    """
+    Blocking wrapper around agenerate_hedged for the CLI.
+
+    The hedge delay is the primary model's `quantile` latency from its
+    service's model_stats (see hedge_delay). Both services are prepared up
+    front, so loading a provider SDK never counts against the delay.
+    """
+    delay_seconds = hedge_delay(primary.model_stats, primary.model, quantile)
+    with span("prepare"):
+        primary.prepare(query, ai_context, refresh=refresh)
+        secondary.prepare(query, ai_context, refresh=refresh)
+    with span("hedged_request", primary=primary.model, secondary=secondary.model) as current:
+        result = asyncio.run(
+            agenerate_hedged(primary, secondary, query, ai_context, delay_seconds, refresh)
+        )
+        if current is not None:
+            current.attributes.update(
+                delay_ms=round(delay_seconds * 1000, 1), hedged=result.hedged, winner=result.model
+            )
+    return result
@@ -0,0 +1,356 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from fml.schemas import AICommandResponse, SystemInfo
+
+# Stored in PRAGMA user_version; a database with another version is recreated.
+HISTORY_SCHEMA_VERSION = 1
+# Retention: the oldest entries beyond DEFAULT_MAX_ENTRIES, and entries older
+# than DEFAULT_MAX_AGE_DAYS, are deleted.
+DEFAULT_MAX_ENTRIES = 10_000
+DEFAULT_MAX_AGE_DAYS = 365
+# Retention is enforced once every this many recorded entries, so recording
+# stays a single insert for almost every query.
+PRUNE_INTERVAL = 100
+# How long a writer waits for another shell's write lock before giving up.
+BUSY_TIMEOUT_SECONDS = 2.0
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS history (
+        id INTEGER PRIMARY KEY,
+        created_at REAL NOT NULL,
+        query TEXT NOT NULL,
+        command TEXT NOT NULL,
+        explanation TEXT NOT NULL,
+        model TEXT NOT NULL,
+        source TEXT NOT NULL,
+        latency_ms REAL,
+        response TEXT NOT NULL,
+        system_info TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS history_created_at ON history (created_at)",
+)
+
+# An external-content FTS5 index over the searchable columns, kept in sync by
+# triggers so that writers only ever insert into `history`.
+_FTS_SCHEMA = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+        query, explanation, command, content='history', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS history_ai AFTER INSERT ON history BEGIN
+        INSERT INTO history_fts (rowid, query, explanation, command)
+        VALUES (new.id, new.query, new.explanation, new.command);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS history_ad AFTER DELETE ON history BEGIN
+        INSERT INTO history_fts (history_fts, rowid, query, explanation, command)
+        VALUES ('delete', old.id, old.query, old.explanation, old.command);
+    END""",
+)
+
+_COLUMNS = "id, created_at, query, command, explanation, model, source, latency_ms, response"
+
+
+@dataclass(frozen=True)
+class HistoryEntry:
+    """One answered query."""
+
+    id: int
+    created_at: float
+    query: str
+    command: str
+    explanation: str
+    model: str
+    # Where the answer came from: "model", "cache", "daemon" or "index".
+    source: str
+    latency_ms: Optional[float]
+    # The full AICommandResponse, as JSON.
+    response_json: str
+
+    def response(self) -> "AICommandResponse":
+        """Returns the stored AICommandResponse."""
+        from fml.schemas import AICommandResponse
+
+        return AICommandResponse.model_validate_json(self.response_json)
+
+
+class HistoryStore:
+    """
+    Every query fml answered, in a local SQLite database.
+
+    Each entry keeps the query, the AICommandResponse, the model, where the
+    answer came from, how long it took and the client's SystemInfo. The
+    database runs in WAL mode, so shells recording answers at the same time do
+    not block each other or readers. An FTS5 index over queries, explanations
+    and commands lets `fml --history` find earlier commands without calling the
+    model; SQLite builds without FTS5 fall back to substring matching.
+
+    Retention is bounded: at most `max_entries` entries no older than
+    `max_age_days` are kept, enforced every PRUNE_INTERVAL recorded entries,
+    and freed pages are returned to the file system as entries are deleted.
+    Only the standard library is imported. A single instance may be shared
+    between threads.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+    ):
+        if max_entries < 1:
+            raise ValueError("The history must keep at least 1 entry.")
+        if max_age_days <= 0:
+            raise ValueError("The history retention period must be positive.")
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._fts = False
+
+    def record(
+        self,
+        query: str,
+        response: "AICommandResponse",
+        model: str,
+        source: str,
+        latency_ms: Optional[float] = None,
+        system_info: Optional["SystemInfo"] = None,
+        now: Optional[float] = None,
+    ) -> int:
+        """
+        Stores an answered query.
+
+        Returns:
+            The id of the new entry.
+
+        Raises:
+            sqlite3.Error: If the database could not be written (e.g. it stayed
+                locked for longer than BUSY_TIMEOUT_SECONDS).
+        """
+        row = (
+            time.time() if now is None else now,
+            query,
+            response.command,
+            response.explanation,
+            model,
+            source,
+            latency_ms,
+            response.model_dump_json(),
+            system_info.model_dump_json() if system_info is not None else None,
+        )
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                cursor = connection.execute(
+                    "INSERT INTO history (created_at, query, command, explanation, model, "
+                    "source, latency_ms, response, system_info) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    row,
+                )
+            entry_id = cursor.lastrowid
+            if entry_id % PRUNE_INTERVAL == 0:
+                self._prune(connection, row[0])
+        return entry_id
+
+    def search(self, text: str, limit: int = 10) -> List[HistoryEntry]:
+        """
+        Finds earlier answers whose query, explanation or command match text.
+
+        Every word of text must match (as a prefix, case-insensitively). The
+        best matches come first, recent ones first among equals, and each
+        command is listed once. An empty text returns the most recent entries.
+        """
+        words = re.findall(r"\w+", text)
+        if not words:
+            return self.recent(limit)
+        with self._lock:
+            connection = self._connect()
+            if self._fts:
+                match = " ".join('"' + word.replace('"', '""') + '"*' for word in words)
+                rows = connection.execute(
+                    f"SELECT {_qualified('h')} FROM history_fts "
+                    "JOIN history AS h ON h.id = history_fts.rowid "
+                    "WHERE history_fts MATCH ? "
+                    "ORDER BY bm25(history_fts), h.created_at DESC LIMIT ?",
+                    (match, limit * 4),
+                ).fetchall()
+            else:
+                condition = " AND ".join(
+                    "(query LIKE ? OR explanation LIKE ? OR command LIKE ?)" for _ in words
+                )
+                params = [f"%{word}%" for word in words for _ in range(3)]
+                rows = connection.execute(
+                    f"SELECT {_COLUMNS} FROM history WHERE {condition} "
+                    "ORDER BY created_at DESC LIMIT ?",
+                    (*params, limit * 4),
+                ).fetchall()
+        return _unique_commands(rows, limit)
+
+    def recent(self, limit: int = 10) -> List[HistoryEntry]:
+        """Returns the most recent entries, one per command, newest first."""
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT {_COLUMNS} FROM history ORDER BY id DESC LIMIT ?", (limit * 4,)
+            ).fetchall()
+        return _unique_commands(rows, limit)
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """
+        Deletes entries beyond the retention limits.
+
+        Returns:
+            The number of entries deleted.
+        """
+        with self._lock:
+            return self._prune(self._connect(), time.time() if now is None else now)
+
+    def vacuum(self) -> None:
+        """Rebuilds the database file and the search index, reclaiming all free space."""
+        with self._lock:
+            connection = self._connect()
+            if self._fts:
+                with connection:
+                    connection.execute("INSERT INTO history_fts (history_fts) VALUES ('optimize')")
+            connection.execute("VACUUM")
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def clear(self) -> None:
+        """Deletes every entry."""
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute("DELETE FROM history")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def close(self) -> None:
+        """Closes the database connection; it is reopened on next use."""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is not None:
+            return self._connection
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(
+            self.path, timeout=BUSY_TIMEOUT_SECONDS, check_same_thread=False
+        )
+        try:
+            self._fts = _initialize(connection)
+        except sqlite3.Error:
+            connection.close()
+            raise
+        self._connection = connection
+        return connection
+
+    def _prune(self, connection: sqlite3.Connection, now: float) -> int:
+        cutoff = now - self.max_age_days * 24 * 60 * 60
+        with connection:
+            deleted = connection.execute(
+                "DELETE FROM history WHERE created_at < ? OR id <= "
+                "(SELECT id FROM history ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (cutoff, self.max_entries),
+            ).rowcount
+        if deleted:
+            # Return the pages freed by the deleted entries to the file system.
+            connection.execute("PRAGMA incremental_vacuum").fetchall()
+        return deleted
+
+
+def _initialize(connection: sqlite3.Connection) -> bool:
+    """Creates or upgrades the schema; returns whether full-text search is available."""
+    # Only takes effect on a new database, before anything has been written.
+    connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    _enable_wal(connection)
+    # In WAL mode, NORMAL only syncs at checkpoints: a power loss may drop the
+    # last few entries, but never corrupts the database.
+    connection.execute("PRAGMA synchronous = NORMAL")
+    if connection.execute("PRAGMA user_version").fetchone()[0] != HISTORY_SCHEMA_VERSION:
+        _create_schema(connection)
+    return connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'history_fts'"
+    ).fetchone() is not None
+
+
+def _enable_wal(connection: sqlite3.Connection) -> None:
+    # Switching to WAL fails at once, without waiting, while another shell is
+    # creating the database, so it is retried for up to BUSY_TIMEOUT_SECONDS.
+    deadline = time.monotonic() + BUSY_TIMEOUT_SECONDS
+    while True:
+        try:
+            connection.execute("PRAGMA journal_mode = WAL")
+            return
+        except sqlite3.OperationalError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.01)
+
+
+def _create_schema(connection: sqlite3.Connection) -> None:
+    # The write lock is taken up front, so shells creating the database at the
+    # same time wait for each other instead of failing.
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        if version == HISTORY_SCHEMA_VERSION:
+            connection.execute("COMMIT")
+            return
+        if version != 0:
+            connection.execute("DROP TABLE IF EXISTS history_fts")
+            connection.execute("DROP TABLE IF EXISTS history")
+        for statement in _SCHEMA:
+            connection.execute(statement)
+        try:
+            for statement in _FTS_SCHEMA:
+                connection.execute(statement)
+        except sqlite3.OperationalError as e:
+            if "fts5" not in str(e):
+                raise
+            # This SQLite was built without FTS5; searches use LIKE instead.
+        connection.execute(f"PRAGMA user_version = {HISTORY_SCHEMA_VERSION}")
+        connection.execute("COMMIT")
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+
+
+def _qualified(alias: str) -> str:
+    return ", ".join(f"{alias}.{column.strip()}" for column in _COLUMNS.split(","))
+
+
+def _unique_commands(rows, limit: int) -> List[HistoryEntry]:
+    entries = []
+    seen = set()
+    for row in rows:
+        entry = HistoryEntry(*row)
+        if entry.command in seen:
+            continue
+        seen.add(entry.command)
+        entries.append(entry)
+        if len(entries) == limit:
+            break
+    return entries
+
+
+def format_entries(entries: List[HistoryEntry]) -> str:
+    """Returns the `fml --history` listing of entries."""
+    if not entries:
+        return "No matching commands in the history."
+    lines = []
+    for entry in entries:
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.created_at))
+        lines.append(entry.command)
+        lines.append(f"    {entry.query}  ({when}, {entry.model})")
+    return "\n".join(lines)
@@ -0,0 +1,265 @@
+import importlib.util
+import os
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+# Connections kept per transport, and how long an idle one stays open. The
+# httpx defaults close idle connections after five seconds, which is shorter
+# than the gap between queries of a daemon or a throttled batch.
+DEFAULT_POOL_SIZE = 10
+DEFAULT_IDLE_TIMEOUT_SECONDS = 60.0
+
+# httpcore trace events emitted when a new connection is opened.
+_CONNECT_EVENTS = (
+    "connection.connect_tcp.complete",
+    "connection.connect_unix_socket.complete",
+)
+
+
+@dataclass(frozen=True)
+class TransportStats:
+    """Connection reuse of a transport since it was created."""
+
+    requests: int = 0
+    connections_opened: int = 0
+    http2_responses: int = 0
+
+    @property
+    def reused_connections(self) -> int:
+        """Requests sent over a connection that was already open."""
+        return max(self.requests - self.connections_opened, 0)
+
+    def format(self) -> str:
+        """Returns e.g. '12 requests, 2 connections opened (10 reused), 0 over HTTP/2'."""
+        return (
+            f"{self.requests} requests, {self.connections_opened} connections opened "
+            f"({self.reused_connections} reused), {self.http2_responses} over HTTP/2"
+        )
+
+
+class HttpTransport:
+    """
+    Pooled HTTP clients shared by every provider service in a process.
+
+    Each provider SDK would otherwise open its own connection pool per client,
+    so batch queries, hedged requests and daemon requests handled by different
+    services would each pay for a new TCP and TLS handshake. Services obtain
+    their httpx clients here instead: connections are kept alive for
+    `idle_timeout` seconds and reused by every later request to the same host,
+    over HTTP/2 when the `h2` package is installed.
+
+    httpx is only imported when a client is first requested. The async client
+    is meant for one event loop at a time, since its connections belong to the
+    loop that opened them.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT_SECONDS,
+        http2: Optional[bool] = None,
+    ):
+        if pool_size < 1:
+            raise ValueError("The HTTP connection pool size must be at least 1.")
+        if idle_timeout < 0:
+            raise ValueError("The HTTP idle timeout cannot be negative.")
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.http2 = importlib.util.find_spec("h2") is not None if http2 is None else http2
+        self._lock = threading.Lock()
+        self._client = None
+        self._async_client = None
+        self._requests = 0
+        self._connections_opened = 0
+        self._http2_responses = 0
+
+    def client(self):
+        """Returns the shared httpx.Client, creating it on first use."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import httpx
+
+                    self._client = httpx.Client(
+                        **self._client_args(),
+                        event_hooks={
+                            "request": [self._on_request],
+                            "response": [self._on_response],
+                        },
+                    )
+        return self._client
+
+    def async_client(self):
+        """Returns the shared httpx.AsyncClient, creating it on first use."""
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    import httpx
+
+                    self._async_client = httpx.AsyncClient(
+                        **self._client_args(),
+                        event_hooks={
+                            "request": [self._aon_request],
+                            "response": [self._aon_response],
+                        },
+                    )
+        return self._async_client
+
+    def stats(self) -> TransportStats:
+        """Returns how many requests were sent and how many needed a new connection."""
+        with self._lock:
+            return TransportStats(
+                requests=self._requests,
+                connections_opened=self._connections_opened,
+                http2_responses=self._http2_responses,
+            )
+
+    def close(self) -> None:
+        """
+        Closes the connections of both clients and forgets them.
+
+        The async client is closed on a new event loop, so this must not be called
+        from a running one; await aclose() there instead.
+
+        Raises:
+            RuntimeError: If called while an event loop is running in this thread.
+        """
+        import asyncio
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError("HttpTransport.close() cannot run inside an event loop; await aclose().")
+        client, async_client = self._take_clients()
+        if client is not None:
+            client.close()
+        if async_client is not None:
+            try:
+                asyncio.run(async_client.aclose())
+            except RuntimeError:
+                # Its connections belong to an event loop that has already closed.
+                pass
+
+    async def aclose(self) -> None:
+        """Closes the connections of both clients from the event loop that used the async one."""
+        client, async_client = self._take_clients()
+        if client is not None:
+            client.close()
+        if async_client is not None:
+            await async_client.aclose()
+
+    def _take_clients(self) -> tuple:
+        with self._lock:
+            clients = (self._client, self._async_client)
+            self._client = self._async_client = None
+        return clients
+
+    def _client_args(self) -> dict:
+        import httpx
+
+        return dict(
+            limits=httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+                keepalive_expiry=self.idle_timeout,
+            ),
+            http2=self.http2,
+            # The provider SDKs expect redirects to be followed.
+            follow_redirects=True,
+        )
+
+    def _on_request(self, request) -> None:
+        request.extensions["trace"] = self._trace
+        with self._lock:
+            self._requests += 1
+
+    def _on_response(self, response) -> None:
+        if response.http_version == "HTTP/2":
+            with self._lock:
+                self._http2_responses += 1
+
+    def _trace(self, event_name: str, info: dict) -> None:
+        if event_name in _CONNECT_EVENTS:
+            with self._lock:
+                self._connections_opened += 1
+
+    async def _aon_request(self, request) -> None:
+        request.extensions["trace"] = self._atrace
+        with self._lock:
+            self._requests += 1
+
+    async def _aon_response(self, response) -> None:
+        self._on_response(response)
+
+    async def _atrace(self, event_name: str, info: dict) -> None:
+        self._trace(event_name, info)
+
+
+_transport: Optional[HttpTransport] = None
+_transport_lock = threading.Lock()
+
+
+def configure_transport(
+    pool_size: Optional[int] = None, idle_timeout: Optional[float] = None
+) -> HttpTransport:
+    """
+    Replaces the process-wide transport with one using the given settings.
+
+    Settings left as None come from FML_HTTP_POOL_SIZE and FML_HTTP_IDLE_TIMEOUT,
+    or the defaults. Clients already handed out by the previous transport keep
+    working until they are closed.
+
+    Raises:
+        ValueError: If a setting is not a valid number.
+    """
+    global _transport
+
+    transport = _transport_from_settings(pool_size, idle_timeout)
+    with _transport_lock:
+        _transport = transport
+    return transport
+
+
+def get_transport() -> HttpTransport:
+    """Returns the process-wide transport, configured from the environment on first use."""
+    global _transport
+
+    with _transport_lock:
+        if _transport is None:
+            _transport = _transport_from_settings(None, None)
+        return _transport
+
+
+def current_transport() -> Optional[HttpTransport]:
+    """Returns the process-wide transport if one has been created, without creating it."""
+    return _transport
+
+
+def close_transport() -> None:
+    """Closes the process-wide transport's connections, if it was ever created."""
+    transport = _transport
+    if transport is not None:
+        transport.close()
+
+
+def _transport_from_settings(
+    pool_size: Optional[int], idle_timeout: Optional[float]
+) -> HttpTransport:
+    if pool_size is None:
+        pool_size = _env_number("FML_HTTP_POOL_SIZE", int, DEFAULT_POOL_SIZE)
+    if idle_timeout is None:
+        idle_timeout = _env_number("FML_HTTP_IDLE_TIMEOUT", float, DEFAULT_IDLE_TIMEOUT_SECONDS)
+    return HttpTransport(pool_size=pool_size, idle_timeout=idle_timeout)
+
+
+def _env_number(name: str, kind, default):
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return kind(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number, not '{value}'.") from None
@@ -0,0 +1,519 @@
+"""
+Load generator for fml: replays a query corpus against a target and reports
+throughput, latency percentiles, errors by category and peak memory.
+
+Targets:
+    service   an AIService in this process (add --fake to answer from a local
+              fake Gemini API with injected latency, errors and malformed JSON)
+    server    a running `fml serve` (--url)
+    daemon    a running `fml --daemon` (--socket)
+
+Load is either closed-loop (--concurrency N workers sending back to back) or
+open-loop (--rate N queries per second, whatever the response times); open-loop
+latencies are measured from each query's scheduled start, so time spent waiting
+behind a saturated target is included.
+
+Usage:
+    python -m fml.loadtest --fake --latency 0.05 --error-rate 0.02 --concurrency 16 --duration 30
+    FML_GEMINI_BASE_URL=http://127.0.0.1:8765 GEMINI_API_KEY=fake fml serve &
+    python -m fml.loadtest --target server --rate 50 --requests 2000 --pid $!
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional
+from urllib.parse import urlsplit
+
+if TYPE_CHECKING:
+    from fml.ai_service import AIService
+    from fml.schemas import AIContext, SystemInfo
+
+# Used when no --corpus is given.
+DEFAULT_QUERIES = (
+    "list all files including hidden ones",
+    "find files modified in the last day",
+    "show disk usage of the current directory sorted by size",
+    "count lines in all python files",
+    "kill the process listening on port 8080",
+    "compress the logs directory into a tarball",
+    "show the last 100 lines of syslog and follow it",
+    "replace foo with bar in every markdown file",
+)
+# Error categories reported for failures outside AIServiceError.
+CATEGORY_REJECTED = "rejected"
+CATEGORY_INVALID = "invalid"
+CATEGORY_NETWORK = "network"
+CATEGORY_UNAVAILABLE = "unavailable"
+CATEGORY_UNEXPECTED = "unexpected"
+
+
+class LoadTarget(ABC):
+    """Something that answers queries: an AIService, an fml server or a daemon."""
+
+    name: str = ""
+
+    @abstractmethod
+    def send(self, query: str) -> Optional[str]:
+        """
+        Sends one query and waits for its answer.
+
+        Returns:
+            None on success, otherwise the error category (the AIServiceError
+            category where the target reports one).
+        """
+        pass
+
+    def close(self) -> None:
+        """Releases connections held by the target."""
+        pass
+
+
+class ServiceTarget(LoadTarget):
+    """Calls AIService.generate_command in this process."""
+
+    name = "service"
+
+    def __init__(self, service: "AIService", ai_context: "AIContext"):
+        self.service = service
+        self.ai_context = ai_context
+
+    def send(self, query: str) -> Optional[str]:
+        from fml.ai_service import AIServiceError
+
+        try:
+            self.service.generate_command(query, self.ai_context)
+        except AIServiceError as e:
+            return e.category
+        except ValueError:
+            return CATEGORY_INVALID
+        return None
+
+
+class ServerTarget(LoadTarget):
+    """POSTs queries to a running `fml serve` over keep-alive connections (one per thread)."""
+
+    name = "server"
+
+    def __init__(
+        self, base_url: str, model: Optional[str] = None, system_info: Optional["SystemInfo"] = None
+    ):
+        parts = urlsplit(base_url)
+        if parts.scheme != "http" or not parts.hostname:
+            raise ValueError(f"Expected an http:// server URL, not '{base_url}'.")
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = parts.path.rstrip("/") + "/v1/generate"
+        self.model = model
+        self.system_info = system_info.model_dump(mode="json") if system_info else None
+        self._local = threading.local()
+        self._connections: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def send(self, query: str) -> Optional[str]:
+        body = json.dumps(
+            {"query": query, "model": self.model, "system_info": self.system_info}
+        ).encode("utf-8")
+        try:
+            connection = self._connection()
+            connection.request("POST", self.path, body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            payload = response.read()
+        except (OSError, http.client.HTTPException):
+            self._drop_connection()
+            return CATEGORY_NETWORK
+
+        if response.status == 200:
+            return None
+        if response.status == 429:
+            return CATEGORY_REJECTED
+        if response.status == 400:
+            return CATEGORY_INVALID
+        if response.status == 502:
+            try:
+                return json.loads(payload).get("category") or CATEGORY_UNEXPECTED
+            except (ValueError, AttributeError):
+                return CATEGORY_UNEXPECTED
+        return f"http_{response.status}"
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=120)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _drop_connection(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+class DaemonTarget(LoadTarget):
+    """Sends queries to a running `fml --daemon` over its Unix socket."""
+
+    name = "daemon"
+
+    def __init__(
+        self,
+        model: str,
+        socket_path: Optional[str] = None,
+        system_info: Optional["SystemInfo"] = None,
+    ):
+        self.model = model
+        self.socket_path = socket_path
+        self.system_info = system_info
+
+    def send(self, query: str) -> Optional[str]:
+        from fml.ai_service import AIServiceError
+        from fml.daemon import DaemonUnavailable, request_via_daemon
+
+        try:
+            request_via_daemon(self.model, query, self.system_info, socket_path=self.socket_path)
+        except DaemonUnavailable:
+            return CATEGORY_UNAVAILABLE
+        except AIServiceError as e:
+            return e.category
+        except (ValueError, KeyError):
+            return CATEGORY_INVALID
+        except (RuntimeError, OSError):
+            return CATEGORY_UNEXPECTED
+        return None
+
+
+@dataclass
+class LoadReport:
+    """The outcome of a load test."""
+
+    target: str
+    mode: str
+    requests: int = 0
+    errors: Dict[str, int] = field(default_factory=dict)
+    elapsed_seconds: float = 0.0
+    # Latency of every request, successful or not, in completion order.
+    latencies_ms: List[float] = field(default_factory=list)
+    peak_rss_bytes: Optional[int] = None
+
+    @property
+    def failed(self) -> int:
+        """Requests that ended in an error."""
+        return sum(self.errors.values())
+
+    @property
+    def succeeded(self) -> int:
+        """Requests that were answered."""
+        return self.requests - self.failed
+
+    @property
+    def throughput(self) -> float:
+        """Completed requests per second."""
+        return self.requests / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def percentiles(self) -> Dict[str, float]:
+        """Returns p50/p90/p99/max latency in milliseconds (nearest rank)."""
+        ordered = sorted(self.latencies_ms)
+        return {
+            "p50": percentile(ordered, 0.50),
+            "p90": percentile(ordered, 0.90),
+            "p99": percentile(ordered, 0.99),
+            "max": ordered[-1] if ordered else 0.0,
+        }
+
+    def to_dict(self) -> dict:
+        """Returns the report as JSON-serializable data."""
+        return {
+            "target": self.target,
+            "mode": self.mode,
+            "requests": self.requests,
+            "succeeded": self.succeeded,
+            "errors": dict(sorted(self.errors.items())),
+            "elapsed_seconds": round(self.elapsed_seconds, 3),
+            "throughput_rps": round(self.throughput, 2),
+            "latency_ms": {name: round(value, 3) for name, value in self.percentiles().items()},
+            "peak_rss_bytes": self.peak_rss_bytes,
+        }
+
+    def format(self) -> str:
+        """Returns a human readable summary."""
+        latency = self.percentiles()
+        lines = [
+            f"Target: {self.target} ({self.mode})",
+            f"Requests: {self.requests} in {self.elapsed_seconds:.2f}s "
+            f"({self.throughput:.1f}/s), {self.succeeded} succeeded, {self.failed} failed",
+            "Latency: " + ", ".join(f"{name} {value:.1f} ms" for name, value in latency.items()),
+        ]
+        if self.errors:
+            lines.append(
+                "Errors: " + ", ".join(f"{name} {count}" for name, count in sorted(self.errors.items()))
+            )
+        if self.peak_rss_bytes is not None:
+            lines.append(f"Peak RSS: {self.peak_rss_bytes / (1024 * 1024):.1f} MiB")
+        return "\n".join(lines)
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """Returns the nearest-rank q-quantile of already sorted values (0.0 if empty)."""
+    if not ordered:
+        return 0.0
+    rank = min(len(ordered), max(1, math.ceil(q * len(ordered))))
+    return ordered[rank - 1]
+
+
+def peak_rss_bytes(pid: Optional[int] = None) -> Optional[int]:
+    """
+    Returns the peak resident set size of a process, in bytes.
+
+    For this process getrusage is used; other processes are only supported
+    where /proc reports VmHWM (Linux). Returns None when it is unknown.
+    """
+    if pid is None or pid == os.getpid():
+        try:
+            import resource
+        except ImportError:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+        return peak if sys.platform == "darwin" else peak * 1024
+    try:
+        with open(f"/proc/{pid}/status", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+class _Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies_ms: List[float] = []
+        self.errors: Dict[str, int] = {}
+
+    def send(self, target: LoadTarget, query: str, started: float) -> None:
+        try:
+            error = target.send(query)
+        except Exception as e:  # A broken target must not stop the run.
+            error = f"{CATEGORY_UNEXPECTED}:{type(e).__name__}"
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.latencies_ms.append(elapsed_ms)
+            if error is not None:
+                self.errors[error] = self.errors.get(error, 0) + 1
+
+
+def run_load(
+    target: LoadTarget,
+    queries: List[str],
+    concurrency: Optional[int] = None,
+    rate: Optional[float] = None,
+    requests: Optional[int] = None,
+    duration: Optional[float] = None,
+    max_in_flight: int = 256,
+) -> LoadReport:
+    """
+    Replays queries against a target and measures the responses.
+
+    Queries are sent in corpus order, wrapping around, until `requests` have
+    been sent or `duration` seconds have passed (one pass over the corpus when
+    neither is given).
+
+    Args:
+        target: Where queries are sent.
+        queries: The corpus to replay.
+        concurrency: Closed loop: this many workers each send the next query as
+            soon as their previous one is answered.
+        rate: Open loop: queries are started at this many per second, on at
+            most `max_in_flight` threads.
+        requests: Stop after this many queries.
+        duration: Stop starting queries after this many seconds.
+        max_in_flight: The thread limit of open-loop runs.
+
+    Returns:
+        The LoadReport; its peak RSS is that of this process.
+
+    Raises:
+        ValueError: If the settings are inconsistent.
+    """
+    if not queries:
+        raise ValueError("The query corpus is empty.")
+    if (concurrency is None) == (rate is None):
+        raise ValueError("Give either a concurrency or a rate.")
+    if concurrency is not None and concurrency < 1:
+        raise ValueError("The concurrency must be at least 1.")
+    if rate is not None and rate <= 0:
+        raise ValueError("The rate must be positive.")
+    if requests is None and duration is None:
+        requests = len(queries)
+
+    recorder = _Recorder()
+    start = time.perf_counter()
+    deadline = start + duration if duration is not None else None
+    limit = requests if requests is not None else float("inf")
+
+    if concurrency is not None:
+        mode = f"concurrency {concurrency}"
+        counter = iter(range(sys.maxsize))
+        counter_lock = threading.Lock()
+
+        def worker():
+            while True:
+                with counter_lock:
+                    index = next(counter)
+                if index >= limit or (deadline is not None and time.perf_counter() >= deadline):
+                    return
+                recorder.send(target, queries[index % len(queries)], time.perf_counter())
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        mode = f"rate {rate:g}/s"
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            index = 0
+            while index < limit:
+                scheduled = start + index / rate
+                if deadline is not None and scheduled >= deadline:
+                    break
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(recorder.send, target, queries[index % len(queries)], scheduled)
+                index += 1
+
+    return LoadReport(
+        target=target.name,
+        mode=mode,
+        requests=len(recorder.latencies_ms),
+        errors=recorder.errors,
+        elapsed_seconds=time.perf_counter() - start,
+        latencies_ms=recorder.latencies_ms,
+        peak_rss_bytes=peak_rss_bytes(),
+    )
+
+
+def load_corpus(path: Optional[str]) -> List[str]:
+    """Reads queries in the `--batch` input format, or returns DEFAULT_QUERIES."""
+    if path is None:
+        return list(DEFAULT_QUERIES)
+    from fml.batch import read_batch_file
+
+    return [item.query for item in read_batch_file(path) if item.error is None]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from fml.ai_providers.models import MODELS
+
+    parser = argparse.ArgumentParser(
+        prog="python -m fml.loadtest",
+        description="Replay a query corpus against an fml service, server or daemon.",
+    )
+    parser.add_argument("--target", choices=["service", "server", "daemon"], default="service")
+    parser.add_argument("--url", default="http://127.0.0.1:8080",
+                        help="Base URL of the `fml serve` target.")
+    parser.add_argument("--socket", help="Socket of the daemon target (default: its usual path).")
+    parser.add_argument("-m", "--model", default=list(MODELS.keys())[0])
+    parser.add_argument("--corpus", metavar="FILE",
+                        help="Queries to replay, in the --batch input format.")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=int, metavar="N",
+                      help="Workers sending queries back to back (default: 4).")
+    load.add_argument("--rate", type=float, metavar="QPS", help="Queries started per second.")
+    parser.add_argument("--requests", type=int, metavar="N", help="Queries to send.")
+    parser.add_argument("--duration", type=float, metavar="SECONDS",
+                        help="Stop starting queries after this long.")
+    parser.add_argument("--pid", type=int,
+                        help="Report the peak RSS of this process (the server or daemon).")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    fake = parser.add_argument_group("fake provider (service target)")
+    fake.add_argument("--fake", action="store_true",
+                      help="Answer from a local fake Gemini API instead of the real one.")
+    fake.add_argument("--latency", type=float, default=0.0, help="Seconds before each response.")
+    fake.add_argument("--jitter", type=float, default=0.0,
+                      help="Up to this many further seconds before each response.")
+    fake.add_argument("--error-rate", type=float, default=0.0,
+                      help="Fraction of requests failing with HTTP 503.")
+    fake.add_argument("--malformed-rate", type=float, default=0.0,
+                      help="Fraction of requests answered with truncated JSON.")
+    fake.add_argument("--seed", type=int, help="Seed for the injected faults.")
+    args = parser.parse_args(argv)
+
+    if args.fake and args.target != "service":
+        parser.error("--fake only applies to the service target; point the server or "
+                     "daemon at `python -m fml.testing.fake_gemini` instead.")
+    if args.concurrency is None and args.rate is None:
+        args.concurrency = 4
+
+    from fml.gather_system_info import get_system_info
+    from fml.schemas import AIContext
+
+    system_info = get_system_info()
+    fake_server = None
+    try:
+        if args.target == "server":
+            target: LoadTarget = ServerTarget(args.url, args.model, system_info)
+        elif args.target == "daemon":
+            target = DaemonTarget(args.model, args.socket, system_info)
+        else:
+            if args.fake:
+                from fml.testing.fake_gemini import FakeGeminiServer
+
+                fake_server = FakeGeminiServer(
+                    latency=args.latency,
+                    latency_jitter=args.jitter,
+                    error_rate=args.error_rate,
+                    malformed_rate=args.malformed_rate,
+                    seed=args.seed,
+                ).start()
+                os.environ["FML_GEMINI_BASE_URL"] = fake_server.base_url
+                os.environ.setdefault("GEMINI_API_KEY", "fake")
+            from fml.__main__ import _initialize_ai_service
+
+            target = ServiceTarget(
+                _initialize_ai_service(args.model), AIContext(system_info=system_info)
+            )
+        report = run_load(
+            target,
+            load_corpus(args.corpus),
+            concurrency=args.concurrency,
+            rate=args.rate,
+            requests=args.requests,
+            duration=args.duration,
+        )
+        target.close()
+    except (ValueError, RuntimeError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        if fake_server is not None:
+            fake_server.stop()
+
+    if args.pid is not None:
+        report.peak_rss_bytes = peak_rss_bytes(args.pid)
+    elif args.target != "service":
+        # The load generator's own memory says nothing about the server.
+        report.peak_rss_bytes = None
+    print(json.dumps(report.to_dict(), indent=2) if args.json else report.format())
+
+
+if __name__ == "__main__":
+    main()
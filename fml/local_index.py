@@ -0,0 +1,206 @@
+import json
+import math
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from fml.schemas import AICommandResponse
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.dirname(__file__), "data", "commands.json")
+# Minimum score for answering without asking the model.
+DEFAULT_CONFIDENCE = 0.6
+# With --offline there is no better source to fall back to, so weaker matches are shown.
+OFFLINE_MIN_SCORE = 0.3
+
+_WORD_PATTERN = re.compile(r"[\w+-]+")
+_QUOTED_PATTERN = re.compile(r"([\"'`])(.+?)\1")
+# Numbers, sizes, paths, globs and file names: words that are copied into the command.
+_LITERAL_PATTERN = re.compile(r"\d|[/~*\\]|^\.|^[\w-]+\.[\w.-]*\w$")
+_STOP_WORDS = frozenset(
+    "a an the how do i can to in on of for with my me what is are please you "
+    "this that it command use using want should".split()
+)
+
+
+def tokenize(text: str) -> Set[str]:
+    """
+    Splits text into the set of terms used for index lookups.
+
+    Terms are lowercased words without filler words ("how do I ..."), with a
+    trailing plural "s" removed so "files" matches "file".
+
+    Args:
+        text: A natural language query or indexed phrase.
+
+    Returns:
+        The set of terms.
+    """
+    terms = set()
+    for word in _WORD_PATTERN.findall(text.lower()):
+        word = word.strip("-")
+        if not word or word in _STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")):
+            word = word[:-1]
+        terms.add(word)
+    return terms
+
+
+def literal_tokens(query: str) -> Tuple[str, ...]:
+    """
+    Returns the literals of a query, in order: quoted strings, then numbers,
+    sizes, paths, globs and file names.
+
+    Two queries that differ in any of these ask for different commands however
+    many words they share ("older than 7 days" and "older than 30 days"), so
+    neither the local index nor the semantic cache answers one with the other.
+    """
+    literals = [match.group(2) for match in _QUOTED_PATTERN.finditer(query)]
+    for word in _QUOTED_PATTERN.sub(" ", query).split():
+        word = word.strip(",;:!?()[]{}").rstrip(".")
+        if word and _LITERAL_PATTERN.search(word):
+            literals.append(word)
+    return tuple(literals)
+
+
+@dataclass(frozen=True)
+class LocalMatch:
+    """The best index entry for a query and how well it matched."""
+
+    response: "AICommandResponse"
+    score: float
+    phrase: str
+
+
+class LocalCommandIndex:
+    """
+    An inverted index over example phrasings of common commands.
+
+    Each entry in the index data holds a few example queries (`phrases`), the
+    answer (`explanation`, `flags`, `command`) and optionally the operating
+    systems (`os`) the command applies to. A query is scored against every
+    phrase sharing at least one term with it using an IDF-weighted Jaccard
+    similarity, so rare terms ("tar", "stash") count for more than common ones
+    ("file", "show") and query terms the phrase does not cover lower the score.
+    A phrase only matches if it contains every literal of the query (see
+    literal_tokens): "undo the last 3 commits" is not answered with the
+    command for undoing one.
+    """
+
+    def __init__(self, entries: List[dict]):
+        self.entries = entries
+        self._phrases: List[tuple] = []
+        self._postings: Dict[str, List[int]] = {}
+
+        for entry_index, entry in enumerate(entries):
+            for phrase in entry["phrases"]:
+                terms = tokenize(phrase)
+                literals = frozenset(token.lower() for token in literal_tokens(phrase))
+                phrase_id = len(self._phrases)
+                self._phrases.append((entry_index, phrase, terms, literals))
+                for term in terms:
+                    self._postings.setdefault(term, []).append(phrase_id)
+
+        phrase_count = len(self._phrases)
+        self._idf = {
+            term: math.log(1 + phrase_count / len(ids))
+            for term, ids in self._postings.items()
+        }
+        # Terms never seen in the index are as specific as a term can be.
+        self._unknown_idf = math.log(1 + max(phrase_count, 1))
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_INDEX_PATH) -> "LocalCommandIndex":
+        """
+        Loads index data from a JSON file.
+
+        Raises:
+            OSError: If the file cannot be read.
+            ValueError: If the file is not valid index data.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or not isinstance(data.get("entries"), list):
+            raise ValueError(f"Invalid command index: {path}")
+        return cls(data["entries"])
+
+    def search(self, query: str, os_name: Optional[str] = None) -> Optional[LocalMatch]:
+        """
+        Returns the best matching entry for a query, however weak the match.
+
+        Phrases missing any of the query's literals are never matched.
+
+        Args:
+            query: The natural language query.
+            os_name: The user's operating system; entries restricted to other
+                systems are skipped.
+
+        Returns:
+            The best LocalMatch, or None if no phrase shares a term with the query.
+        """
+        from fml.schemas import AICommandResponse
+
+        query_terms = tokenize(query)
+        query_literals = {token.lower() for token in literal_tokens(query)}
+        candidates = set()
+        for term in query_terms:
+            candidates.update(self._postings.get(term, ()))
+
+        best_score, best_id = 0.0, None
+        for phrase_id in candidates:
+            entry_index, _, phrase_terms, phrase_literals = self._phrases[phrase_id]
+            if not query_literals <= phrase_literals:
+                continue
+            allowed = self.entries[entry_index].get("os")
+            if allowed and os_name not in allowed:
+                continue
+            score = self._weight(query_terms & phrase_terms) / self._weight(
+                query_terms | phrase_terms
+            )
+            if score > best_score:
+                best_score, best_id = score, phrase_id
+
+        if best_id is None:
+            return None
+        entry_index, phrase, _, _ = self._phrases[best_id]
+        entry = self.entries[entry_index]
+        response = AICommandResponse(
+            explanation=entry["explanation"],
+            flags=entry.get("flags", []),
+            command=entry["command"],
+        )
+        return LocalMatch(response=response, score=best_score, phrase=phrase)
+
+    def lookup(
+        self,
+        query: str,
+        os_name: Optional[str] = None,
+        min_score: float = DEFAULT_CONFIDENCE,
+    ) -> Optional["AICommandResponse"]:
+        """
+        Returns the indexed answer for a query if the match is confident enough.
+
+        Args:
+            query: The natural language query.
+            os_name: The user's operating system.
+            min_score: The minimum match score (0-1) to accept.
+
+        Returns:
+            The AICommandResponse, or None if nothing matched well enough.
+        """
+        match = self.search(query, os_name)
+        if match is None or match.score < min_score:
+            return None
+        return match.response
+
+    def _weight(self, terms: Set[str]) -> float:
+        return sum(self._idf.get(term, self._unknown_idf) for term in terms)
+
+
+@lru_cache(maxsize=1)
+def get_default_index() -> LocalCommandIndex:
+    """Returns the index shipped with fml, loaded once per process."""
+    return LocalCommandIndex.load()
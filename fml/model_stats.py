@@ -0,0 +1,239 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from fml.paths import atomic_write, lock_file
+
+MODEL_STATS_FORMAT_VERSION = 1
+# Upper bounds, in seconds, of the latency histogram buckets. A final open
+# bucket holds everything slower. Changing them requires a format version bump.
+LATENCY_BUCKETS = (0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 4.0, 6.0, 8.0, 12.0, 20.0, 30.0)
+# Once a model has this many samples every count is halved, so the histogram
+# follows the model's recent behaviour instead of its whole history.
+MAX_SAMPLES = 200
+# Quantiles are not estimated from fewer samples than this.
+MIN_SAMPLES = 10
+# Consecutive failures after which a model's circuit opens, and how long it
+# stays open. Once the cool-down has passed one request is let through: a
+# success closes the circuit, another failure opens it again.
+FAILURE_THRESHOLD = 3
+COOLDOWN_SECONDS = 60.0
+
+
+class ModelStatsStore:
+    """
+    Per-model latency histograms and health shared by fml runs.
+
+    AIService records every provider request here (see AIService.model_stats):
+    the latency of successful ones and the failures caused by the model (API
+    errors and malformed responses). Features that depend on how fast and how
+    reliable a model is, such as hedged requests and `--model auto`, read the
+    statistics back. A model failing FAILURE_THRESHOLD times in a row has its
+    circuit opened for COOLDOWN_SECONDS. With a `path`, the statistics are kept
+    in a small JSON file so that every invocation learns from the earlier
+    ones; without one they live in memory.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._models: Optional[Dict[str, dict]] = None
+
+    def record_latency(self, model: str, seconds: float) -> None:
+        """
+        Adds a latency to the model's histogram without affecting its health.
+
+        Used for requests that were abandoned before they finished, whose
+        elapsed time is still a lower bound of the model's latency.
+        """
+        self._update(lambda models: _add_latency(_entry(models, model), seconds))
+
+    def record_success(self, model: str, seconds: float) -> None:
+        """Records a successful request: its latency, and that the model is healthy."""
+
+        def add(models: Dict[str, dict]) -> None:
+            entry = _entry(models, model)
+            _add_latency(entry, seconds)
+            _add_outcome(entry, failed=False)
+            entry["consecutive_failures"] = 0
+            entry["open_until"] = 0.0
+
+        self._update(add)
+
+    def record_failure(self, model: str) -> None:
+        """Records a request that failed because of the model."""
+
+        def add(models: Dict[str, dict]) -> None:
+            entry = _entry(models, model)
+            _add_outcome(entry, failed=True)
+            entry["consecutive_failures"] += 1
+            if entry["consecutive_failures"] >= FAILURE_THRESHOLD:
+                entry["open_until"] = time.time() + COOLDOWN_SECONDS
+
+        self._update(add)
+
+    def failure_rate(self, model: str) -> float:
+        """Returns the (recent) share of the model's requests that failed."""
+        with self._lock:
+            entry = self._loaded().get(model)
+        if not entry or not entry["requests"]:
+            return 0.0
+        return entry["failures"] / entry["requests"]
+
+    def circuit_open_until(self, model: str) -> float:
+        """
+        Returns the time.time() until which the model's circuit is open, or 0.0
+        if requests may be sent to it.
+        """
+        with self._lock:
+            entry = self._loaded().get(model)
+        if not entry or entry["open_until"] <= time.time():
+            return 0.0
+        return entry["open_until"]
+
+    def sample_count(self, model: str) -> int:
+        """Returns the number of latencies currently weighed for a model."""
+        with self._lock:
+            entry = self._loaded().get(model)
+        return entry["count"] if entry else 0
+
+    def latency_quantile(self, model: str, quantile: float) -> Optional[float]:
+        """
+        Estimates a latency quantile of a model from its histogram.
+
+        Args:
+            model: The model name.
+            quantile: The quantile, between 0 and 1 (e.g. 0.9 for p90).
+
+        Returns:
+            The estimated latency in seconds, interpolated within its bucket, or
+            None if fewer than MIN_SAMPLES latencies have been recorded.
+        """
+        with self._lock:
+            entry = self._loaded().get(model)
+            buckets = list(entry["buckets"]) if entry else []
+        total = sum(buckets)
+        if total < MIN_SAMPLES:
+            return None
+
+        target = min(max(quantile, 0.0), 1.0) * total
+        cumulative = 0
+        for index, count in enumerate(buckets):
+            if count and cumulative + count >= target:
+                if index == len(LATENCY_BUCKETS):
+                    # Nothing is known about the open bucket beyond its lower bound.
+                    return LATENCY_BUCKETS[-1]
+                lower = LATENCY_BUCKETS[index - 1] if index else 0.0
+                upper = LATENCY_BUCKETS[index]
+                return lower + (upper - lower) * (target - cumulative) / count
+            cumulative += count
+        return LATENCY_BUCKETS[-1]
+
+    def _loaded(self) -> Dict[str, dict]:
+        if self._models is None:
+            self._models = self._load()
+        return self._models
+
+    def _update(self, change: Callable[[Dict[str, dict]], None]) -> None:
+        with self._lock:
+            if not self.path:
+                change(self._loaded())
+                return
+            # The file is re-read under a lock shared with other processes, so
+            # samples and failures they record in the meantime are kept.
+            with self._file_lock():
+                models = self._load()
+                change(models)
+                self._models = models
+                self._save(models)
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        except OSError:
+            # Without a lock file, updates from concurrent processes may race.
+            yield
+            return
+        try:
+            with lock_file(fd):
+                yield
+        finally:
+            os.close(fd)
+
+    def _load(self) -> Dict[str, dict]:
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != MODEL_STATS_FORMAT_VERSION:
+            return {}
+        models = data.get("models")
+        if not isinstance(models, dict):
+            return {}
+        return {name: entry for name, entry in models.items() if _valid_entry(entry)}
+
+    def _save(self, models: Dict[str, dict]) -> None:
+        try:
+            atomic_write(
+                self.path, json.dumps({"version": MODEL_STATS_FORMAT_VERSION, "models": models})
+            )
+        except OSError:
+            # The samples stay in memory for the rest of this run.
+            pass
+
+
+def _entry(models: Dict[str, dict], model: str) -> dict:
+    entry = models.get(model)
+    if entry is None:
+        entry = models[model] = {
+            "buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+            "count": 0,
+            "requests": 0,
+            "failures": 0,
+            "consecutive_failures": 0,
+            "open_until": 0.0,
+        }
+    return entry
+
+
+def _add_latency(entry: dict, seconds: float) -> None:
+    entry["buckets"][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    entry["count"] += 1
+    if entry["count"] >= MAX_SAMPLES:
+        entry["buckets"] = [count // 2 for count in entry["buckets"]]
+        entry["count"] = sum(entry["buckets"])
+
+
+def _add_outcome(entry: dict, failed: bool) -> None:
+    entry["requests"] += 1
+    entry["failures"] += int(failed)
+    if entry["requests"] >= MAX_SAMPLES:
+        entry["requests"] //= 2
+        entry["failures"] //= 2
+
+
+def _valid_entry(entry) -> bool:
+    if not isinstance(entry, dict):
+        return False
+    buckets: List = entry.get("buckets")
+    if not (
+        isinstance(buckets, list)
+        and len(buckets) == len(LATENCY_BUCKETS) + 1
+        and all(isinstance(count, int) and count >= 0 for count in buckets)
+        and entry.get("count") == sum(buckets)
+    ):
+        return False
+    # Health fields were added later; entries without them start out healthy.
+    for key in ("requests", "failures", "consecutive_failures"):
+        if not isinstance(entry.setdefault(key, 0), int):
+            return False
+    return isinstance(entry.setdefault("open_until", 0.0), (int, float))
@@ -1,4 +1,9 @@
-from fml.schemas import AICommandResponse
+import sys
+from typing import TYPE_CHECKING
+from fml.profiling import traced
+
+if TYPE_CHECKING:
+    from fml.schemas import AICommandResponse
 
 
 class OutputFormatter:
@@ -6,8 +11,9 @@ class OutputFormatter:
     Handles formatting of AI command responses for terminal display.
     """
 
+    @traced("format_response")
     def format_response(self,
-                        ai_response: AICommandResponse,
+                        ai_response: "AICommandResponse",
                         enable_color: bool = True) -> str:
         """
         Formats the AICommandResponse object into a human-readable string for the terminal.
@@ -50,3 +56,106 @@ class OutputFormatter:
         output_parts.append(command)
 
         return "\n".join(output_parts)
+
+
+class StreamingRenderer:
+    """
+    Renders an AICommandResponse incrementally while it is being streamed.
+
+    The layout matches OutputFormatter.format_response: explanation text is written
+    as it arrives, each flag is written once it is complete, and the command line is
+    only written by `finish` once the full response has been validated.
+    """
+
+    def __init__(self, stream=None, enable_color: bool = True):
+        """
+        Args:
+            stream: A text stream to write to (defaults to sys.stdout).
+            enable_color: A boolean indicating whether to apply color to the output.
+        """
+        self.stream = stream
+        self.enable_color = enable_color
+        self._explanation_written = ""
+        self._explanation_closed = False
+        self._flags_written = 0
+
+    def update(self, partial: dict) -> None:
+        """
+        Writes whatever is new in a partial response snapshot.
+
+        Args:
+            partial: A dict snapshot of the partially received response JSON.
+        """
+        explanation = partial.get("explanation")
+        if isinstance(explanation, str):
+            self._write_explanation(explanation)
+
+        # The schema orders explanation, flags, command, so once a later key shows
+        # up the previous field is final.
+        if "flags" in partial or "command" in partial:
+            self._close_explanation()
+
+        flags = partial.get("flags")
+        if isinstance(flags, list):
+            # The last flag object may still be incomplete unless command has started.
+            complete_count = len(flags) if "command" in partial else len(flags) - 1
+            for flag_obj in flags[self._flags_written:complete_count]:
+                if not isinstance(flag_obj, dict):
+                    break
+                self._write_flag(flag_obj.get("flag", ""), flag_obj.get("description", ""))
+
+    def finish(self, ai_response: "AICommandResponse") -> None:
+        """
+        Writes the remainder of the validated response, including the command line.
+
+        Args:
+            ai_response: The complete AICommandResponse.
+        """
+        self._write_explanation(ai_response.explanation)
+        self._close_explanation()
+        for flag_obj in ai_response.flags[self._flags_written:]:
+            self._write_flag(flag_obj.flag, flag_obj.description)
+        if ai_response.flags:
+            self._write("\n")
+
+        command = ai_response.command
+        if self.enable_color:
+            from colorama import Fore, Style
+
+            command = Fore.GREEN + command + Style.RESET_ALL
+        self._write(command + "\n")
+
+    def _write_explanation(self, explanation: str) -> None:
+        if self._explanation_closed:
+            return
+        if not explanation.startswith(self._explanation_written):
+            # The text changed underneath us; keep what is already on screen.
+            return
+        delta = explanation[len(self._explanation_written):]
+        if not delta:
+            return
+        self._explanation_written = explanation
+        if self.enable_color:
+            from colorama import Fore, Style
+
+            delta = Fore.CYAN + delta + Style.RESET_ALL
+        self._write(delta)
+
+    def _close_explanation(self) -> None:
+        if not self._explanation_closed:
+            self._explanation_closed = True
+            self._write("\n\n")
+
+    def _write_flag(self, flag_text: str, description_text: str) -> None:
+        self._flags_written += 1
+        if self.enable_color:
+            from colorama import Fore, Style
+
+            flag_text = Fore.YELLOW + flag_text + Style.RESET_ALL
+            description_text = Fore.WHITE + description_text + Style.RESET_ALL
+        self._write(f"{flag_text}: {description_text}\n")
+
+    def _write(self, text: str) -> None:
+        stream = self.stream or sys.stdout
+        stream.write(text)
+        stream.flush()
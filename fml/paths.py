@@ -0,0 +1,97 @@
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def get_cache_dir() -> str:
+    """
+    Returns the directory fml uses for its local caches and stores.
+
+    Resolution order: the FML_CACHE_DIR environment variable, then the
+    platform's conventional per-user cache location.
+
+    Returns:
+        The absolute path of the cache directory (not created by this function).
+    """
+    override = os.environ.get("FML_CACHE_DIR")
+    if override:
+        return os.path.abspath(os.path.expanduser(override))
+
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~\\AppData\\Local")
+        return os.path.join(base, "fml", "Cache")
+    if sys.platform == "darwin":
+        return os.path.expanduser("~/Library/Caches/fml")
+
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "fml")
+
+
+def atomic_write(path: str, data: Union[bytes, str]) -> None:
+    """
+    Replaces the contents of a file atomically.
+
+    The data is written to a temporary file in the same directory (created if
+    needed), which is then renamed over `path`, so readers see either the old
+    or the new contents in full, never a partial write.
+
+    Args:
+        path: The file to write.
+        data: The new contents; str is encoded as UTF-8.
+
+    Raises:
+        OSError: If the file could not be written. No temporary file is left behind.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix="." + os.path.basename(path) + "-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+@contextmanager
+def lock_file(fd: int, exclusive: bool = True) -> Iterator[None]:
+    """
+    Holds an advisory lock on an open file, shared between processes.
+
+    Used to serialize processes that update the same files in the cache
+    directory. Blocks until the lock is granted.
+
+    Args:
+        fd: A descriptor of the lock file, opened for reading and writing.
+        exclusive: Whether to take an exclusive (writer) lock rather than a
+            shared (reader) one. Windows only offers exclusive locks.
+    """
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        # msvcrt only offers exclusive byte-range locks.
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,288 @@
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+TRACE_FORMAT_CHROME = "chrome"
+TRACE_FORMAT_OTEL = "otel"
+TRACE_FORMATS = (TRACE_FORMAT_CHROME, TRACE_FORMAT_OTEL)
+
+_NO_SPAN = nullcontext()
+
+
+@dataclass
+class Span:
+    """A timed phase of an fml run."""
+
+    name: str
+    span_id: int
+    parent_id: Optional[int]
+    thread_id: int
+    start_ns: int
+    end_ns: int = 0
+    attributes: Dict[str, object] = field(default_factory=dict)
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6
+
+
+class Tracer:
+    """
+    Collects nested timing spans.
+
+    A tracer is disabled until `enable` is called; while disabled, `span`
+    returns a shared no-op context manager so instrumented code pays almost
+    nothing. Spans nest per thread: a span opened while another is active on
+    the same thread becomes its child.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+        # Anchors perf_counter_ns to wall-clock time for exported timestamps.
+        self._epoch_ns = time.time_ns() - time.perf_counter_ns()
+
+    def enable(self) -> None:
+        """Starts recording spans."""
+        self.enabled = True
+
+    def reset(self) -> None:
+        """Discards recorded spans and stops recording."""
+        with self._lock:
+            self.enabled = False
+            self.spans = []
+
+    def span(self, name: str, **attributes):
+        """
+        Returns a context manager timing the enclosed block as a span.
+
+        Args:
+            name: The phase name (e.g. "generate_command").
+            **attributes: Extra values recorded with the span.
+
+        Returns:
+            A context manager yielding the Span (or None when disabled), whose
+            attributes may be updated inside the block.
+        """
+        if not self.enabled:
+            return _NO_SPAN
+        return self._record(name, attributes)
+
+    @contextmanager
+    def _record(self, name: str, attributes: dict) -> Iterator[Span]:
+        stack = self._stack()
+        span = Span(
+            name=name,
+            span_id=next(self._ids),
+            parent_id=stack[-1].span_id if stack else None,
+            thread_id=threading.get_ident(),
+            start_ns=time.perf_counter_ns(),
+            attributes=attributes,
+        )
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            span.end_ns = time.perf_counter_ns()
+            stack.pop()
+            with self._lock:
+                self.spans.append(span)
+
+    def add_span(self, name: str, start_ns: int, end_ns: int, **attributes) -> None:
+        """
+        Records a span measured elsewhere (e.g. module import time) as a root span.
+
+        Args:
+            name: The phase name.
+            start_ns: The time.perf_counter_ns() value at the start.
+            end_ns: The time.perf_counter_ns() value at the end.
+            **attributes: Extra values recorded with the span.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self.spans.append(
+                Span(name, next(self._ids), None, threading.get_ident(), start_ns, end_ns, attributes)
+            )
+
+    def _stack(self) -> List[Span]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def format_summary(self) -> str:
+        """
+        Returns a human-readable per-phase breakdown, indented by nesting.
+        """
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start_ns)
+        if not spans:
+            return "Profile: no spans recorded."
+
+        children: Dict[Optional[int], List[Span]] = {}
+        for span in spans:
+            children.setdefault(span.parent_id, []).append(span)
+
+        main_thread = threading.main_thread().ident
+        total_ms = (max(s.end_ns for s in spans) - spans[0].start_ns) / 1e6
+        lines = [f"Profile ({total_ms:.1f} ms from first to last span):"]
+
+        def render(span: Span, depth: int) -> None:
+            label = "  " * depth + span.name
+            if span.thread_id != main_thread:
+                label += " [thread]"
+            details = " ".join(f"{k}={v}" for k, v in span.attributes.items())
+            lines.append(f"  {label:<44} {span.duration_ms:>9.2f} ms  {details}".rstrip())
+            for child in children.get(span.span_id, []):
+                render(child, depth + 1)
+
+        for root in children.get(None, []):
+            render(root, 0)
+        return "\n".join(lines)
+
+    def to_chrome_trace(self) -> dict:
+        """
+        Returns the spans as Chrome trace-event JSON (chrome://tracing, Perfetto).
+        """
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "traceEvents": [
+                {
+                    "name": span.name,
+                    "cat": "fml",
+                    "ph": "X",
+                    "ts": (self._epoch_ns + span.start_ns) / 1000,
+                    "dur": (span.end_ns - span.start_ns) / 1000,
+                    "pid": pid,
+                    "tid": span.thread_id,
+                    "args": {k: _json_value(v) for k, v in span.attributes.items()},
+                }
+                for span in spans
+            ],
+            "displayTimeUnit": "ms",
+        }
+
+    def to_otel(self) -> dict:
+        """
+        Returns the spans in the OpenTelemetry OTLP/JSON trace format.
+        """
+        trace_id = os.urandom(16).hex()
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [_otel_attribute("service.name", "fml")]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "fml.profiling"},
+                            "spans": [
+                                {
+                                    "traceId": trace_id,
+                                    "spanId": f"{span.span_id:016x}",
+                                    "parentSpanId": f"{span.parent_id:016x}"
+                                    if span.parent_id
+                                    else "",
+                                    "name": span.name,
+                                    "kind": 1,
+                                    "startTimeUnixNano": str(self._epoch_ns + span.start_ns),
+                                    "endTimeUnixNano": str(self._epoch_ns + span.end_ns),
+                                    "attributes": [
+                                        _otel_attribute(k, v)
+                                        for k, v in span.attributes.items()
+                                    ],
+                                }
+                                for span in spans
+                            ],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def write_trace(self, path: str, trace_format: str = TRACE_FORMAT_CHROME) -> None:
+        """
+        Writes the spans to a JSON file.
+
+        Args:
+            path: The output file.
+            trace_format: Either "chrome" or "otel".
+
+        Raises:
+            ValueError: If the format is unknown.
+            OSError: If the file cannot be written.
+        """
+        if trace_format == TRACE_FORMAT_CHROME:
+            data = self.to_chrome_trace()
+        elif trace_format == TRACE_FORMAT_OTEL:
+            data = self.to_otel()
+        else:
+            raise ValueError(f"Unknown trace format '{trace_format}'.")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+
+
+def _json_value(value):
+    return value if isinstance(value, (str, int, float, bool)) or value is None else str(value)
+
+
+def _otel_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """Returns the process-wide tracer used by fml's instrumentation."""
+    return _tracer
+
+
+def span(name: str, **attributes):
+    """Times the enclosed block on the process-wide tracer; see Tracer.span."""
+    return _tracer.span(name, **attributes)
+
+
+def traced(name: Optional[str] = None):
+    """
+    Decorator recording every call of the function as a span.
+
+    Args:
+        name: The span name; defaults to the function's name.
+    """
+
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _tracer.enabled:
+                return func(*args, **kwargs)
+            with _tracer.span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from fml.paths import atomic_write
+
+PROMPT_CACHE_FORMAT_VERSION = 1
+# How long a refused cache creation is remembered before it is attempted again.
+UNSUPPORTED_RETRY_SECONDS = 24 * 60 * 60
+
+
+def prompt_cache_key(model: str, system_instruction: str) -> str:
+    """Returns the registry key of a model's cached system instruction."""
+    digest = hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+@dataclass(frozen=True)
+class PromptCacheEntry:
+    """
+    A provider-side cache of a system instruction.
+
+    `name` is the provider's identifier for the cached content, or None if the
+    provider refused to cache the instruction (e.g. because it is too short).
+    """
+
+    name: Optional[str]
+    expires_at: float
+
+
+class PromptCacheRegistry:
+    """
+    Remembers provider-side caches of system instructions across fml runs.
+
+    Providers such as Gemini can store a system instruction server-side and
+    bill requests that reference it at a reduced rate. Creating such a cache is
+    a request of its own, so the names of live caches (and refusals) are kept
+    in a small JSON file until they expire, letting every later invocation
+    reuse them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[PromptCacheEntry]:
+        """Returns the unexpired entry for a key, or None."""
+        with self._lock:
+            data = self._load().get(key)
+        if not isinstance(data, dict) or not isinstance(data.get("expires_at"), (int, float)):
+            return None
+        if data["expires_at"] <= time.time():
+            return None
+        name = data.get("name")
+        return PromptCacheEntry(name=name if isinstance(name, str) else None, expires_at=data["expires_at"])
+
+    def put(self, key: str, name: Optional[str], expires_at: float) -> None:
+        """Records a cache name (or a refusal, with name None) until `expires_at`."""
+        with self._lock:
+            entries = self._load()
+            now = time.time()
+            entries = {k: v for k, v in entries.items() if v.get("expires_at", 0) > now}
+            entries[key] = {"name": name, "expires_at": expires_at}
+            self._save(entries)
+
+    def discard(self, key: str) -> None:
+        """Forgets a key, e.g. after the provider reported its cache missing."""
+        with self._lock:
+            entries = self._load()
+            if entries.pop(key, None) is not None:
+                self._save(entries)
+
+    def _load(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get("version") != PROMPT_CACHE_FORMAT_VERSION:
+            return {}
+        entries = data.get("entries")
+        if not isinstance(entries, dict):
+            return {}
+        return {k: v for k, v in entries.items() if isinstance(v, dict)}
+
+    def _save(self, entries: Dict[str, dict]) -> None:
+        try:
+            atomic_write(
+                self.path, json.dumps({"version": PROMPT_CACHE_FORMAT_VERSION, "entries": entries})
+            )
+        except OSError:
+            # A forgotten cache name only costs creating the cache again.
+            pass
@@ -0,0 +1,614 @@
+import hashlib
+import json
+import mmap
+import os
+import secrets
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+from fml.paths import atomic_write, lock_file
+from fml.schemas import AICommandResponse, AIContext
+
+CACHE_FORMAT_VERSION = 2
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60  # one week
+DEFAULT_MAX_ENTRIES = 100_000
+# Index slots are kept at most this full, so that probes stay short.
+MAX_LOAD_FACTOR = 0.7
+MIN_INDEX_CAPACITY = 1024
+# Once max_entries is exceeded, this share of it is evicted at once (least
+# recently used first), so the index scan that eviction needs stays rare.
+EVICTION_FRACTION = 0.1
+# The log is compacted in the background once this many bytes belong to
+# replaced, expired or evicted entries and they outweigh the live ones.
+COMPACTION_MIN_DEAD_BYTES = 256 * 1024
+
+# Log file: a header, then records of (payload length, CRC-32, JSON payload).
+_LOG_MAGIC = b"FMLRLOG\0"
+_LOG_HEADER = struct.Struct("<8sI8s")  # magic, format version, log id
+_RECORD_HEADER = struct.Struct("<II")
+# Index file: a header, then an open-addressing hash table of fixed-size slots.
+_INDEX_MAGIC = b"FMLRIDX\0"
+# magic, format version, capacity, log id, live entries, used slots, dead log bytes
+_INDEX_HEADER = struct.Struct("<8sII8sIIQ")
+_INDEX_HEADER_SIZE = 64
+# key digest, record offset, record length, created_at, last_access
+_SLOT = struct.Struct("<16sQI4xdd")
+_LAST_ACCESS_OFFSET = 40
+# Slot offsets that are not records (the log header occupies the first bytes).
+_EMPTY = 0
+_DELETED = 1
+
+
+def normalize_query(query: str) -> str:
+    """Collapses whitespace and case so trivially different phrasings share a cache entry."""
+    return " ".join(query.split()).casefold()
+
+
+def make_context_key(model: str, system_instruction: str, ai_context: AIContext) -> str:
+    """
+    Identifies everything about a request except the query itself.
+
+    Covers the model name, a hash of the system prompt and the SystemInfo fields
+    that influence the generated command. The working directory is deliberately
+    left out so the same question asked from another directory still hits the cache.
+
+    Args:
+        model: The model name the request is sent to.
+        system_instruction: The system prompt content used by the service.
+        ai_context: The AIContext passed to the service.
+
+    Returns:
+        A hex digest identifying the request context.
+    """
+    system_info = ai_context.system_info
+    key_material = {
+        "model": model,
+        "prompt": hashlib.sha256(system_instruction.encode("utf-8")).hexdigest(),
+        "os_name": system_info.os_name if system_info else None,
+        "shell": system_info.shell if system_info else None,
+        "architecture": system_info.architecture if system_info else None,
+    }
+    encoded = json.dumps(key_material, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def make_cache_key(
+    model: str, query: str, system_instruction: str, ai_context: AIContext
+) -> str:
+    """
+    Builds a stable cache key for a generate_command call.
+
+    The key combines make_context_key with the normalized query.
+
+    Args:
+        model: The model name the request is sent to.
+        query: The natural language query.
+        system_instruction: The system prompt content used by the service.
+        ai_context: The AIContext passed to the service.
+
+    Returns:
+        A hex digest identifying the request.
+    """
+    context_key = make_context_key(model, system_instruction, ai_context)
+    encoded = f"{context_key}\0{normalize_query(query)}".encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class ResponseCache:
+    """
+    An on-disk cache of validated AICommandResponse objects shared by fml processes.
+
+    Entries expire after `ttl_seconds` and the store is bounded to `max_entries`,
+    evicting the least recently used entries first. Responses are appended to
+    a log file (`path`) and located through a hash index (`path` + ".index")
+    that every process memory-maps: a lookup probes a few index slots and
+    reads a single record, so it stays well under a millisecond however large
+    the cache grows, and nothing is parsed or rewritten as a whole.
+
+    Writers serialize on a lock file (`path` + ".lock") and append; readers
+    take no lock and verify each record's key and checksum, so a racing
+    writer can only cause a miss. Space held by replaced, expired and evicted
+    entries is reclaimed by compacting the log, which replaces both files
+    atomically; other processes notice and map the new ones. Compaction runs
+    in the put() that triggers it, or, with `background_compaction` (for
+    long-lived processes such as the daemon), in a thread that close() and
+    interpreter exit wait for. A single instance may be shared between threads.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        background_compaction: bool = False,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.background_compaction = background_compaction
+        self._index_path = path + ".index"
+        self._lock_path = path + ".lock"
+        self._lock = threading.RLock()
+        self._lock_fd: Optional[int] = None
+        self._log_fd: Optional[int] = None
+        self._index: Optional[mmap.mmap] = None
+        self._index_id: Optional[Tuple[int, int]] = None
+        self._capacity = 0
+        self._log_id = b""
+        self._compactor: Optional[threading.Thread] = None
+
+    def get(self, key: str) -> Optional[AICommandResponse]:
+        """
+        Looks up a cached response.
+
+        Args:
+            key: A key produced by make_cache_key.
+
+        Returns:
+            The cached AICommandResponse, or None on a miss or an expired entry.
+        """
+        digest = _digest(key)
+        with self._lock:
+            try:
+                if not self._map_for_reading():
+                    return None
+                found = self._find(digest)
+                if found is None:
+                    return None
+                slot, offset, length, created_at = found
+                now = time.time()
+                if now - created_at > self.ttl_seconds:
+                    self._delete(digest)
+                    return None
+                response = _decode_record(_read_at(self._log_fd, length, offset), key)
+                if response is None:
+                    # A corrupt entry is treated as a miss and dropped.
+                    self._delete(digest)
+                    return None
+                # Unlocked: concurrent updates of the access time are harmless.
+                struct.pack_into("<d", self._index, _slot_position(slot) + _LAST_ACCESS_OFFSET, now)
+                return response
+            except (OSError, ValueError):
+                return None
+
+    def put(self, key: str, response: AICommandResponse) -> None:
+        """
+        Stores a validated response, evicting old entries if the cache is full.
+
+        Args:
+            key: A key produced by make_cache_key.
+            response: The AICommandResponse to store.
+        """
+        now = time.time()
+        payload = json.dumps(
+            {"key": key, "created_at": now, "response": response.model_dump(mode="json")},
+            separators=(",", ":"),
+        ).encode("utf-8")
+        record = _RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        try:
+            with self._writing():
+                offset = os.lseek(self._log_fd, 0, os.SEEK_END)
+                _write_all(self._log_fd, record)
+                self._insert(_digest(key), offset, len(record), now)
+                if self._header()[4] > self.max_entries:
+                    self._evict(now)
+                self._maybe_start_compaction()
+        except OSError:
+            # A response that could not be stored is simply generated again.
+            pass
+
+    def clear(self) -> None:
+        """Removes every entry from the cache."""
+        try:
+            with self._writing():
+                self._reset()
+        except OSError:
+            pass
+
+    def compact(self) -> None:
+        """Rewrites the log without replaced, expired or evicted entries."""
+        try:
+            with self._writing():
+                self._compact()
+        except OSError:
+            pass
+
+    def close(self) -> None:
+        """
+        Waits for a running compaction, then unmaps the index and closes the
+        files; they are reopened on next use.
+        """
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        with self._lock:
+            self._close_files()
+            if self._lock_fd is not None:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            try:
+                return self._header()[4] if self._map_for_reading() else 0
+            except (OSError, ValueError):
+                return 0
+
+    # Locking and mapping.
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool) -> Iterator[None]:
+        if self._lock_fd is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._lock_fd = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        with lock_file(self._lock_fd, exclusive):
+            yield
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        """Holds the writer lock with the current index mapped, creating the files if needed."""
+        with self._lock, self._file_lock(exclusive=True):
+            if not (self._is_current() or self._open_files()):
+                self._recover()
+            yield
+
+    def _map_for_reading(self) -> bool:
+        """Maps the current index and log; returns False if there is no valid cache yet."""
+        if self._is_current():
+            return True
+        if not os.path.exists(self._index_path):
+            return False
+        # Files are only replaced under the exclusive lock, so the pair opened
+        # here always belongs together.
+        with self._file_lock(exclusive=False):
+            return self._open_files()
+
+    def _is_current(self) -> bool:
+        if self._index is None:
+            return False
+        try:
+            stat = os.stat(self._index_path)
+        except OSError:
+            return False
+        return (stat.st_dev, stat.st_ino) == self._index_id
+
+    def _open_files(self) -> bool:
+        self._close_files()
+        try:
+            index_fd = os.open(self._index_path, os.O_RDWR)
+        except OSError:
+            return False
+        log_fd = None
+        try:
+            stat = os.fstat(index_fd)
+            index = mmap.mmap(index_fd, 0)
+            magic, version, capacity, log_id = _INDEX_HEADER.unpack_from(index, 0)[:4]
+            if (magic, version) != (_INDEX_MAGIC, CACHE_FORMAT_VERSION) or len(index) != (
+                _INDEX_HEADER_SIZE + capacity * _SLOT.size
+            ):
+                index.close()
+                raise ValueError("invalid index")
+            log_fd = os.open(self.path, os.O_RDWR | os.O_APPEND | getattr(os, "O_BINARY", 0))
+            if _read_log_id(log_fd) != log_id:
+                index.close()
+                raise ValueError("the index belongs to another log")
+        except (OSError, ValueError, struct.error):
+            os.close(index_fd)
+            if log_fd is not None:
+                os.close(log_fd)
+            return False
+        # The mapping stays valid after the descriptor is closed.
+        os.close(index_fd)
+        self._index, self._log_fd = index, log_fd
+        self._index_id = (stat.st_dev, stat.st_ino)
+        self._capacity, self._log_id = capacity, log_id
+        return True
+
+    def _close_files(self) -> None:
+        if self._index is not None:
+            self._index.close()
+        if self._log_fd is not None:
+            os.close(self._log_fd)
+        self._index, self._log_fd, self._index_id = None, None, None
+
+    # Index access; the caller holds the lock.
+
+    def _header(self) -> tuple:
+        return _INDEX_HEADER.unpack_from(self._index, 0)
+
+    def _set_counts(self, count: int, used: int, dead_bytes: int) -> None:
+        _INDEX_HEADER.pack_into(
+            self._index, 0, _INDEX_MAGIC, CACHE_FORMAT_VERSION, self._capacity, self._log_id,
+            count, used, dead_bytes,
+        )
+
+    def _find(self, digest: bytes) -> Optional[Tuple[int, int, int, float]]:
+        """Returns the slot, record offset, record length and creation time of a key."""
+        mask = self._capacity - 1
+        slot = _home_slot(digest, mask)
+        for _ in range(self._capacity):
+            slot_digest, offset, length, created_at, _ = _SLOT.unpack_from(
+                self._index, _slot_position(slot))
+            if offset == _EMPTY:
+                return None
+            if offset != _DELETED and slot_digest == digest:
+                return slot, offset, length, created_at
+            slot = (slot + 1) & mask
+        return None
+
+    def _insert(self, digest: bytes, offset: int, length: int, now: float) -> None:
+        count, used, dead_bytes = self._header()[4:]
+        if used + 1 > self._capacity * MAX_LOAD_FACTOR:
+            self._rebuild_index(_capacity_for(count + 1))
+            count, used, dead_bytes = self._header()[4:]
+
+        mask = self._capacity - 1
+        slot = _home_slot(digest, mask)
+        target = None
+        for _ in range(self._capacity):
+            slot_digest, old_offset, old_length = _SLOT.unpack_from(
+                self._index, _slot_position(slot))[:3]
+            if old_offset == _EMPTY:
+                if target is None:
+                    target = slot
+                    used += 1
+                count += 1
+                break
+            if old_offset == _DELETED:
+                if target is None:
+                    target = slot
+            elif slot_digest == digest:
+                # The key is answered again: the old record becomes dead.
+                target = slot
+                dead_bytes += old_length
+                break
+            slot = (slot + 1) & mask
+        else:
+            if target is None:
+                raise OSError("The response cache index is full.")
+            count += 1
+        _SLOT.pack_into(self._index, _slot_position(target), digest, offset, length, now, now)
+        self._set_counts(count, used, dead_bytes)
+
+    def _delete(self, digest: bytes) -> None:
+        with self._writing():
+            found = self._find(digest)
+            if found is None:
+                return
+            slot, _, length, _ = found
+            struct.pack_into("<Q", self._index, _slot_position(slot) + 16, _DELETED)
+            count, used, dead_bytes = self._header()[4:]
+            self._set_counts(count - 1, used, dead_bytes + length)
+
+    def _live_slots(self) -> List[tuple]:
+        """Returns (slot, digest, offset, length, created_at, last_access) of every entry."""
+        entries = []
+        view = memoryview(self._index)[_INDEX_HEADER_SIZE:]
+        try:
+            for slot, (digest, offset, length, created_at, last_access) in enumerate(
+                _SLOT.iter_unpack(view)
+            ):
+                if offset > _DELETED:
+                    entries.append((slot, digest, offset, length, created_at, last_access))
+        finally:
+            view.release()
+        return entries
+
+    def _evict(self, now: float) -> None:
+        entries = self._live_slots()
+        expired = [entry for entry in entries if now - entry[4] > self.ttl_seconds]
+        fresh = [entry for entry in entries if now - entry[4] <= self.ttl_seconds]
+        excess = 0
+        if len(fresh) > self.max_entries:
+            excess = len(fresh) - (self.max_entries - int(self.max_entries * EVICTION_FRACTION))
+        victims = expired + sorted(fresh, key=lambda entry: entry[5])[:excess]
+
+        count, used, dead_bytes = self._header()[4:]
+        for slot, _, _, length, _, _ in victims:
+            struct.pack_into("<Q", self._index, _slot_position(slot) + 16, _DELETED)
+            dead_bytes += length
+        self._set_counts(count - len(victims), used, dead_bytes)
+
+    # Whole-file operations; the caller holds the writer lock.
+
+    def _rebuild_index(self, capacity: int) -> None:
+        """Replaces the index with a larger (or tombstone-free) copy over the same log."""
+        entries = [entry[1:] for entry in self._live_slots()]
+        dead_bytes = self._header()[6]
+        self._replace_index(capacity, self._log_id, entries, dead_bytes)
+        if not self._open_files():
+            raise OSError("The rebuilt response cache index could not be opened.")
+
+    def _replace_index(self, capacity: int, log_id: bytes, entries: List[tuple],
+                       dead_bytes: int) -> None:
+        buffer = bytearray(_INDEX_HEADER_SIZE + capacity * _SLOT.size)
+        mask = capacity - 1
+        for digest, offset, length, created_at, last_access in entries:
+            slot = _home_slot(digest, mask)
+            while _SLOT.unpack_from(buffer, _slot_position(slot))[1] != _EMPTY:
+                slot = (slot + 1) & mask
+            _SLOT.pack_into(buffer, _slot_position(slot), digest, offset, length,
+                            created_at, last_access)
+        _INDEX_HEADER.pack_into(buffer, 0, _INDEX_MAGIC, CACHE_FORMAT_VERSION, capacity, log_id,
+                                len(entries), len(entries), dead_bytes)
+        atomic_write(self._index_path, bytes(buffer))
+
+    def _reset(self) -> None:
+        """Starts an empty log and index."""
+        log_id = secrets.token_bytes(8)
+        self._close_files()
+        self._remove_temporary_files()
+        atomic_write(self.path, _LOG_HEADER.pack(_LOG_MAGIC, CACHE_FORMAT_VERSION, log_id))
+        self._replace_index(MIN_INDEX_CAPACITY, log_id, [], 0)
+        if not self._open_files():
+            raise OSError("The response cache could not be created.")
+
+    def _recover(self) -> None:
+        """Rebuilds a missing or stale index from the log, or starts afresh."""
+        self._close_files()
+        self._remove_temporary_files()
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except OSError:
+            data = b""
+        scanned = _scan_log(data)
+        if scanned is None:
+            self._reset()
+            return
+
+        log_id, records, end = scanned
+        if end < len(data):
+            # Drop a record cut short by a writer that was interrupted.
+            os.truncate(self.path, end)
+        live = {}
+        for digest, offset, length, created_at in records:
+            live[digest] = (digest, offset, length, created_at, created_at)
+        live_bytes = sum(entry[2] for entry in live.values())
+        self._replace_index(_capacity_for(len(live)), log_id, list(live.values()),
+                            end - _LOG_HEADER.size - live_bytes)
+        if not self._open_files():
+            raise OSError("The recovered response cache index could not be opened.")
+
+    def _remove_temporary_files(self) -> None:
+        """Deletes files left behind by a writer that died while replacing the log or index."""
+        # Every replacement happens under the writer lock, which the caller
+        # holds, so no temporary file found here is still being written.
+        directory = os.path.dirname(self.path) or "."
+        prefixes = tuple("." + os.path.basename(path) + "-" for path in (self.path, self._index_path))
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return
+        for name in names:
+            if name.startswith(prefixes):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+    def _maybe_start_compaction(self) -> None:
+        dead_bytes = self._header()[6]
+        log_size = os.lseek(self._log_fd, 0, os.SEEK_END)
+        if dead_bytes < COMPACTION_MIN_DEAD_BYTES or dead_bytes * 2 < log_size:
+            return
+        if not self.background_compaction:
+            self._compact()
+        elif self._compactor is None or not self._compactor.is_alive():
+            # Not a daemon thread: the interpreter waits for it on exit instead
+            # of killing it halfway through writing the new files.
+            self._compactor = threading.Thread(target=self.compact, name="fml-cache-compaction")
+            self._compactor.start()
+
+    def _compact(self) -> None:
+        self._remove_temporary_files()
+        now = time.time()
+        entries = [entry for entry in self._live_slots() if now - entry[4] <= self.ttl_seconds]
+        entries.sort(key=lambda entry: entry[2])
+        log_id = secrets.token_bytes(8)
+        chunks = [_LOG_HEADER.pack(_LOG_MAGIC, CACHE_FORMAT_VERSION, log_id)]
+        offset = _LOG_HEADER.size
+        moved = []
+        for _, digest, old_offset, length, created_at, last_access in entries:
+            chunks.append(_read_at(self._log_fd, length, old_offset))
+            moved.append((digest, offset, length, created_at, last_access))
+            offset += length
+        # The log is replaced first: should the index not follow, its log id no
+        # longer matches and the next writer rebuilds it from the new log.
+        atomic_write(self.path, b"".join(chunks))
+        self._replace_index(_capacity_for(len(moved)), log_id, moved, 0)
+        if not self._open_files():
+            raise OSError("The compacted response cache could not be opened.")
+
+
+def _digest(key: str) -> bytes:
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+def _home_slot(digest: bytes, mask: int) -> int:
+    return int.from_bytes(digest[:8], "little") & mask
+
+
+def _slot_position(slot: int) -> int:
+    return _INDEX_HEADER_SIZE + slot * _SLOT.size
+
+
+def _capacity_for(entries: int) -> int:
+    """Returns an index size with room for the entries to double before it is rebuilt."""
+    capacity = MIN_INDEX_CAPACITY
+    while entries * 2 > capacity * MAX_LOAD_FACTOR:
+        capacity *= 2
+    return capacity
+
+
+def _read_at(fd: int, length: int, offset: int) -> bytes:
+    if hasattr(os, "pread"):
+        return os.pread(fd, length, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, length)
+
+
+def _write_all(fd: int, data: bytes) -> None:
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _read_log_id(fd: int) -> bytes:
+    magic, version, log_id = _LOG_HEADER.unpack(_read_at(fd, _LOG_HEADER.size, 0))
+    if (magic, version) != (_LOG_MAGIC, CACHE_FORMAT_VERSION):
+        raise ValueError("invalid log")
+    return log_id
+
+
+def _decode_record(data: bytes, key: str) -> Optional[AICommandResponse]:
+    """Returns the response of a record, or None if it is damaged or belongs to another key."""
+    if len(data) < _RECORD_HEADER.size:
+        return None
+    length, checksum = _RECORD_HEADER.unpack_from(data)
+    payload = data[_RECORD_HEADER.size:_RECORD_HEADER.size + length]
+    if len(payload) != length or zlib.crc32(payload) != checksum:
+        return None
+    try:
+        record = json.loads(payload)
+        if record["key"] != key:
+            return None
+        return AICommandResponse.model_validate(record["response"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _scan_log(data: bytes) -> Optional[Tuple[bytes, List[tuple], int]]:
+    """
+    Reads every intact record of a log.
+
+    Returns:
+        The log id, (digest, offset, length, created_at) of each record in
+        order, and where the intact records end; None if data is not a log.
+    """
+    try:
+        magic, version, log_id = _LOG_HEADER.unpack_from(data)
+    except struct.error:
+        return None
+    if (magic, version) != (_LOG_MAGIC, CACHE_FORMAT_VERSION):
+        return None
+
+    records = []
+    offset = _LOG_HEADER.size
+    while offset + _RECORD_HEADER.size <= len(data):
+        length, checksum = _RECORD_HEADER.unpack_from(data, offset)
+        start = offset + _RECORD_HEADER.size
+        payload = data[start:start + length]
+        if len(payload) != length or zlib.crc32(payload) != checksum:
+            break
+        try:
+            record = json.loads(payload)
+            records.append((_digest(record["key"]), offset, _RECORD_HEADER.size + length,
+                            float(record["created_at"])))
+        except (ValueError, KeyError, TypeError):
+            break
+        offset = start + length
+    return log_id, records, offset
@@ -0,0 +1,63 @@
+import random
+from typing import List, Optional
+
+from fml.model_stats import MIN_SAMPLES, ModelStatsStore
+
+# The latency quantile compared between models.
+ROUTING_QUANTILE = 0.5
+# Share of runs that go to a healthy model with too few recorded latencies,
+# so that every model is measured eventually.
+EXPLORATION_RATE = 0.1
+# Failure rates above this are treated as this, so a flaky model is penalized
+# without its expected latency becoming infinite.
+_MAX_FAILURE_RATE = 0.9
+
+
+def expected_latency(stats: ModelStatsStore, model: str) -> Optional[float]:
+    """
+    Estimates how long a query sent to a model takes to get a valid answer.
+
+    A failed request has to be repeated, so the model's median latency is
+    divided by its success rate.
+
+    Returns:
+        The expected seconds, or None if too few latencies have been recorded.
+    """
+    median = stats.latency_quantile(model, ROUTING_QUANTILE)
+    if median is None:
+        return None
+    return median / (1.0 - min(stats.failure_rate(model), _MAX_FAILURE_RATE))
+
+
+def choose_model(
+    stats: ModelStatsStore,
+    models: List[str],
+    rng: Optional[random.Random] = None,
+) -> str:
+    """
+    Picks the model with the best expected latency whose circuit is closed.
+
+    Models without enough recorded latencies are used when no model has
+    enough, and otherwise for EXPLORATION_RATE of the calls; the earliest of
+    them in `models` is preferred, so the default model is measured first. If
+    every circuit is open, the model that will be retried soonest is returned.
+
+    Args:
+        stats: The recorded latencies and failures.
+        models: The candidate model names, in order of preference.
+        rng: The random source for exploration (defaults to the random module).
+
+    Returns:
+        The chosen model name.
+    """
+    healthy = [model for model in models if not stats.circuit_open_until(model)]
+    if not healthy:
+        return min(models, key=stats.circuit_open_until)
+
+    unmeasured = [model for model in healthy if stats.sample_count(model) < MIN_SAMPLES]
+    measured = {
+        model: expected_latency(stats, model) for model in healthy if model not in unmeasured
+    }
+    if unmeasured and (not measured or (rng or random).random() < EXPLORATION_RATE):
+        return unmeasured[0]
+    return min(measured, key=measured.get)
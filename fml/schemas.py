@@ -1,6 +1,11 @@
+from functools import lru_cache
 from pydantic import BaseModel, Field
 from typing import List, Optional
 
+# Bump whenever AICommandResponse changes shape, so that artifacts derived from
+# its JSON schema (e.g. provider request configs) are rebuilt.
+RESPONSE_SCHEMA_VERSION = 1
+
 
 class Flag(BaseModel):
     flag: str = Field(
@@ -27,6 +32,46 @@ class AICommandResponse(BaseModel):
     )
 
 
+@lru_cache(maxsize=None)
+def response_json_schema(schema_version: int = RESPONSE_SCHEMA_VERSION) -> dict:
+    """
+    Returns AICommandResponse's JSON schema, generated once per process.
+
+    Generating the schema takes far longer than building the rest of a request,
+    so it is shared by every request. The returned dict must not be mutated.
+
+    Args:
+        schema_version: The RESPONSE_SCHEMA_VERSION the schema belongs to.
+    """
+    return AICommandResponse.model_json_schema()
+
+
+class PackedCommandResponse(AICommandResponse):
+    id: str = Field(..., description="The id of the query this response answers.")
+
+
+class PackedCommandResponses(BaseModel):
+    responses: List[PackedCommandResponse] = Field(
+        ...,
+        description="One response per query, each tagged with the id of its query.",
+    )
+
+
+@lru_cache(maxsize=None)
+def packed_response_json_schema(schema_version: int = RESPONSE_SCHEMA_VERSION) -> dict:
+    """
+    Returns the JSON schema of a packed response, generated once per process.
+
+    Packed requests ask for the answers to several queries at once (see
+    AIService.generate_packed). Like response_json_schema, the returned dict
+    must not be mutated.
+
+    Args:
+        schema_version: The RESPONSE_SCHEMA_VERSION the schema belongs to.
+    """
+    return PackedCommandResponses.model_json_schema()
+
+
 class SystemInfo(BaseModel):
     os_name: str = Field(
         ...,
@@ -45,8 +90,38 @@ class SystemInfo(BaseModel):
     )
 
 
+class GitContext(BaseModel):
+    branch: Optional[str] = Field(
+        None, description="The checked out branch, or None for a detached HEAD."
+    )
+    upstream: Optional[str] = Field(
+        None, description="The upstream branch (e.g., 'origin/main'), if one is set."
+    )
+    ahead: int = Field(0, description="Commits on the branch not yet on the upstream.")
+    behind: int = Field(0, description="Commits on the upstream not yet on the branch.")
+    changed_files: List[str] = Field(
+        default_factory=list,
+        description="Paths with staged, unstaged or untracked changes (truncated).",
+    )
+
+
+class FileContext(BaseModel):
+    entries: List[str] = Field(
+        ...,
+        description="Names in the current working directory; directories end with '/'.",
+    )
+    truncated: bool = Field(
+        False, description="Whether the directory has more entries than listed."
+    )
+
+
 class AIContext(BaseModel):
     system_info: Optional[SystemInfo] = Field(
         None, description="Information about the user's system environment."
     )
-    # Future context types can be added here (e.g., git_context, file_context)
+    git_context: Optional[GitContext] = Field(
+        None, description="The state of the git repository the user is in, if any."
+    )
+    file_context: Optional[FileContext] = Field(
+        None, description="The contents of the user's current working directory."
+    )
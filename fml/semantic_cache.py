@@ -0,0 +1,455 @@
+import atexit
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from fml.local_index import literal_tokens
+from fml.paths import atomic_write, lock_file
+from fml.response_cache import DEFAULT_TTL_SECONDS, make_context_key, normalize_query
+from fml.schemas import AICommandResponse, AIContext
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.9
+DEFAULT_DIMENSIONS = 1024
+DEFAULT_MAX_ENTRIES = 2000
+SEMANTIC_FORMAT_VERSION = 2
+# Hit and miss counts are added to the stored statistics once this many
+# lookups have been counted, and when the process exits.
+STATS_FLUSH_INTERVAL = 100
+# Files of the first format, which rewrote every vector on each add().
+_LEGACY_FILES = ("semantic_vectors.npy", "semantic_entries.json")
+
+_WORD_PATTERN = re.compile(r"[\w.-]+")
+# Filler words that carry no meaning for command lookup ("how do I ...").
+_STOP_WORDS = frozenset(
+    "a an the how do i can to in on of for with my me what is are please".split()
+)
+
+
+def embed_query(query: str, dimensions: int = DEFAULT_DIMENSIONS) -> np.ndarray:
+    """
+    Embeds a query as an L2-normalized hashed feature vector.
+
+    Features are whole words (minus filler words such as "how do I") plus
+    character trigrams of each word, hashed into `dimensions` buckets with a sign
+    bit to reduce collision bias. This is cheap, deterministic across processes
+    and needs no model download, while still matching reordered words and small
+    spelling differences. It is purely lexical: "list" and "delete" are simply
+    different words, which is why the similarity threshold is kept high.
+
+    Args:
+        query: The natural language query.
+        dimensions: The vector size.
+
+    Returns:
+        A float32 vector of unit length (or all zeros for an empty query).
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in _WORD_PATTERN.findall(normalize_query(query)):
+        if word in _STOP_WORDS:
+            continue
+        _add_feature(vector, "w:" + word, 1.0)
+        padded = f"#{word}#"
+        for i in range(len(padded) - 2):
+            _add_feature(vector, "c:" + padded[i:i + 3], 0.5)
+
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+def _add_feature(vector: np.ndarray, feature: str, weight: float) -> None:
+    digest = zlib.crc32(feature.encode("utf-8"))
+    sign = -1.0 if digest & 0x80000000 else 1.0
+    vector[digest % len(vector)] += sign * weight
+
+
+class SemanticCache:
+    """
+    A near-duplicate query cache backed by a local vector index.
+
+    Queries are embedded with embed_query and compared by cosine similarity
+    against previously answered queries from the same context (model, system
+    prompt, OS, shell and architecture). The most similar match at or above
+    `threshold` whose literals (see literal_tokens) are the same as the query's
+    returns the stored AICommandResponse.
+
+    Entries are appended to a JSON-lines file and their vectors, as raw
+    float32 rows, to a second file, so answering a query writes one line and
+    one row. Only the newest `max_entries` entries are searched; the files are
+    rewritten without older and expired entries once they hold twice as many.
+    Every process keeps the entries in memory and reads those appended by
+    others (or everything, after a rewrite) when the files change; writers and
+    readers share a lock file, so the daemon and concurrent shells never lose
+    each other's entries. Hit and miss counts are batched (see
+    STATS_FLUSH_INTERVAL) rather than written by each lookup. A single
+    instance may be shared between threads.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        dimensions: int = DEFAULT_DIMENSIONS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+    ):
+        self.directory = directory
+        self.threshold = threshold
+        self.dimensions = dimensions
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.RLock()
+        self._lock_fd: Optional[int] = None
+        # Entries in file order (None for a damaged line) and their vectors,
+        # in the first len(self._entries) rows of a buffer grown by doubling.
+        self._entries: List[Optional[dict]] = []
+        self._vectors = np.zeros((0, dimensions), dtype=np.float32)
+        # The entries file the memory reflects, and how many bytes of it were read.
+        self._file_id: Optional[Tuple[int, int]] = None
+        self._offset = 0
+        # Whether the files on disk cannot be appended to and must be rewritten.
+        self._stale = True
+        self._pending = {"hits": 0, "misses": 0}
+        self._flush_at_exit = False
+
+    @property
+    def _entries_path(self) -> str:
+        return os.path.join(self.directory, "semantic_entries.jsonl")
+
+    @property
+    def _vectors_path(self) -> str:
+        return os.path.join(self.directory, "semantic_vectors.f32")
+
+    @property
+    def _stats_path(self) -> str:
+        return os.path.join(self.directory, "semantic_stats.json")
+
+    @property
+    def _row_bytes(self) -> int:
+        return self.dimensions * 4
+
+    def lookup(
+        self, model: str, query: str, system_instruction: str, ai_context: AIContext
+    ) -> Optional[AICommandResponse]:
+        """
+        Returns the cached response of the most similar earlier query, if similar enough.
+
+        Args:
+            model: The model name the request is sent to.
+            query: The natural language query.
+            system_instruction: The system prompt content used by the service.
+            ai_context: The AIContext passed to the service.
+
+        Returns:
+            The cached AICommandResponse, or None if no stored query passes the threshold.
+        """
+        context_key = make_context_key(model, system_instruction, ai_context)
+        query_vector = embed_query(query, self.dimensions)
+
+        with self._lock:
+            self._refresh()
+            response = None
+            candidates = [
+                i for i in self._live_indices(time.time())
+                if self._entries[i]["context"] == context_key
+            ]
+            if candidates:
+                similarities = self._vectors[candidates] @ query_vector
+                literals = literal_tokens(query)
+                for best in np.argsort(-similarities):
+                    if similarities[best] < self.threshold:
+                        break
+                    entry = self._entries[candidates[best]]
+                    if literal_tokens(entry["query"]) != literals:
+                        continue
+                    try:
+                        response = AICommandResponse.model_validate(entry["response"])
+                        break
+                    except (ValueError, KeyError, TypeError):
+                        # A damaged or outdated entry is skipped and dropped; the
+                        # next rewrite leaves it out of the files.
+                        self._entries[candidates[best]] = None
+
+            self._record(hit=response is not None)
+            return response
+
+    def add(
+        self,
+        model: str,
+        query: str,
+        system_instruction: str,
+        ai_context: AIContext,
+        response: AICommandResponse,
+    ) -> None:
+        """
+        Indexes a freshly generated response under its query.
+
+        Args:
+            model: The model name the request was sent to.
+            query: The natural language query.
+            system_instruction: The system prompt content used by the service.
+            ai_context: The AIContext passed to the service.
+            response: The validated AICommandResponse to store.
+        """
+        entry = {
+            "context": make_context_key(model, system_instruction, ai_context),
+            "query": query,
+            "response": response.model_dump(mode="json"),
+            "created_at": time.time(),
+        }
+        vector = embed_query(query, self.dimensions)[np.newaxis, :]
+
+        with self._lock:
+            try:
+                with self._file_lock(exclusive=True):
+                    self._read_changes()
+                    if self._stale or len(self._entries) + 1 >= 2 * self.max_entries:
+                        self._append_to_memory([entry], vector)
+                        self._rewrite(entry["created_at"])
+                    else:
+                        self._append_to_files(entry, vector)
+                        self._append_to_memory([entry], vector)
+            except OSError:
+                # The entry is lost; the next lookup reloads what is on disk.
+                self._file_id = None
+
+    def stats(self) -> dict:
+        """
+        Returns cumulative lookup statistics, including lookups not yet flushed.
+
+        Returns:
+            A dict with `entries`, `hits`, `misses`, `lookups` and `hit_rate`.
+        """
+        with self._lock:
+            self._refresh()
+            stored = self._read_stats()
+            hits = stored["hits"] + self._pending["hits"]
+            misses = stored["misses"] + self._pending["misses"]
+            lookups = hits + misses
+            return {
+                "entries": len(self._live_indices(time.time())),
+                "hits": hits,
+                "misses": misses,
+                "lookups": lookups,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+
+    def flush(self) -> None:
+        """Adds the hits and misses counted since the last flush to the stored statistics."""
+        with self._lock:
+            if not any(self._pending.values()):
+                return
+            try:
+                with self._file_lock(exclusive=True):
+                    stats = self._read_stats()
+                    for name, count in self._pending.items():
+                        stats[name] += count
+                    atomic_write(self._stats_path, json.dumps(stats))
+            except OSError:
+                # Kept for the next flush.
+                return
+            self._pending = {"hits": 0, "misses": 0}
+
+    def _record(self, hit: bool) -> None:
+        self._pending["hits" if hit else "misses"] += 1
+        if sum(self._pending.values()) >= STATS_FLUSH_INTERVAL:
+            self.flush()
+        elif not self._flush_at_exit:
+            atexit.register(self.flush)
+            self._flush_at_exit = True
+
+    def _read_stats(self) -> dict:
+        stats = _read_json(self._stats_path)
+        if not isinstance(stats, dict):
+            stats = {}
+        try:
+            return {"hits": int(stats.get("hits", 0)), "misses": int(stats.get("misses", 0))}
+        except (TypeError, ValueError):
+            return {"hits": 0, "misses": 0}
+
+    def _live_indices(self, now: float) -> List[int]:
+        """Returns the indices of the newest max_entries entries that have not expired."""
+        start = max(0, len(self._entries) - self.max_entries)
+        return [
+            i for i in range(start, len(self._entries))
+            if self._entries[i] is not None and now - self._entries[i]["created_at"] <= self.ttl_seconds
+        ]
+
+    # Files; the caller holds self._lock.
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool) -> Iterator[None]:
+        if self._lock_fd is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._lock_fd = os.open(
+                os.path.join(self.directory, "semantic.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+        with lock_file(self._lock_fd, exclusive):
+            yield
+
+    def _refresh(self) -> None:
+        """Picks up entries other processes wrote since the files were last read."""
+        try:
+            stat = os.stat(self._entries_path)
+        except OSError:
+            if self._file_id is not None or self._entries:
+                self._forget()
+            return
+        if (stat.st_dev, stat.st_ino) == self._file_id and stat.st_size == self._offset:
+            return
+        try:
+            with self._file_lock(exclusive=False):
+                self._read_changes()
+        except OSError:
+            pass
+
+    def _read_changes(self) -> None:
+        """Reads entries appended since the last read, or all of them if the files were replaced."""
+        try:
+            with open(self._entries_path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                file_id = (stat.st_dev, stat.st_ino)
+                if file_id != self._file_id or stat.st_size < self._offset:
+                    self._forget()
+                    self._file_id = file_id
+                    self._offset = stat.st_size
+                    header = f.readline()
+                    if not self._valid_header(header):
+                        # Another format or vector size; the next add() starts over.
+                        return
+                    self._offset = len(header)
+                    self._stale = False
+                f.seek(self._offset)
+                data = f.read()
+        except OSError:
+            self._forget()
+            return
+        if self._stale:
+            return
+
+        # A line without its newline is a write still cut short by a crash.
+        end = data.rfind(b"\n") + 1
+        lines = data[:end].splitlines()
+        if not lines:
+            return
+        rows = self._read_vectors(len(self._entries), len(lines))
+        if rows is None:
+            # The vectors do not match the entries; the next add() starts over.
+            self._forget()
+            self._file_id = file_id
+            self._offset = stat.st_size
+            return
+        self._append_to_memory([_parse_entry(line) for line in lines], rows)
+        self._offset += end
+
+    def _valid_header(self, line: bytes) -> bool:
+        try:
+            header = json.loads(line)
+        except ValueError:
+            return False
+        return (
+            isinstance(header, dict)
+            and header.get("version") == SEMANTIC_FORMAT_VERSION
+            and header.get("dimensions") == self.dimensions
+        )
+
+    def _read_vectors(self, first: int, count: int) -> Optional[np.ndarray]:
+        try:
+            with open(self._vectors_path, "rb") as f:
+                f.seek(first * self._row_bytes)
+                data = f.read(count * self._row_bytes)
+        except OSError:
+            return None
+        if len(data) != count * self._row_bytes:
+            return None
+        return np.frombuffer(data, dtype="<f4").reshape(count, self.dimensions)
+
+    def _append_to_files(self, entry: dict, vector: np.ndarray) -> None:
+        # Drop whatever a crashed writer left past the last complete entry.
+        expected = len(self._entries) * self._row_bytes
+        if os.path.getsize(self._vectors_path) != expected:
+            os.truncate(self._vectors_path, expected)
+        if os.path.getsize(self._entries_path) != self._offset:
+            os.truncate(self._entries_path, self._offset)
+        # The vector goes first: readers take only the rows of complete lines.
+        with open(self._vectors_path, "ab") as f:
+            f.write(vector.astype("<f4").tobytes())
+        line = (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+        with open(self._entries_path, "ab") as f:
+            f.write(line)
+        self._offset += len(line)
+
+    def _rewrite(self, now: float) -> None:
+        """Replaces both files with the live entries in memory."""
+        keep = self._live_indices(now)
+        entries = [self._entries[i] for i in keep]
+        vectors = self._vectors[keep]
+        header = {"version": SEMANTIC_FORMAT_VERSION, "dimensions": self.dimensions}
+        lines = [json.dumps(header)] + [json.dumps(entry, separators=(",", ":")) for entry in entries]
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        # Readers wait on the lock held by the caller, so they never see one
+        # file replaced without the other.
+        atomic_write(self._vectors_path, vectors.astype("<f4").tobytes())
+        atomic_write(self._entries_path, data)
+        for name in _LEGACY_FILES:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+        self._forget()
+        self._append_to_memory(entries, vectors)
+        stat = os.stat(self._entries_path)
+        self._file_id = (stat.st_dev, stat.st_ino)
+        self._offset = len(data)
+        self._stale = False
+
+    # Memory.
+
+    def _forget(self) -> None:
+        self._entries = []
+        self._file_id = None
+        self._offset = 0
+        self._stale = True
+
+    def _append_to_memory(self, entries: List[Optional[dict]], vectors: np.ndarray) -> None:
+        count = len(self._entries)
+        needed = count + len(entries)
+        if needed > len(self._vectors):
+            grown = np.zeros((max(needed, 2 * len(self._vectors), 64), self.dimensions),
+                             dtype=np.float32)
+            grown[:count] = self._vectors[:count]
+            self._vectors = grown
+        self._vectors[count:needed] = vectors
+        self._entries.extend(entries)
+
+
+def _parse_entry(line: bytes) -> Optional[dict]:
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return None
+    if not (
+        isinstance(entry, dict)
+        and isinstance(entry.get("context"), str)
+        and isinstance(entry.get("query"), str)
+        and isinstance(entry.get("response"), dict)
+        and isinstance(entry.get("created_at"), (int, float))
+    ):
+        return None
+    return entry
+
+
+def _read_json(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
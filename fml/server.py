@@ -0,0 +1,327 @@
+import bisect
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, TYPE_CHECKING
+
+from fml.daemon import RequestDispatcher
+from fml.http_transport import close_transport, current_transport
+
+if TYPE_CHECKING:
+    from fml.ai_service import AIService
+    from fml.response_cache import ResponseCache
+    from fml.semantic_cache import SemanticCache
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_WORKERS = 4
+# Requests accepted beyond the busy workers; anything more is answered with 429.
+DEFAULT_QUEUE_SIZE = 16
+# Larger request bodies are refused with 413.
+MAX_BODY_BYTES = 1024 * 1024
+# Upper bounds, in seconds, of the /metrics latency histogram buckets. Cache
+# hits take milliseconds, model requests seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# The optional /v1/generate keys, with the JSON types they accept (or null).
+_OPTIONAL_FIELDS = {
+    "model": (str, "a string"),
+    "refresh": (bool, "a boolean"),
+    "use_cache": (bool, "a boolean"),
+    "system_info": (dict, "an object"),
+    "context": (dict, "an object"),
+}
+# HTTP status codes for the error types reported by RequestDispatcher.
+_ERROR_STATUS = {"ValueError": 400, "KeyError": 400, "RuntimeError": 500, "AIServiceError": 502}
+
+
+class LatencyHistogram:
+    """A thread-safe cumulative histogram of request durations, in Prometheus form."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        """Records one duration."""
+        with self._lock:
+            self._counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self._sum += seconds
+
+    def render(self, name: str, labels: str = "") -> List[str]:
+        """Returns the Prometheus exposition lines of the histogram."""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        prefix = labels + "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        cumulative += counts[-1]
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {total:.6f}")
+        lines.append(f"{name}_count{suffix} {cumulative}")
+        return lines
+
+
+class _ServeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "fml"
+
+    def do_GET(self):
+        server: "FmlServer" = self.server.fml_server
+        path = self.path.split("?")[0]
+        if path == "/healthz":
+            self._send_json(200, {"status": "ok"})
+        elif path == "/metrics":
+            body = server.render_metrics().encode("utf-8")
+            self._send(200, body, "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self._send_json(404, {"error": f"Unknown endpoint {path}"})
+
+    def do_POST(self):
+        server: "FmlServer" = self.server.fml_server
+        path = self.path.split("?")[0]
+        if path != "/v1/generate":
+            self._send_json(404, {"error": f"Unknown endpoint {path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0 or length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send_json(413, {"error": "Invalid Content-Length or request body too large."})
+            return
+        try:
+            request = json.loads(self.rfile.read(length) or b"null")
+        except ValueError as e:
+            self._send_json(400, {"error": f"Invalid JSON: {e}"})
+            return
+        status, reply = server.generate(request)
+        headers = {"Retry-After": "1"} if status == 429 else {}
+        self._send_json(status, reply, headers)
+
+    def _send_json(self, status: int, payload: dict, headers: Optional[Dict[str, str]] = None) -> None:
+        self._send(status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+    def _send(
+        self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None
+    ) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class FmlServer:
+    """
+    Serves AIService.generate_command over HTTP/JSON for a whole team.
+
+    `POST /v1/generate` takes `{"query": ..., "system_info": {...}}` (plus the
+    optional `model`, `refresh`, `use_cache` and `context` keys understood by
+    RequestDispatcher) and returns `{"response": AICommandResponse}`. Only the
+    server needs a provider API key, and services, response caches and HTTP
+    connections stay warm between requests.
+
+    At most `workers` requests are answered at once and up to `queue_size` more
+    wait for a worker; requests arriving while the queue is full get 429 with a
+    Retry-After header instead of piling up. `GET /metrics` reports request
+    counts, latency histograms, queue depth and connection reuse in the
+    Prometheus text format, and `GET /healthz` answers once the server is up.
+    """
+
+    def __init__(
+        self,
+        service_factory: Callable[[str], "AIService"],
+        default_model: str,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        workers: int = DEFAULT_WORKERS,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        cache: Optional["ResponseCache"] = None,
+        semantic_cache: Optional["SemanticCache"] = None,
+        model_resolver: Optional[Callable[[str], str]] = None,
+    ):
+        if workers < 1:
+            raise ValueError("The server needs at least 1 worker.")
+        if queue_size < 0:
+            raise ValueError("The queue size cannot be negative.")
+        self.dispatcher = RequestDispatcher(service_factory, cache, semantic_cache, model_resolver)
+        self.default_model = default_model
+        self.workers = workers
+        self.queue_size = queue_size
+        self._httpd = _HTTPServer((host, port), _ServeHandler)
+        self._httpd.fml_server = self
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fml-worker")
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._running = 0
+        self._responses: Dict[int, int] = {}
+        self._latency = {"ok": LatencyHistogram(), "error": LatencyHistogram()}
+        self._started_at = time.time()
+
+    @property
+    def base_url(self) -> str:
+        """The URL clients should send requests to."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def serve(self) -> None:
+        """Serves requests until stop() is called."""
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+            self._executor.shutdown(wait=False)
+            close_transport()
+
+    def stop(self) -> None:
+        """Stops serving; requests that are being answered are abandoned."""
+        self._httpd.shutdown()
+
+    def generate(self, request) -> tuple:
+        """
+        Answers a decoded /v1/generate request body on the worker pool.
+
+        Returns:
+            The HTTP status code and the JSON reply.
+        """
+        query = request.get("query") if isinstance(request, dict) else None
+        if not isinstance(query, str) or not query.strip():
+            return self._count(400), {"error": "The request needs a non-empty 'query' string."}
+        for name, (expected_type, description) in _OPTIONAL_FIELDS.items():
+            value = request.get(name)
+            if value is not None and not isinstance(value, expected_type):
+                return self._count(400), {"error": f"'{name}' must be {description}."}
+
+        with self._lock:
+            if self._admitted >= self.workers + self.queue_size:
+                self._responses[429] = self._responses.get(429, 0) + 1
+                return 429, {"error": "The server is busy; retry shortly."}
+            self._admitted += 1
+
+        start = time.perf_counter()
+        try:
+            reply = self._executor.submit(self._answer, request).result()
+        except RuntimeError:
+            # The executor has been shut down.
+            reply = {"ok": False, "error_type": "RuntimeError", "error": "The server is stopping."}
+        finally:
+            with self._lock:
+                self._admitted -= 1
+        elapsed = time.perf_counter() - start
+
+        if reply.get("ok"):
+            self._latency["ok"].observe(elapsed)
+            return self._count(200), {"response": reply["response"]}
+        self._latency["error"].observe(elapsed)
+        status = _ERROR_STATUS.get(reply.get("error_type"), 500)
+        body = {"error": reply.get("error")}
+        if reply.get("error_category"):
+            body["category"] = reply["error_category"]
+        return self._count(status), body
+
+    def _answer(self, request: dict) -> dict:
+        with self._lock:
+            self._running += 1
+        try:
+            return self.dispatcher.handle_request(
+                {**request, "model": request.get("model") or self.default_model}
+            )
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _count(self, status: int) -> int:
+        with self._lock:
+            self._responses[status] = self._responses.get(status, 0) + 1
+        return status
+
+    def render_metrics(self) -> str:
+        """Returns the /metrics page in the Prometheus text exposition format."""
+        with self._lock:
+            responses = dict(self._responses)
+            running = self._running
+            queued = self._admitted - self._running
+
+        lines = [
+            "# HELP fml_generate_requests_total /v1/generate requests by HTTP status code.",
+            "# TYPE fml_generate_requests_total counter",
+        ]
+        lines += [
+            f'fml_generate_requests_total{{code="{code}"}} {count}'
+            for code, count in sorted(responses.items())
+        ]
+        lines += [
+            "# HELP fml_generate_duration_seconds Time to answer accepted /v1/generate requests.",
+            "# TYPE fml_generate_duration_seconds histogram",
+        ]
+        for outcome, histogram in self._latency.items():
+            lines += histogram.render("fml_generate_duration_seconds", f'outcome="{outcome}"')
+        lines += _gauge("fml_workers_busy", "Requests being answered by a worker.", running)
+        lines += _gauge("fml_queue_depth", "Accepted requests waiting for a worker.", queued)
+        lines += _gauge("fml_workers", "Size of the worker pool.", self.workers)
+        lines += _gauge("fml_queue_capacity", "Requests that may wait before 429 is returned.",
+                        self.queue_size)
+        lines += _gauge("fml_uptime_seconds", "Seconds since the server started.",
+                        round(time.time() - self._started_at, 3))
+
+        services = self.dispatcher.services()
+        usage = [service.usage_totals for service in services]
+        lines += [
+            "# HELP fml_tokens_total Tokens reported by the model provider.",
+            "# TYPE fml_tokens_total counter",
+            f'fml_tokens_total{{kind="input"}} {sum(u.prompt_tokens for u in usage)}',
+            f'fml_tokens_total{{kind="cached"}} {sum(u.cached_tokens for u in usage)}',
+            f'fml_tokens_total{{kind="output"}} {sum(u.output_tokens for u in usage)}',
+        ]
+        coalesced = sum(s.coalescer.stats().coalesced for s in services if s.coalescer)
+        lines += _counter("fml_coalesced_requests_total",
+                          "Requests that joined an identical in-flight request.", coalesced)
+
+        transport = current_transport()
+        if transport is not None:
+            stats = transport.stats()
+            lines += _counter("fml_provider_http_requests_total",
+                              "HTTP requests sent to the model provider.", stats.requests)
+            lines += _counter("fml_provider_connections_opened_total",
+                              "Connections opened to the model provider.",
+                              stats.connections_opened)
+        return "\n".join(lines) + "\n"
+
+
+def _gauge(name: str, help_text: str, value) -> List[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+
+def _counter(name: str, help_text: str, value) -> List[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {value}"]
+
+
+def run_server(server: FmlServer) -> None:
+    """Serves in the foreground until interrupted."""
+    print(f"fml serve listening on {server.base_url} "
+          f"({server.workers} workers, queue of {server.queue_size})", file=sys.stderr)
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
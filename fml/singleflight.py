@@ -0,0 +1,87 @@
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Generic, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class SingleFlightStats:
+    """How many calls a SingleFlight made and how many callers joined one instead."""
+
+    calls: int = 0
+    coalesced: int = 0
+
+
+class _Call(Generic[T]):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[T] = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight(Generic[T]):
+    """
+    Collapses concurrent calls with the same key into one.
+
+    The first caller for a key (the leader) runs the function; callers arriving
+    with the same key while it is running wait for it and receive its result,
+    or its exception. Once the call has finished the key is forgotten, so later
+    callers run the function again (by then a cache usually answers them). A
+    single instance may be shared between threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call[T]] = {}
+        self._stats = SingleFlightStats()
+
+    def do(self, key: str, fn: Callable[[], T]) -> Tuple[T, bool]:
+        """
+        Runs fn, or waits for the call already running under the same key.
+
+        Args:
+            key: Identifies calls that are interchangeable.
+            fn: Produces the result; only called by the leader.
+
+        Returns:
+            The result, and whether it was shared from another caller's call.
+
+        Raises:
+            Whatever fn raised, in the leader and every waiting caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self._stats = SingleFlightStats(self._stats.calls + 1, self._stats.coalesced)
+            else:
+                self._stats = SingleFlightStats(self._stats.calls, self._stats.coalesced + 1)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        """Returns the number of calls currently running."""
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> SingleFlightStats:
+        """Returns the number of calls made and of callers that joined one."""
+        with self._lock:
+            return self._stats
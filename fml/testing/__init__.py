@@ -0,0 +1 @@
+# Helpers for exercising fml without network access (benchmarks, load tests).
@@ -0,0 +1,353 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+
+def make_response_payload(query: str, explanation_words: int = 30, flag_count: int = 2) -> str:
+    """
+    Builds the JSON text of a fake AICommandResponse.
+
+    Args:
+        query: The user query found in the request; echoed in the command.
+        explanation_words: The number of words in the explanation.
+        flag_count: The number of flags listed.
+
+    Returns:
+        A JSON string matching the AICommandResponse schema.
+    """
+    return json.dumps(
+        {
+            "explanation": " ".join(["word"] * explanation_words),
+            "flags": [
+                {"flag": f"--flag-{i}", "description": f"Description of flag {i}."}
+                for i in range(flag_count)
+            ],
+            "command": "echo " + json.dumps(query[:80]),
+        }
+    )
+
+
+def make_packed_response_payload(
+    queries: List[dict], explanation_words: int = 30, flag_count: int = 2
+) -> str:
+    """
+    Builds the JSON text of a fake packed response.
+
+    Args:
+        queries: The {"id", "query"} objects listed in a packed request.
+        explanation_words: The number of words in each explanation.
+        flag_count: The number of flags listed in each response.
+
+    Returns:
+        A JSON string matching the PackedCommandResponses schema.
+    """
+    responses = []
+    for item in queries:
+        response = json.loads(
+            make_response_payload(str(item.get("query", "")), explanation_words, flag_count)
+        )
+        responses.append({"id": str(item.get("id", "")), **response})
+    return json.dumps({"responses": responses})
+
+
+def _packed_queries(body: dict) -> Optional[List[dict]]:
+    """Returns the queries of a packed request, or None for a single-query request."""
+    schema = (body.get("generationConfig") or {}).get("responseSchema") or {}
+    if "responses" not in (schema.get("properties") or {}):
+        return None
+    try:
+        queries = json.loads(body["contents"][0]["parts"][1]["text"])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return []
+    return [item for item in queries if isinstance(item, dict)] if isinstance(queries, list) else []
+
+
+class _FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server: "FakeGeminiServer" = self.server.fake
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            body = {}
+        if not isinstance(body, dict):
+            body = {}
+        try:
+            query = body["contents"][0]["parts"][0]["text"]
+        except (KeyError, IndexError, TypeError):
+            query = ""
+        server._record_request()
+
+        if self.path.split("?")[0].endswith("/cachedContents"):
+            self._send_json(200, server._create_cached_content(body))
+            return
+        if ":generateContent" not in self.path and ":streamGenerateContent" not in self.path:
+            self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+            return
+
+        if body.get("cachedContent") and body["cachedContent"] not in server.cached_contents:
+            self._send_json(
+                404,
+                {"error": {"code": 404, "message": "CachedContent not found", "status": "NOT_FOUND"}},
+            )
+            return
+
+        delay, fault = server._draw()
+        if delay:
+            time.sleep(delay)
+        if fault == _FAULT_ERROR:
+            status = server.error_status
+            self._send_json(
+                status,
+                {"error": {"code": status, "message": "Injected failure",
+                           "status": _STATUS_NAMES.get(status, "UNKNOWN")}},
+            )
+            return
+        packed = _packed_queries(body)
+        if packed is not None:
+            text = make_packed_response_payload(packed, server.explanation_words, server.flag_count)
+        else:
+            text = make_response_payload(query, server.explanation_words, server.flag_count)
+        usage = server._usage(body, text)
+        if fault == _FAULT_MALFORMED:
+            # Cut the JSON off mid-way, like a response truncated by the model.
+            text = text[: len(text) // 2]
+
+        if ":streamGenerateContent" in self.path:
+            self._send_stream(text, server.stream_chunks, server.chunk_interval, usage)
+        else:
+            self._send_json(200, _candidate(text, finish=True, usage=usage))
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, text: str, chunks: int, interval: float, usage: dict) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        size = max(1, -(-len(text) // max(1, chunks)))
+        for start in range(0, len(text), size):
+            if start and interval:
+                time.sleep(interval)
+            last = start + size >= len(text)
+            event = json.dumps(
+                _candidate(text[start:start + size], finish=last, usage=usage if last else None)
+            )
+            self.wfile.write(f"data: {event}\r\n\r\n".encode("utf-8"))
+            self.wfile.flush()
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+_FAULT_ERROR = "error"
+_FAULT_MALFORMED = "malformed"
+# google.rpc status names of the error codes the fake server may inject.
+_STATUS_NAMES = {
+    400: "INVALID_ARGUMENT",
+    429: "RESOURCE_EXHAUSTED",
+    500: "INTERNAL",
+    503: "UNAVAILABLE",
+    504: "DEADLINE_EXCEEDED",
+}
+
+
+def _candidate(text: str, finish: bool, usage: Optional[dict] = None) -> dict:
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if finish:
+        candidate["finishReason"] = "STOP"
+    payload = {"candidates": [candidate]}
+    if usage:
+        payload["usageMetadata"] = usage
+    return payload
+
+
+def estimate_tokens(value) -> int:
+    """Estimates the tokens in the text of a request fragment (four characters per token)."""
+    if isinstance(value, str):
+        return -(-len(value) // 4)
+    if isinstance(value, dict):
+        return sum(estimate_tokens(item) for item in value.values())
+    if isinstance(value, list):
+        return sum(estimate_tokens(item) for item in value)
+    return 0
+
+
+class FakeGeminiServer:
+    """
+    A local HTTP stand-in for the Gemini generateContent API.
+
+    It answers `generateContent` and `streamGenerateContent` (server-sent
+    events) requests for any model with a valid AICommandResponse JSON (or, for
+    packed requests, one per listed query) after `latency` seconds, so GeminiService can be exercised end to end without
+    network access. Point the service at it with FML_GEMINI_BASE_URL set to
+    `base_url`. Payload size is controlled by `explanation_words` and
+    `flag_count`; streamed responses are split into `stream_chunks` events sent
+    `chunk_interval` seconds apart. Responses report estimated token usage, and
+    system instructions stored through the `cachedContents` endpoint are
+    counted as cached tokens when a request references them.
+
+    For load tests, faults can be injected: each response is delayed by a
+    further random `latency_jitter` seconds at most, a fraction `error_rate`
+    of requests fail with HTTP `error_status`, and a fraction `malformed_rate`
+    succeed with truncated JSON. `seed` makes the draws reproducible, and the
+    injected faults are counted in `injected_errors` and `injected_malformed`.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        explanation_words: int = 30,
+        flag_count: int = 2,
+        stream_chunks: int = 4,
+        chunk_interval: float = 0.0,
+        latency_jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        malformed_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        if not 0 <= error_rate + malformed_rate <= 1:
+            raise ValueError("error_rate and malformed_rate must add up to between 0 and 1.")
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.malformed_rate = malformed_rate
+        self.injected_errors = 0
+        self.injected_malformed = 0
+        self._random = random.Random(seed)
+        self.explanation_words = explanation_words
+        self.flag_count = flag_count
+        self.stream_chunks = stream_chunks
+        self.chunk_interval = chunk_interval
+        self.request_count = 0
+        self.cached_contents = {}
+        self._count_lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _FakeGeminiHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        """The URL to use as FML_GEMINI_BASE_URL."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeGeminiServer":
+        """Serves requests from a background thread."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops serving and closes the listening socket."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> "FakeGeminiServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _record_request(self) -> None:
+        with self._count_lock:
+            self.request_count += 1
+
+    def _draw(self) -> Tuple[float, Optional[str]]:
+        """Returns the delay of the next response and the fault to inject, if any."""
+        with self._count_lock:
+            delay = self.latency + self._random.uniform(0, self.latency_jitter)
+            roll = self._random.random()
+            if roll < self.error_rate:
+                self.injected_errors += 1
+                return delay, _FAULT_ERROR
+            if roll < self.error_rate + self.malformed_rate:
+                self.injected_malformed += 1
+                return delay, _FAULT_MALFORMED
+            return delay, None
+
+    def _create_cached_content(self, body: dict) -> dict:
+        with self._count_lock:
+            name = f"cachedContents/fake-{len(self.cached_contents) + 1}"
+            self.cached_contents[name] = estimate_tokens(body.get("systemInstruction"))
+        expire_time = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 3600))
+        return {"name": name, "model": body.get("model", ""), "expireTime": expire_time}
+
+    def _usage(self, body: dict, text: str) -> dict:
+        cached = self.cached_contents.get(body.get("cachedContent"), 0)
+        prompt = estimate_tokens(body.get("contents")) + estimate_tokens(
+            body.get("systemInstruction")
+        ) + cached
+        output = estimate_tokens(text)
+        usage = {
+            "promptTokenCount": prompt,
+            "candidatesTokenCount": output,
+            "totalTokenCount": prompt + output,
+        }
+        if cached:
+            usage["cachedContentTokenCount"] = cached
+        return usage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Gemini API server for offline testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before each response.")
+    parser.add_argument("--explanation-words", type=int, default=30)
+    parser.add_argument("--flags", type=int, default=2, help="Flags per response.")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="Up to this many further seconds before each response.")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with an HTTP error.")
+    parser.add_argument("--error-status", type=int, default=503,
+                        help="HTTP status of injected errors.")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with truncated JSON.")
+    parser.add_argument("--seed", type=int, help="Seed for the injected faults.")
+    args = parser.parse_args()
+
+    server = FakeGeminiServer(
+        args.host,
+        args.port,
+        latency=args.latency,
+        explanation_words=args.explanation_words,
+        flag_count=args.flags,
+        latency_jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        malformed_rate=args.malformed_rate,
+        seed=args.seed,
+    )
+    print(f"Fake Gemini API listening on {server.base_url}")
+    print(f"Use it with: FML_GEMINI_BASE_URL={server.base_url} GEMINI_API_KEY=fake fml ...")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
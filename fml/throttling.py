@@ -0,0 +1,100 @@
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+
+class TokenBucket:
+    """
+    A thread-safe token-bucket rate limiter.
+
+    Tokens refill continuously at `rate_per_second` up to `capacity`. Callers that
+    find the bucket empty reserve a token anyway and sleep until it would have been
+    refilled, so concurrent callers are spaced out fairly instead of stampeding.
+    """
+
+    def __init__(
+        self,
+        rate_per_second: float,
+        capacity: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if rate_per_second <= 0:
+            raise ValueError("rate_per_second must be positive.")
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1.")
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests_per_minute: float, burst: Optional[float] = None) -> "TokenBucket":
+        """
+        Creates a bucket matching a provider's requests-per-minute quota.
+
+        Args:
+            requests_per_minute: The sustained request rate to allow.
+            burst: How many requests may be sent back to back; defaults to one
+                second's worth of requests (at least one).
+        """
+        rate = requests_per_minute / 60.0
+        return cls(rate, capacity=burst if burst is not None else max(1.0, rate))
+
+    def acquire(self) -> float:
+        """
+        Takes one token, blocking until it is available.
+
+        Returns:
+            The number of seconds the caller waited.
+        """
+        wait = self.reserve()
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def reserve(self) -> float:
+        """
+        Takes one token without blocking.
+
+        The token is reserved immediately; the caller must wait the returned number
+        of seconds before using it. Async callers use this with asyncio.sleep.
+
+        Returns:
+            The number of seconds to wait before sending the request.
+        """
+        with self._lock:
+            now = self._clock()
+            elapsed = now - self._updated_at
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate_per_second)
+            self._updated_at = now
+            self._tokens -= 1
+            return -self._tokens / self.rate_per_second if self._tokens < 0 else 0.0
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    How often and how long to back off before retrying a retryable AIServiceError.
+
+    Delays follow exponential backoff with "full jitter": attempt n waits a random
+    time between 0 and min(max_delay, base_delay * 2**n) seconds.
+    """
+
+    max_attempts: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+
+    def delay(self, attempt: int) -> float:
+        """
+        Returns the backoff before the next try.
+
+        Args:
+            attempt: The zero-based number of the attempt that just failed.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2**attempt)))
@@ -0,0 +1,29 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def isolated_fml_environment(tmp_path, monkeypatch):
+    """Keeps tests away from the user's real cache directory and any running daemon."""
+    monkeypatch.setenv("FML_CACHE_DIR", str(tmp_path / "fml-cache"))
+    monkeypatch.delenv("FML_DAEMON", raising=False)
+    monkeypatch.delenv("FML_DAEMON_SOCKET", raising=False)
+    monkeypatch.delenv("FML_GEMINI_BASE_URL", raising=False)
+    # The built-in command index would answer common test queries before the
+    # mocked AI service; tests that exercise it enable it explicitly.
+    monkeypatch.setenv("FML_LOCAL_INDEX", "off")
+    # Answers are not recorded in the query history unless a test opts in.
+    monkeypatch.setenv("FML_HISTORY", "off")
+    # Copies go to an in-memory clipboard, detected afresh for every test.
+    monkeypatch.setenv("FML_CLIPBOARD", "fake")
+    from fml.clipboard import get_clipboard
+
+    get_clipboard.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_tracer():
+    """Leaves the process-wide tracer disabled and empty after every test."""
+    yield
+    from fml.profiling import get_tracer
+
+    get_tracer().reset()
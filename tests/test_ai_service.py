@@ -1,3 +1,4 @@
+import json
 import pytest
 from abc import ABC, abstractmethod
 from typing import List
@@ -65,3 +66,508 @@ def test_concrete_ai_service_implements_abstract_methods(mock_ai_context):
     service = ConcreteAIService("key", "path", "model")
     response = service.generate_command("test query", mock_ai_context)
     assert response.command == "mocked command"
+
+
+def test_generate_command_maps_network_errors(mock_ai_context):
+    """Verify that connection failures from the HTTP layer become network AIServiceErrors."""
+    import httpx
+    from fml.ai_service import AIServiceError
+
+    class FailingAIService(ConcreteAIService):
+        def _generate_command_internal(self, query, ai_context):
+            raise httpx.ConnectError("connection refused")
+
+    service = FailingAIService("key", "path", "model")
+    with pytest.raises(AIServiceError, match="Network Error: Could not connect"):
+        service.generate_command("test query", mock_ai_context)
+
+
+def test_parse_partial_response_keeps_trailing_strings():
+    """Verify that partially streamed JSON yields the fields received so far."""
+    from fml.ai_service import parse_partial_response
+
+    assert parse_partial_response("") == {}
+    assert parse_partial_response('{"explanation": "Lists fi') == {"explanation": "Lists fi"}
+    assert parse_partial_response('{"explanation": "Done.", "fla') == {"explanation": "Done."}
+    assert parse_partial_response("not json") == {}
+
+
+def test_generate_command_streaming_falls_back_for_non_streaming_services(mock_ai_context):
+    """Verify that services without a streaming implementation still return a response."""
+    partials = []
+    service = ConcreteAIService("key", "path", "model")
+    response = service.generate_command("test query", mock_ai_context, on_partial=partials.append)
+    assert response.command == "mocked command"
+    assert partials == []
+
+
+class FlakyAIService(ConcreteAIService):
+    """Fails with the given errors before succeeding."""
+
+    def __init__(self, errors):
+        super().__init__("key", "path", "model")
+        self.errors = list(errors)
+        self.calls = 0
+
+    def _generate_command_internal(self, query, ai_context):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return super()._generate_command_internal(query, ai_context)
+
+
+def test_ai_service_error_retryable_categories():
+    from fml.ai_service import AIServiceError
+
+    assert AIServiceError("x", category="api", status_code=429).retryable
+    assert AIServiceError("x", category="api", status_code=503).retryable
+    assert AIServiceError("x", category="network").retryable
+    assert not AIServiceError("x", category="api", status_code=400).retryable
+    assert not AIServiceError("x", category="format").retryable
+    assert AIServiceError("x").category == "unexpected"
+
+
+def test_generate_command_retries_retryable_errors(mock_ai_context):
+    from fml.ai_service import AIServiceError
+    from fml.throttling import RetryPolicy
+
+    service = FlakyAIService(
+        [
+            AIServiceError("busy", category="api", status_code=429),
+            AIServiceError("down", category="api", status_code=503),
+        ]
+    )
+    service.retry_policy = RetryPolicy(max_attempts=3, base_delay=0)
+
+    response = service.generate_command("test query", mock_ai_context)
+
+    assert response.command == "mocked command"
+    assert service.calls == 3
+
+
+def test_generate_command_does_not_retry_client_errors(mock_ai_context):
+    from fml.ai_service import AIServiceError
+    from fml.throttling import RetryPolicy
+
+    service = FlakyAIService([AIServiceError("bad request", category="api", status_code=400)])
+    service.retry_policy = RetryPolicy(max_attempts=3, base_delay=0)
+
+    with pytest.raises(AIServiceError, match="bad request") as excinfo:
+        service.generate_command("test query", mock_ai_context)
+    assert excinfo.value.status_code == 400
+    assert service.calls == 1
+
+
+def test_generate_command_gives_up_after_max_attempts(mock_ai_context):
+    from fml.ai_service import AIServiceError
+    from fml.throttling import RetryPolicy
+
+    service = FlakyAIService(
+        [AIServiceError("busy", category="api", status_code=429)] * 5
+    )
+    service.retry_policy = RetryPolicy(max_attempts=2, base_delay=0)
+
+    with pytest.raises(AIServiceError, match="busy"):
+        service.generate_command("test query", mock_ai_context)
+    assert service.calls == 2
+
+
+def test_generate_command_acquires_rate_limiter_per_provider_call(mock_ai_context):
+    from unittest.mock import MagicMock
+
+    service = ConcreteAIService("key", "path", "model")
+    service.rate_limiter = MagicMock()
+
+    service.generate_command("test query", mock_ai_context)
+
+    service.rate_limiter.acquire.assert_called_once_with()
+
+
+def test_generate_commands_runs_concurrently_and_keeps_order(mock_ai_context):
+    import threading
+    from fml.ai_service import AIServiceError
+
+    barrier = threading.Barrier(3, timeout=5)
+
+    class BarrierAIService(ConcreteAIService):
+        def _generate_command_internal(self, query, ai_context):
+            barrier.wait()  # only passes if three calls are in flight at once
+            if query == "bad":
+                raise AIServiceError("nope", category="api", status_code=400)
+            return AICommandResponse(explanation=query, flags=[], command=query)
+
+    service = BarrierAIService("key", "path", "model")
+    results = service.generate_commands(["a", "bad", "c"], mock_ai_context, max_concurrency=3)
+
+    assert [r.query for r in results] == ["a", "bad", "c"]
+    assert results[0].response.command == "a"
+    assert results[1].response is None and results[1].error.status_code == 400
+    assert results[2].response.command == "c"
+    assert all(r.latency_seconds >= 0 for r in results)
+
+
+def test_generate_commands_rejects_invalid_concurrency(mock_ai_context):
+    service = ConcreteAIService("key", "path", "model")
+    with pytest.raises(ValueError):
+        service.generate_commands(["a"], mock_ai_context, max_concurrency=0)
+
+
+def test_agenerate_command_default_runs_sync_implementation(mock_ai_context):
+    """Verify services without an async client still work through agenerate_command."""
+    import asyncio
+
+    service = ConcreteAIService("key", "path", "model")
+    response = asyncio.run(service.agenerate_command("test query", mock_ai_context))
+    assert response.command == "mocked command"
+
+
+def test_agenerate_command_uses_cache_and_retries(mock_ai_context, tmp_path):
+    import asyncio
+    from fml.ai_service import AIServiceError
+    from fml.response_cache import ResponseCache
+    from fml.throttling import RetryPolicy
+
+    service = FlakyAIService([AIServiceError("busy", category="api", status_code=429)])
+    service.retry_policy = RetryPolicy(max_attempts=2, base_delay=0)
+    service.cache = ResponseCache(str(tmp_path / "responses.json"))
+
+    async def run_twice():
+        first = await service.agenerate_command("test query", mock_ai_context)
+        second = await service.agenerate_command("test query", mock_ai_context)
+        return first, second
+
+    first, second = asyncio.run(run_twice())
+    assert first == second
+    assert service.calls == 2  # one retried failure, then served from cache
+
+
+@pytest.mark.parametrize("status_codes, calls", [([429, 503], 3), ([429, 503, 503], 3), ([400], 1)])
+def test_generate_command_and_agenerate_command_retry_alike(mock_ai_context, status_codes, calls):
+    """Both paths make the same retry decisions for the same failures."""
+    import asyncio
+    from fml.ai_service import AIServiceError
+    from fml.throttling import RetryPolicy
+
+    def run(drive):
+        service = FlakyAIService(
+            [AIServiceError(str(code), category="api", status_code=code) for code in status_codes]
+        )
+        service.retry_policy = RetryPolicy(max_attempts=3, base_delay=0)
+        try:
+            outcome = drive(service).command
+        except AIServiceError as e:
+            outcome = e.status_code
+        return outcome, service.calls
+
+    sync = run(lambda service: service.generate_command("test query", mock_ai_context))
+    async_ = run(lambda service: asyncio.run(service.agenerate_command("test query", mock_ai_context)))
+    assert sync == async_
+    assert sync[1] == calls
+
+
+def test_agenerate_command_shares_one_event_loop(mock_ai_context):
+    import asyncio
+
+    class SlowAsyncAIService(ConcreteAIService):
+        async def _agenerate_command_internal(self, query, ai_context):
+            await asyncio.sleep(0.05)
+            return AICommandResponse(explanation=query, flags=[], command=query)
+
+    service = SlowAsyncAIService("key", "path", "model")
+
+    async def run_many():
+        return await asyncio.gather(
+            *(service.agenerate_command(str(i), mock_ai_context) for i in range(200))
+        )
+
+    responses = asyncio.run(run_many())
+    assert [r.command for r in responses] == [str(i) for i in range(200)]
+
+
+def test_agenerate_command_maps_unexpected_errors(mock_ai_context):
+    import asyncio
+    from fml.ai_service import AIServiceError
+
+    class BrokenAsyncAIService(ConcreteAIService):
+        async def _agenerate_command_internal(self, query, ai_context):
+            raise RuntimeError("socket exploded")
+
+    service = BrokenAsyncAIService("key", "path", "model")
+    with pytest.raises(
+        AIServiceError, match="An unexpected error occurred during AI interaction: socket exploded"
+    ):
+        asyncio.run(service.agenerate_command("test query", mock_ai_context))
+
+
+def test_prepare_skips_client_when_answer_is_cached(tmp_path, mock_ai_context):
+    """Verify prepare() only loads the provider client when the cache cannot answer."""
+    from unittest.mock import patch
+    from fml.response_cache import ResponseCache
+
+    service = ConcreteAIService("key", "prompt", "test-model")
+    service.cache = ResponseCache(str(tmp_path / "responses.json"))
+    service.generate_command("cached query", mock_ai_context)
+
+    with patch.object(service, "_prepare_client") as mock_prepare:
+        service.prepare("cached query", mock_ai_context)
+        mock_prepare.assert_not_called()
+
+        service.prepare("cached query", mock_ai_context, refresh=True)
+        service.prepare("new query", mock_ai_context)
+        assert mock_prepare.call_count == 2
+
+
+def test_ai_service_records_token_usage(mock_ai_context, tmp_path):
+    """Recorded usage is exposed as last_usage and cleared by a cache hit."""
+    from fml.ai_service import TokenUsage
+    from fml.response_cache import ResponseCache
+
+    class UsageAIService(ConcreteAIService):
+        def _generate_command_internal(self, query, ai_context):
+            self._record_usage(TokenUsage(prompt_tokens=10, cached_tokens=4, output_tokens=5, total_tokens=15))
+            return super()._generate_command_internal(query, ai_context)
+
+    service = UsageAIService("key", "prompt", "model")
+    service.cache = ResponseCache(str(tmp_path / "responses.json"))
+
+    service.generate_command("list files", mock_ai_context)
+    assert service.last_usage == TokenUsage(10, 4, 5, 15)
+    assert service.last_usage.format() == "10 input (4 cached), 5 output, 15 total"
+
+    service.generate_command("list files", mock_ai_context)
+    assert service.last_usage is None
+    assert service.usage_totals == TokenUsage(10, 4, 5, 15)
+
+
+def test_ai_service_records_model_health(mock_ai_context):
+    """Successes and model failures feed model_stats; network errors do not."""
+    from fml.ai_service import AIServiceError
+    from fml.model_stats import ModelStatsStore
+
+    errors = [
+        AIServiceError("bad request", category="api", status_code=400),
+        AIServiceError("malformed", category="format"),
+        AIServiceError("offline", category="network"),
+    ]
+
+    class FlakyAIService(ConcreteAIService):
+        def _generate_command_internal(self, query, ai_context):
+            if errors:
+                raise errors.pop(0)
+            return super()._generate_command_internal(query, ai_context)
+
+    service = FlakyAIService("key", "prompt", "model")
+    service.model_stats = ModelStatsStore()
+    for _ in range(4):
+        try:
+            service.generate_command("list files", mock_ai_context)
+        except AIServiceError:
+            pass
+
+    assert service.model_stats.failure_rate("model") == 2 / 3
+    assert service.model_stats.sample_count("model") == 1
+
+
+def test_generate_command_coalesces_identical_concurrent_requests(mock_ai_context):
+    """Concurrent identical calls share one provider request; different ones do not."""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    class SlowAIService(ConcreteAIService):
+        def _generate_command_internal(self, query, ai_context):
+            calls.append(query)
+            started.set()
+            release.wait(5)
+            return AICommandResponse(explanation=query, flags=[], command=query)
+
+    service = SlowAIService("key", "path", "model")
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        first = executor.submit(service.generate_command, "ls", mock_ai_context)
+        started.wait(5)
+        joined = [
+            executor.submit(service.generate_command, "ls", mock_ai_context.model_copy())
+            for _ in range(2)
+        ]
+        while service.coalescer.stats().coalesced < 2:
+            pass
+        release.set()
+        other = service.generate_command("pwd", mock_ai_context)
+        responses = [first.result()] + [future.result() for future in joined]
+
+    assert calls == ["ls", "pwd"]
+    assert all(response is responses[0] for response in responses)
+    assert other.command == "pwd"
+
+
+def test_generate_command_shares_errors_and_skips_coalescing_when_disabled(mock_ai_context):
+    """Joined callers see the leader's error; without a coalescer every call is sent."""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from fml.ai_service import AIServiceError
+
+    release = threading.Event()
+    calls = []
+
+    class FailingAIService(ConcreteAIService):
+        def _generate_command_internal(self, query, ai_context):
+            calls.append(query)
+            release.wait(5)
+            raise AIServiceError("nope", category="api", status_code=400)
+
+    service = FailingAIService("key", "path", "model")
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(service.generate_command, "ls", mock_ai_context)
+                   for _ in range(2)]
+        while service.coalescer.stats().coalesced < 1:
+            pass
+        release.set()
+        for future in futures:
+            with pytest.raises(AIServiceError, match="nope"):
+                future.result()
+    assert calls == ["ls"]
+
+    service.coalescer = None
+    for _ in range(2):
+        with pytest.raises(AIServiceError):
+            service.generate_command("ls", mock_ai_context)
+    assert calls == ["ls"] * 3
+
+
+def test_parse_packed_response_validates_each_answer_on_its_own():
+    """Missing, duplicated, unknown and invalid answers become None; the rest survive."""
+    from fml.ai_service import pack_queries, parse_packed_response
+
+    ids, listing = pack_queries(["ls", "pwd", "date", "who"])
+    answer = {"explanation": "e", "flags": [], "command": "c"}
+    text = json.dumps({"responses": [
+        {"id": "1", **answer},
+        {"id": "2", "explanation": "no command", "flags": []},
+        {"id": "3", **answer},
+        {"id": "3", **answer},
+        {"id": "9", **answer},
+        "not an object",
+    ]})
+
+    responses = parse_packed_response(text, ids)
+
+    assert ids == ["1", "2", "3", "4"]
+    assert json.loads(listing)[1] == {"id": "2", "query": "pwd"}
+    assert responses[0].command == "c"
+    assert responses[1:] == [None, None, None]
+
+
+def test_parse_packed_response_rejects_unparseable_text():
+    """A response that is not a packed JSON object is a format error."""
+    from fml.ai_service import AIServiceError, parse_packed_response
+
+    for text in ("not json", '{"answers": []}'):
+        with pytest.raises(AIServiceError) as excinfo:
+            parse_packed_response(text, ["1"])
+        assert excinfo.value.category == "format"
+
+
+def test_token_usage_split_adds_up():
+    """Shares of a packed request's usage add up to the original counts."""
+    from fml.ai_service import TokenUsage
+
+    usage = TokenUsage(prompt_tokens=10, cached_tokens=0, output_tokens=7, total_tokens=17)
+    shares = usage.split(3)
+
+    assert shares[0] == TokenUsage(4, 0, 3, 6)
+    assert sum(shares, TokenUsage()) == usage
+
+
+class PackingAIService(ConcreteAIService):
+    """Answers packs in one call; queries containing 'bad' get no valid answer."""
+
+    supports_packing = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.packs = []
+        self.singles = []
+
+    def _generate_packed_internal(self, queries, ai_context):
+        from fml.ai_service import TokenUsage
+
+        self.packs.append(list(queries))
+        self._record_usage(TokenUsage(prompt_tokens=10, output_tokens=20, total_tokens=30))
+        return [
+            None if "bad" in query else
+            AICommandResponse(explanation="packed", flags=[], command=query)
+            for query in queries
+        ]
+
+    def _generate_command_internal(self, query, ai_context):
+        self.singles.append(query)
+        return AICommandResponse(explanation="single", flags=[], command=query)
+
+
+def test_generate_packed_retries_invalid_answers_on_their_own(mock_ai_context, tmp_path):
+    """One request answers the pack; the invalid answer is asked again alone, and cached answers are skipped."""
+    from fml.response_cache import ResponseCache
+
+    service = PackingAIService("key", "path", "model")
+    service.cache = ResponseCache(str(tmp_path / "cache.json"))
+    service.cache.put(
+        service._cache_key("cached", mock_ai_context),
+        AICommandResponse(explanation="cache", flags=[], command="cached"),
+    )
+
+    results = service.generate_packed(["ls", "cached", "bad one", "pwd"], mock_ai_context)
+
+    assert service.packs == [["ls", "bad one", "pwd"]]
+    assert service.singles == ["bad one"]
+    assert [r.response.explanation for r in results] == ["packed", "cache", "single", "packed"]
+    assert results[0].usage.total_tokens + results[3].usage.total_tokens == 30
+    assert results[1].usage is None
+    assert service.cache.get(service._cache_key("ls", mock_ai_context)).command == "ls"
+
+
+def test_generate_packed_falls_back_or_fails_with_the_pack(mock_ai_context):
+    """An unparseable pack is retried query by query; an API error fails every query."""
+    from fml.ai_service import AIServiceError
+
+    class BrokenPackAIService(PackingAIService):
+        error = AIServiceError("garbled", category="format")
+
+        def _generate_packed_internal(self, queries, ai_context):
+            self.packs.append(list(queries))
+            raise self.error
+
+    service = BrokenPackAIService("key", "path", "model")
+    results = service.generate_packed(["ls", "pwd"], mock_ai_context)
+    assert service.singles == ["ls", "pwd"]
+    assert all(r.response.explanation == "single" for r in results)
+
+    service.error = AIServiceError("denied", category="api", status_code=403)
+    results = service.generate_packed(["date", "who"], mock_ai_context)
+    assert service.singles == ["ls", "pwd"]
+    assert [r.error.status_code for r in results] == [403, 403]
+
+
+def test_default_packed_internal_answers_each_query(mock_ai_context):
+    """Services that cannot pack still answer _generate_packed_internal, one query at a time."""
+    service = PackingAIService("key", "path", "model")
+
+    responses = AIService._generate_packed_internal(service, ["ls", "pwd"], mock_ai_context)
+
+    assert service.singles == ["ls", "pwd"]
+    assert [response.command for response in responses] == ["ls", "pwd"]
+
+
+def test_generate_commands_sends_packs_of_pack_size(mock_ai_context):
+    """generate_commands splits the queries into packs and keeps the result order."""
+    service = PackingAIService("key", "path", "model")
+
+    results = service.generate_commands(["a", "b", "c", "d", "e"], mock_ai_context, pack_size=2)
+
+    assert sorted(service.packs) == [["a", "b"], ["c", "d"]]
+    assert service.singles == ["e"]
+    assert [r.response.command for r in results] == ["a", "b", "c", "d", "e"]
+    with pytest.raises(ValueError):
+        service.generate_commands(["a"], mock_ai_context, pack_size=0)
@@ -0,0 +1,215 @@
+import io
+import json
+import pytest
+from unittest.mock import patch
+
+from fml.ai_service import AIService, AIServiceError
+from fml.batch import read_batch_items, run_batch
+from fml.schemas import AICommandResponse, AIContext, SystemInfo
+
+
+class EchoAIService(AIService):
+    """A concrete AIService that echoes queries and fails on demand."""
+
+    def _generate_command_internal(
+        self, query: str, ai_context: AIContext
+    ) -> AICommandResponse:
+        if "fail" in query:
+            raise AIServiceError("API Error: boom (Code: 500)")
+        return AICommandResponse(
+            explanation=f"{self.model} answer.", flags=[], command=f"echo {query}"
+        )
+
+
+@pytest.fixture
+def ai_context():
+    """Provides an AIContext with fixed system information."""
+    return AIContext(
+        system_info=SystemInfo(
+            os_name="Linux", shell="bash", cwd="/", architecture="x86_64"
+        )
+    )
+
+
+def test_read_batch_items_supports_plain_and_json_lines():
+    lines = [
+        "list files\n",
+        "\n",
+        "# a comment\n",
+        '{"query": "disk usage", "id": 7, "model": "m2", "refresh": true}\n',
+        '{"id": "missing-query"}\n',
+        "{not json\n",
+    ]
+
+    items = read_batch_items(lines)
+
+    assert [item.index for item in items] == [0, 1, 2, 3]
+    assert items[0].query == "list files" and items[0].error is None
+    assert (items[1].query, items[1].id, items[1].model, items[1].refresh) == (
+        "disk usage",
+        "7",
+        "m2",
+        True,
+    )
+    assert "missing 'query'" in items[2].error
+    assert items[3].error.startswith("Invalid batch line")
+
+
+def test_run_batch_writes_results_in_order_without_aborting(ai_context):
+    items = read_batch_items(
+        ["list files", "please fail", '{"query": "pwd", "model": "other"}', "{bad"]
+    )
+    created = []
+
+    def factory(model):
+        service = EchoAIService("key", "prompt", model)
+        created.append(model)
+        return service
+
+    output = io.StringIO()
+    summary = run_batch(items, factory, ai_context, "default", output)
+
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [r["index"] for r in results] == [0, 1, 2, 3]
+    assert [r["ok"] for r in results] == [True, False, True, False]
+    assert results[0]["response"]["command"] == "echo list files"
+    assert results[1]["error"] == "API Error: boom (Code: 500)"
+    assert results[1]["error_category"] == "unexpected"
+    assert results[2]["model"] == "other"
+    assert all(r["latency_ms"] >= 0 for r in results)
+    assert created == ["default", "other"]  # one service per model
+    assert (summary.total, summary.succeeded, summary.failed) == (4, 2, 2)
+
+
+def test_run_batch_reports_service_initialization_errors(ai_context):
+    def factory(model):
+        raise ValueError(f"Unsupported model '{model}'.")
+
+    output = io.StringIO()
+    summary = run_batch(read_batch_items(["ls"]), factory, ai_context, "nope", output)
+
+    result = json.loads(output.getvalue())
+    assert result["ok"] is False
+    assert "Unsupported model 'nope'" in result["error"]
+    assert summary.failed == 1
+
+
+def test_run_batch_reports_invalid_items_without_aborting(ai_context):
+    """Non-string queries or models fail on their own line instead of the whole batch."""
+    from fml.batch import BatchItem
+
+    items = read_batch_items(['{"query": "ls", "model": 5}', "pwd"]) + [
+        BatchItem(index=2, query=None),
+        BatchItem(index=3, query="whoami", model={"name": "m"}),
+    ]
+    assert "'model' must be a string" in items[0].error
+
+    for pack_size in (1, 4):
+        output = io.StringIO()
+        summary = run_batch(
+            items,
+            lambda model: EchoAIService("key", "prompt", model),
+            ai_context,
+            "default",
+            output,
+            pack_size=pack_size,
+        )
+
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert [r["ok"] for r in results] == [False, True, False, False]
+        assert "'query' must be a non-empty string" in results[2]["error"]
+        assert "'model' must be a string" in results[3]["error"]
+        assert (summary.succeeded, summary.failed) == (1, 3)
+
+
+def test_main_batch_reads_stdin(monkeypatch, capsys, ai_context):
+    from fml.__main__ import main
+
+    monkeypatch.setattr("sys.argv", ["fml", "--batch", "-"])
+    monkeypatch.setattr("sys.stdin", io.StringIO("list files\nshow date\n"))
+    with patch(
+        "fml.__main__._initialize_ai_service",
+        side_effect=lambda model: EchoAIService("key", "prompt", model),
+    ) as mock_init, patch(
+        "fml.__main__.get_system_info", return_value=ai_context.system_info
+    ):
+        main()
+
+    captured = capsys.readouterr()
+    results = [json.loads(line) for line in captured.out.splitlines()]
+    assert [r["response"]["command"] for r in results] == ["echo list files", "echo show date"]
+    assert "Batch finished: 2/2 succeeded" in captured.err
+    mock_init.assert_called_once()
+
+
+def test_main_batch_exits_nonzero_when_a_query_fails(monkeypatch, tmp_path, ai_context):
+    from fml.__main__ import main
+
+    batch_file = tmp_path / "queries.txt"
+    batch_file.write_text("list files\nplease fail\n")
+    monkeypatch.setattr("sys.argv", ["fml", "--batch", str(batch_file)])
+    with patch(
+        "fml.__main__._initialize_ai_service",
+        side_effect=lambda model: EchoAIService("key", "prompt", model),
+    ), patch("fml.__main__.get_system_info", return_value=ai_context.system_info):
+        with pytest.raises(SystemExit) as excinfo:
+            main()
+    assert excinfo.value.code == 1
+
+
+def test_run_batch_concurrent_output_stays_in_input_order(ai_context):
+    import time
+
+    class SlowFirstAIService(EchoAIService):
+        def _generate_command_internal(self, query, ai_context):
+            if query == "slow":
+                time.sleep(0.2)
+            return super()._generate_command_internal(query, ai_context)
+
+    output = io.StringIO()
+    run_batch(
+        read_batch_items(["slow", "fast 1", "fast 2"]),
+        lambda model: SlowFirstAIService("key", "prompt", model),
+        ai_context,
+        "default",
+        output,
+        max_concurrency=3,
+    )
+
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [r["query"] for r in results] == ["slow", "fast 1", "fast 2"]
+
+
+def test_run_batch_packs_queries_per_model_in_input_order(ai_context):
+    """--pack groups queries by model and still writes results in input order."""
+    packs = []
+
+    class PackingEchoAIService(EchoAIService):
+        supports_packing = True
+
+        def _generate_packed_internal(self, queries, ai_context):
+            packs.append((self.model, list(queries)))
+            return [
+                AICommandResponse(explanation="packed", flags=[], command=f"echo {query}")
+                for query in queries
+            ]
+
+    output = io.StringIO()
+    summary = run_batch(
+        read_batch_items(
+            ["a", '{"query": "b", "model": "other"}', "c", "d", "{bad", "e"]
+        ),
+        lambda model: PackingEchoAIService("key", "prompt", model),
+        ai_context,
+        "default",
+        output,
+        max_concurrency=2,
+        pack_size=2,
+    )
+
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [r["index"] for r in results] == [0, 1, 2, 3, 4, 5]
+    assert sorted(packs) == [("default", ["a", "c"]), ("default", ["d", "e"])]
+    assert [r.get("packed") for r in results] == [2, None, 2, 2, None, 2]
+    assert results[1]["response"]["explanation"] == "other answer."
+    assert (summary.succeeded, summary.failed) == (5, 1)
@@ -103,7 +103,7 @@ def test_main_with_query_and_default_model(
     mock_sys_exit.assert_not_called()  # Should not exit on valid query
     mock_initialize_ai_service.assert_called_once_with("gemini-2.5-flash-preview-05-20")
     mock_initialize_ai_service.return_value.generate_command.assert_called_once_with(
-        "how do I list files?", mock_ai_context
+        "how do I list files?", mock_ai_context, refresh=False
     )
     mock_output_formatter.return_value.format_response.assert_called_once()
     captured = capsys.readouterr()
@@ -129,7 +129,7 @@ def test_main_with_query_and_specified_model(
     mock_sys_exit.assert_not_called()
     mock_initialize_ai_service.assert_called_once_with("gemini-1.0-pro")
     mock_initialize_ai_service.return_value.generate_command.assert_called_once_with(
-        "show docker images", mock_ai_context
+        "show docker images", mock_ai_context, refresh=False
     )
     mock_output_formatter.return_value.format_response.assert_called_once()
     captured = capsys.readouterr()
@@ -155,7 +155,7 @@ def test_main_with_multi_word_query(
     mock_sys_exit.assert_not_called()
     mock_initialize_ai_service.assert_called_once_with("gemini-2.5-flash-preview-05-20")
     mock_initialize_ai_service.return_value.generate_command.assert_called_once_with(
-        "git commit -m initial commit", mock_ai_context
+        "git commit -m initial commit", mock_ai_context, refresh=False
     )
     captured = capsys.readouterr()
     assert "Formatted Output" in captured.out
@@ -193,3 +193,341 @@ def test_main_handles_ai_service_value_error(
     assert excinfo.value.code == 1
     captured = capsys.readouterr()
     assert "Error: Unsupported model 'unsupported-model'." in captured.err
+
+
+def test_main_attaches_response_cache_by_default(
+    mock_sys_argv,
+    mock_sys_exit,
+    mock_initialize_ai_service,
+    mock_output_formatter,
+    mock_ai_context,
+):
+    """
+    Test main() attaches the on-disk response cache unless --no-cache is given.
+    """
+    sys.argv = ["fml", "list files"]
+    with patch(
+        "fml.__main__.get_system_info", return_value=mock_ai_context.system_info
+    ), patch("fml.__main__._create_response_cache") as mock_create_cache:
+        main()
+    assert (
+        mock_initialize_ai_service.return_value.cache
+        is mock_create_cache.return_value
+    )
+
+
+def test_main_no_cache_flag_skips_response_cache(
+    mock_sys_argv,
+    mock_sys_exit,
+    mock_initialize_ai_service,
+    mock_output_formatter,
+    mock_ai_context,
+):
+    """
+    Test main() with --no-cache does not create a response cache.
+    """
+    sys.argv = ["fml", "--no-cache", "list files"]
+    with patch(
+        "fml.__main__.get_system_info", return_value=mock_ai_context.system_info
+    ), patch("fml.__main__._create_response_cache") as mock_create_cache:
+        main()
+    mock_create_cache.assert_not_called()
+
+
+def test_main_refresh_flag_is_passed_to_service(
+    mock_sys_argv,
+    mock_sys_exit,
+    mock_initialize_ai_service,
+    mock_output_formatter,
+    mock_ai_context,
+):
+    """
+    Test main() forwards --refresh to generate_command.
+    """
+    sys.argv = ["fml", "--refresh", "list files"]
+    with patch(
+        "fml.__main__.get_system_info", return_value=mock_ai_context.system_info
+    ), patch("fml.__main__._create_response_cache"):
+        main()
+    mock_initialize_ai_service.return_value.generate_command.assert_called_once_with(
+        "list files", mock_ai_context, refresh=True
+    )
+
+
+def test_main_stream_flag_renders_incrementally(
+    mock_sys_argv, mock_sys_exit, mock_initialize_ai_service, mock_ai_context, capsys
+):
+    """
+    Test main() with --stream passes a partial callback and renders via StreamingRenderer.
+    """
+    from fml.schemas import AICommandResponse
+
+    sys.argv = ["fml", "--stream", "--no-color", "list files"]
+    service = mock_initialize_ai_service.return_value
+
+    def fake_generate(query, ai_context, refresh, on_partial):
+        on_partial({"explanation": "Lists"})
+        return AICommandResponse(explanation="Lists files.", flags=[], command="ls")
+
+    service.generate_command.side_effect = fake_generate
+    with patch(
+        "fml.__main__.get_system_info", return_value=mock_ai_context.system_info
+    ), patch("pyperclip.copy"):
+        main()
+    captured = capsys.readouterr()
+    assert captured.out.startswith("Lists files.\n\nls\n")
+
+
+def test_main_answers_from_local_index_without_model(
+    mock_sys_argv, mock_sys_exit, mock_initialize_ai_service, mock_ai_context, capsys, monkeypatch
+):
+    """
+    Test main() answers a common query from the local index without initializing a service.
+    """
+    monkeypatch.delenv("FML_LOCAL_INDEX")
+    sys.argv = ["fml", "--no-color", "show", "docker", "images"]
+    with patch(
+        "fml.__main__.get_system_info", return_value=mock_ai_context.system_info
+    ):
+        main()
+
+    from fml.clipboard import get_clipboard
+
+    mock_initialize_ai_service.assert_not_called()
+    assert get_clipboard().copies == ["docker images"]
+    assert "docker images" in capsys.readouterr().out
+
+
+def test_main_offline_without_match_exits_with_error(
+    mock_sys_argv, mock_sys_exit, mock_initialize_ai_service, mock_ai_context, capsys
+):
+    """
+    Test main() with --offline never initializes a service and errors when the index has no answer.
+    """
+    sys.argv = ["fml", "--offline", "write", "a", "haiku"]
+    with patch(
+        "fml.__main__.get_system_info", return_value=mock_ai_context.system_info
+    ):
+        with pytest.raises(SystemExit) as excinfo:
+            main()
+
+    assert excinfo.value.code == 1
+    mock_initialize_ai_service.assert_not_called()
+    assert "No offline answer" in capsys.readouterr().err
+
+
+def test_main_offline_declines_match_with_other_numbers(
+    mock_sys_argv, mock_sys_exit, mock_initialize_ai_service, mock_ai_context, capsys
+):
+    """
+    Test main() with --offline does not answer "older than 7 days" with the 30-day command.
+    """
+    sys.argv = ["fml", "--offline", "delete", "files", "older", "than", "7", "days"]
+    with patch(
+        "fml.__main__.get_system_info", return_value=mock_ai_context.system_info
+    ):
+        with pytest.raises(SystemExit) as excinfo:
+            main()
+
+    assert excinfo.value.code == 1
+    assert "No offline answer" in capsys.readouterr().err
+
+
+def test_main_no_local_index_flag_asks_model(
+    mock_sys_argv, mock_sys_exit, mock_initialize_ai_service, mock_ai_context, monkeypatch
+):
+    """
+    Test main() with --no-local-index sends even common queries to the model.
+    """
+    monkeypatch.delenv("FML_LOCAL_INDEX")
+    sys.argv = ["fml", "--no-local-index", "--no-daemon", "show", "docker", "images"]
+    with patch(
+        "fml.__main__.get_system_info", return_value=mock_ai_context.system_info
+    ), patch("pyperclip.copy"):
+        main()
+
+    mock_initialize_ai_service.return_value.generate_command.assert_called_once()
+
+
+def test_main_context_flag_adds_collected_context(
+    mock_sys_argv, mock_sys_exit, mock_initialize_ai_service, mock_ai_context, tmp_path, monkeypatch
+):
+    """
+    Test main() with --context files sends the working directory listing to the service.
+    """
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "Makefile").write_text("")
+    sys.argv = ["fml", "--context", "files", "--no-daemon", "build", "the", "project"]
+    with patch(
+        "fml.__main__.get_system_info", return_value=mock_ai_context.system_info
+    ), patch("pyperclip.copy"):
+        main()
+
+    ai_context = mock_initialize_ai_service.return_value.generate_command.call_args[0][1]
+    assert ai_context.system_info == mock_ai_context.system_info
+    assert ai_context.file_context.entries == ["Makefile"]
+    assert ai_context.git_context is None
+
+
+def test_main_rejects_unknown_context(mock_sys_argv, mock_sys_exit, capsys):
+    """
+    Test main() reports an argument error for an unknown --context name.
+    """
+    sys.argv = ["fml", "--context", "git,bogus", "query"]
+    with pytest.raises(SystemExit) as excinfo:
+        main()
+    assert excinfo.value.code == 2
+    assert "unknown context 'bogus'" in capsys.readouterr().err
+
+
+def test_main_profile_prints_breakdown_and_writes_trace(
+    mock_sys_argv, mock_sys_exit, mock_initialize_ai_service, mock_ai_context, tmp_path, capsys
+):
+    """
+    Test main() with --profile prints phase timings and --trace-file writes Chrome trace events.
+    """
+    trace_path = tmp_path / "trace.json"
+    sys.argv = ["fml", "--no-daemon", "--profile", "--trace-file", str(trace_path), "list files"]
+    with patch(
+        "fml.__main__.get_system_info", return_value=mock_ai_context.system_info
+    ), patch("pyperclip.copy"):
+        main()
+
+    err = capsys.readouterr().err
+    assert "Profile (" in err
+    for phase in ("import fml.__main__", "main", "system_info", "format_response", "clipboard"):
+        assert phase in err
+
+    import json
+
+    names = {event["name"] for event in json.loads(trace_path.read_text())["traceEvents"]}
+    assert {"main", "system_info", "clipboard"} <= names
+
+
+def test_main_usage_flag_prints_token_counts(
+    mock_sys_argv, mock_sys_exit, mock_initialize_ai_service, mock_output_formatter, mock_ai_context, capsys
+):
+    """
+    Test main() with --usage reports the tokens of the model request and applies --context-encoding.
+    """
+    from fml.ai_service import TokenUsage
+
+    service = mock_initialize_ai_service.return_value
+    service.last_usage = TokenUsage(prompt_tokens=120, cached_tokens=0, output_tokens=40, total_tokens=160)
+    sys.argv = ["fml", "--usage", "--context-encoding", "kv", "--no-daemon", "list", "files"]
+    with patch(
+        "fml.__main__.get_system_info", return_value=mock_ai_context.system_info
+    ), patch("pyperclip.copy"):
+        main()
+
+    assert service.context_encoding == "kv"
+    assert "Tokens: 120 input (0 cached), 40 output, 160 total" in capsys.readouterr().err
+
+
+def test_main_rejects_hedge_with_stream(mock_sys_argv, mock_sys_exit, capsys):
+    """
+    Test that --hedge and --stream cannot be combined.
+    """
+    sys.argv = ["fml", "--hedge", "gemini-2.0-flash", "--stream", "list", "files"]
+    with pytest.raises(SystemExit):
+        main()
+    assert "--hedge cannot be combined with --stream" in capsys.readouterr().err
+
+
+def test_main_model_auto_routes_to_recorded_model(
+    mock_sys_argv, mock_sys_exit, mock_initialize_ai_service, mock_output_formatter, mock_ai_context
+):
+    """
+    Test that --model auto uses the model chosen from the recorded statistics.
+    """
+    sys.argv = ["fml", "-m", "auto", "--no-daemon", "list", "files"]
+    with patch(
+        "fml.__main__.get_system_info", return_value=mock_ai_context.system_info
+    ), patch("fml.routing.choose_model", return_value="gemini-2.0-flash") as mock_choose, patch(
+        "pyperclip.copy"
+    ):
+        main()
+
+    assert mock_choose.call_args[0][1] == list(MODELS)
+    mock_initialize_ai_service.assert_called_once_with("gemini-2.0-flash")
+
+
+def test_main_records_answers_and_history_finds_them(
+    mock_sys_argv, mock_sys_exit, mock_initialize_ai_service, mock_output_formatter,
+    mock_ai_context, monkeypatch, capsys
+):
+    """
+    Test that answers are recorded in the history and `--history` finds them without the model.
+    """
+    from fml.schemas import AICommandResponse
+
+    monkeypatch.delenv("FML_HISTORY")
+    service = mock_initialize_ai_service.return_value
+    service.generate_command.return_value = AICommandResponse(
+        explanation="Lists all containers.", flags=[], command="docker ps -a")
+    service.last_usage = None
+    sys.argv = ["fml", "--no-daemon", "show", "all", "containers"]
+    with patch("fml.__main__.get_system_info", return_value=mock_ai_context.system_info):
+        main()
+    capsys.readouterr()
+    mock_initialize_ai_service.reset_mock()
+
+    sys.argv = ["fml", "--history", "docker"]
+    main()
+
+    output = capsys.readouterr().out
+    assert output.splitlines()[0] == "docker ps -a"
+    assert "show all containers" in output
+    mock_initialize_ai_service.assert_not_called()
+
+
+def test_main_records_where_the_answer_came_from(
+    mock_sys_argv, mock_sys_exit, mock_initialize_ai_service, mock_output_formatter,
+    mock_ai_context, monkeypatch, capsys
+):
+    """
+    Test that the history source follows the path that answered, even for providers without usage.
+    """
+    from fml.__main__ import _create_history_store
+    from fml.ai_service import AIService
+    from fml.schemas import AICommandResponse
+
+    class UsagelessAIService(AIService):
+        def _generate_command_internal(self, query, ai_context):
+            return AICommandResponse(explanation="Lists files.", flags=[], command="ls")
+
+    monkeypatch.delenv("FML_HISTORY")
+    mock_initialize_ai_service.side_effect = lambda model: UsagelessAIService("key", "prompt", model)
+    sys.argv = ["fml", "--no-daemon", "list", "files"]
+    with patch("fml.__main__.get_system_info", return_value=mock_ai_context.system_info), \
+            patch("pyperclip.copy"):
+        main()
+        main()
+    capsys.readouterr()
+
+    connection = _create_history_store()._connect()
+    sources = [row[0] for row in connection.execute("SELECT source FROM history ORDER BY id")]
+    assert sources == ["model", "cache"]
+
+
+def test_main_no_history_flag_skips_recording(
+    mock_sys_argv, mock_sys_exit, mock_initialize_ai_service, mock_output_formatter,
+    mock_ai_context, monkeypatch, capsys
+):
+    """
+    Test that --no-history keeps the answer out of the history.
+    """
+    from fml.schemas import AICommandResponse
+
+    monkeypatch.delenv("FML_HISTORY")
+    mock_initialize_ai_service.return_value.generate_command.return_value = AICommandResponse(
+        explanation="Lists files.", flags=[], command="ls")
+    sys.argv = ["fml", "--no-daemon", "--no-history", "list", "files"]
+    with patch("fml.__main__.get_system_info", return_value=mock_ai_context.system_info):
+        main()
+    capsys.readouterr()
+
+    sys.argv = ["fml", "--history"]
+    main()
+
+    assert capsys.readouterr().out.strip() == "No matching commands in the history."
@@ -1,7 +1,20 @@
+import base64
+import time
+
 import pytest
 import pyperclip
 from unittest.mock import MagicMock, patch
 from fml.__main__ import main
+from fml.clipboard import (
+    ClipboardError,
+    CommandBackend,
+    FakeBackend,
+    OSC52Backend,
+    PyperclipBackend,
+    _helpers,
+    detect_backend,
+    get_clipboard,
+)
 from fml.schemas import AICommandResponse
 
 
@@ -25,16 +38,13 @@ def test_clipboard_copy_success(mock_ai_service_success, monkeypatch, capsys):
     """
     Tests that the command is copied to the clipboard and a confirmation message is displayed.
     """
-    mock_pyperclip_copy = MagicMock()
-    monkeypatch.setattr("pyperclip.copy", mock_pyperclip_copy)
-
     # Simulate command-line arguments
     monkeypatch.setattr("sys.argv", ["fml", "test query"])
 
     main()
 
-    # Verify pyperclip.copy was called with the correct command
-    mock_pyperclip_copy.assert_called_once_with("test command --test")
+    # Verify the fake backend received the command
+    assert get_clipboard().copies == ["test command --test"]
 
     # Verify the confirmation message is printed
     captured = capsys.readouterr()
@@ -47,9 +57,9 @@ def test_clipboard_copy_failure(mock_ai_service_success, monkeypatch, capsys):
     """
 
     def mock_copy_fail(text):
-        raise pyperclip.PyperclipException("Clipboard not available")
+        raise ClipboardError("Clipboard not available")
 
-    monkeypatch.setattr("pyperclip.copy", mock_copy_fail)
+    monkeypatch.setattr(get_clipboard(), "copy", mock_copy_fail)
 
     # Simulate command-line arguments
     monkeypatch.setattr("sys.argv", ["fml", "test query"])
@@ -61,3 +71,142 @@ def test_clipboard_copy_failure(mock_ai_service_success, monkeypatch, capsys):
     assert (
         "Warning: Could not copy to clipboard: Clipboard not available" in captured.err
     )
+
+
+def test_clipboard_backend_is_detected_once(monkeypatch):
+    """
+    Tests that get_clipboard caches the detected backend for the process.
+    """
+    backend = get_clipboard()
+    monkeypatch.setenv("FML_CLIPBOARD", "osc52")
+
+    assert get_clipboard() is backend
+    assert isinstance(backend, FakeBackend)
+
+
+@pytest.mark.parametrize(
+    "platform, environ, tools, expected",
+    [
+        ("darwin", {}, {"pbcopy"}, ["pbcopy"]),
+        ("linux", {"WAYLAND_DISPLAY": "wayland-0"}, {"wl-copy", "xclip"}, ["wl-copy"]),
+        ("linux", {"DISPLAY": ":0"}, {"xclip", "xsel"}, ["xclip", "-selection", "clipboard"]),
+        ("linux", {"DISPLAY": ":0"}, {"xsel"}, ["xsel", "--clipboard", "--input"]),
+    ],
+)
+def test_detect_backend_prefers_detached_helpers(platform, environ, tools, expected):
+    """
+    Tests that native clipboard helpers are driven as detached processes.
+    """
+    backend = detect_backend(environ, platform, lambda name: name if name in tools else None)
+
+    assert isinstance(backend, CommandBackend)
+    assert backend.command == expected
+
+
+def test_detect_backend_uses_osc52_without_display():
+    """
+    Tests that headless and SSH sessions fall back to the terminal's OSC 52 support.
+    """
+    assert isinstance(detect_backend({}, "linux", lambda name: None), OSC52Backend)
+    ssh = detect_backend({"SSH_TTY": "/dev/pts/1", "DISPLAY": ":0"}, "linux", lambda name: None)
+    assert isinstance(ssh, OSC52Backend)
+
+
+def test_detect_backend_falls_back_to_pyperclip_and_honours_override():
+    """
+    Tests the pyperclip fallback (e.g. Windows) and the FML_CLIPBOARD override.
+    """
+    assert isinstance(detect_backend({}, "win32", lambda name: None), PyperclipBackend)
+    forced = detect_backend({"FML_CLIPBOARD": "pyperclip", "DISPLAY": ":0"}, "linux", lambda name: name)
+    assert isinstance(forced, PyperclipBackend)
+
+
+def test_osc52_backend_writes_escape_sequence(tmp_path, monkeypatch):
+    """
+    Tests that the OSC 52 sequence carries the base64 text, wrapped for tmux when needed.
+    """
+    monkeypatch.setattr("sys.stdout.isatty", lambda: True)
+    tty = tmp_path / "tty"
+    OSC52Backend(str(tty), tmux=False).copy("ls -la")
+
+    assert tty.read_text() == "\033]52;c;" + base64.b64encode(b"ls -la").decode() + "\a"
+    wrapped = OSC52Backend(str(tty), tmux=True).sequence("ls")
+    assert wrapped.startswith("\033Ptmux;\033\033]52;c;") and wrapped.endswith("\033\\")
+
+
+def test_osc52_backend_without_terminal_raises(tmp_path, monkeypatch):
+    """
+    Tests that a missing terminal is reported as a ClipboardError.
+    """
+    monkeypatch.setattr("sys.stdout.isatty", lambda: True)
+    with pytest.raises(ClipboardError, match="No terminal"):
+        OSC52Backend(str(tmp_path / "missing" / "tty")).copy("ls")
+
+
+def test_osc52_backend_refuses_when_stdout_is_not_a_terminal(tmp_path, monkeypatch):
+    """
+    Tests that piped output is reported as a ClipboardError instead of a copy.
+    """
+    monkeypatch.setattr("sys.stdout.isatty", lambda: False)
+    tty = tmp_path / "tty"
+    with pytest.raises(ClipboardError, match="not a terminal"):
+        OSC52Backend(str(tty)).copy("ls")
+    assert not tty.exists()
+
+
+def test_osc52_copy_is_reported_as_sent(mock_ai_service_success, monkeypatch, capsys):
+    """
+    Tests that an OSC 52 copy is not claimed as confirmed, since terminals never acknowledge it.
+    """
+    monkeypatch.setenv("FML_CLIPBOARD", "osc52")
+    monkeypatch.setattr("fml.clipboard.OSC52Backend.copy", lambda self, text: None)
+    monkeypatch.setattr("sys.argv", ["fml", "test query"])
+
+    main()
+
+    out = capsys.readouterr().out
+    assert "(command sent to the terminal clipboard)" in out
+    assert "copied" not in out
+
+
+def test_command_backend_does_not_wait_for_helper(tmp_path):
+    """
+    Tests that the helper receives the text while copy() returns before it exits.
+    """
+    output = tmp_path / "clipboard.txt"
+    backend = CommandBackend(["sh", "-c", f"cat > {output}; sleep 2"])
+
+    start = time.perf_counter()
+    backend.copy("git status")
+    assert time.perf_counter() - start < 1
+
+    helper = _helpers[-1]
+    deadline = time.monotonic() + 5
+    while not (output.exists() and output.read_text() == "git status"):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert output.read_text() == "git status"
+    helper.kill()
+    helper.wait()
+
+
+def test_command_backend_reports_missing_helper():
+    """
+    Tests that a helper that cannot be started raises ClipboardError.
+    """
+    with pytest.raises(ClipboardError, match="Could not start"):
+        CommandBackend(["fml-no-such-clipboard-helper"]).copy("ls")
+
+
+def test_pyperclip_backend_maps_errors(monkeypatch):
+    """
+    Tests that pyperclip failures surface as ClipboardError.
+    """
+
+    def mock_copy_fail(text):
+        raise pyperclip.PyperclipException("Clipboard not available")
+
+    monkeypatch.setattr("pyperclip.copy", mock_copy_fail)
+
+    with pytest.raises(ClipboardError, match="Clipboard not available"):
+        PyperclipBackend().copy("ls")
@@ -0,0 +1,190 @@
+import shutil
+import subprocess
+import threading
+
+import pytest
+
+from fml.context_collectors import (
+    ContextCollection,
+    ContextCollector,
+    FileContextCollector,
+    GitContextCollector,
+    SystemInfoCollector,
+    parse_git_status,
+)
+from fml.schemas import SystemInfo
+
+
+class StubCollector(ContextCollector):
+    """A collector that returns a fixed value, optionally after blocking on an event."""
+
+    def __init__(self, name, field, value, cost=0.0, release=None, error=None):
+        self.name = name
+        self.field = field
+        self.cost = cost
+        self.value = value
+        self.release = release
+        self.error = error
+
+    def collect(self, timeout):
+        if self.release is not None:
+            self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+@pytest.fixture
+def system_info():
+    """Provides fixed system information."""
+    return SystemInfo(
+        os_name="Linux",
+        shell="bash",
+        cwd="/home/user",
+        architecture="x86_64",
+        python_version="3.12.0",
+    )
+
+
+def test_parse_git_status_reads_branch_and_changes():
+    """
+    Test that branch, upstream, ahead/behind counts and changed paths are parsed.
+    """
+    output = "\n".join(
+        [
+            "# branch.oid 1234567890abcdef",
+            "# branch.head feature",
+            "# branch.upstream origin/feature",
+            "# branch.ab +2 -1",
+            "1 .M N... 100644 100644 100644 abc abc src/app.py",
+            "2 R. N... 100644 100644 100644 abc abc R100 new name.py\told.py",
+            "? notes.txt",
+        ]
+    )
+
+    fields = parse_git_status(output)
+
+    assert fields["branch"] == "feature"
+    assert fields["upstream"] == "origin/feature"
+    assert (fields["ahead"], fields["behind"]) == (2, 1)
+    assert fields["changed_files"] == ["src/app.py", "new name.py", "notes.txt"]
+
+
+def test_parse_git_status_detached_head():
+    """
+    Test that a detached HEAD is reported without a branch name.
+    """
+    assert parse_git_status("# branch.head (detached)\n")["branch"] is None
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+def test_git_collector_reports_repository_state(tmp_path, monkeypatch):
+    """
+    Test the git collector inside a fresh repository and outside any repository.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("GIT_CEILING_DIRECTORIES", str(tmp_path.parent))
+    assert GitContextCollector().collect(timeout=5) is None
+
+    subprocess.run(["git", "init", "-q", "-b", "main"], check=True)
+    (tmp_path / "README.md").write_text("hello")
+
+    git_context = GitContextCollector().collect(timeout=5)
+
+    assert git_context.branch == "main"
+    assert git_context.changed_files == ["README.md"]
+
+
+def test_file_collector_lists_and_truncates(tmp_path, monkeypatch):
+    """
+    Test that the file collector marks directories and truncates long listings.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("fml.context_collectors.MAX_FILE_ENTRIES", 3)
+    (tmp_path / "src").mkdir()
+    (tmp_path / "a.txt").write_text("")
+
+    file_context = FileContextCollector().collect(timeout=1)
+    assert file_context.entries == ["a.txt", "src/"]
+    assert not file_context.truncated
+
+    (tmp_path / "b.txt").write_text("")
+    (tmp_path / "c.txt").write_text("")
+    assert FileContextCollector().collect(timeout=1).truncated
+
+
+def test_collection_fills_fields_and_records_timings(system_info):
+    """
+    Test that collectors finishing within the budget fill their AIContext fields.
+    """
+    collection = ContextCollection(
+        [
+            SystemInfoCollector(lambda: system_info),
+            StubCollector("files", "file_context", {"entries": ["a.txt"]}),
+        ],
+        budget_seconds=5,
+    ).start()
+
+    ai_context = collection.context()
+
+    assert ai_context.system_info == system_info
+    assert ai_context.file_context.entries == ["a.txt"]
+    assert set(collection.timings) == {"system_info", "files"}
+    assert collection.dropped == [] and collection.failed == []
+
+
+def test_collection_drops_slow_and_failing_collectors(system_info):
+    """
+    Test that a collector still running at the deadline is dropped and a failing one is skipped.
+    """
+    release = threading.Event()
+    collection = ContextCollection(
+        [
+            SystemInfoCollector(lambda: system_info),
+            StubCollector("git", "git_context", {"branch": "main"}, release=release),
+            StubCollector("files", "file_context", None, error=OSError("denied")),
+        ],
+        budget_seconds=0.05,
+    ).start()
+
+    try:
+        ai_context = collection.context()
+    finally:
+        release.set()
+
+    assert ai_context.system_info == system_info
+    assert ai_context.git_context is None
+    assert ai_context.file_context is None
+    assert collection.dropped == ["git"]
+    assert collection.failed == ["files"]
+
+
+def test_collection_skips_collectors_costlier_than_budget(system_info):
+    """
+    Test that collectors declaring a cost above the budget are never started.
+    """
+    expensive = StubCollector("git", "git_context", {"branch": "main"}, cost=1.0)
+    collection = ContextCollection(
+        [SystemInfoCollector(lambda: system_info), expensive], budget_seconds=0.1
+    ).start()
+
+    assert collection.context().git_context is None
+    assert collection.dropped == ["git"]
+    assert "git" not in collection.timings
+
+
+def test_collection_waits_for_required_collectors_beyond_budget(system_info):
+    """
+    Test that required collectors are waited for even after the budget is used up.
+    """
+    release = threading.Event()
+
+    def slow_gather():
+        release.wait(5)
+        return system_info
+
+    collection = ContextCollection([SystemInfoCollector(slow_gather)], budget_seconds=0.01).start()
+    threading.Timer(0.05, release.set).start()
+
+    assert collection.wait_for("system_info") == system_info
+    assert collection.context().system_info == system_info
@@ -0,0 +1,92 @@
+import json
+
+import pytest
+
+from fml.context_encoding import (
+    CONTEXT_ENCODING_COMPACT,
+    CONTEXT_ENCODING_KV,
+    CONTEXT_ENCODING_PRETTY,
+    encode_context,
+    encode_section,
+)
+from fml.schemas import AIContext, FileContext, GitContext, SystemInfo
+
+
+@pytest.fixture
+def ai_context():
+    """Provides an AIContext with every field filled."""
+    return AIContext(
+        system_info=SystemInfo(
+            os_name="Linux",
+            shell="bash",
+            cwd="/home/user/my project",
+            architecture="x86_64",
+            python_version="3.12.0",
+        ),
+        git_context=GitContext(branch="main", changed_files=["app.py", "README.md"]),
+        file_context=FileContext(entries=["app.py", "src/"]),
+    )
+
+
+def test_pretty_encoding_is_fenced_indented_json(ai_context):
+    """The default encoding keeps the original pretty-printed JSON sections."""
+    sections = encode_context(ai_context)
+
+    assert sections[0] == (
+        "\n\nUser's System Information:\n```json\n"
+        + ai_context.system_info.model_dump_json(indent=2)
+        + "\n```"
+    )
+    assert sections[1].startswith("\n\nUser's Git Repository:\n```json\n")
+    assert '"upstream": null' in sections[1]
+    assert sections[2].startswith("\n\nFiles in User's Current Directory:")
+
+
+def test_compact_encoding_is_minified_without_nulls(ai_context):
+    """Compact sections hold minified JSON without null or empty fields."""
+    sections = encode_context(ai_context, CONTEXT_ENCODING_COMPACT)
+
+    title, body = sections[1].split(": ", 1)
+    assert title == "\n\nUser's Git Repository"
+    assert json.loads(body) == {
+        "branch": "main",
+        "ahead": 0,
+        "behind": 0,
+        "changed_files": ["app.py", "README.md"],
+    }
+    assert " " not in body
+    pretty = encode_context(ai_context, CONTEXT_ENCODING_PRETTY)
+    assert sum(map(len, sections)) < sum(map(len, pretty))
+
+
+def test_kv_encoding_quotes_ambiguous_values(ai_context):
+    """Key=value sections join lists with commas and quote values with spaces."""
+    sections = encode_context(ai_context, CONTEXT_ENCODING_KV)
+
+    assert sections[0] == (
+        "\n\nUser's System Information: os_name=Linux shell=bash "
+        'cwd="/home/user/my project" architecture=x86_64 python_version=3.12.0'
+    )
+    assert sections[1] == (
+        "\n\nUser's Git Repository: branch=main ahead=0 behind=0 "
+        "changed_files=app.py,README.md"
+    )
+    assert sections[2].endswith("entries=app.py,src/ truncated=false")
+
+
+def test_encode_context_skips_missing_fields():
+    """Only filled AIContext fields produce sections."""
+    assert encode_context(AIContext(), CONTEXT_ENCODING_COMPACT) == []
+
+
+def test_encode_context_rejects_unknown_encoding(ai_context):
+    """An unknown encoding name raises ValueError."""
+    with pytest.raises(ValueError, match="Unknown context encoding 'yaml'"):
+        encode_context(ai_context, "yaml")
+
+
+def test_encode_section_keeps_falsy_scalars():
+    """Zero counts are data, not missing values, and are kept."""
+    section = encode_section("Git", GitContext(ahead=0, behind=0), CONTEXT_ENCODING_KV)
+
+    assert section == "\n\nGit: ahead=0 behind=0"
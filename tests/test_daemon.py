@@ -0,0 +1,280 @@
+import os
+import socket
+import threading
+import time
+import pytest
+from unittest.mock import patch
+
+from fml.ai_service import AIService, AIServiceError
+from fml.daemon import (
+    DaemonUnavailable,
+    FmlDaemon,
+    daemon_supported,
+    request_via_daemon,
+)
+from fml.response_cache import ResponseCache
+from fml.schemas import AICommandResponse, AIContext, SystemInfo
+
+pytestmark = pytest.mark.skipif(
+    not daemon_supported(), reason="Unix domain sockets are not available"
+)
+
+
+class RecordingAIService(AIService):
+    """A concrete AIService that records the queries it receives."""
+
+    def __init__(self, api_key: str, system_instruction_content: str, model: str):
+        super().__init__(api_key, system_instruction_content, model)
+        self.queries = []
+
+    def _generate_command_internal(
+        self, query: str, ai_context: AIContext
+    ) -> AICommandResponse:
+        if query == "fail":
+            raise AIServiceError("API Error: quota exhausted (Code: 429)")
+        self.queries.append((query, ai_context))
+        return AICommandResponse(
+            explanation=f"Answer from {self.model}.", flags=[], command=f"echo {query}"
+        )
+
+
+@pytest.fixture
+def system_info():
+    """Provides fixed client system information."""
+    return SystemInfo(
+        os_name="Linux",
+        shell="bash",
+        cwd="/home/user",
+        architecture="x86_64",
+        python_version="3.12.0",
+    )
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    """Provides a short socket path (AF_UNIX paths are length limited)."""
+    path = os.path.join("/tmp", f"fml-test-{os.getpid()}-{id(tmp_path)}.sock")
+    yield path
+    if os.path.exists(path):
+        os.unlink(path)
+
+
+@pytest.fixture
+def running_daemon(socket_path, tmp_path):
+    """Starts a daemon with a recording service factory in a background thread."""
+    created = []
+
+    def factory(model):
+        if model == "unknown":
+            raise ValueError(f"Unsupported model '{model}'.")
+        service = RecordingAIService("key", "prompt", model)
+        created.append(service)
+        return service
+
+    daemon = FmlDaemon(
+        service_factory=factory,
+        socket_path=socket_path,
+        idle_timeout=30,
+        cache=ResponseCache(str(tmp_path / "responses.json")),
+    )
+    thread = threading.Thread(target=daemon.serve, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while not os.path.exists(socket_path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield daemon, created
+    daemon.stop()
+    thread.join(timeout=5)
+
+
+def test_daemon_answers_queries_and_reuses_services(running_daemon, socket_path, system_info):
+    daemon, created = running_daemon
+
+    first = request_via_daemon("model-a", "ls", system_info, socket_path=socket_path)
+    second = request_via_daemon("model-a", "pwd", system_info, socket_path=socket_path)
+
+    assert first.command == "echo ls"
+    assert second.command == "echo pwd"
+    assert len(created) == 1
+    assert created[0].queries[0][1].system_info == system_info
+
+
+def test_daemon_serves_repeat_queries_from_shared_cache(
+    running_daemon, socket_path, system_info
+):
+    daemon, created = running_daemon
+
+    request_via_daemon("model-a", "ls", system_info, socket_path=socket_path)
+    request_via_daemon("model-a", "ls", system_info, socket_path=socket_path)
+    request_via_daemon("model-a", "ls", system_info, socket_path=socket_path, refresh=True)
+
+    assert len(created[0].queries) == 2
+
+
+def test_daemon_re_raises_service_errors(running_daemon, socket_path, system_info):
+    with pytest.raises(AIServiceError, match="quota exhausted"):
+        request_via_daemon("model-a", "fail", system_info, socket_path=socket_path)
+    with pytest.raises(ValueError, match="Unsupported model 'unknown'"):
+        request_via_daemon("unknown", "ls", system_info, socket_path=socket_path)
+
+
+def test_request_without_daemon_raises_unavailable(socket_path, system_info):
+    with pytest.raises(DaemonUnavailable):
+        request_via_daemon("model-a", "ls", system_info, socket_path=socket_path)
+
+
+def _serve_once(socket_path, handle):
+    """Accepts one connection on a bare socket and passes it to handle."""
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(1)
+
+    def accept():
+        connection, _ = listener.accept()
+        try:
+            handle(connection)
+        finally:
+            connection.close()
+            listener.close()
+
+    threading.Thread(target=accept, daemon=True).start()
+
+
+@pytest.mark.parametrize(
+    "handle",
+    [
+        # A daemon that shuts down while idling out, after accepting.
+        lambda connection: connection.recv(65536),
+        # A daemon that dies halfway through its reply.
+        lambda connection: (connection.recv(65536), connection.sendall(b'{"ok": tr')),
+    ],
+)
+def test_connection_failure_after_connecting_raises_unavailable(socket_path, system_info, handle):
+    _serve_once(socket_path, handle)
+
+    with pytest.raises(DaemonUnavailable):
+        request_via_daemon("model-a", "ls", system_info, socket_path=socket_path)
+
+
+def test_reply_timeout_raises_unavailable(socket_path, system_info, monkeypatch):
+    monkeypatch.setattr("fml.daemon.CLIENT_TIMEOUT_SECONDS", 0.1)
+    answered = threading.Event()
+    _serve_once(socket_path, lambda connection: answered.wait(5))
+
+    try:
+        with pytest.raises(DaemonUnavailable, match="timed out"):
+            request_via_daemon("model-a", "ls", system_info, socket_path=socket_path)
+    finally:
+        answered.set()
+
+
+def test_daemon_reports_socket_errors(tmp_path, monkeypatch, capsys):
+    """A socket that cannot be created is reported like other errors."""
+    from fml.__main__ import main
+
+    monkeypatch.setenv("FML_DAEMON_SOCKET", str(tmp_path / ("x" * 200) / "daemon.sock"))
+    monkeypatch.setattr("sys.argv", ["fml", "--daemon"])
+    with pytest.raises(SystemExit) as exc_info:
+        main()
+
+    assert exc_info.value.code == 1
+    assert capsys.readouterr().err.startswith("Error: Could not listen on ")
+
+
+def test_daemon_exits_after_idle_timeout(socket_path):
+    daemon = FmlDaemon(
+        service_factory=lambda model: None, socket_path=socket_path, idle_timeout=0.2
+    )
+    thread = threading.Thread(target=daemon.serve, daemon=True)
+    thread.start()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    assert not os.path.exists(socket_path)
+
+
+def test_daemon_closes_the_http_transport_on_shutdown(socket_path, monkeypatch):
+    from fml.http_transport import HttpTransport
+
+    transport = HttpTransport(http2=False)
+    monkeypatch.setattr("fml.http_transport._transport", transport)
+    async_client = transport.async_client()
+    daemon = FmlDaemon(
+        service_factory=lambda model: None, socket_path=socket_path, idle_timeout=0.2
+    )
+
+    daemon.serve()
+
+    assert async_client.is_closed
+
+
+def test_main_uses_daemon_when_available(monkeypatch, capsys, system_info):
+    """main() prints the daemon's answer without initializing a local service."""
+    from fml.__main__ import main
+
+    monkeypatch.setattr("sys.argv", ["fml", "--no-color", "list files"])
+    response = AICommandResponse(explanation="From daemon.", flags=[], command="ls")
+    with patch("fml.daemon.request_via_daemon", return_value=response) as mock_request, \
+            patch("fml.__main__._initialize_ai_service") as mock_init, \
+            patch("fml.__main__.get_system_info", return_value=system_info), \
+            patch("pyperclip.copy"):
+        main()
+
+    mock_init.assert_not_called()
+    mock_request.assert_called_once_with(
+        "gemini-2.5-flash-preview-05-20",
+        "list files",
+        system_info,
+        refresh=False,
+        use_cache=True,
+    )
+    assert "From daemon." in capsys.readouterr().out
+
+
+def test_main_falls_back_and_spawns_daemon_in_auto_mode(monkeypatch, system_info):
+    """Without a daemon, main() answers in-process and FML_DAEMON=auto spawns one."""
+    from fml.__main__ import main
+
+    monkeypatch.setattr("sys.argv", ["fml", "list files"])
+    monkeypatch.setenv("FML_DAEMON", "auto")
+    with patch("fml.daemon.spawn_daemon") as mock_spawn, \
+            patch("fml.__main__._initialize_ai_service") as mock_init, \
+            patch("fml.__main__.get_system_info", return_value=system_info), \
+            patch("pyperclip.copy"):
+        mock_init.return_value.generate_command.return_value = AICommandResponse(
+            explanation="Local.", flags=[], command="ls"
+        )
+        main()
+
+    mock_spawn.assert_called_once()
+    mock_init.assert_called_once()
+
+
+def test_main_no_daemon_flag_skips_client(monkeypatch, system_info):
+    from fml.__main__ import main
+
+    monkeypatch.setattr("sys.argv", ["fml", "--no-daemon", "list files"])
+    with patch("fml.daemon.request_via_daemon") as mock_request, \
+            patch("fml.__main__._initialize_ai_service") as mock_init, \
+            patch("fml.__main__.get_system_info", return_value=system_info), \
+            patch("pyperclip.copy"):
+        mock_init.return_value.generate_command.return_value = AICommandResponse(
+            explanation="Local.", flags=[], command="ls"
+        )
+        main()
+
+    mock_request.assert_not_called()
+
+
+def test_daemon_uses_forwarded_context(running_daemon, socket_path, system_info):
+    """A full AIContext sent by the client replaces the bare system information."""
+    from fml.schemas import GitContext
+
+    daemon, created = running_daemon
+    ai_context = AIContext(system_info=system_info, git_context=GitContext(branch="main"))
+
+    request_via_daemon(
+        "model-a", "ls", system_info, socket_path=socket_path, ai_context=ai_context
+    )
+
+    assert created[0].queries[0][1] == ai_context
@@ -0,0 +1,198 @@
+import asyncio
+
+import pytest
+
+from fml.ai_providers.gemini_service import GeminiService
+from fml.schemas import AICommandResponse, AIContext, SystemInfo
+from fml.testing.fake_gemini import FakeGeminiServer, make_response_payload
+
+
+@pytest.fixture
+def fake_server():
+    """Runs a fake Gemini API server for the duration of a test."""
+    with FakeGeminiServer(explanation_words=5, flag_count=1, stream_chunks=3) as server:
+        yield server
+
+
+@pytest.fixture
+def ai_context():
+    """Provides a fixed AIContext."""
+    return AIContext(
+        system_info=SystemInfo(
+            os_name="Linux",
+            shell="bash",
+            cwd="/home/user",
+            architecture="x86_64",
+            python_version="3.12.0",
+        )
+    )
+
+
+def test_make_response_payload_matches_schema():
+    """The fake payload validates as an AICommandResponse of the requested size."""
+    response = AICommandResponse.model_validate_json(
+        make_response_payload("list files", explanation_words=3, flag_count=2)
+    )
+
+    assert response.explanation == "word word word"
+    assert len(response.flags) == 2
+    assert response.command == 'echo "list files"'
+
+
+def test_gemini_service_uses_base_url_from_environment(fake_server, ai_context, monkeypatch):
+    """FML_GEMINI_BASE_URL routes the real SDK to the fake server."""
+    monkeypatch.setenv("FML_GEMINI_BASE_URL", fake_server.base_url)
+    service = GeminiService("fake-key", "prompt", "gemini-2.0-flash")
+
+    response = service.generate_command("list files", ai_context)
+
+    assert response.command == 'echo "list files"'
+    assert fake_server.request_count == 1
+
+
+def test_gemini_service_streams_from_fake_server(fake_server, ai_context):
+    """Streamed responses arrive as several partial snapshots."""
+    service = GeminiService("fake-key", "prompt", "gemini-2.0-flash", base_url=fake_server.base_url)
+    partials = []
+
+    response = service.generate_command("list files", ai_context, on_partial=partials.append)
+
+    assert response.flags[0].flag == "--flag-0"
+    assert len(partials) > 1
+
+
+def test_gemini_service_async_against_fake_server(fake_server, ai_context):
+    """The async client works against the fake server too."""
+    service = GeminiService("fake-key", "prompt", "gemini-2.0-flash", base_url=fake_server.base_url)
+
+    response = asyncio.run(service.agenerate_command("list files", ai_context))
+
+    assert response.command == 'echo "list files"'
+
+
+def test_concurrent_first_requests_share_one_client(fake_server, ai_context):
+    """Threads racing to make the first request all succeed with a single client."""
+    service = GeminiService("fake-key", "prompt", "gemini-2.0-flash", base_url=fake_server.base_url)
+    results = service.generate_commands([f"query {i}" for i in range(8)], ai_context, max_concurrency=8)
+
+    assert all(result.error is None for result in results)
+    assert fake_server.request_count == 8
+
+
+def test_gemini_service_reports_token_usage(fake_server, ai_context):
+    """Usage reported by the API is exposed per request and summed per service."""
+    service = GeminiService("fake-key", "prompt", "gemini-2.0-flash", base_url=fake_server.base_url)
+
+    service.generate_command("list files", ai_context)
+    first = service.last_usage
+    service.generate_command("show disk usage", ai_context, on_partial=lambda partial: None)
+
+    assert first.prompt_tokens > 0
+    assert first.output_tokens > 0
+    assert first.total_tokens == first.prompt_tokens + first.output_tokens
+    assert service.last_usage.output_tokens > 0
+    assert service.usage_totals == first + service.last_usage
+
+
+def test_compact_context_encoding_uses_fewer_tokens(fake_server, ai_context):
+    """The compact encodings send fewer prompt tokens than pretty JSON."""
+    usage = {}
+    for encoding in ("pretty", "compact", "kv"):
+        service = GeminiService("fake-key", "prompt", "gemini-2.0-flash", base_url=fake_server.base_url)
+        service.context_encoding = encoding
+        service.generate_command("list files", ai_context)
+        usage[encoding] = service.last_usage.prompt_tokens
+
+    assert usage["kv"] <= usage["compact"] < usage["pretty"]
+
+
+def test_prompt_cache_is_created_once_and_reused(fake_server, ai_context, tmp_path):
+    """A long system instruction is cached server-side and shared through the registry."""
+    from fml.prompt_cache import PromptCacheRegistry
+
+    instruction = "Answer with a shell command. " * 200
+    path = str(tmp_path / "prompt_caches.json")
+    for _ in range(2):
+        service = GeminiService("fake-key", instruction, "gemini-2.0-flash", base_url=fake_server.base_url)
+        service.prompt_cache = PromptCacheRegistry(path)
+        service.generate_command("list files", ai_context)
+        assert service.last_usage.cached_tokens > 0
+
+    assert len(fake_server.cached_contents) == 1
+    # One cache creation and two generate requests.
+    assert fake_server.request_count == 3
+
+
+def test_prompt_cache_falls_back_when_cache_is_gone(fake_server, ai_context, tmp_path):
+    """A request referencing a vanished cache is repeated with the instruction inline."""
+    from fml.prompt_cache import PromptCacheRegistry, prompt_cache_key
+
+    instruction = "Answer with a shell command. " * 200
+    registry = PromptCacheRegistry(str(tmp_path / "prompt_caches.json"))
+    service = GeminiService("fake-key", instruction, "gemini-2.0-flash", base_url=fake_server.base_url)
+    service.prompt_cache = registry
+    service.generate_command("list files", ai_context)
+    fake_server.cached_contents.clear()
+
+    response = service.generate_command("show disk usage", ai_context)
+
+    assert response.command == 'echo "show disk usage"'
+    assert service.last_usage.cached_tokens == 0
+    assert registry.get(prompt_cache_key("gemini-2.0-flash", instruction)) is None
+
+
+def test_short_system_instruction_is_sent_inline(fake_server, ai_context, tmp_path):
+    """Instructions below the caching minimum are never sent to the cache endpoint."""
+    from fml.prompt_cache import PromptCacheRegistry
+
+    service = GeminiService("fake-key", "prompt", "gemini-2.0-flash", base_url=fake_server.base_url)
+    service.prompt_cache = PromptCacheRegistry(str(tmp_path / "prompt_caches.json"))
+
+    service.generate_command("list files", ai_context)
+    service.generate_command("show disk usage", ai_context)
+
+    assert fake_server.cached_contents == {}
+    assert fake_server.request_count == 2
+
+
+def test_packed_queries_are_answered_by_one_request(fake_server, ai_context):
+    """A pack of queries sharing a context costs one request and fewer tokens."""
+    queries = ["list files", "show disk usage", "find large files"]
+    packed = GeminiService("fake-key", "prompt " * 200, "gemini-2.0-flash",
+                           base_url=fake_server.base_url)
+    single = GeminiService("fake-key", "prompt " * 200, "gemini-2.0-flash",
+                           base_url=fake_server.base_url)
+
+    results = packed.generate_packed(queries, ai_context)
+    assert fake_server.request_count == 1
+    for query in queries:
+        single.generate_command(query, ai_context)
+
+    assert [r.response.command for r in results] == [f'echo "{q}"' for q in queries]
+    assert sum(r.usage.total_tokens for r in results) == packed.usage_totals.total_tokens
+    assert packed.usage_totals.prompt_tokens < single.usage_totals.prompt_tokens / 2
+
+
+def test_fake_server_injects_errors_and_malformed_json(ai_context):
+    """Injected faults surface as categorized AIServiceErrors."""
+    from fml.ai_service import AIServiceError
+
+    with FakeGeminiServer(error_rate=1.0, error_status=503) as server:
+        service = GeminiService("fake-key", "prompt", "gemini-2.0-flash", base_url=server.base_url)
+        with pytest.raises(AIServiceError) as exc_info:
+            service.generate_command("list files", ai_context)
+    assert (exc_info.value.category, exc_info.value.status_code) == ("api", 503)
+    assert server.injected_errors == 1
+
+    with FakeGeminiServer(malformed_rate=1.0) as server:
+        service = GeminiService("fake-key", "prompt", "gemini-2.0-flash", base_url=server.base_url)
+        with pytest.raises(AIServiceError) as exc_info:
+            service.generate_command("list files", ai_context)
+    assert exc_info.value.category == "format"
+    assert server.injected_malformed == 1
+
+
+def test_fake_server_fault_rates_are_validated():
+    """Fault rates adding up to more than one are rejected."""
+    with pytest.raises(ValueError, match="between 0 and 1"):
+        FakeGeminiServer(error_rate=0.6, malformed_rate=0.6)
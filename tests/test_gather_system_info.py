@@ -104,3 +104,73 @@ def test_get_system_info_windows_git_bash(
     assert system_info.cwd == "D:\\Projects"
     assert system_info.architecture == "x86"
     assert system_info.python_version == "3.6.9"
+
+
+def test_gatherer_caches_static_facts_and_recomputes_cwd(tmp_path):
+    """
+    Test that a second gather reads static facts from disk but recomputes cwd.
+    """
+    from fml.gather_system_info import SystemInfoGatherer
+
+    cache_path = str(tmp_path / "system_info.json")
+    with patch("platform.system", return_value="Linux"), patch(
+        "platform.machine", return_value="x86_64"
+    ), patch("os.getcwd", return_value="/first"):
+        first = SystemInfoGatherer(cache_path)
+        first_info = first.gather()
+
+    with patch("platform.system") as mock_system, patch(
+        "platform.machine"
+    ) as mock_machine, patch("os.getcwd", return_value="/second"):
+        second = SystemInfoGatherer(cache_path)
+        second_info = second.gather()
+
+    assert not first.static_cache_hit
+    assert second.static_cache_hit
+    mock_system.assert_not_called()
+    mock_machine.assert_not_called()
+    assert second_info.os_name == first_info.os_name == "Linux"
+    assert second_info.architecture == "x86_64"
+    assert second_info.cwd == "/second"
+
+
+def test_gatherer_recomputes_when_fingerprint_changes(tmp_path):
+    """
+    Test that cached static facts are ignored after a reboot or interpreter change.
+    """
+    from fml.gather_system_info import SystemInfoGatherer
+
+    cache_path = str(tmp_path / "system_info.json")
+    with patch("fml.gather_system_info.static_fingerprint", return_value="boot-1"), patch(
+        "platform.system", return_value="Linux"
+    ):
+        SystemInfoGatherer(cache_path).gather()
+
+    with patch("fml.gather_system_info.static_fingerprint", return_value="boot-2"), patch(
+        "platform.system", return_value="Darwin"
+    ):
+        gatherer = SystemInfoGatherer(cache_path)
+        info = gatherer.gather()
+
+    assert not gatherer.static_cache_hit
+    assert info.os_name == "Darwin"
+
+
+def test_gatherer_reports_collector_timings(tmp_path):
+    """
+    Test that every collector's duration is recorded.
+    """
+    from fml.gather_system_info import SystemInfoGatherer
+
+    gatherer = SystemInfoGatherer(str(tmp_path / "system_info.json"))
+    gatherer.gather()
+
+    assert set(gatherer.timings) == {
+        "static_cache",
+        "os_name",
+        "architecture",
+        "python_version",
+        "shell",
+        "cwd",
+    }
+    assert all(seconds >= 0 for seconds in gatherer.timings.values())
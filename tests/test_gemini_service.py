@@ -4,6 +4,7 @@ from fml.ai_providers.gemini_service import GeminiService
 from fml.ai_providers.models import MODELS
 from fml.schemas import AICommandResponse, AIContext, SystemInfo
 from fml.ai_service import AIServiceError
+from fml.http_transport import get_transport
 from google import genai
 from google.genai.types import GenerateContentResponse
 from google.genai.errors import APIError
@@ -42,12 +43,57 @@ def test_gemini_service_initialization(mock_genai_client):
 
     service = GeminiService(api_key, system_instruction_content, model)
 
-    # Assert that genai.Client was called with the correct api_key
-    mock_genai_client.assert_called_once_with(api_key=api_key)
+    # The client is created lazily on first use
+    mock_genai_client.assert_not_called()
+    assert service.client is mock_genai_client.return_value
+    assert service.client is mock_genai_client.return_value
+
+    # Assert that genai.Client was called once with the correct api_key and
+    # the process-wide pooled HTTP clients
+    mock_genai_client.assert_called_once()
+    kwargs = mock_genai_client.call_args.kwargs
+    assert kwargs["api_key"] == api_key
+    assert kwargs["http_options"].httpx_client is get_transport().client()
+    assert kwargs["http_options"].httpx_async_client is get_transport().async_client()
     assert service.model_name == model
     assert service.system_instruction == "mock system instruction"
 
 
+def test_http_options_share_the_transport_clients():
+    """The real HttpOptions accepts the pooled httpx clients."""
+    from fml.ai_providers.gemini_service import _http_options
+    from fml.http_transport import HttpTransport
+
+    transport = HttpTransport()
+    options = _http_options(genai.types.HttpOptions, "http://localhost:1", transport)
+
+    assert isinstance(options, genai.types.HttpOptions)
+    assert options.base_url == "http://localhost:1"
+    assert options.httpx_client is transport.client()
+    assert options.httpx_async_client is transport.async_client()
+    transport.close()
+
+
+def test_http_options_fall_back_without_httpx_fields():
+    """google-genai releases without the httpx fields still get a usable HttpOptions."""
+    from typing import Optional
+
+    from pydantic import BaseModel, ConfigDict
+    from fml.ai_providers.gemini_service import _http_options
+    from fml.http_transport import HttpTransport
+
+    class OldHttpOptions(BaseModel):
+        # google-genai 1.18.0 forbids unknown fields such as httpx_client.
+        model_config = ConfigDict(extra="forbid")
+        base_url: Optional[str] = None
+
+    transport = HttpTransport()
+    options = _http_options(OldHttpOptions, "http://localhost:1", transport)
+
+    assert options.base_url == "http://localhost:1"
+    assert transport._client is None and transport._async_client is None
+
+
 def test_gemini_service_generate_command_success(mock_genai_client, mock_ai_context):
     """Verify generate_command successfully calls API and parses response."""
     api_key = "test_gemini_api_key"
@@ -151,3 +197,171 @@ def test_gemini_service_generate_command_invalid_json_response(
         match="AI Response Format Error: The AI returned an unexpected response format. Details: 1 validation error for AICommandResponse",
     ):
         service.generate_command(query, mock_ai_context)
+
+
+def test_gemini_service_streams_partial_responses(mock_genai_client, mock_ai_context):
+    """Verify streaming mode forwards partial snapshots and validates the final JSON."""
+    chunks = [
+        '{"explanation": "Lists all',
+        ' Docker containers.", "flags": [{"flag": "-a", ',
+        '"description": "Show all containers."}], "command": "docker ps -a"}',
+    ]
+    mock_client_instance = mock_genai_client.return_value
+    mock_client_instance.models.generate_content_stream.return_value = iter(
+        [MagicMock(text=chunk) for chunk in chunks]
+    )
+
+    partials = []
+    service = GeminiService("key", "mock system instruction", "gemini-1.5-flash")
+    response = service.generate_command(
+        "list docker containers", mock_ai_context, on_partial=partials.append
+    )
+
+    mock_client_instance.models.generate_content.assert_not_called()
+    assert partials[0] == {"explanation": "Lists all"}
+    assert partials[-1]["command"] == "docker ps -a"
+    assert response.command == "docker ps -a"
+    assert response.flags[0].flag == "-a"
+
+
+def test_gemini_service_stream_invalid_json(mock_genai_client, mock_ai_context):
+    """Verify a malformed streamed response is reported as a format error."""
+    mock_client_instance = mock_genai_client.return_value
+    mock_client_instance.models.generate_content_stream.return_value = iter(
+        [MagicMock(text='{"explanation": "oops", "flags": "nope", "command": ""}')]
+    )
+
+    service = GeminiService("key", "mock system instruction", "gemini-1.5-flash")
+    with pytest.raises(AIServiceError, match="AI Response Format Error"):
+        service.generate_command("query", mock_ai_context, on_partial=lambda p: None)
+
+
+def test_gemini_service_api_error_carries_status_code(mock_genai_client, mock_ai_context):
+    """Verify APIErrors become retryable AIServiceErrors with their HTTP status."""
+    mock_client_instance = mock_genai_client.return_value
+    mock_client_instance.models.generate_content.side_effect = APIError(
+        503, response_json={"error": {"message": "Overloaded", "status": "UNAVAILABLE"}}
+    )
+
+    service = GeminiService("key", "mock system instruction", "gemini-1.5-flash")
+    with pytest.raises(AIServiceError, match="API Error: Overloaded") as excinfo:
+        service.generate_command("query", mock_ai_context)
+    assert excinfo.value.category == "api"
+    assert excinfo.value.status_code == 503
+    assert excinfo.value.retryable
+
+
+def test_gemini_service_agenerate_command_uses_async_client(mock_genai_client, mock_ai_context):
+    """Verify agenerate_command awaits client.aio and parses the response."""
+    import asyncio
+    from unittest.mock import AsyncMock
+
+    mock_api_response = MagicMock(spec=GenerateContentResponse)
+    mock_api_response.text = '{"explanation": "Lists containers.", "flags": [], "command": "docker ps"}'
+    mock_client_instance = mock_genai_client.return_value
+    mock_client_instance.aio.models.generate_content = AsyncMock(return_value=mock_api_response)
+
+    service = GeminiService("key", "mock system instruction", "gemini-1.5-flash")
+    response = asyncio.run(service.agenerate_command("list containers", mock_ai_context))
+
+    assert response.command == "docker ps"
+    mock_client_instance.aio.models.generate_content.assert_awaited_once()
+    mock_client_instance.models.generate_content.assert_not_called()
+
+
+def test_gemini_service_agenerate_command_maps_errors(mock_genai_client, mock_ai_context):
+    """Verify the async path applies the same error mapping as generate_command."""
+    import asyncio
+    from unittest.mock import AsyncMock
+
+    mock_client_instance = mock_genai_client.return_value
+    mock_client_instance.aio.models.generate_content = AsyncMock(
+        side_effect=APIError(
+            429, response_json={"error": {"message": "Slow down", "status": "RESOURCE_EXHAUSTED"}}
+        )
+    )
+    service = GeminiService("key", "mock system instruction", "gemini-1.5-flash")
+    with pytest.raises(AIServiceError, match="API Error: Slow down") as excinfo:
+        asyncio.run(service.agenerate_command("query", mock_ai_context))
+    assert excinfo.value.status_code == 429
+
+    mock_bad_response = MagicMock(spec=GenerateContentResponse)
+    mock_bad_response.text = '{"explanation": "x", "flags": "bad", "command": ""}'
+    mock_client_instance.aio.models.generate_content = AsyncMock(return_value=mock_bad_response)
+    with pytest.raises(AIServiceError, match="AI Response Format Error") as excinfo:
+        asyncio.run(service.agenerate_command("query", mock_ai_context))
+    assert excinfo.value.category == "format"
+
+
+def test_gemini_service_sends_git_and_file_context(mock_genai_client, mock_ai_context):
+    """Verify collected git and file context are appended to the request contents."""
+    from fml.schemas import FileContext, GitContext
+
+    ai_context = mock_ai_context.model_copy(
+        update={
+            "git_context": GitContext(branch="main", changed_files=["app.py"]),
+            "file_context": FileContext(entries=["app.py", "src/"]),
+        }
+    )
+    service = GeminiService("key", "prompt", "gemini-1.5-pro")
+
+    contents = service._build_request("undo my changes", ai_context)["contents"]
+
+    assert len(contents) == 4
+    assert contents[2].startswith("\n\nUser's Git Repository:")
+    assert '"changed_files": [\n    "app.py"\n  ]' in contents[2]
+    assert contents[3].startswith("\n\nFiles in User's Current Directory:")
+
+
+def test_gemini_service_prepare_creates_client(mock_genai_client, mock_ai_context):
+    """Verify prepare() creates the client ahead of the request."""
+    service = GeminiService("key", "prompt", "gemini-1.5-pro")
+
+    service.prepare("list files", mock_ai_context)
+
+    mock_genai_client.assert_called_once()
+    assert mock_genai_client.call_args.kwargs["api_key"] == "key"
+
+
+def test_gemini_service_reuses_request_config(mock_genai_client, mock_ai_context):
+    """Verify the generation config and system info block are built once and shared."""
+    first = GeminiService("key", "prompt", "gemini-1.5-pro")
+    second = GeminiService("key", "prompt", "gemini-2.0-flash")
+
+    request_a = first._build_request("list files", mock_ai_context)
+    request_b = first._build_request("show disk usage", mock_ai_context)
+    request_c = second._build_request("list files", mock_ai_context.model_copy())
+
+    assert request_a["config"] is request_b["config"] is request_c["config"]
+    assert request_a["contents"][1] is request_c["contents"][1]
+    assert request_a["config"] == genai.types.GenerateContentConfig(
+        system_instruction="prompt",
+        response_mime_type="application/json",
+        response_schema=AICommandResponse.model_json_schema(),
+    )
+
+
+def test_gemini_service_config_follows_system_instruction(mock_genai_client, mock_ai_context):
+    """Verify services with different system prompts do not share a config."""
+    first = GeminiService("key", "prompt one", "gemini-1.5-pro")
+    second = GeminiService("key", "prompt two", "gemini-1.5-pro")
+
+    config_a = first._build_request("q", mock_ai_context)["config"]
+    config_b = second._build_request("q", mock_ai_context)["config"]
+
+    assert config_a.system_instruction == "prompt one"
+    assert config_b.system_instruction == "prompt two"
+
+
+def test_gemini_service_system_info_block_tracks_changes(mock_genai_client, mock_ai_context):
+    """Verify a changed working directory produces a fresh system info block."""
+    service = GeminiService("key", "prompt", "gemini-1.5-pro")
+    moved = mock_ai_context.model_copy(
+        update={"system_info": mock_ai_context.system_info.model_copy(update={"cwd": "/elsewhere"})}
+    )
+
+    before = service._build_request("q", mock_ai_context)["contents"][1]
+    after = service._build_request("q", moved)["contents"][1]
+
+    assert '"cwd": "/test/cwd"' in before
+    assert '"cwd": "/elsewhere"' in after
@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from fml.ai_service import AIService, AIServiceError
+from fml.hedging import DEFAULT_HEDGE_DELAY_SECONDS, agenerate_hedged, generate_hedged, hedge_delay
+from fml.model_stats import MIN_SAMPLES, ModelStatsStore
+from fml.schemas import AICommandResponse, AIContext
+
+
+class DelayedAIService(AIService):
+    """Answers after a fixed delay, optionally failing, and records cancellation."""
+
+    def __init__(self, model: str, delay: float, fail: bool = False):
+        super().__init__("key", "prompt", model)
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = False
+
+    def _generate_command_internal(self, query, ai_context):
+        raise NotImplementedError
+
+    async def _agenerate_command_internal(self, query, ai_context):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.fail:
+            raise AIServiceError(f"{self.model} failed", category="api", status_code=400)
+        return AICommandResponse(explanation=self.model, flags=[], command=f"echo {self.model}")
+
+
+def hedge(primary, secondary, delay):
+    return asyncio.run(agenerate_hedged(primary, secondary, "list files", AIContext(), delay))
+
+
+def test_fast_primary_is_not_hedged():
+    """A primary answering within the delay is used and the secondary is never asked."""
+    primary = DelayedAIService("fast", 0.01)
+    secondary = DelayedAIService("backup", 0.01)
+
+    result = hedge(primary, secondary, 0.5)
+
+    assert result.model == "fast"
+    assert not result.hedged
+    assert secondary.calls == 0
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    """After the delay the secondary is asked; the first valid answer wins and the loser is cancelled."""
+    primary = DelayedAIService("slow", 5.0)
+    secondary = DelayedAIService("backup", 0.01)
+    primary.model_stats = ModelStatsStore()
+
+    result = hedge(primary, secondary, 0.05)
+
+    assert result.model == "backup"
+    assert result.hedged
+    assert primary.cancelled
+    assert primary.model_stats.sample_count("slow") == 1
+
+
+def test_primary_that_answers_first_after_hedging_wins():
+    """The hedge does not replace a primary that finishes before it."""
+    primary = DelayedAIService("primary", 0.1)
+    secondary = DelayedAIService("backup", 5.0)
+
+    result = hedge(primary, secondary, 0.02)
+
+    assert result.model == "primary"
+    assert result.hedged
+    assert secondary.cancelled
+
+
+def test_failed_primary_hedges_immediately():
+    """A primary failure sends the secondary request without waiting for the delay."""
+    primary = DelayedAIService("broken", 0.0, fail=True)
+    secondary = DelayedAIService("backup", 0.01)
+
+    result = hedge(primary, secondary, 10.0)
+
+    assert result.model == "backup"
+
+
+def test_both_failing_raises_primary_error():
+    """When neither request validates, the primary's error is raised."""
+    primary = DelayedAIService("broken", 0.0, fail=True)
+    secondary = DelayedAIService("backup", 0.0, fail=True)
+
+    with pytest.raises(AIServiceError, match="broken failed"):
+        hedge(primary, secondary, 0.01)
+
+
+def test_hedge_delay_uses_recorded_quantile():
+    """The delay is the primary's latency quantile once enough samples exist."""
+    stats = ModelStatsStore()
+    assert hedge_delay(stats, "model") == DEFAULT_HEDGE_DELAY_SECONDS
+    for _ in range(MIN_SAMPLES):
+        stats.record_latency("model", 0.6)
+
+    assert 0.5 < hedge_delay(stats, "model", 0.9) <= 0.75
+
+
+def test_generate_hedged_records_latency_of_winner():
+    """Successful provider requests feed the winner's latency histogram."""
+    primary = DelayedAIService("fast", 0.01)
+    primary.model_stats = ModelStatsStore()
+
+    result = generate_hedged(primary, DelayedAIService("backup", 0.01), "list files", AIContext())
+
+    assert result.response.command == "echo fast"
+    assert primary.model_stats.sample_count("fast") == 1
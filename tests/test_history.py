@@ -0,0 +1,170 @@
+import sqlite3
+import threading
+
+import pytest
+
+from fml.history import (
+    PRUNE_INTERVAL,
+    HistoryStore,
+    format_entries,
+)
+from fml.schemas import AICommandResponse, Flag, SystemInfo
+
+
+def _response(command: str, explanation: str = "Does something.") -> AICommandResponse:
+    return AICommandResponse(explanation=explanation, flags=[], command=command)
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Provides a history store in a temporary directory."""
+    history = HistoryStore(str(tmp_path / "history" / "history.sqlite3"))
+    yield history
+    history.close()
+
+
+def test_record_stores_full_answer(store):
+    """Entries keep the query, response, model, source, latency and system information."""
+    response = AICommandResponse(
+        explanation="Lists running containers.",
+        flags=[Flag(flag="-a", description="Include stopped containers.")],
+        command="docker ps -a",
+    )
+    system_info = SystemInfo(os_name="Linux", shell="bash", cwd="/srv",
+                             architecture="x86_64", python_version="3.12.0")
+
+    store.record("show all containers", response, "gemini-2.0-flash", "model",
+                 latency_ms=812.5, system_info=system_info)
+
+    [entry] = store.recent()
+    assert (entry.query, entry.command, entry.model, entry.source, entry.latency_ms) == (
+        "show all containers", "docker ps -a", "gemini-2.0-flash", "model", 812.5)
+    assert entry.response() == response
+    stored = sqlite3.connect(store.path).execute("SELECT system_info FROM history").fetchone()[0]
+    assert SystemInfo.model_validate_json(stored) == system_info
+
+
+def test_database_uses_wal_mode(store):
+    """Concurrent shells can write thanks to the write-ahead log; freed space is reclaimed."""
+    store.record("list files", _response("ls"), "gemini-2.0-flash", "model")
+
+    connection = sqlite3.connect(store.path)
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    # Pages freed by pruning are returned to the file system (INCREMENTAL).
+    assert connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+def test_search_matches_query_explanation_and_command(store):
+    """Words may match any of the indexed columns, as prefixes and case-insensitively."""
+    store.record("show all containers", _response("docker ps -a"), "m", "model")
+    store.record("free disk space", _response("docker system prune", "Removes unused data."),
+                 "m", "model")
+    store.record("list files", _response("ls -la", "Lists files with details."), "m", "model")
+
+    assert {e.command for e in store.search("docker")} == {"docker ps -a", "docker system prune"}
+    assert [e.command for e in store.search("CONTAIN")] == ["docker ps -a"]
+    assert [e.command for e in store.search("unused")] == ["docker system prune"]
+    assert [e.command for e in store.search("docker disk")] == ["docker system prune"]
+    assert store.search("kubernetes") == []
+
+
+def test_search_lists_each_command_once(store):
+    """Repeated answers with the same command are listed once, most recent first."""
+    store.record("list files", _response("ls"), "m", "model", now=100.0)
+    store.record("list the files", _response("ls"), "m", "cache", now=200.0)
+    store.record("list files by size", _response("ls -S"), "m", "model", now=300.0)
+
+    assert [e.command for e in store.recent()] == ["ls -S", "ls"]
+    assert [e.query for e in store.search("")] == ["list files by size", "list the files"]
+    assert len(store.search("list", limit=1)) == 1
+
+
+def test_search_ignores_fts_syntax(store):
+    """Quotes and operators in the search text are treated as plain words."""
+    store.record("find python files", _response("find . -name '*.py'"), "m", "model")
+
+    assert [e.command for e in store.search('"python" AND (NOT')] == []
+    assert [e.command for e in store.search('python*"')] == ["find . -name '*.py'"]
+
+
+def test_prune_enforces_entry_limit_and_age(tmp_path):
+    """The oldest entries beyond the limits are deleted."""
+    store = HistoryStore(str(tmp_path / "history.sqlite3"), max_entries=3, max_age_days=1)
+    day = 24 * 60 * 60
+    for i in range(5):
+        store.record(f"query {i}", _response(f"echo {i}"), "m", "model", now=10 * day + i)
+    store.record("ancient", _response("echo old"), "m", "model", now=0.0)
+
+    deleted = store.prune(now=10 * day + 10)
+
+    assert deleted == 4
+    assert [e.command for e in store.recent()] == ["echo 4", "echo 3"]
+    assert store.search("ancient") == []
+    assert len(store) == 2
+
+
+def test_record_prunes_periodically(tmp_path):
+    """Retention is enforced while recording, without an explicit prune."""
+    store = HistoryStore(str(tmp_path / "history.sqlite3"), max_entries=10)
+    for i in range(PRUNE_INTERVAL):
+        store.record(f"query {i}", _response(f"echo {i}"), "m", "model")
+
+    assert len(store) == 10
+    assert store.search("query")[0].command == f"echo {PRUNE_INTERVAL - 1}"
+
+
+def test_vacuum_and_clear(store):
+    """Vacuuming keeps the entries searchable; clearing removes them from the index too."""
+    for i in range(20):
+        store.record(f"query {i}", _response(f"echo {i}"), "m", "model")
+    store.vacuum()
+    assert len(store.search("query", limit=50)) == 20
+
+    store.clear()
+
+    assert len(store) == 0
+    assert store.search("query") == []
+
+
+def test_concurrent_writers_share_the_database(tmp_path):
+    """Several stores (as in several shells) can record at the same time."""
+    path = str(tmp_path / "history.sqlite3")
+    errors = []
+
+    def write(worker):
+        history = HistoryStore(path)
+        try:
+            for i in range(20):
+                history.record(f"query {worker} {i}", _response(f"echo {worker} {i}"), "m", "model")
+        except sqlite3.Error as e:
+            errors.append(e)
+        finally:
+            history.close()
+
+    threads = [threading.Thread(target=write, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(HistoryStore(path)) == 80
+
+
+def test_retention_settings_are_validated(tmp_path):
+    """A history that keeps nothing is rejected."""
+    with pytest.raises(ValueError, match="at least 1"):
+        HistoryStore(str(tmp_path / "h.sqlite3"), max_entries=0)
+    with pytest.raises(ValueError, match="positive"):
+        HistoryStore(str(tmp_path / "h.sqlite3"), max_age_days=0)
+
+
+def test_format_entries(store):
+    """The listing shows each command with the query that produced it."""
+    store.record("show all containers", _response("docker ps -a"), "gemini-2.0-flash", "model")
+
+    text = format_entries(store.recent())
+
+    assert text.splitlines()[0] == "docker ps -a"
+    assert "show all containers" in text and "gemini-2.0-flash" in text
+    assert format_entries([]) == "No matching commands in the history."
@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+
+from fml.ai_providers.gemini_service import GeminiService
+from fml.http_transport import (
+    DEFAULT_IDLE_TIMEOUT_SECONDS,
+    HttpTransport,
+    TransportStats,
+    configure_transport,
+    get_transport,
+)
+from fml.schemas import AIContext, SystemInfo
+from fml.testing.fake_gemini import FakeGeminiServer
+
+GENERATE_PATH = "/v1beta/models/gemini-2.0-flash:generateContent"
+
+
+@pytest.fixture
+def fake_server():
+    """Runs a fake Gemini API server for the duration of a test."""
+    with FakeGeminiServer(explanation_words=5, flag_count=1) as server:
+        yield server
+
+
+@pytest.fixture
+def ai_context():
+    """Provides a fixed AIContext."""
+    return AIContext(
+        system_info=SystemInfo(
+            os_name="Linux",
+            shell="bash",
+            cwd="/home/user",
+            architecture="x86_64",
+            python_version="3.12.0",
+        )
+    )
+
+
+def test_transport_reuses_keep_alive_connections(fake_server):
+    """Sequential requests through the shared client open a single connection."""
+    transport = HttpTransport(http2=False)
+    client = transport.client()
+
+    for _ in range(3):
+        client.post(fake_server.base_url + GENERATE_PATH, json={})
+
+    assert transport.client() is client
+    assert transport.stats() == TransportStats(requests=3, connections_opened=1)
+    assert transport.stats().reused_connections == 2
+    transport.close()
+
+
+def test_transport_counts_async_requests(fake_server):
+    """The async client reports its requests and connections too."""
+    transport = HttpTransport(http2=False)
+
+    async def send():
+        client = transport.async_client()
+        for _ in range(2):
+            await client.post(fake_server.base_url + GENERATE_PATH, json={})
+        await client.aclose()
+
+    asyncio.run(send())
+
+    assert transport.stats() == TransportStats(requests=2, connections_opened=1)
+
+
+def test_transport_close_closes_both_clients():
+    """close() shuts the async client's pool too, not just the sync one."""
+    transport = HttpTransport(http2=False)
+    client, async_client = transport.client(), transport.async_client()
+
+    transport.close()
+
+    assert client.is_closed and async_client.is_closed
+    assert transport.client() is not client
+    transport.close()
+
+
+def test_transport_aclose_closes_connections_on_their_loop(fake_server):
+    """aclose() closes the async client's open connections from inside its event loop."""
+    transport = HttpTransport(http2=False)
+
+    async def send_and_close():
+        client = transport.async_client()
+        await client.post(fake_server.base_url + GENERATE_PATH, json={})
+        with pytest.raises(RuntimeError, match="await aclose"):
+            transport.close()
+        await transport.aclose()
+        return client
+
+    assert asyncio.run(send_and_close()).is_closed
+
+
+def test_services_share_pooled_connections(fake_server, ai_context):
+    """Services for different models send their requests over the same connection."""
+    transport = HttpTransport(http2=False)
+    services = [
+        GeminiService("fake-key", "prompt", model, base_url=fake_server.base_url,
+                      http_transport=transport)
+        for model in ("gemini-2.0-flash", "gemini-2.5-flash", "gemini-2.0-flash")
+    ]
+
+    for service in services:
+        service.generate_command("list files", ai_context)
+
+    stats = transport.stats()
+    assert stats.requests == 3
+    assert stats.connections_opened == 1
+    assert stats.format() == "3 requests, 1 connections opened (2 reused), 0 over HTTP/2"
+    transport.close()
+
+
+def test_transport_pool_settings_are_validated():
+    """A pool without connections or a negative idle timeout is rejected."""
+    with pytest.raises(ValueError, match="at least 1"):
+        HttpTransport(pool_size=0)
+    with pytest.raises(ValueError, match="negative"):
+        HttpTransport(idle_timeout=-1)
+
+
+def test_configure_transport_reads_environment(monkeypatch):
+    """Unset settings come from the environment and replace the shared transport."""
+    monkeypatch.setenv("FML_HTTP_POOL_SIZE", "3")
+
+    transport = configure_transport(idle_timeout=5)
+
+    assert get_transport() is transport
+    assert (transport.pool_size, transport.idle_timeout) == (3, 5)
+    monkeypatch.delenv("FML_HTTP_POOL_SIZE")
+    assert configure_transport().idle_timeout == DEFAULT_IDLE_TIMEOUT_SECONDS
@@ -0,0 +1,232 @@
+import json
+import threading
+import time
+
+import pytest
+
+from fml.ai_providers.gemini_service import GeminiService
+from fml.ai_service import AIService, AIServiceError
+from fml.loadtest import (
+    DEFAULT_QUERIES,
+    LoadReport,
+    LoadTarget,
+    ServerTarget,
+    ServiceTarget,
+    load_corpus,
+    main,
+    peak_rss_bytes,
+    percentile,
+    run_load,
+)
+from fml.schemas import AICommandResponse, AIContext, SystemInfo
+from fml.server import FmlServer
+from fml.testing.fake_gemini import FakeGeminiServer
+
+
+@pytest.fixture
+def ai_context():
+    """Provides a fixed AIContext."""
+    return AIContext(
+        system_info=SystemInfo(
+            os_name="Linux",
+            shell="bash",
+            cwd="/home/user",
+            architecture="x86_64",
+            python_version="3.12.0",
+        )
+    )
+
+
+class CountingTarget(LoadTarget):
+    """Records queries and fails those containing 'fail'."""
+
+    name = "counting"
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.queries = []
+        self.lock = threading.Lock()
+
+    def send(self, query):
+        time.sleep(self.delay)
+        with self.lock:
+            self.queries.append(query)
+        return "api" if "fail" in query else None
+
+
+class EchoAIService(AIService):
+    """A concrete AIService answering every query immediately."""
+
+    def _generate_command_internal(self, query, ai_context):
+        return AICommandResponse(explanation="Echo.", flags=[], command=f"echo {query}")
+
+
+def test_closed_loop_sends_requested_number_of_queries():
+    """Queries wrap around the corpus and failures are counted by category."""
+    target = CountingTarget()
+
+    report = run_load(target, ["ok", "fail"], concurrency=3, requests=7)
+
+    assert report.requests == 7
+    assert sorted(target.queries) == ["fail"] * 3 + ["ok"] * 4
+    assert report.errors == {"api": 3}
+    assert report.succeeded == 4
+    assert report.mode == "concurrency 3"
+    assert len(report.latencies_ms) == 7
+
+
+def test_open_loop_paces_queries():
+    """A rate-limited run takes about requests / rate seconds."""
+    target = CountingTarget()
+
+    report = run_load(target, ["ok"], rate=50, requests=10)
+
+    assert report.requests == 10
+    assert report.elapsed_seconds >= 9 / 50
+    assert report.mode == "rate 50/s"
+
+
+def test_duration_bounds_the_run():
+    """Without a request count, queries are sent until the duration has passed."""
+    report = run_load(CountingTarget(delay=0.01), ["ok"], concurrency=2, duration=0.1)
+
+    assert 2 <= report.requests <= 40
+    assert report.elapsed_seconds < 1
+
+
+@pytest.mark.parametrize(
+    "kwargs, message",
+    [
+        ({}, "either a concurrency or a rate"),
+        ({"concurrency": 1, "rate": 1.0}, "either a concurrency or a rate"),
+        ({"concurrency": 0}, "at least 1"),
+        ({"rate": 0}, "positive"),
+    ],
+)
+def test_run_load_validates_settings(kwargs, message):
+    """Inconsistent load settings are rejected."""
+    with pytest.raises(ValueError, match=message):
+        run_load(CountingTarget(), ["ok"], **kwargs)
+
+
+def test_target_exceptions_are_recorded():
+    """A target raising unexpectedly is reported instead of aborting the run."""
+
+    class BrokenTarget(LoadTarget):
+        name = "broken"
+
+        def send(self, query):
+            raise KeyError(query)
+
+    report = run_load(BrokenTarget(), ["ok"], concurrency=1, requests=2)
+
+    assert report.errors == {"unexpected:KeyError": 2}
+
+
+def test_report_percentiles_and_format():
+    """The report summarizes throughput, latency, errors and memory."""
+    report = LoadReport(
+        target="server",
+        mode="concurrency 2",
+        requests=4,
+        errors={"rejected": 1},
+        elapsed_seconds=2.0,
+        latencies_ms=[40.0, 10.0, 30.0, 20.0],
+        peak_rss_bytes=64 * 1024 * 1024,
+    )
+
+    assert report.percentiles() == {"p50": 20.0, "p90": 40.0, "p99": 40.0, "max": 40.0}
+    assert report.to_dict()["throughput_rps"] == 2.0
+    text = report.format()
+    assert "4 in 2.00s (2.0/s), 3 succeeded, 1 failed" in text
+    assert "Errors: rejected 1" in text
+    assert "Peak RSS: 64.0 MiB" in text
+
+
+def test_percentile_uses_nearest_rank():
+    """Percentiles pick an observed value."""
+    assert percentile([], 0.5) == 0.0
+    assert percentile([1.0, 2.0, 3.0], 0.5) == 2.0
+    assert percentile(list(range(1, 101)), 0.99) == 99
+
+
+def test_peak_rss_of_this_process():
+    """This process always has a known, positive peak RSS."""
+    assert peak_rss_bytes() > 0
+    assert peak_rss_bytes(pid=2 ** 22 + 1) is None
+
+
+def test_service_target_reports_error_categories(ai_context):
+    """The service target reports injected faults by AIServiceError category."""
+    with FakeGeminiServer(error_rate=0.25, malformed_rate=0.25, seed=7) as server:
+        service = GeminiService("fake-key", "prompt", "gemini-2.0-flash", base_url=server.base_url)
+        # Distinct queries, so concurrent requests are never coalesced.
+        queries = [f"query {i}" for i in range(40)]
+        report = run_load(ServiceTarget(service, ai_context), queries, concurrency=4)
+
+    assert report.requests == 40
+    assert report.errors.get("api", 0) == server.injected_errors
+    assert report.errors.get("format", 0) == server.injected_malformed
+    assert report.succeeded == 40 - server.injected_errors - server.injected_malformed
+
+
+def test_server_target_reports_rejections_and_categories(ai_context):
+    """HTTP status codes of `fml serve` map to the same categories."""
+
+    class FailingService(EchoAIService):
+        def _generate_command_internal(self, query, ai_context):
+            if query == "fail":
+                raise AIServiceError("Bad JSON", category="format")
+            return super()._generate_command_internal(query, ai_context)
+
+    server = FmlServer(lambda model: FailingService("key", "prompt", model),
+                       default_model="gemini-2.0-flash", port=0)
+    threading.Thread(target=server.serve, daemon=True).start()
+    target = ServerTarget(server.base_url, system_info=ai_context.system_info)
+    try:
+        report = run_load(target, ["ok", "fail"], concurrency=2, requests=6)
+    finally:
+        target.close()
+        server.stop()
+
+    assert report.errors == {"format": 3}
+    assert report.succeeded == 3
+
+
+def test_server_target_reports_unreachable_server():
+    """Connection failures count as network errors."""
+    server = FmlServer(lambda model: None, default_model="gemini-2.0-flash", port=0)
+    url = server.base_url
+    server._httpd.server_close()
+
+    report = run_load(ServerTarget(url), ["ok"], concurrency=1, requests=2)
+
+    assert report.errors == {"network": 2}
+
+
+def test_server_target_rejects_other_schemes():
+    """Only plain http:// URLs are supported."""
+    with pytest.raises(ValueError, match="http://"):
+        ServerTarget("https://fml.example.com")
+
+
+def test_load_corpus_reads_batch_format(tmp_path):
+    """Corpus files use the batch input format; invalid lines are skipped."""
+    corpus = tmp_path / "queries.txt"
+    corpus.write_text('list files\n# comment\n{"query": "show disk usage"}\n{"id": 1}\n')
+
+    assert load_corpus(str(corpus)) == ["list files", "show disk usage"]
+    assert load_corpus(None) == list(DEFAULT_QUERIES)
+
+
+def test_main_runs_against_fake_provider(capsys, monkeypatch):
+    """`python -m fml.loadtest --fake` prints a JSON report."""
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+
+    main(["--fake", "--requests", "5", "--concurrency", "2", "--json"])
+
+    report = json.loads(capsys.readouterr().out)
+    assert report["target"] == "service"
+    assert report["requests"] == 5
+    assert report["errors"] == {}
+    assert report["peak_rss_bytes"] > 0
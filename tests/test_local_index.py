@@ -0,0 +1,161 @@
+import time
+
+import pytest
+
+from fml.local_index import (
+    DEFAULT_CONFIDENCE,
+    OFFLINE_MIN_SCORE,
+    LocalCommandIndex,
+    get_default_index,
+    literal_tokens,
+    tokenize,
+)
+from fml.schemas import AICommandResponse
+
+
+@pytest.fixture
+def index():
+    """Provides a small index with an OS-specific entry."""
+    return LocalCommandIndex(
+        [
+            {
+                "phrases": ["extract a tar.gz file", "untar an archive"],
+                "explanation": "Extracts a tar archive.",
+                "flags": [{"flag": "-x", "description": "Extract files."}],
+                "command": "tar -xzf archive.tar.gz",
+            },
+            {
+                "phrases": ["list files in directory"],
+                "explanation": "Lists files.",
+                "flags": [],
+                "command": "ls -la",
+                "os": ["Linux", "Darwin"],
+            },
+            {
+                "phrases": ["list files in directory"],
+                "explanation": "Lists files.",
+                "flags": [],
+                "command": "Get-ChildItem",
+                "os": ["Windows"],
+            },
+        ]
+    )
+
+
+def test_tokenize_drops_filler_words_and_plurals():
+    """
+    Test that filler words are removed and plural terms are singularized.
+    """
+    assert tokenize("How do I list the files?") == {"list", "file"}
+    assert tokenize("show git status") == {"show", "git", "status"}
+
+
+def test_lookup_returns_response_for_confident_match(index):
+    """
+    Test that a close paraphrase returns the indexed AICommandResponse.
+    """
+    response = index.lookup("how do I extract a tar.gz file", os_name="Linux")
+
+    assert isinstance(response, AICommandResponse)
+    assert response.command == "tar -xzf archive.tar.gz"
+    assert response.flags[0].flag == "-x"
+
+
+def test_lookup_rejects_weak_match(index):
+    """
+    Test that queries sharing only a term or two with an entry are not answered.
+    """
+    match = index.search("extract the audio track from a video file", os_name="Linux")
+
+    assert match is not None
+    assert match.score < DEFAULT_CONFIDENCE
+    assert index.lookup("extract the audio track from a video file", os_name="Linux") is None
+
+
+def test_lookup_returns_none_without_shared_terms(index):
+    """
+    Test that unrelated queries find nothing at all.
+    """
+    assert index.search("write a haiku", os_name="Linux") is None
+
+
+def test_lookup_respects_entry_os(index):
+    """
+    Test that entries restricted to another OS are never returned.
+    """
+    assert index.lookup("list files in directory", os_name="Linux").command == "ls -la"
+    assert index.lookup("list files in directory", os_name="Windows").command == "Get-ChildItem"
+
+
+def test_load_rejects_invalid_data(tmp_path):
+    """
+    Test that a file without an entries list raises ValueError.
+    """
+    path = tmp_path / "commands.json"
+    path.write_text('{"version": 1}')
+
+    with pytest.raises(ValueError):
+        LocalCommandIndex.load(str(path))
+
+
+def test_default_index_answers_common_queries_quickly():
+    """
+    Test that the shipped index answers common git, docker and tar queries in well under 20 ms.
+    """
+    index = get_default_index()
+    index.lookup("warm up")
+
+    queries = {
+        "how do I undo my last git commit": "git reset --soft HEAD~1",
+        "show docker images": "docker images",
+        "extract a tar.gz file": "tar -xzvf archive.tar.gz",
+    }
+    for query, command in queries.items():
+        start = time.perf_counter()
+        response = index.lookup(query, os_name="Linux")
+        elapsed = time.perf_counter() - start
+
+        assert response.command == command
+        assert elapsed < 0.02
+
+
+def test_literal_tokens_extracts_numbers_sizes_and_paths():
+    assert literal_tokens("delete files older than 7 days in /tmp") == ("7", "/tmp")
+    assert literal_tokens("find files larger than 100mb") == ("100mb",)
+    assert literal_tokens("how do I list docker containers?") == ()
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "undo last 3 git commits",
+        "delete files older than 7 days",
+        "delete files older than 90 days",
+    ],
+)
+def test_default_index_declines_queries_with_other_literals(query):
+    """
+    Test that a phrase sharing the words but not the numbers of a query never answers it.
+    """
+    index = get_default_index()
+
+    assert index.lookup(query, os_name="Linux") is None
+    assert index.lookup(query, os_name="Linux", min_score=OFFLINE_MIN_SCORE) is None
+
+
+def test_default_index_answers_queries_with_matching_literals():
+    index = get_default_index()
+
+    response = index.lookup("delete files older than 30 days", os_name="Linux")
+    assert response.command == "find . -type f -mtime +30 -delete"
+
+
+def test_default_index_removes_only_stopped_containers():
+    """
+    Test that removing stopped containers does not also prune images, networks and build cache.
+    """
+    index = get_default_index()
+
+    response = index.lookup("remove all stopped docker containers", os_name="Linux")
+    assert response.command == "docker container prune -f"
+    assert index.lookup("clean up docker", os_name="Linux").command == "docker system prune -f"
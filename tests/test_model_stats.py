@@ -0,0 +1,144 @@
+import json
+
+import pytest
+
+from fml.model_stats import LATENCY_BUCKETS, MAX_SAMPLES, MIN_SAMPLES, ModelStatsStore
+
+
+def test_quantile_needs_enough_samples():
+    """No quantile is estimated before MIN_SAMPLES latencies are recorded."""
+    stats = ModelStatsStore()
+    for _ in range(MIN_SAMPLES - 1):
+        stats.record_latency("fast", 0.4)
+
+    assert stats.latency_quantile("fast", 0.9) is None
+    assert stats.latency_quantile("unknown", 0.9) is None
+
+
+def test_quantile_interpolates_within_bucket():
+    """Quantiles are interpolated linearly inside the bucket they fall in."""
+    stats = ModelStatsStore()
+    for _ in range(10):
+        stats.record_latency("model", 0.3)  # (0.25, 0.5] bucket
+    for _ in range(10):
+        stats.record_latency("model", 1.2)  # (1.0, 1.5] bucket
+
+    assert stats.latency_quantile("model", 0.25) == pytest.approx(0.375)
+    assert stats.latency_quantile("model", 0.5) == pytest.approx(0.5)
+    assert stats.latency_quantile("model", 1.0) == pytest.approx(1.5)
+
+
+def test_quantile_of_open_bucket_is_its_lower_bound():
+    """Latencies slower than every bucket report the largest bucket bound."""
+    stats = ModelStatsStore()
+    for _ in range(MIN_SAMPLES):
+        stats.record_latency("slow", 120.0)
+
+    assert stats.latency_quantile("slow", 0.5) == LATENCY_BUCKETS[-1]
+
+
+def test_counts_decay_after_max_samples():
+    """Histograms are halved once they reach MAX_SAMPLES, favouring recent latencies."""
+    stats = ModelStatsStore()
+    for _ in range(MAX_SAMPLES - 1):
+        stats.record_latency("model", 0.1)
+    stats.record_latency("model", 0.1)
+
+    assert stats.sample_count("model") == MAX_SAMPLES // 2
+
+
+def test_stats_persist_across_instances(tmp_path):
+    """Latencies recorded by one store are seen by another on the same file."""
+    path = str(tmp_path / "model_stats.json")
+    first = ModelStatsStore(path)
+    second = ModelStatsStore(path)
+    for _ in range(MIN_SAMPLES):
+        first.record_latency("model", 0.6)
+    second.record_latency("model", 0.6)
+
+    assert ModelStatsStore(path).sample_count("model") == MIN_SAMPLES + 1
+
+
+def test_invalid_stats_file_is_ignored(tmp_path):
+    """A damaged or mismatched file is treated as empty."""
+    path = tmp_path / "model_stats.json"
+    path.write_text(json.dumps({"version": 1, "models": {"model": {"buckets": [1], "count": 1}}}))
+
+    assert ModelStatsStore(str(path)).sample_count("model") == 0
+
+
+def test_circuit_opens_after_consecutive_failures(monkeypatch):
+    """FAILURE_THRESHOLD failures in a row open the circuit until the cool-down passes."""
+    from fml import model_stats
+
+    now = [1000.0]
+    monkeypatch.setattr(model_stats.time, "time", lambda: now[0])
+    stats = ModelStatsStore()
+    for _ in range(model_stats.FAILURE_THRESHOLD - 1):
+        stats.record_failure("model")
+    assert stats.circuit_open_until("model") == 0.0
+
+    stats.record_failure("model")
+    assert stats.circuit_open_until("model") == 1000.0 + model_stats.COOLDOWN_SECONDS
+
+    now[0] += model_stats.COOLDOWN_SECONDS
+    assert stats.circuit_open_until("model") == 0.0
+    # The trial request after the cool-down fails: the circuit opens again at once.
+    stats.record_failure("model")
+    assert stats.circuit_open_until("model") > now[0]
+
+
+def test_success_closes_circuit_and_counts_towards_failure_rate():
+    """A success resets the failure streak; the failure rate covers all requests."""
+    stats = ModelStatsStore()
+    for _ in range(3):
+        stats.record_failure("model")
+    stats.record_success("model", 0.5)
+
+    assert stats.circuit_open_until("model") == 0.0
+    assert stats.failure_rate("model") == 0.75
+    assert stats.sample_count("model") == 1
+
+
+def test_abandoned_latency_does_not_affect_health():
+    """record_latency only feeds the histogram."""
+    stats = ModelStatsStore()
+    stats.record_latency("model", 3.0)
+
+    assert stats.sample_count("model") == 1
+    assert stats.failure_rate("model") == 0.0
+
+
+def test_entries_without_health_fields_start_healthy(tmp_path):
+    """Latency-only entries written by older versions are still read."""
+    path = tmp_path / "model_stats.json"
+    buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+    buckets[2] = 4
+    path.write_text(json.dumps({"version": 1, "models": {"model": {"buckets": buckets, "count": 4}}}))
+    stats = ModelStatsStore(str(path))
+
+    assert stats.sample_count("model") == 4
+    assert stats.failure_rate("model") == 0.0
+    assert stats.circuit_open_until("model") == 0.0
+
+
+def test_concurrent_processes_do_not_lose_samples(tmp_path):
+    """Updates from several processes sharing the file are all kept."""
+    import subprocess
+    import sys
+
+    path = str(tmp_path / "model_stats.json")
+    script = (
+        "import sys\n"
+        "from fml.model_stats import ModelStatsStore\n"
+        "store = ModelStatsStore(sys.argv[1])\n"
+        "for _ in range(40):\n"
+        "    store.record_success('model', 0.1)\n"
+    )
+    processes = [subprocess.Popen([sys.executable, "-c", script, path]) for _ in range(4)]
+    assert all(process.wait(timeout=60) == 0 for process in processes)
+
+    store = ModelStatsStore(path)
+    assert store.sample_count("model") == 160
+    with open(path, "r", encoding="utf-8") as f:
+        assert json.load(f)["models"]["model"]["requests"] == 160
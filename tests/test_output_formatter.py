@@ -1,6 +1,8 @@
+import io
 import pytest
+from fml.ai_service import parse_partial_response
 from fml.schemas import AICommandResponse, Flag
-from fml.output_formatter import OutputFormatter
+from fml.output_formatter import OutputFormatter, StreamingRenderer
 
 
 @pytest.fixture
@@ -114,3 +116,82 @@ def test_format_response_empty_flags_and_explanation(output_formatter):
     ai_response = AICommandResponse(explanation="", flags=[], command="just_a_command")
     expected_output = "\n\njust_a_command"
     assert output_formatter.format_response(ai_response, enable_color=False) == expected_output
+
+
+def _stream_in_chunks(ai_response, chunk_size, enable_color=False):
+    """Feeds the response JSON to a StreamingRenderer a few characters at a time."""
+    stream = io.StringIO()
+    renderer = StreamingRenderer(stream=stream, enable_color=enable_color)
+    text = ai_response.model_dump_json()
+    writes_before_finish = []
+    for end in range(chunk_size, len(text) + chunk_size, chunk_size):
+        renderer.update(parse_partial_response(text[:end]))
+        writes_before_finish.append(stream.getvalue())
+    renderer.finish(ai_response)
+    return stream.getvalue(), writes_before_finish
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000])
+def test_streaming_renderer_matches_format_response(output_formatter, chunk_size):
+    """
+    Test that streamed output ends up identical to the non-streaming layout.
+    """
+    ai_response = AICommandResponse(
+        explanation="Lists directory contents.",
+        flags=[
+            Flag(flag="-a", description="All files"),
+            Flag(flag="-l", description="Long listing format"),
+        ],
+        command="ls -al",
+    )
+    streamed, _ = _stream_in_chunks(ai_response, chunk_size)
+    assert streamed == output_formatter.format_response(ai_response, enable_color=False) + "\n"
+
+
+def test_streaming_renderer_without_flags(output_formatter):
+    ai_response = AICommandResponse(explanation="Shows the directory.", flags=[], command="pwd")
+    streamed, _ = _stream_in_chunks(ai_response, 3)
+    assert streamed == output_formatter.format_response(ai_response, enable_color=False) + "\n"
+
+
+def test_streaming_renderer_writes_explanation_before_command():
+    """
+    Test that explanation text is shown while streaming but the command only on finish.
+    """
+    ai_response = AICommandResponse(
+        explanation="Lists directory contents.",
+        flags=[Flag(flag="-a", description="All files")],
+        command="ls -al",
+    )
+    _, writes = _stream_in_chunks(ai_response, 5)
+    assert any(w.startswith("Lists dir") and "-a" not in w for w in writes)
+    assert any("-a: All files" in w for w in writes)
+    assert all("ls -al" not in w for w in writes)
+
+
+def test_streaming_renderer_skips_incomplete_flags():
+    stream = io.StringIO()
+    renderer = StreamingRenderer(stream=stream, enable_color=False)
+    renderer.update(
+        {"explanation": "Done.", "flags": [{"flag": "-a", "description": "Al"}]}
+    )
+    assert "-a" not in stream.getvalue()
+    renderer.update(
+        {
+            "explanation": "Done.",
+            "flags": [{"flag": "-a", "description": "All"}],
+            "command": "",
+        }
+    )
+    assert stream.getvalue() == "Done.\n\n-a: All\n"
+
+
+def test_streaming_renderer_color_output():
+    from colorama import Fore, Style
+
+    stream = io.StringIO()
+    renderer = StreamingRenderer(stream=stream, enable_color=True)
+    renderer.finish(AICommandResponse(explanation="Hi.", flags=[], command="ls"))
+    assert stream.getvalue() == (
+        Fore.CYAN + "Hi." + Style.RESET_ALL + "\n\n" + Fore.GREEN + "ls" + Style.RESET_ALL + "\n"
+    )
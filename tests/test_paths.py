@@ -0,0 +1,34 @@
+import os
+
+import pytest
+
+from fml.paths import atomic_write
+
+
+def test_atomic_write_creates_directories_and_replaces_contents(tmp_path):
+    """The file is created with its directory, then replaced as a whole."""
+    path = str(tmp_path / "nested" / "data.json")
+
+    atomic_write(path, "first")
+    atomic_write(path, b"second")
+
+    with open(path, "rb") as f:
+        assert f.read() == b"second"
+    assert os.listdir(tmp_path / "nested") == ["data.json"]
+
+
+def test_atomic_write_removes_its_temporary_file_on_failure(tmp_path, monkeypatch):
+    """A failed write leaves neither a partial file nor a temporary one."""
+    path = str(tmp_path / "data.json")
+    atomic_write(path, "old")
+
+    def fail(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        atomic_write(path, "new")
+
+    assert os.listdir(tmp_path) == ["data.json"]
+    with open(path, "r", encoding="utf-8") as f:
+        assert f.read() == "old"
@@ -0,0 +1,126 @@
+import json
+import threading
+
+import pytest
+
+from fml.profiling import Tracer, get_tracer, traced
+
+
+@pytest.fixture
+def tracer():
+    """Provides an enabled tracer."""
+    tracer = Tracer()
+    tracer.enable()
+    return tracer
+
+
+def test_disabled_tracer_records_nothing():
+    """
+    Test that spans are no-ops until the tracer is enabled.
+    """
+    tracer = Tracer()
+    with tracer.span("phase") as span:
+        assert span is None
+    tracer.add_span("imports", 0, 10)
+
+    assert tracer.spans == []
+
+
+def test_spans_nest_per_thread(tracer):
+    """
+    Test that spans opened inside another span on the same thread become its children.
+    """
+    def run_worker():
+        with tracer.span("worker"):
+            pass
+
+    with tracer.span("outer") as outer:
+        with tracer.span("inner", model="m") as inner:
+            pass
+        worker = threading.Thread(target=run_worker)
+        worker.start()
+        worker.join()
+
+    worker_span = next(span for span in tracer.spans if span.name == "worker")
+    assert worker_span.parent_id is None
+    assert inner.parent_id == outer.span_id
+    assert inner.attributes == {"model": "m"}
+    assert outer.parent_id is None
+    assert outer.end_ns >= inner.end_ns >= inner.start_ns >= outer.start_ns
+
+
+def test_format_summary_indents_children(tracer):
+    """
+    Test that the breakdown lists phases in start order, indented by depth.
+    """
+    with tracer.span("main"):
+        with tracer.span("generate_command", model="m"):
+            pass
+
+    lines = tracer.format_summary().splitlines()
+
+    assert lines[0].startswith("Profile (")
+    assert lines[1].lstrip().startswith("main")
+    assert lines[2].startswith("    generate_command")
+    assert lines[2].endswith("model=m")
+
+
+def test_chrome_trace_events(tracer):
+    """
+    Test that spans are exported as complete ('X') Chrome trace events in microseconds.
+    """
+    tracer.add_span("imports", 1_000_000, 3_000_000, module="fml")
+
+    event = tracer.to_chrome_trace()["traceEvents"][0]
+
+    assert event["name"] == "imports"
+    assert event["ph"] == "X"
+    assert event["dur"] == 2000
+    assert event["args"] == {"module": "fml"}
+
+
+def test_otel_export_links_parents(tracer, tmp_path):
+    """
+    Test that the OTLP/JSON export carries parent span IDs and typed attributes.
+    """
+    with tracer.span("parent"):
+        with tracer.span("child", attempt=1, stream=False):
+            pass
+    path = tmp_path / "trace.json"
+    tracer.write_trace(str(path), "otel")
+
+    spans = json.loads(path.read_text())["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    by_name = {span["name"]: span for span in spans}
+
+    assert by_name["child"]["parentSpanId"] == by_name["parent"]["spanId"]
+    assert by_name["parent"]["parentSpanId"] == ""
+    assert by_name["child"]["traceId"] == by_name["parent"]["traceId"]
+    assert {"key": "attempt", "value": {"intValue": "1"}} in by_name["child"]["attributes"]
+    assert {"key": "stream", "value": {"boolValue": False}} in by_name["child"]["attributes"]
+    assert int(by_name["parent"]["endTimeUnixNano"]) >= int(by_name["parent"]["startTimeUnixNano"])
+
+
+def test_write_trace_rejects_unknown_format(tracer, tmp_path):
+    """
+    Test that an unknown trace format raises ValueError.
+    """
+    with pytest.raises(ValueError):
+        tracer.write_trace(str(tmp_path / "trace.json"), "xml")
+
+
+def test_traced_decorator_uses_global_tracer():
+    """
+    Test that decorated functions record a span only while the global tracer is enabled.
+    """
+
+    @traced("work")
+    def work():
+        return 42
+
+    tracer = get_tracer()
+    assert work() == 42
+    assert tracer.spans == []
+
+    tracer.enable()
+    assert work() == 42
+    assert [span.name for span in tracer.spans] == ["work"]
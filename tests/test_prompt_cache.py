@@ -0,0 +1,63 @@
+import time
+
+from fml.prompt_cache import PromptCacheRegistry, prompt_cache_key
+
+
+def test_prompt_cache_key_depends_on_model_and_instruction():
+    """Keys differ per model and per system instruction."""
+    key = prompt_cache_key("gemini-2.0-flash", "prompt")
+
+    assert key == prompt_cache_key("gemini-2.0-flash", "prompt")
+    assert key != prompt_cache_key("gemini-1.5-flash", "prompt")
+    assert key != prompt_cache_key("gemini-2.0-flash", "other prompt")
+
+
+def test_registry_round_trips_entries_across_instances(tmp_path):
+    """Entries written by one registry are read by another on the same file."""
+    path = str(tmp_path / "prompt_caches.json")
+    expires_at = time.time() + 60
+    PromptCacheRegistry(path).put("key", "cachedContents/abc", expires_at)
+
+    entry = PromptCacheRegistry(path).get("key")
+
+    assert entry.name == "cachedContents/abc"
+    assert entry.expires_at == expires_at
+
+
+def test_registry_remembers_refusals(tmp_path):
+    """A refusal is stored as an entry without a name."""
+    registry = PromptCacheRegistry(str(tmp_path / "prompt_caches.json"))
+    registry.put("key", None, time.time() + 60)
+
+    entry = registry.get("key")
+
+    assert entry is not None
+    assert entry.name is None
+
+
+def test_registry_ignores_expired_entries(tmp_path):
+    """Expired entries are not returned and are pruned on the next write."""
+    registry = PromptCacheRegistry(str(tmp_path / "prompt_caches.json"))
+    registry.put("old", "cachedContents/old", time.time() - 1)
+    registry.put("new", "cachedContents/new", time.time() + 60)
+
+    assert registry.get("old") is None
+    assert "old" not in registry._load()
+
+
+def test_registry_discard_forgets_entry(tmp_path):
+    """discard() removes a single key."""
+    registry = PromptCacheRegistry(str(tmp_path / "prompt_caches.json"))
+    registry.put("key", "cachedContents/abc", time.time() + 60)
+
+    registry.discard("key")
+
+    assert registry.get("key") is None
+
+
+def test_registry_treats_corrupt_file_as_empty(tmp_path):
+    """A damaged registry file is ignored instead of failing the run."""
+    path = tmp_path / "prompt_caches.json"
+    path.write_text("{not json")
+
+    assert PromptCacheRegistry(str(path)).get("key") is None
@@ -0,0 +1,339 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+from unittest.mock import patch
+
+from fml.ai_service import AIService
+from fml.response_cache import (
+    COMPACTION_MIN_DEAD_BYTES,
+    MIN_INDEX_CAPACITY,
+    ResponseCache,
+    make_cache_key,
+    normalize_query,
+)
+from fml.schemas import AICommandResponse, AIContext, SystemInfo
+
+
+class CountingAIService(AIService):
+    """A concrete AIService that counts provider calls."""
+
+    def __init__(self, api_key: str, system_instruction_content: str, model: str):
+        super().__init__(api_key, system_instruction_content, model)
+        self.calls = 0
+
+    def _generate_command_internal(
+        self, query: str, ai_context: AIContext
+    ) -> AICommandResponse:
+        self.calls += 1
+        return AICommandResponse(
+            explanation=f"explanation {self.calls}", flags=[], command="ls -la"
+        )
+
+
+@pytest.fixture
+def ai_context():
+    """Provides an AIContext with fixed system information."""
+    return AIContext(
+        system_info=SystemInfo(
+            os_name="Linux",
+            shell="bash",
+            cwd="/home/user",
+            architecture="x86_64",
+            python_version="3.12.0",
+        )
+    )
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    """Provides a path for a temporary cache file."""
+    return str(tmp_path / "responses.log")
+
+
+def _response(command="ls -la"):
+    return AICommandResponse(explanation="Lists files.", flags=[], command=command)
+
+
+def test_normalize_query_collapses_whitespace_and_case():
+    assert normalize_query("  List   FILES\n") == normalize_query("list files")
+    assert normalize_query("List\t files") == "list files"
+
+
+def test_cache_key_ignores_cwd_but_not_shell(ai_context):
+    other_cwd = ai_context.model_copy(
+        update={"system_info": ai_context.system_info.model_copy(update={"cwd": "/tmp"})}
+    )
+    other_shell = ai_context.model_copy(
+        update={"system_info": ai_context.system_info.model_copy(update={"shell": "zsh"})}
+    )
+    key = make_cache_key("model", "list files", "prompt", ai_context)
+
+    assert key == make_cache_key("model", "List  files", "prompt", other_cwd)
+    assert key != make_cache_key("model", "list files", "prompt", other_shell)
+    assert key != make_cache_key("other-model", "list files", "prompt", ai_context)
+    assert key != make_cache_key("model", "list files", "new prompt", ai_context)
+
+
+def test_cache_round_trip_persists_to_disk(cache_path):
+    ResponseCache(cache_path).put("key", _response())
+
+    cached = ResponseCache(cache_path).get("key")
+
+    assert cached == _response()
+
+
+def test_cache_expires_entries_after_ttl(cache_path):
+    cache = ResponseCache(cache_path, ttl_seconds=10)
+    with patch("time.time", return_value=1000.0):
+        cache.put("key", _response())
+    with patch("time.time", return_value=1011.0):
+        assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_cache_evicts_least_recently_used(cache_path):
+    cache = ResponseCache(cache_path, max_entries=2)
+    with patch("time.time", return_value=1.0):
+        cache.put("a", _response("a"))
+    with patch("time.time", return_value=2.0):
+        cache.put("b", _response("b"))
+    with patch("time.time", return_value=3.0):
+        cache.get("a")  # "b" is now the least recently used entry
+    with patch("time.time", return_value=4.0):
+        cache.put("c", _response("c"))
+
+    with patch("time.time", return_value=5.0):
+        assert cache.get("b") is None
+        assert cache.get("a").command == "a"
+        assert cache.get("c").command == "c"
+
+
+def test_cache_ignores_corrupt_file(cache_path):
+    with open(cache_path, "w") as f:
+        f.write("{not json")
+
+    cache = ResponseCache(cache_path)
+
+    assert cache.get("key") is None
+    cache.put("key", _response())
+    assert ResponseCache(cache_path).get("key") == _response()
+
+
+def test_cache_overwrites_existing_key(cache_path):
+    cache = ResponseCache(cache_path)
+    cache.put("key", _response("old"))
+    cache.put("key", _response("new"))
+
+    assert len(cache) == 1
+    assert ResponseCache(cache_path).get("key").command == "new"
+
+
+def test_cache_writes_are_visible_to_open_instances(cache_path):
+    """Another process's cache, already mapped, sees later writes and clears."""
+    reader = ResponseCache(cache_path)
+    writer = ResponseCache(cache_path)
+    writer.put("a", _response("a"))
+    assert reader.get("a").command == "a"
+
+    writer.put("b", _response("b"))
+    assert reader.get("b").command == "b"
+
+    writer.clear()
+    assert reader.get("a") is None
+    assert len(reader) == 0
+
+
+def test_cache_grows_index_beyond_initial_capacity(cache_path):
+    cache = ResponseCache(cache_path)
+    reader = ResponseCache(cache_path)
+    reader.get("warm-up")
+    count = MIN_INDEX_CAPACITY
+    for i in range(count):
+        cache.put(f"key {i}", _response(f"echo {i}"))
+
+    assert len(cache) == count
+    assert reader.get("key 0").command == "echo 0"
+    assert reader.get(f"key {count - 1}").command == f"echo {count - 1}"
+    assert os.path.getsize(cache_path + ".index") > 64 + MIN_INDEX_CAPACITY * 48
+
+
+def test_cache_rebuilds_missing_index_from_log(cache_path):
+    cache = ResponseCache(cache_path)
+    cache.put("a", _response("a"))
+    cache.put("b", _response("b"))
+    cache.close()
+    os.remove(cache_path + ".index")
+
+    assert ResponseCache(cache_path).get("a") is None  # readers never rebuild
+    recovered = ResponseCache(cache_path)
+    recovered.put("c", _response("c"))
+
+    assert [recovered.get(key).command for key in "abc"] == ["a", "b", "c"]
+
+
+def test_cache_drops_truncated_record(cache_path):
+    cache = ResponseCache(cache_path)
+    cache.put("a", _response("a"))
+    cache.close()
+    with open(cache_path, "ab") as f:
+        f.write(b"\x50\x00\x00\x00garbage")
+    os.remove(cache_path + ".index")
+
+    recovered = ResponseCache(cache_path)
+    recovered.put("b", _response("b"))
+
+    assert recovered.get("a").command == "a"
+    assert ResponseCache(cache_path).get("b").command == "b"
+
+
+def test_cache_treats_damaged_record_as_miss(cache_path):
+    cache = ResponseCache(cache_path)
+    cache.put("key", _response())
+    with open(cache_path, "r+b") as f:
+        f.seek(-5, os.SEEK_END)
+        f.write(b"XXXXX")
+
+    assert ResponseCache(cache_path).get("key") is None
+    assert len(cache) == 0
+
+
+def test_compaction_reclaims_dead_records(cache_path):
+    cache = ResponseCache(cache_path, background_compaction=False)
+    explanation = "x" * 1000
+    for i in range(COMPACTION_MIN_DEAD_BYTES // 1000 + 50):
+        cache.put("key", AICommandResponse(explanation=explanation, flags=[], command=f"echo {i}"))
+    cache.put("other", _response("other"))
+
+    assert os.path.getsize(cache_path) < COMPACTION_MIN_DEAD_BYTES
+    assert cache.get("other").command == "other"
+    assert ResponseCache(cache_path).get("key").explanation == explanation
+
+
+def test_compaction_runs_in_background(cache_path):
+    cache = ResponseCache(cache_path, background_compaction=True)
+    reader = ResponseCache(cache_path)
+    cache.put("keep", _response("keep"))
+    reader.get("keep")
+    explanation = "x" * 1000
+    for i in range(COMPACTION_MIN_DEAD_BYTES // 1000 + 50):
+        cache.put("key", AICommandResponse(explanation=explanation, flags=[], command=f"echo {i}"))
+    cache._compactor.join(5)
+
+    assert os.path.getsize(cache_path) < COMPACTION_MIN_DEAD_BYTES
+    assert reader.get("keep").command == "keep"
+    assert reader.get("key").command.startswith("echo")
+
+
+_COMPACT_AND_EXIT = """
+import sys
+from fml.response_cache import COMPACTION_MIN_DEAD_BYTES, ResponseCache
+from fml.schemas import AICommandResponse
+
+cache = ResponseCache(sys.argv[1], background_compaction=sys.argv[2] == "background")
+for i in range(COMPACTION_MIN_DEAD_BYTES // 1000 + 50):
+    cache.put("key", AICommandResponse(explanation="x" * 1000, flags=[], command=f"echo {i}"))
+    if cache._compactor is not None:
+        break
+"""
+
+
+@pytest.mark.parametrize("mode", ["background", "inline"])
+def test_compaction_finishes_before_process_exits(cache_path, mode):
+    """A process exiting right after triggering compaction leaves a compacted cache and no temporary files."""
+    subprocess.run([sys.executable, "-c", _COMPACT_AND_EXIT, cache_path, mode],
+                   check=True, timeout=60)
+
+    assert os.path.getsize(cache_path) < COMPACTION_MIN_DEAD_BYTES
+    assert sorted(os.listdir(os.path.dirname(cache_path))) == [
+        "responses.log", "responses.log.index", "responses.log.lock"]
+    assert ResponseCache(cache_path).get("key").command.startswith("echo")
+
+
+def test_stale_temporary_files_are_removed(cache_path):
+    """Files left by a writer that died while replacing the cache are deleted on recovery."""
+    cache = ResponseCache(cache_path)
+    cache.put("key", _response())
+    directory = os.path.dirname(cache_path)
+    for name in (".responses.log-abc123", ".responses.log.index-def456"):
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(b"partial")
+    os.remove(cache_path + ".index")
+
+    ResponseCache(cache_path).put("other", _response("other"))
+
+    assert not [name for name in os.listdir(directory) if name.startswith(".")]
+    assert ResponseCache(cache_path).get("key") == _response()
+
+
+def _put_many(path, worker, count):
+    cache = ResponseCache(path)
+    for i in range(count):
+        cache.put(f"{worker}-{i}", _response(f"echo {worker} {i}"))
+
+
+def test_cache_is_safe_across_processes(cache_path):
+    """Several processes writing at once lose no entries."""
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=_put_many, args=(cache_path, w, 50)) for w in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+
+    cache = ResponseCache(cache_path)
+    assert [worker.exitcode for worker in workers] == [0, 0, 0, 0]
+    assert len(cache) == 200
+    assert all(cache.get(f"{w}-{i}").command == f"echo {w} {i}"
+               for w in range(4) for i in range(50))
+
+
+def test_cache_lookup_is_fast(cache_path):
+    cache = ResponseCache(cache_path)
+    for i in range(2000):
+        cache.put(f"key {i}", _response(f"echo {i}"))
+    reader = ResponseCache(cache_path)
+    reader.get("key 0")
+
+    start = time.perf_counter()
+    for i in range(2000):
+        assert reader.get(f"key {i}") is not None
+    elapsed = (time.perf_counter() - start) / 2000
+
+    assert elapsed < 0.001
+
+
+def test_generate_command_returns_cached_response(cache_path, ai_context):
+    service = CountingAIService("key", "prompt", "model")
+    service.cache = ResponseCache(cache_path)
+
+    first = service.generate_command("list files", ai_context)
+    second = service.generate_command("list   files", ai_context)
+
+    assert service.calls == 1
+    assert first == second
+
+
+def test_generate_command_refresh_bypasses_lookup(cache_path, ai_context):
+    service = CountingAIService("key", "prompt", "model")
+    service.cache = ResponseCache(cache_path)
+
+    service.generate_command("list files", ai_context)
+    refreshed = service.generate_command("list files", ai_context, refresh=True)
+    cached = service.generate_command("list files", ai_context)
+
+    assert service.calls == 2
+    assert refreshed.explanation == "explanation 2"
+    assert cached.explanation == "explanation 2"
+
+
+def test_generate_command_without_cache_always_calls_provider(ai_context):
+    service = CountingAIService("key", "prompt", "model")
+
+    service.generate_command("list files", ai_context)
+    service.generate_command("list files", ai_context)
+
+    assert service.calls == 2
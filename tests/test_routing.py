@@ -0,0 +1,81 @@
+import random
+
+from fml.model_stats import FAILURE_THRESHOLD, MIN_SAMPLES, ModelStatsStore
+from fml.routing import EXPLORATION_RATE, choose_model, expected_latency
+
+MODELS = ["default", "fast", "slow"]
+
+
+class FixedRandom(random.Random):
+    """A random source always returning the same value."""
+
+    def __init__(self, value: float):
+        super().__init__()
+        self.value = value
+
+    def random(self) -> float:
+        return self.value
+
+
+def measured_stats(**latencies) -> ModelStatsStore:
+    stats = ModelStatsStore()
+    for model, seconds in latencies.items():
+        for _ in range(MIN_SAMPLES):
+            stats.record_success(model, seconds)
+    return stats
+
+
+def test_default_model_is_used_without_measurements():
+    """With no recorded latencies the first (default) model is chosen."""
+    assert choose_model(ModelStatsStore(), MODELS, FixedRandom(0.99)) == "default"
+
+
+def test_fastest_measured_model_is_chosen():
+    """The healthy model with the lowest expected latency wins."""
+    stats = measured_stats(default=1.2, fast=0.3, slow=5.0)
+
+    assert choose_model(stats, MODELS, FixedRandom(0.99)) == "fast"
+
+
+def test_open_circuit_is_skipped():
+    """A model that keeps failing is not chosen while its circuit is open."""
+    stats = measured_stats(default=1.2, fast=0.3, slow=5.0)
+    for _ in range(FAILURE_THRESHOLD):
+        stats.record_failure("fast")
+
+    assert choose_model(stats, MODELS, FixedRandom(0.99)) == "default"
+
+
+def test_failures_raise_expected_latency():
+    """A model's failure rate inflates its expected latency."""
+    stats = measured_stats(default=0.6, fast=0.5)
+    for _ in range(MIN_SAMPLES):
+        stats.record_failure("fast")
+        stats.record_failure("fast")
+        stats.record_success("fast", 0.5)
+
+    assert expected_latency(stats, "fast") > expected_latency(stats, "default")
+    assert choose_model(stats, ["default", "fast"], FixedRandom(0.99)) == "default"
+
+
+def test_unmeasured_model_is_explored_occasionally():
+    """Models without enough latencies are tried EXPLORATION_RATE of the time."""
+    stats = measured_stats(default=0.6)
+
+    assert choose_model(stats, MODELS, FixedRandom(EXPLORATION_RATE / 2)) == "fast"
+    assert choose_model(stats, MODELS, FixedRandom(0.99)) == "default"
+
+
+def test_soonest_recovering_model_is_used_when_all_circuits_are_open(monkeypatch):
+    """If every circuit is open the model that will be retried first is chosen."""
+    from fml import model_stats
+
+    now = [1000.0]
+    monkeypatch.setattr(model_stats.time, "time", lambda: now[0])
+    stats = ModelStatsStore()
+    for model in ["slow", "default"]:
+        for _ in range(FAILURE_THRESHOLD):
+            stats.record_failure(model)
+        now[0] += 1
+
+    assert choose_model(stats, ["default", "slow"]) == "slow"
@@ -342,3 +342,13 @@ def test_ai_context_incorrect_system_info_type():
         exc_info.value
     )
     assert "system_info" in str(exc_info.value)
+
+
+def test_response_json_schema_is_generated_once():
+    """
+    Test that response_json_schema returns the same cached schema on every call.
+    """
+    from fml.schemas import response_json_schema
+
+    assert response_json_schema() is response_json_schema()
+    assert response_json_schema() == AICommandResponse.model_json_schema()
@@ -0,0 +1,218 @@
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from fml.ai_service import AIService
+from fml.schemas import AICommandResponse, AIContext, SystemInfo
+from fml.semantic_cache import (
+    DEFAULT_SIMILARITY_THRESHOLD,
+    STATS_FLUSH_INTERVAL,
+    SemanticCache,
+    embed_query,
+    literal_tokens,
+)
+
+
+class CountingAIService(AIService):
+    """A concrete AIService that counts provider calls."""
+
+    def __init__(self, api_key: str, system_instruction_content: str, model: str):
+        super().__init__(api_key, system_instruction_content, model)
+        self.calls = 0
+
+    def _generate_command_internal(
+        self, query: str, ai_context: AIContext
+    ) -> AICommandResponse:
+        self.calls += 1
+        return AICommandResponse(explanation=query, flags=[], command="docker ps")
+
+
+def _context(shell="bash"):
+    return AIContext(
+        system_info=SystemInfo(
+            os_name="Linux", shell=shell, cwd="/", architecture="x86_64"
+        )
+    )
+
+
+@pytest.fixture
+def semantic_cache(tmp_path):
+    """Provides a semantic cache with the default threshold in a temporary directory."""
+    return SemanticCache(str(tmp_path / "semantic"))
+
+
+def test_embed_query_is_normalized_and_deterministic():
+    vector = embed_query("List Docker containers")
+    assert vector.dtype == np.float32
+    assert np.linalg.norm(vector) == pytest.approx(1.0)
+    assert np.array_equal(vector, embed_query("list docker   containers"))
+    assert not embed_query("").any()
+
+
+def test_embed_query_similarity_ranks_rephrasings_above_unrelated_queries():
+    base = embed_query("list docker containers")
+    assert base @ embed_query("how do I list the docker containers?") >= DEFAULT_SIMILARITY_THRESHOLD
+    assert base @ embed_query("docker containers list") >= DEFAULT_SIMILARITY_THRESHOLD
+    assert base @ embed_query("list docker images") < DEFAULT_SIMILARITY_THRESHOLD
+    assert base @ embed_query("undo the last git commit") < 0.2
+
+
+def test_literal_tokens_extracts_numbers_paths_and_quoted_strings():
+    assert literal_tokens("delete files older than 7 days in /tmp") == ("7", "/tmp")
+    assert literal_tokens("find files named 'notes.md' under ~/docs.") == ("notes.md", "~/docs")
+    assert literal_tokens("copy a.txt to b.txt") == ("a.txt", "b.txt")
+    assert literal_tokens("list *.py files") == ("*.py",)
+    assert literal_tokens("how do I list docker containers?") == ()
+
+
+def test_lookup_returns_similar_query_response(semantic_cache):
+    response = AICommandResponse(explanation="Lists containers.", flags=[], command="docker ps")
+    semantic_cache.add("model", "list docker containers", "prompt", _context(), response)
+
+    assert semantic_cache.lookup("model", "how do I list the docker containers?", "prompt", _context()) == response
+    assert semantic_cache.lookup("model", "compress a folder with tar", "prompt", _context()) is None
+
+
+def test_lookup_refuses_queries_with_different_literals(semantic_cache):
+    """Near-identical queries asking about other numbers, paths or names do not hit."""
+    response = AICommandResponse(
+        explanation="Deletes old files.", flags=[], command="find /tmp -type f -mtime +7 -delete"
+    )
+    semantic_cache.add(
+        "model", "delete all files older than 7 days in /tmp", "prompt", _context(), response)
+
+    for query in [
+        "delete all files older than 30 days in /tmp",
+        "delete all files older than 7 days in /var/tmp",
+    ]:
+        # Similar enough to hit on their embeddings alone.
+        assert embed_query(query) @ embed_query(
+            "delete all files older than 7 days in /tmp") >= DEFAULT_SIMILARITY_THRESHOLD
+        assert semantic_cache.lookup("model", query, "prompt", _context()) is None
+    assert semantic_cache.lookup(
+        "model", "how do I delete files older than 7 days in /tmp?", "prompt", _context()
+    ) == response
+
+
+def test_lookup_is_scoped_to_model_and_shell(semantic_cache):
+    response = AICommandResponse(explanation="Lists containers.", flags=[], command="docker ps")
+    semantic_cache.add("model", "list docker containers", "prompt", _context(), response)
+
+    assert semantic_cache.lookup("other-model", "list docker containers", "prompt", _context()) is None
+    assert semantic_cache.lookup("model", "list docker containers", "prompt", _context("zsh")) is None
+    assert semantic_cache.lookup("model", "list docker containers", "new prompt", _context()) is None
+
+
+def test_stats_track_hit_rate_and_persist(tmp_path):
+    directory = str(tmp_path / "semantic")
+    cache = SemanticCache(directory)
+    response = AICommandResponse(explanation="x", flags=[], command="ls")
+    cache.add("model", "list files", "prompt", _context(), response)
+    cache.lookup("model", "list files", "prompt", _context())
+    cache.lookup("model", "reboot the machine", "prompt", _context())
+    cache.lookup("model", "list the files", "prompt", _context())
+
+    expected = {"entries": 1, "hits": 2, "misses": 1, "lookups": 3, "hit_rate": 2 / 3}
+    assert cache.stats() == expected
+    # Lookups are counted in memory until flushed.
+    assert not os.path.exists(os.path.join(directory, "semantic_stats.json"))
+    cache.flush()
+    assert SemanticCache(directory).stats() == expected
+
+
+def test_stats_are_flushed_in_batches(tmp_path):
+    directory = str(tmp_path / "semantic")
+    cache = SemanticCache(directory)
+    for _ in range(STATS_FLUSH_INTERVAL):
+        cache.lookup("model", "list files", "prompt", _context())
+
+    assert SemanticCache(directory).stats()["misses"] == STATS_FLUSH_INTERVAL
+
+
+def test_index_is_bounded(tmp_path):
+    cache = SemanticCache(str(tmp_path / "semantic"), max_entries=2)
+    for word in ["alpha", "bravo", "charlie"]:
+        cache.add("model", word, "prompt", _context(), AICommandResponse(explanation=word, flags=[], command=word))
+
+    reloaded = SemanticCache(str(tmp_path / "semantic"), max_entries=2)
+    assert reloaded.stats()["entries"] == 2
+    assert reloaded.lookup("model", "alpha", "prompt", _context()) is None
+    assert reloaded.lookup("model", "charlie", "prompt", _context()).command == "charlie"
+
+    # Once the files hold twice max_entries, they are rewritten with the newest entries.
+    cache.add("model", "delta", "prompt", _context(), AICommandResponse(explanation="d", flags=[], command="delta"))
+    with open(tmp_path / "semantic" / "semantic_entries.jsonl", "r", encoding="utf-8") as f:
+        assert len(f.readlines()) == 3  # the header and two entries
+    assert SemanticCache(str(tmp_path / "semantic")).stats()["entries"] == 2
+
+
+def test_add_appends_instead_of_rewriting(tmp_path):
+    directory = tmp_path / "semantic"
+    cache = SemanticCache(str(directory))
+    cache.add("model", "list files", "prompt", _context(), AICommandResponse(explanation="x", flags=[], command="ls"))
+    inode = os.stat(directory / "semantic_vectors.f32").st_ino
+
+    cache.add("model", "reboot", "prompt", _context(), AICommandResponse(explanation="x", flags=[], command="reboot"))
+
+    stat = os.stat(directory / "semantic_vectors.f32")
+    assert stat.st_ino == inode
+    assert stat.st_size == 2 * cache.dimensions * 4
+
+
+def test_instances_sharing_a_directory_see_each_others_entries(tmp_path):
+    """Entries added by one process are found by another, and neither overwrites the other."""
+    directory = str(tmp_path / "semantic")
+    first, second = SemanticCache(directory), SemanticCache(directory)
+    first.lookup("model", "warm up", "prompt", _context())
+    first.add("model", "list files", "prompt", _context(), AICommandResponse(explanation="x", flags=[], command="ls"))
+    second.add("model", "reboot the machine", "prompt", _context(),
+               AICommandResponse(explanation="x", flags=[], command="reboot"))
+    first.add("model", "show disk usage", "prompt", _context(),
+              AICommandResponse(explanation="x", flags=[], command="df -h"))
+
+    assert first.lookup("model", "reboot the machine", "prompt", _context()).command == "reboot"
+    assert second.lookup("model", "show disk usage", "prompt", _context()).command == "df -h"
+    assert SemanticCache(directory).stats()["entries"] == 3
+
+
+def test_damaged_files_are_rebuilt(tmp_path):
+    directory = tmp_path / "semantic"
+    cache = SemanticCache(str(directory))
+    cache.add("model", "list files", "prompt", _context(), AICommandResponse(explanation="x", flags=[], command="ls"))
+    os.truncate(directory / "semantic_vectors.f32", 10)
+
+    assert SemanticCache(str(directory)).lookup("model", "list files", "prompt", _context()) is None
+    writer = SemanticCache(str(directory))
+    writer.add("model", "reboot", "prompt", _context(), AICommandResponse(explanation="x", flags=[], command="reboot"))
+    assert SemanticCache(str(directory)).lookup("model", "reboot", "prompt", _context()).command == "reboot"
+
+
+def test_damaged_entries_are_dropped_as_misses(tmp_path):
+    """An entry whose response no longer validates is a miss, not an error."""
+    directory = tmp_path / "semantic"
+    cache = SemanticCache(str(directory))
+    cache.add("model", "list files", "prompt", _context(), AICommandResponse(explanation="x", flags=[], command="ls"))
+    path = directory / "semantic_entries.jsonl"
+    path.write_text(path.read_text().replace('"command":"ls"', '"command":null'))
+
+    reader = SemanticCache(str(directory))
+    assert reader.lookup("model", "list files", "prompt", _context()) is None
+    assert reader.stats()["entries"] == 0
+
+    service = CountingAIService("key", "prompt", "model")
+    service.semantic_cache = SemanticCache(str(directory))
+    assert service.generate_command("list files", _context()).command == "docker ps"
+
+
+def test_generate_command_consults_semantic_cache(semantic_cache):
+    service = CountingAIService("key", "prompt", "model")
+    service.semantic_cache = semantic_cache
+
+    first = service.generate_command("list docker containers", _context())
+    second = service.generate_command("please list the docker containers", _context())
+    service.generate_command("please list the docker containers", _context(), refresh=True)
+
+    assert first == second
+    assert service.calls == 2
@@ -0,0 +1,317 @@
+import json
+import sys
+import threading
+import urllib.error
+import urllib.request
+from unittest.mock import patch
+
+import pytest
+
+from fml.__main__ import _is_serve_command, main
+from fml.ai_providers.gemini_service import GeminiService
+from fml.ai_service import ERROR_CATEGORY_API, AIService, AIServiceError
+from fml.http_transport import HttpTransport
+from fml.schemas import AICommandResponse, AIContext
+from fml.server import FmlServer, LatencyHistogram
+from fml.testing.fake_gemini import FakeGeminiServer
+
+SYSTEM_INFO = {
+    "os_name": "Linux",
+    "shell": "bash",
+    "cwd": "/home/user",
+    "architecture": "x86_64",
+    "python_version": "3.12.0",
+}
+
+
+class GatedAIService(AIService):
+    """An AIService whose answers wait until the test opens a gate."""
+
+    def __init__(self, model: str, gate: threading.Event, started: threading.Semaphore):
+        super().__init__("key", "prompt", model)
+        self.gate = gate
+        self.started = started
+
+    def _generate_command_internal(
+        self, query: str, ai_context: AIContext
+    ) -> AICommandResponse:
+        self.started.release()
+        self.gate.wait(5)
+        if query == "fail":
+            raise AIServiceError("API Error: quota exhausted (Code: 429)",
+                                 category=ERROR_CATEGORY_API, status_code=429)
+        return AICommandResponse(
+            explanation=f"Answer from {self.model}.", flags=[], command=f"echo {query}"
+        )
+
+
+def _start(server: FmlServer) -> FmlServer:
+    threading.Thread(target=server.serve, daemon=True).start()
+    return server
+
+
+def _post(server: FmlServer, payload, path: str = "/v1/generate"):
+    body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+    request = urllib.request.Request(
+        server.base_url + path, data=body, headers={"Content-Type": "application/json"}
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read()), response.headers
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read()), e.headers
+
+
+def _get(server: FmlServer, path: str) -> str:
+    with urllib.request.urlopen(server.base_url + path, timeout=10) as response:
+        return response.read().decode("utf-8")
+
+
+@pytest.fixture
+def gate():
+    """Provides an open gate, so gated services answer immediately."""
+    event = threading.Event()
+    event.set()
+    return event
+
+
+@pytest.fixture
+def make_server(gate):
+    """Builds servers on free ports backed by gated services, stopping them afterwards."""
+    servers = []
+    started = threading.Semaphore(0)
+
+    def factory(model):
+        if model == "unknown":
+            raise ValueError(f"Unsupported model '{model}'.")
+        return GatedAIService(model, gate, started)
+
+    def make(**kwargs):
+        server = _start(FmlServer(factory, default_model="gemini-2.0-flash", port=0, **kwargs))
+        server.started = started
+        servers.append(server)
+        return server
+
+    yield make
+    gate.set()
+    for server in servers:
+        server.stop()
+
+
+def test_generate_returns_command(make_server):
+    """A query is answered with the service's command response."""
+    server = make_server()
+
+    status, reply, _ = _post(server, {"query": "list files", "system_info": SYSTEM_INFO})
+
+    assert status == 200
+    assert reply["response"]["command"] == "echo list files"
+    assert reply["response"]["explanation"] == "Answer from gemini-2.0-flash."
+
+
+def test_generate_uses_requested_model(make_server):
+    """A request may name the model it wants."""
+    server = make_server()
+
+    _, reply, _ = _post(server, {"query": "ls", "model": "gemini-2.5-flash"})
+
+    assert reply["response"]["explanation"] == "Answer from gemini-2.5-flash."
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [b"{not json", {"system_info": SYSTEM_INFO}, {"query": "  "}, ["list files"]],
+)
+def test_invalid_requests_are_rejected(make_server, payload):
+    """Bodies that are not JSON or lack a query get 400."""
+    server = make_server()
+
+    status, reply, _ = _post(server, payload)
+
+    assert status == 400
+    assert reply["error"]
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"query": "ls", "model": [1]},
+        {"query": "ls", "refresh": "yes"},
+        {"query": "ls", "use_cache": 0},
+        {"query": "ls", "context": "Linux"},
+        {"query": "ls", "system_info": ["Linux"]},
+    ],
+)
+def test_optional_fields_of_the_wrong_type_are_rejected(make_server, payload):
+    """Malformed optional fields get 400 instead of breaking the worker."""
+    server = make_server()
+
+    status, reply, _ = _post(server, payload)
+
+    assert status == 400
+    assert "must be" in reply["error"]
+    # The server keeps answering.
+    assert _post(server, {"query": "ls"})[0] == 200
+
+
+def test_model_is_resolved_for_every_request(make_server):
+    """A routed model is chosen per request rather than once for the server's lifetime."""
+    choices = iter(["gemini-2.0-flash", "gemini-2.5-flash"])
+    server = make_server(model_resolver=lambda model: next(choices) if model == "auto" else model)
+
+    first = _post(server, {"query": "ls", "model": "auto"})[1]
+    second = _post(server, {"query": "ls", "model": "auto"})[1]
+
+    assert first["response"]["explanation"] == "Answer from gemini-2.0-flash."
+    assert second["response"]["explanation"] == "Answer from gemini-2.5-flash."
+
+
+def test_unknown_model_is_a_client_error(make_server):
+    """An unsupported model is reported with 400, like other invalid requests."""
+    server = make_server()
+
+    status, reply, _ = _post(server, {"query": "ls", "model": "unknown"})
+
+    assert status == 400
+    assert "Unsupported model" in reply["error"]
+
+
+def test_provider_errors_report_their_category(make_server):
+    """AI service failures become 502 with the error category."""
+    server = make_server()
+
+    status, reply, _ = _post(server, {"query": "fail"})
+
+    assert status == 502
+    assert reply["category"] == "api"
+
+
+def test_full_queue_is_refused_with_429(make_server, gate):
+    """Requests beyond the busy workers and the queue get 429 with Retry-After."""
+    gate.clear()
+    server = make_server(workers=1, queue_size=0)
+    replies = []
+    blocked = threading.Thread(target=lambda: replies.append(_post(server, {"query": "slow"})))
+    blocked.start()
+    assert server.started.acquire(timeout=5)
+
+    status, reply, headers = _post(server, {"query": "ls"})
+    gate.set()
+    blocked.join(5)
+
+    assert status == 429
+    assert headers["Retry-After"] == "1"
+    assert "busy" in reply["error"]
+    assert replies[0][0] == 200
+
+
+def test_healthz_and_unknown_paths(make_server):
+    """The health check answers, unknown endpoints get 404."""
+    server = make_server()
+
+    assert json.loads(_get(server, "/healthz")) == {"status": "ok"}
+    status, _, _ = _post(server, {"query": "ls"}, path="/v1/other")
+    assert status == 404
+
+
+def test_metrics_report_requests_and_latency(make_server):
+    """/metrics counts responses by status and records latency histograms."""
+    server = make_server(workers=2, queue_size=3)
+    _post(server, {"query": "ls"})
+    _post(server, {"query": "fail"})
+    _post(server, {})
+
+    metrics = _get(server, "/metrics")
+
+    assert 'fml_generate_requests_total{code="200"} 1' in metrics
+    assert 'fml_generate_requests_total{code="400"} 1' in metrics
+    assert 'fml_generate_requests_total{code="502"} 1' in metrics
+    assert 'fml_generate_duration_seconds_count{outcome="ok"} 1' in metrics
+    assert 'fml_generate_duration_seconds_bucket{outcome="error",le="+Inf"} 1' in metrics
+    assert "fml_workers 2" in metrics
+    assert "fml_queue_capacity 3" in metrics
+    assert "fml_queue_depth 0" in metrics
+
+
+def test_latency_histogram_is_cumulative():
+    """Bucket counts include every faster observation."""
+    histogram = LatencyHistogram(buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(seconds)
+
+    assert histogram.render("latency") == [
+        'latency_bucket{le="0.1"} 1',
+        'latency_bucket{le="1.0"} 3',
+        'latency_bucket{le="+Inf"} 4',
+        "latency_sum 4.250000",
+        "latency_count 4",
+    ]
+
+
+def test_server_settings_are_validated():
+    """A server without workers or with a negative queue is rejected."""
+    with pytest.raises(ValueError, match="at least 1"):
+        FmlServer(lambda model: None, "gemini-2.0-flash", port=0, workers=0)
+    with pytest.raises(ValueError, match="negative"):
+        FmlServer(lambda model: None, "gemini-2.0-flash", port=0, queue_size=-1)
+
+
+def test_server_answers_from_fake_provider():
+    """End to end: the server forwards queries to a (fake) Gemini API over pooled connections."""
+    transport = HttpTransport(http2=False)
+    with FakeGeminiServer(explanation_words=5, flag_count=1) as provider:
+        def factory(model):
+            return GeminiService("fake-key", "prompt", model, base_url=provider.base_url,
+                                 http_transport=transport)
+
+        server = _start(FmlServer(factory, default_model="gemini-2.0-flash", port=0))
+        try:
+            replies = [_post(server, {"query": f"query {i}", "system_info": SYSTEM_INFO})
+                       for i in range(3)]
+        finally:
+            server.stop()
+
+    assert [status for status, _, _ in replies] == [200, 200, 200]
+    assert all(reply["response"]["command"] for _, reply, _ in replies)
+    assert provider.request_count == 3
+    assert transport.stats().connections_opened == 1
+    transport.close()
+
+
+def test_serve_closes_the_http_transport_on_shutdown(monkeypatch):
+    transport = HttpTransport(http2=False)
+    monkeypatch.setattr("fml.http_transport._transport", transport)
+    client, async_client = transport.client(), transport.async_client()
+    server = FmlServer(lambda model: None, "gemini-2.0-flash", port=0)
+    thread = threading.Thread(target=server.serve)
+    thread.start()
+
+    server.stop()
+    thread.join(timeout=5)
+
+    assert client.is_closed and async_client.is_closed
+
+
+@pytest.mark.parametrize(
+    "argv, expected",
+    [
+        (["serve"], True),
+        (["serve", "--port", "9000"], True),
+        (["serve", "static", "files"], False),
+        (["list", "files"], False),
+        ([], False),
+    ],
+)
+def test_serve_command_detection(argv, expected):
+    """Only a bare `serve`, optionally with options, starts the server."""
+    assert _is_serve_command(argv) is expected
+
+
+def test_serve_rejects_invalid_worker_count(capsys):
+    """`fml serve --workers 0` is a usage error."""
+    with patch.object(sys, "argv", ["fml", "serve", "--workers", "0"]), \
+            pytest.raises(SystemExit) as exc_info:
+        main()
+
+    assert exc_info.value.code == 2
+    assert "at least 1 worker" in capsys.readouterr().err
@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+from fml.singleflight import SingleFlight, SingleFlightStats
+
+
+def _run_concurrently(count, target):
+    threads = [threading.Thread(target=target) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_singleflight_shares_one_call_between_concurrent_callers():
+    """Callers arriving while a call is running get its result without calling again."""
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    threads = _run_concurrently(4, lambda: results.append(flight.do("key", slow)))
+    # Everyone but the leader is waiting once four callers have registered.
+    while flight.stats().calls + flight.stats().coalesced < 4:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert sorted(results) == [("answer", False)] + [("answer", True)] * 3
+    assert flight.stats() == SingleFlightStats(calls=1, coalesced=3)
+    assert flight.in_flight() == 0
+
+
+def test_singleflight_propagates_errors_and_forgets_finished_calls():
+    """A failing call raises in every caller, and the next call runs afresh."""
+    flight = SingleFlight()
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        flight.do("key", fail)
+
+    assert flight.do("key", lambda: 42) == (42, False)
+    assert flight.do("other", lambda: 7) == (7, False)
+    assert flight.stats() == SingleFlightStats(calls=3, coalesced=0)
@@ -0,0 +1,108 @@
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+# Modules that are expensive to import and must stay off the startup path.
+HEAVY_MODULES = ["google.genai", "requests", "pyperclip", "pydantic", "httpx"]
+
+
+def _run_and_list_heavy_modules(script, env=None):
+    """Runs a script in a fresh interpreter and returns which heavy modules it loaded."""
+    probe = "\n".join(
+        [
+            "import json, sys",
+            "try:",
+            textwrap.indent(textwrap.dedent(script).strip(), "    "),
+            "except SystemExit:",
+            "    pass",
+            f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))",
+        ]
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", probe],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, **(env or {})},
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_help_does_not_import_heavy_modules():
+    """`fml --help` must not load pydantic, the Gemini SDK, requests or pyperclip."""
+    loaded = _run_and_list_heavy_modules(
+        """
+        sys.argv = ["fml", "--help"]
+        from fml.__main__ import main
+        main()
+        """
+    )
+    assert loaded == []
+
+
+def test_no_query_does_not_import_heavy_modules():
+    """Running `fml` without a query prints help without loading heavy modules."""
+    loaded = _run_and_list_heavy_modules(
+        """
+        sys.argv = ["fml"]
+        from fml.__main__ import main
+        main()
+        """
+    )
+    assert loaded == []
+
+
+def test_argument_error_does_not_import_heavy_modules():
+    """An argument error exits before any heavy module is loaded."""
+    loaded = _run_and_list_heavy_modules(
+        """
+        sys.argv = ["fml", "--model"]
+        from fml.__main__ import main
+        main()
+        """
+    )
+    assert loaded == []
+
+
+def test_cache_hit_does_not_import_provider_sdk(tmp_path):
+    """A cached answer is served without importing google.genai, requests or httpx."""
+    loaded = _run_and_list_heavy_modules(
+        """
+        from fml.__main__ import main, _create_response_cache
+        from fml.gather_system_info import get_system_info
+        from fml.prompts.gemini_system_prompt import GEMINI_SYSTEM_PROMPT
+        from fml.response_cache import make_cache_key
+        from fml.schemas import AICommandResponse, AIContext
+
+        key = make_cache_key(
+            "gemini-2.0-flash",
+            "list files",
+            GEMINI_SYSTEM_PROMPT,
+            AIContext(system_info=get_system_info()),
+        )
+        _create_response_cache().put(
+            key, AICommandResponse(explanation="Lists files.", flags=[], command="ls")
+        )
+        sys.argv = ["fml", "--no-color", "--model", "gemini-2.0-flash", "list files"]
+        main()
+        """,
+        env={"FML_CACHE_DIR": str(tmp_path), "GEMINI_API_KEY": "dummy"},
+    )
+    assert "google.genai" not in loaded
+    assert "requests" not in loaded
+    assert "httpx" not in loaded
+
+
+def test_history_search_does_not_import_heavy_modules(tmp_path):
+    """`fml --history` answers from SQLite without loading pydantic or the provider SDK."""
+    loaded = _run_and_list_heavy_modules(
+        """
+        sys.argv = ["fml", "--history", "docker"]
+        from fml.__main__ import main
+        main()
+        """,
+        env={"FML_CACHE_DIR": str(tmp_path)},
+    )
+    assert loaded == []
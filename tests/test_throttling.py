@@ -0,0 +1,69 @@
+import pytest
+from unittest.mock import patch
+
+from fml.throttling import RetryPolicy, TokenBucket
+
+
+class FakeClock:
+    """A manually advanced clock whose sleep() moves time forward."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket_allows_burst_then_spaces_requests():
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_second=2.0, capacity=2, clock=clock, sleep=clock.sleep)
+
+    waits = [bucket.acquire() for _ in range(4)]
+
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(0.5)
+    assert waits[3] == pytest.approx(0.5)
+
+
+def test_token_bucket_refills_over_time():
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_second=1.0, capacity=1, clock=clock, sleep=clock.sleep)
+
+    bucket.acquire()
+    clock.now += 5  # refill is capped at capacity
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(1.0)
+
+
+def test_token_bucket_per_minute():
+    bucket = TokenBucket.per_minute(120)
+    assert bucket.rate_per_second == 2.0
+    assert bucket.capacity == 2.0
+    assert TokenBucket.per_minute(15).capacity == 1.0
+
+
+def test_token_bucket_rejects_invalid_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(rate_per_second=0)
+
+
+def test_retry_policy_delay_is_jittered_and_capped():
+    policy = RetryPolicy(base_delay=1.0, max_delay=4.0)
+    with patch("random.uniform", side_effect=lambda low, high: high) as mock_uniform:
+        assert [policy.delay(n) for n in range(4)] == [1.0, 2.0, 4.0, 4.0]
+    mock_uniform.assert_called_with(0, 4.0)
+
+
+def test_token_bucket_reserve_does_not_sleep():
+    clock = FakeClock()
+    bucket = TokenBucket(rate_per_second=1.0, capacity=1, clock=clock, sleep=clock.sleep)
+
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(1.0)
+    assert bucket.reserve() == pytest.approx(2.0)
+    assert clock.sleeps == []